@@ -6,6 +6,9 @@ import config
 import constants
 import engine
 import packet_common
+import scheduler
+import timer
+import watchdog
 
 def log_level(string):
     string = string.lower()
@@ -23,6 +26,47 @@ def log_level(string):
         msg = "{} is not a valid log level".format(string)
         raise argparse.ArgumentTypeError(msg)
 
+def positive_int(string):
+    try:
+        value = int(string)
+    except ValueError:
+        value = 0
+    if value < 1:
+        msg = "{} is not a positive integer".format(string)
+        raise argparse.ArgumentTypeError(msg)
+    return value
+
+def non_negative_float(string):
+    try:
+        value = float(string)
+    except ValueError:
+        value = -1.0
+    if value < 0.0:
+        msg = "{} is not a non-negative number".format(string)
+        raise argparse.ArgumentTypeError(msg)
+    return value
+
+def jitter_fraction(string):
+    try:
+        value = float(string)
+    except ValueError:
+        value = -1.0
+    if value < 0.0 or value >= 1.0:
+        msg = "{} is not a number between 0 (inclusive) and 1 (exclusive)".format(string)
+        raise argparse.ArgumentTypeError(msg)
+    return value
+
+def milliseconds(string):
+    # Returns seconds
+    try:
+        value = float(string)
+    except ValueError:
+        value = 0.0
+    if value <= 0.0:
+        msg = "{} is not a positive number of milliseconds".format(string)
+        raise argparse.ArgumentTypeError(msg)
+    return value / 1000.0
+
 def parse_command_line_arguments():
     parser = argparse.ArgumentParser(description='Routing In Fat Trees (RIFT) protocol engine')
     parser.add_argument(
@@ -62,7 +106,98 @@ def parse_command_line_arguments():
     parser.add_argument(
         '--ipv6-multicast-loopback-disable', action="store_true",
         help='Disable IPv6 loopback on multicast send sockets')
+    parser.add_argument(
+        '--scheduler',
+        choices=scheduler.SCHEDULER_TYPES,
+        default=scheduler.DEFAULT_SCHEDULER_TYPE,
+        help='Scheduler type (select uses select(), epoll uses epoll or the best alternative for '
+             'the platform and has no limit on the number of file descriptors, asyncio lets an '
+             'asyncio event loop drive the engine)')
+    parser.add_argument(
+        '--processes',
+        type=positive_int,
+        default=1,
+        help='Number of processes over which the nodes are distributed (default 1)')
+    parser.add_argument(
+        '--read-budget',
+        type=positive_int,
+        default=scheduler.DEFAULT_READ_BUDGET,
+        help='Maximum number of packets read from a socket before the other sockets and the timers '
+             'get a turn (default {})'.format(scheduler.DEFAULT_READ_BUDGET))
+    parser.add_argument(
+        '--rx-policy',
+        choices=scheduler.RX_POLICIES,
+        default=scheduler.DEFAULT_RX_POLICY,
+        help='Order in which sockets that are ready to read are served (fair serves all sockets '
+             'round-robin, priority serves LIE sockets before flooding sockets)')
+    parser.add_argument(
+        '--timer-jitter',
+        type=jitter_fraction,
+        default=timer.DEFAULT_PERIODIC_JITTER,
+        help='Delay each expiry of the periodic node and interface timers by a random fraction of '
+             'the interval of at most this value (default {:g}, i.e. no jitter)'.format(
+                 timer.DEFAULT_PERIODIC_JITTER))
+    parser.add_argument(
+        '--timer-phase-spread',
+        action="store_true",
+        help='Spread the first expiry of the periodic node and interface timers randomly over the '
+             'first interval')
+    parser.add_argument(
+        '--codec',
+        choices=packet_common.CODECS,
+        default=packet_common.DEFAULT_CODEC,
+        help='Thrift codec used to decode packets (accelerated uses the thrift C extension if it '
+             'is available and falls back to python otherwise)')
+    parser.add_argument(
+        '--tie-pass-through',
+        action="store_true",
+        help='Decode the element of each received TIE only when it is needed, instead of right '
+             'away')
+    parser.add_argument(
+        '--immediate-tie-flooding',
+        action="store_true",
+        help='Send a TIE as soon as it is queued for flooding, instead of at the next tick of the '
+             'flooding queue timer')
+    parser.add_argument(
+        '--verify-encode',
+        action="store_true",
+        help='Check the output of the fast packet encoder against the output of the Thrift encoder '
+             '(slow, for debugging)')
+    parser.add_argument(
+        '--virtual-clock',
+        action="store_true",
+        help='Use a virtual clock which jumps to the next timer expiry whenever there is nothing '
+             'else to do, so that topologies converge faster than real time')
+    parser.add_argument(
+        '--virtual-clock-stop',
+        type=non_negative_float,
+        help='Stop the virtual clock after the specified number of virtual seconds')
+    parser.add_argument(
+        '--watchdog-threshold',
+        type=milliseconds,
+        metavar='MSECS',
+        help='Enable the watchdog, which samples the stack of scheduler callbacks that run longer '
+             'than the specified number of milliseconds')
+    parser.add_argument(
+        '--watchdog-interval',
+        type=milliseconds,
+        metavar='MSECS',
+        help='Interval in milliseconds between the stack samples of the watchdog (default {:g})'
+        .format(watchdog.DEFAULT_SAMPLE_INTERVAL * 1000.0))
+    parser.add_argument(
+        '--seed',
+        type=int,
+        help='Seed for the random number generator, for reproducible runs')
     args = parser.parse_args()
+    if args.virtual_clock:
+        if args.processes > 1:
+            parser.error("--virtual-clock cannot be combined with --processes")
+        if args.scheduler == scheduler.AsyncioScheduler.TYPE:
+            parser.error("--virtual-clock cannot be combined with --scheduler asyncio")
+    elif args.virtual_clock_stop is not None:
+        parser.error("--virtual-clock-stop requires --virtual-clock")
+    if args.watchdog_interval is not None and args.watchdog_threshold is None:
+        parser.error("--watchdog-interval requires --watchdog-threshold")
     return args
 
 def parse_environment_variables(args):
@@ -88,6 +223,23 @@ def ipv6_multicast_loopback(parsed_args):
     else:
         return True
 
+def engine_options(parsed_args):
+    return engine.EngineOptions(scheduler_type=parsed_args.scheduler,
+                                processes=parsed_args.processes,
+                                virtual_clock=parsed_args.virtual_clock,
+                                virtual_clock_stop=parsed_args.virtual_clock_stop,
+                                seed=parsed_args.seed,
+                                read_budget=parsed_args.read_budget,
+                                rx_policy=parsed_args.rx_policy,
+                                timer_jitter=parsed_args.timer_jitter,
+                                timer_phase_spread=parsed_args.timer_phase_spread,
+                                watchdog_threshold=parsed_args.watchdog_threshold,
+                                watchdog_interval=parsed_args.watchdog_interval,
+                                verify_encode=parsed_args.verify_encode,
+                                codec=parsed_args.codec,
+                                tie_pass_through=parsed_args.tie_pass_through,
+                                immediate_tie_flooding=parsed_args.immediate_tie_flooding)
+
 def main():
     args = parse_command_line_arguments()
     parse_environment_variables(args)
@@ -100,7 +252,8 @@ def main():
                         ipv4_multicast_loopback=ipv4_multicast_loopback(args),
                         ipv6_multicast_loopback=ipv6_multicast_loopback(args),
                         log_level=args.log_level,
-                        config=parsed_config)
+                        config=parsed_config,
+                        options=engine_options(args))
     eng.run()
 
 if __name__ == "__main__":
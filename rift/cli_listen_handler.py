@@ -4,6 +4,8 @@ import cli_session_handler
 
 class CliListenHandler:
 
+    handler_type = "CLI listen"    # For the scheduler histograms
+
     def __init__(self, command_tree, command_handler, log, default_node, port=0):
         self._command_tree = command_tree
         self._command_handler = command_handler
@@ -37,6 +37,8 @@ VT100_ERASE_TO_END_OF_LINE = 75
 
 class CliSessionHandler:
 
+    handler_type = "CLI session"    # For the scheduler histograms
+
     def __init__(self, sock, rx_fd, tx_fd, parse_tree, command_handler, log, node):
         # Socket is None for interactive sessions that use stdin and stdout. For network connections
         # it is something else than None; we never use the socket, but we need to store it anyway
@@ -13,10 +13,15 @@ import cli_session_handler
 import constants
 import interface
 import key
+import msg_queues
+import multi_process
 import node
+import packet_common
 import scheduler
 import stats
 import table
+import timer
+import watchdog
 
 OLD_TERMINAL_SETTINGS = None
 
@@ -39,11 +44,73 @@ def restore_terminal():
         termios.tcsetattr(sys.stdin, termios.TCSADRAIN, OLD_TERMINAL_SETTINGS)
         OLD_TERMINAL_SETTINGS = None
 
+class EngineOptions:
+
+    # The options of the RIFT engine which tune how it runs (scheduler, timers, packet codec,
+    # flooding, watchdog, multi-process mode, virtual clock), as opposed to what it runs (the
+    # configuration). An option which is None keeps the default of the module that implements it.
+
+    def __init__(self, scheduler_type=None, processes=1, virtual_clock=False,
+                 virtual_clock_stop=None, seed=None, read_budget=None, rx_policy=None,
+                 timer_jitter=None, timer_phase_spread=None, watchdog_threshold=None,
+                 watchdog_interval=None, verify_encode=False, codec=None, tie_pass_through=None,
+                 immediate_tie_flooding=None):
+        self.scheduler_type = scheduler_type
+        self.processes = processes
+        self.virtual_clock = virtual_clock
+        self.virtual_clock_stop = virtual_clock_stop
+        self.seed = seed
+        self.read_budget = read_budget
+        self.rx_policy = rx_policy
+        self.timer_jitter = timer_jitter
+        self.timer_phase_spread = timer_phase_spread
+        self.watchdog_threshold = watchdog_threshold
+        self.watchdog_interval = watchdog_interval
+        self.verify_encode = verify_encode
+        self.codec = codec
+        self.tie_pass_through = tie_pass_through
+        self.immediate_tie_flooding = immediate_tie_flooding
+
+    def apply_scheduler_options(self):
+        if self.scheduler_type is not None:
+            scheduler.set_scheduler_type(self.scheduler_type)
+        if self.read_budget is not None:
+            scheduler.SCHEDULER.read_budget = self.read_budget
+        if self.rx_policy is not None:
+            scheduler.SCHEDULER.rx_policy = self.rx_policy
+        if self.timer_jitter is not None:
+            timer.PERIODIC_JITTER = self.timer_jitter
+        if self.timer_phase_spread is not None:
+            timer.PERIODIC_SPREAD_PHASE = self.timer_phase_spread
+
+    def apply_packet_options(self):
+        if self.verify_encode:
+            packet_common.VERIFY_ENCODE = True
+        if self.codec is not None:
+            # Fall back to the pure-Python codec if the accelerated codec is not available
+            if packet_common.set_codec(self.codec) != self.codec:
+                logging.warning("Codec %s not available, using codec %s instead", self.codec,
+                                packet_common.CODEC)
+        if self.tie_pass_through is not None:
+            packet_common.TIE_PASS_THROUGH = self.tie_pass_through
+        if self.immediate_tie_flooding is not None:
+            msg_queues.IMMEDIATE_TIE_FLOODING = self.immediate_tie_flooding
+
+    def apply_watchdog_options(self):
+        if self.watchdog_threshold is not None:
+            watchdog_interval = self.watchdog_interval
+            if watchdog_interval is None:
+                watchdog_interval = watchdog.DEFAULT_SAMPLE_INTERVAL
+            watchdog.enable(self.watchdog_threshold, watchdog_interval)
+
 class Engine:
 
     def __init__(self, passive_nodes, run_which_nodes, interactive, telnet_port_file,
-                 ipv4_multicast_loopback, ipv6_multicast_loopback, log_level, config):
+                 ipv4_multicast_loopback, ipv6_multicast_loopback, log_level, config,
+                 options=None, node_indexes=None, worker_connection=None):
         # pylint:disable=too-many-statements
+        if options is None:
+            options = EngineOptions()
         log_file_name = "rift.log"  # TODO: Make this configurable
         if "RIFT_TEST_RESULTS_DIR" in os.environ:
             log_file_name = os.environ["RIFT_TEST_RESULTS_DIR"] + "/" + log_file_name
@@ -51,12 +118,46 @@ class Engine:
             filename=log_file_name,
             format='%(asctime)s:%(levelname)s:%(name)s:%(message)s',
             level=log_level)
+        self._config = config
+        # Seed the random number generator first, so that everything that is random (e.g. nonces)
+        # is reproducible for a given seed
+        self._seed = options.seed
+        if options.seed is not None:
+            random.seed(options.seed)
+        # In multi-process mode, the nodes run in worker processes. The workers are started before
+        # anything else is created, so that they don't inherit any sockets or timers.
+        self._workers = []
+        if options.processes > 1 and self.nr_nodes() > 1:
+            worker_kwargs = {
+                'passive_nodes': passive_nodes,
+                'run_which_nodes': run_which_nodes,
+                'interactive': False,
+                'telnet_port_file': None,
+                'ipv4_multicast_loopback': ipv4_multicast_loopback,
+                'ipv6_multicast_loopback': ipv6_multicast_loopback,
+                'log_level': log_level,
+                'config': config,
+                'options': options
+            }
+            self._workers = multi_process.start_workers(Engine, worker_kwargs, config,
+                                                        options.processes)
+        options.apply_scheduler_options()
+        options.apply_packet_options()
+        if options.virtual_clock:
+            # The virtual clock is not supported in multi-process mode (each process would have its
+            # own clock) nor with the asyncio scheduler (the event loop has its own clock)
+            assert not self._workers
+            assert scheduler.SCHEDULER.TYPE != scheduler.AsyncioScheduler.TYPE
+            timer.enable_virtual_clock(options.virtual_clock_stop)
+        # The watchdog thread is only started after the worker processes have been forked
+        options.apply_watchdog_options()
         self._run_which_nodes = run_which_nodes
         self._interactive = interactive
         self._telnet_port_file = telnet_port_file
         self.ipv4_multicast_loopback = ipv4_multicast_loopback
         self.ipv6_multicast_loopback = ipv6_multicast_loopback
-        self._config = config
+        self._node_indexes = node_indexes
+        self._next_node_index = 0
         if self.nr_nodes() > 1:
             self._stand_alone = False
             self.simulated_interfaces = True
@@ -83,26 +184,40 @@ class Engine:
         self.keys = {}    # Indexed by key-id
         self.keys[0] = key.Key(key_id=0, algorithm="null", secret="")
         self._nodes = sortedcontainers.SortedDict()
-        self.create_configuration(passive_nodes)
+        if self._workers:
+            for worker in self._workers:
+                for node_name in worker.node_names:
+                    self._nodes[node_name] = multi_process.RemoteNode(node_name, worker)
+            parse_tree = multi_process.forwarding_parse_tree(
+                self.parse_tree, self.parent_process_commands, self.all_workers_commands)
+        else:
+            self.create_configuration(passive_nodes)
+            parse_tree = self.parse_tree
         cli_log = logging.getLogger('cli')
         if self._nodes:
             first_node = self._nodes.peekitem(0)[1]
         else:
             first_node = None
-        if self._interactive:
+        if worker_connection is not None:
+            # Worker process in multi-process mode: the CLI runs in the parent process
+            self._cli_listen_handler = None
+            self._interactive_cli_session_handler = None
+            self._worker_handler = multi_process.WorkerHandler(worker_connection, self,
+                                                               self._nodes)
+        elif self._interactive:
             make_terminal_unbuffered()
             self._cli_listen_handler = None
             self._interactive_cli_session_handler = cli_session_handler.CliSessionHandler(
                 sock=None,
                 rx_fd=sys.stdin.fileno(),
                 tx_fd=sys.stdout.fileno(),
-                parse_tree=self.parse_tree,
+                parse_tree=parse_tree,
                 command_handler=self,
                 log=cli_log,
                 node=first_node)
         else:
             self._cli_listen_handler = cli_listen_handler.CliListenHandler(
-                command_tree=self.parse_tree,
+                command_tree=parse_tree,
                 command_handler=self,
                 log=cli_log,
                 default_node=first_node)
@@ -182,6 +297,13 @@ class Engine:
     def create_shard(self, shard_config, passive_nodes):
         if 'nodes' in shard_config:
             for node_config in shard_config['nodes']:
+                node_index = self._next_node_index
+                self._next_node_index += 1
+                if self._node_indexes is not None and node_index not in self._node_indexes:
+                    # The node runs in another worker process. Skip its node number anyway, so that
+                    # generated node names are the same in every process.
+                    node.Node.skip_node_nr()
+                    continue
                 if 'name' in node_config:
                     force_passive = node_config['name'] in passive_nodes
                 else:
@@ -195,6 +317,13 @@ class Engine:
     def run(self):
         scheduler.SCHEDULER.run()
 
+    async def run_async(self):
+        # Run the engine in an already running asyncio event loop, e.g. next to other asyncio
+        # services. Requires the asyncio scheduler type, and the engine must have been created from
+        # within that same event loop.
+        assert scheduler.SCHEDULER.TYPE == scheduler.AsyncioScheduler.TYPE
+        await scheduler.SCHEDULER.run_async()
+
     def command_clear_engine_stats(self, _cli_session):
         self.intf_traffic_stats_group.clear()
         self.intf_security_stats_group.clear()
@@ -207,6 +336,14 @@ class Engine:
         scheduler.SCHEDULER.max_expired_timers_proc_time = 0.0
         scheduler.SCHEDULER.max_select_proc_time = 0.0
         scheduler.SCHEDULER.max_ready_to_read_proc_time = 0.0
+        scheduler.SCHEDULER.clear_latency_stats()
+
+    def command_clear_engine_latency(self, _cli_session):
+        scheduler.SCHEDULER.clear_histograms()
+
+    def command_clear_engine_watchdog(self, _cli_session):
+        if watchdog.WATCHDOG is not None:
+            watchdog.WATCHDOG.clear()
 
     def command_clear_intf_stats(self, cli_session, parameters):
         cli_session.current_node.command_clear_intf_stats(cli_session, parameters)
@@ -229,6 +366,23 @@ class Engine:
         tab.add_row(["Flooding Reduction Redundancy", self.floodred_redundancy])
         tab.add_row(["Flooding Reduction Similarity", self.floodred_similarity])
         tab.add_row(["Flooding Reduction System Random", self.floodred_system_random])
+        tab.add_row(["Scheduler", scheduler.SCHEDULER.TYPE])
+        tab.add_row(["Receive Read Budget", scheduler.SCHEDULER.read_budget])
+        tab.add_row(["Receive Policy", scheduler.SCHEDULER.rx_policy])
+        tab.add_row(["Periodic Timer Jitter", timer.PERIODIC_JITTER])
+        tab.add_row(["Periodic Timer Phase Spread", timer.PERIODIC_SPREAD_PHASE])
+        tab.add_row(["Packet Codec", packet_common.CODEC])
+        tab.add_row(["TIE Pass Through", packet_common.TIE_PASS_THROUGH])
+        tab.add_row(["Immediate TIE Flooding", msg_queues.IMMEDIATE_TIE_FLOODING])
+        tab.add_row(["Verify Encode", packet_common.VERIFY_ENCODE])
+        tab.add_row(["Random Seed", self._seed])
+        virtual_clock = timer.TIMER_SCHEDULER.virtual_clock_enabled()
+        tab.add_row(["Virtual Clock", virtual_clock])
+        if virtual_clock:
+            tab.add_row(["Virtual Clock Elapsed Time",
+                         "{:06f}".format(timer.TIMER_SCHEDULER.virtual_clock_elapsed_secs())])
+            tab.add_row(["Virtual Clock Stop Time",
+                         timer.TIMER_SCHEDULER.virtual_clock_stop_secs()])
         tab.add_row(["Timer slips > 10ms", scheduler.SCHEDULER.slip_count_10ms])
         tab.add_row(["Timer slips > 100ms", scheduler.SCHEDULER.slip_count_100ms])
         tab.add_row(["Timer slips > 1000ms", scheduler.SCHEDULER.slip_count_1000ms])
@@ -242,6 +396,59 @@ class Engine:
                      "{:06f}".format(scheduler.SCHEDULER.max_ready_to_read_proc_time)])
         cli_session.print(tab.to_string())
 
+    def command_show_engine_latency(self, cli_session):
+        cli_session.print("Scheduler Loop Phases:")
+        tab = stats.histograms_table("Phase", scheduler.SCHEDULER.phase_histograms.items())
+        cli_session.print(tab.to_string())
+        cli_session.print("Ready To Read Handlers:")
+        tab = stats.histograms_table(["Handler", "Type"],
+                                     sorted(scheduler.SCHEDULER.handler_histograms.items()))
+        cli_session.print(tab.to_string())
+        cli_session.print("Timer Expire Functions:")
+        tab = stats.histograms_table("Timer",
+                                     sorted(timer.TIMER_SCHEDULER.expire_histograms.items()))
+        cli_session.print(tab.to_string())
+        cli_session.print("Work Within Each Second:")
+        tab = table.Table()
+        tab.add_row([["Offset", "(secs)"], ["Work", "(secs)"], ["Share", "(%)"]])
+        work_by_slot = scheduler.SCHEDULER.work_by_slot
+        total_work = sum(work_by_slot)
+        nr_slots = len(work_by_slot)
+        for (slot, work) in enumerate(work_by_slot):
+            share = 100.0 * work / total_work if total_work > 0.0 else 0.0
+            tab.add_row(["{:.1f}-{:.1f}".format(slot / nr_slots, (slot + 1) / nr_slots),
+                         "{:06f}".format(work),
+                         "{:.1f}".format(share)])
+        cli_session.print(tab.to_string())
+        cli_session.print("Work Per Window:")
+        window_name = "{:g}ms".format(1000.0 / nr_slots)
+        tab = stats.histograms_table("Window",
+                                     [(window_name, scheduler.SCHEDULER.work_window_histogram)])
+        cli_session.print(tab.to_string())
+
+    def command_show_engine_watchdog(self, cli_session):
+        dog = watchdog.WATCHDOG
+        tab = table.Table(separators=False)
+        tab.add_row(["Watchdog Enabled", dog is not None])
+        if dog is not None:
+            tab.add_row(["Threshold", "{:06f}".format(dog.threshold_secs)])
+            tab.add_row(["Sample Interval", "{:06f}".format(dog.sample_interval_secs)])
+            tab.add_row(["Samples", dog.nr_samples()])
+        cli_session.print(tab.to_string())
+        if dog is not None:
+            cli_session.print("Callbacks Longer Than Threshold:")
+            tab = stats.histograms_table("Callback", sorted(dog.long_callback_histograms.items()))
+            cli_session.print(tab.to_string())
+
+    def command_show_engine_wd_stacks(self, cli_session):
+        # One line per distinct stack in collapsed stack format (input for flamegraph tools)
+        dog = watchdog.WATCHDOG
+        if dog is None:
+            cli_session.print("Watchdog is not enabled")
+            return
+        for line in dog.collapsed_stacks():
+            cli_session.print(line)
+
     def command_show_engine_stats(self, cli_session, exclude_zero=False):
         cli_session.print("All Node ZTP FSMs:")
         tab = self.node_ztp_fsm_stats_group.table(exclude_zero)
@@ -255,6 +462,14 @@ class Engine:
         cli_session.print("All Interface LIE FSMs:")
         tab = self.intf_lie_fsm_stats_group.table(exclude_zero)
         cli_session.print(tab.to_string())
+        cli_session.print("Event Loop Latency:")
+        tab = table.Table()
+        tab.add_row(["Description", "Value"])
+        tab.add_row(["Samples", scheduler.SCHEDULER.latency_samples])
+        tab.add_row(["Average latency",
+                     "{:06f}".format(scheduler.SCHEDULER.latency_average())])
+        tab.add_row(["Maximum latency", "{:06f}".format(scheduler.SCHEDULER.latency_max)])
+        cli_session.print(tab.to_string())
 
     def command_show_eng_stats_ex_zero(self, cli_session):
         self.command_show_engine_stats(cli_session, True)
@@ -420,6 +635,20 @@ class Engine:
         cli_session.current_node.fsm.push_event(node.Node.Event.CHANGE_LOCAL_CONFIGURED_LEVEL,
                                                 level_symbol)
 
+    def forward_command(self, cli_session, function_name, parameters, all_workers):
+        # Multi-process mode: execute a command in the worker process that runs the current node, or
+        # in all worker processes
+        if all_workers:
+            for worker in self._workers:
+                cli_session.print("{}:".format(worker.description()))
+                output = worker.execute_command(None, function_name, parameters)
+                cli_session.print(output, add_newline=False)
+        else:
+            current_node = cli_session.current_node
+            output = current_node.worker.execute_command(current_node.name, function_name,
+                                                         parameters)
+            cli_session.print(output, add_newline=False)
+
     def command_exit(self, cli_session):
         cli_session.close()
 
@@ -433,7 +662,9 @@ class Engine:
     parse_tree = {
         "clear": {
             "engine": {
-                "statistics": command_clear_engine_stats
+                "latency": command_clear_engine_latency,
+                "statistics": command_clear_engine_stats,
+                "watchdog": command_clear_engine_watchdog
             },
             "$interface": {
                 "statistics": command_clear_intf_stats
@@ -456,9 +687,14 @@ class Engine:
             "disaggregation": command_show_disaggregation,
             "engine": {
                 "": command_show_engine,
+                "latency": command_show_engine_latency,
                 "statistics": {
                     "": command_show_engine_stats,
                     "exclude-zero": command_show_eng_stats_ex_zero
+                },
+                "watchdog": {
+                    "": command_show_engine_watchdog,
+                    "stacks": command_show_engine_wd_stacks
                 }
             },
             "flooding-reduction": command_show_flooding_reduction,
@@ -545,6 +781,33 @@ class Engine:
         "stop": command_stop,
     }
 
+    # In multi-process mode, the parent process executes these commands itself (the nodes in
+    # self._nodes are multi_process.RemoteNode objects)...
+    parent_process_commands = [
+        command_exit,
+        command_help,
+        command_set_node,
+        command_show_lie_fsm,
+        command_show_nodes,
+        command_show_nodes_level,
+        command_show_ztp_fsm,
+        command_stop
+    ]
+
+    # ... it executes these engine-wide commands in every worker process, and it executes all
+    # other commands in the worker process that runs the current node.
+    all_workers_commands = [
+        command_clear_engine_latency,
+        command_clear_engine_stats,
+        command_clear_engine_watchdog,
+        command_show_engine,
+        command_show_engine_latency,
+        command_show_engine_stats,
+        command_show_eng_stats_ex_zero,
+        command_show_engine_watchdog,
+        command_show_engine_wd_stacks
+    ]
+
     @property
     def active_nodes(self):
         return self._run_which_nodes
@@ -1,4 +1,5 @@
 import collections
+import logging
 import time
 
 import sortedcontainers
@@ -45,6 +46,48 @@ class FsmDefinition:
             self.verbose_events = []
         else:
             self.verbose_events = verbose_events
+        self._compile()
+
+    def _compile(self):
+        # Compile the transitions into a dispatch table that has an entry for every (state, event)
+        # combination, including the implicit transitions, so that processing an event takes two
+        # dictionary lookups and nothing needs to be parsed or formatted at run-time. From-state
+        # None is used for events that are processed before the FSM is started, and the start
+        # itself is a transition from state None for event None.
+        self._state_indexes = {state: index for (index, state) in enumerate(self.state_enum)}
+        self._event_indexes = {event: index for (index, event) in enumerate(self.event_enum)}
+        # The last index is used for state None and for event None respectively
+        self.nr_state_indexes = len(self._state_indexes) + 1
+        self.nr_event_indexes = len(self._event_indexes) + 1
+        self.dispatch_table = {}
+        for from_state in [None] + list(self.state_enum):
+            from_state_transitions = self.transitions.get(from_state, {})
+            self.dispatch_table[from_state] = {
+                event: _CompiledTransition(self, from_state, event,
+                                           from_state_transitions.get(event))
+                for event in self.event_enum
+            }
+        self.start_transition = _CompiledTransition(self, None, None, (self.initial_state, []))
+
+    def state_index(self, state):
+        return self._state_indexes.get(state, self.nr_state_indexes - 1)
+
+    def event_index(self, event):
+        return self._event_indexes.get(event, self.nr_event_indexes - 1)
+
+    def state_entry_actions(self, state):
+        # Returns a tuple of actions and a tuple of the corresponding names
+        if state in self.state_actions:
+            (entry_actions, _) = self.state_actions[state]
+            return (tuple(entry_actions), tuple(map(_action_to_name, entry_actions)))
+        return ((), ())
+
+    def state_exit_actions(self, state):
+        # Returns a tuple of actions and a tuple of the corresponding names
+        if state in self.state_actions:
+            (_, exit_actions) = self.state_actions[state]
+            return (tuple(exit_actions), tuple(map(_action_to_name, exit_actions)))
+        return ((), ())
 
     @staticmethod
     def parse_transition(transition):
@@ -164,24 +207,92 @@ class FsmDefinition:
         tab = self.state_actions_table()
         cli_session.print(tab.to_string())
 
+class _CompiledTransition:
+
+    # An entry in the dispatch table of a compiled FSM definition: everything that is needed to
+    # process a particular event in a particular state, determined once when the definition is
+    # created rather than for every event (the transition itself, the state exit and entry actions,
+    # the names to be recorded in the history, and the indexes of the counters to be increased).
+
+    __slots__ = ['event', 'event_index', 'verbose', 'implicit', 'to_state', 'actions',
+                 'action_names', 'push_events', 'state_change', 'from_state_index',
+                 'to_state_index', 'exit_actions', 'exit_action_names', 'entry_actions',
+                 'entry_action_names', 'transition_index', 'transition_description',
+                 'event_transition_index', 'event_transition_description']
+
+    def __init__(self, definition, from_state, event, transition):
+        # Event None and from-state None are used for starting the FSM
+        self.event = event
+        self.event_index = definition.event_index(event)
+        self.verbose = (event in definition.verbose_events)
+        self.implicit = (transition is None)
+        if transition is None:
+            (to_state, actions, push_events) = (None, [], [])
+        else:
+            (to_state, actions, push_events) = FsmDefinition.parse_transition(transition)
+        self.to_state = to_state
+        self.actions = tuple(actions)
+        self.action_names = tuple(map(_action_to_name, actions))
+        self.push_events = tuple(push_events)
+        self.state_change = (to_state is not None and to_state != from_state)
+        self.from_state_index = definition.state_index(from_state)
+        if to_state is None:
+            counted_to_state = from_state
+        else:
+            counted_to_state = to_state
+        self.to_state_index = definition.state_index(counted_to_state)
+        if from_state is None:
+            (self.exit_actions, self.exit_action_names) = ((), ())
+        else:
+            (self.exit_actions, self.exit_action_names) = definition.state_exit_actions(from_state)
+        if to_state is None:
+            (self.entry_actions, self.entry_action_names) = ((), ())
+        else:
+            (self.entry_actions, self.entry_action_names) = definition.state_entry_actions(to_state)
+        self.transition_index = (self.from_state_index * definition.nr_state_indexes +
+                                 self.to_state_index)
+        self.transition_description = "Transitions {} -> {}".format(
+            _state_to_name(from_state), _state_to_name(counted_to_state))
+        self.event_transition_index = (self.from_state_index * definition.nr_event_indexes +
+                                       self.event_index)
+        self.event_transition_description = "Event-Transitions {} -[{}]-> {}".format(
+            _state_to_name(from_state), _event_to_name(event), _state_to_name(counted_to_state))
+
 class FsmRecord:
 
+    # Records of verbose events are reused (see Fsm.new_record), hence no constructor arguments. A
+    # record that has not been used yet is marked as verbose, so that it can be reused.
+
+    __slots__ = ['seq_nr', 'time', 'queue_time', 'processing_time', 'skipped', 'from_state',
+                 'event', 'verbose', 'actions_and_pushed_events', 'to_state', 'implicit']
+
     _next_seq_nr = 1
 
-    def __init__(self, fsm, from_state, event, verbose, queue_time):
-        self.fsm = fsm
+    def __init__(self):
+        self.seq_nr = None
+        self.time = None
+        self.queue_time = None
+        self.processing_time = None
+        self.skipped = 0
+        self.from_state = None
+        self.event = None
+        self.verbose = True
+        self.actions_and_pushed_events = []
+        self.to_state = None
+        self.implicit = False
+
+    def reset(self, from_state, transition, queue_time, now):
         self.seq_nr = FsmRecord._next_seq_nr
         FsmRecord._next_seq_nr += 1
-        self.time = time.monotonic()
+        self.time = now
         self.queue_time = queue_time
         self.processing_time = None
         self.skipped = 0
         self.from_state = from_state
-        self.event = event
-        self.verbose = verbose
-        self.actions_and_pushed_events = []
+        self.event = transition.event
+        self.verbose = transition.verbose
         self.to_state = None
-        self.implicit = False
+        self.implicit = transition.implicit
 
     def log_str(self):
         log_msg = ("FSM transition sequence-nr={} from-state={} event={} "
@@ -213,47 +324,62 @@ class Fsm:
             else:
                 self._log.info("[%s] %s" % (self._log_id, msg), *args)
 
+    def will_log(self, debug):
+        if not self._log:
+            return False
+        if debug:
+            return self._log.isEnabledFor(logging.DEBUG)
+        return self._log.isEnabledFor(logging.INFO)
+
     def __init__(self, definition, action_handler, log, log_id, sum_stats_group=None):
         self._definition = definition
         self._log = log
         self._log_id = log_id
-        self._state_enum = definition.state_enum
-        self._event_enum = definition.event_enum
-        self._transitions = definition.transitions
-        self._state_actions = definition.state_actions
+        self._dispatch_table = definition.dispatch_table
         self._verbose_events = definition.verbose_events
         self._state = None
-        self._last_state_change_time = time.time()
+        self._last_state_change_time = stats.TIME_FUNCTION()
         self._action_handler = action_handler
+        # The non-verbose records, most recent first
         self._records = collections.deque([], _MAX_RECORDS)
-        self._verbose_records = collections.deque([], _MAX_RECORDS)
+        # The most recent records, both verbose and non-verbose, in a ring. Slots that contain a
+        # verbose record are overwritten in place.
+        self._record_ring = []
+        self._record_ring_next = 0
         self._current_record = None
         self._verbose_records_skipped = 0
         self._stats_group = stats.Group(sum_stats_group)
-        self._event_counters = {}
-        self._init_event_counters()             # Indexed by event
-        self._state_entry_counters = {}         # Indexed by state
-        self._state_exit_counters = {}          # Indexed by state
-        self._transition_counters = {}          # Indexed by (from_state, to_state)
-        self._event_transition_counters = {}    # Indexed by (from_state, event, to_state)
+        # The counters are indexed by the state and event indexes of the FSM definition. Except for
+        # the event counters, they are created on the fly the first time they are needed, to avoid
+        # having N^2 counters where N is the number of states.
+        self._event_counters = []
+        self._init_event_counters()
+        nr_state_indexes = definition.nr_state_indexes
+        nr_event_indexes = definition.nr_event_indexes
+        self._state_entry_counters = [None] * nr_state_indexes
+        self._state_exit_counters = [None] * nr_state_indexes
+        self._transition_counters = [None] * (nr_state_indexes * nr_state_indexes)
+        self._event_transition_counters = [None] * (nr_state_indexes * nr_event_indexes)
         self.info("Create FSM")
 
     def _init_event_counters(self):
-        for event in self._event_enum:
+        for event in self._definition.event_enum:
             counter = stats.Counter(self._stats_group, "Events " + _event_to_name(event), "Event")
-            self._event_counters[event] = counter
+            self._event_counters.append(counter)
 
     def start(self):
-        self._state = self._definition.initial_state
-        self._last_state_change_time = time.time()
-        self.info("Start FSM, state=%s", self._state.name)
         # Record start state and start state entry actions as from-state=None, and event=None
-        self._current_record = FsmRecord(self, None, None, False, 0.0)
+        transition = self._definition.start_transition
+        self._state = transition.to_state
+        self._last_state_change_time = stats.TIME_FUNCTION()
+        self.info("Start FSM, state=%s", self._state.name)
         start_time = time.monotonic()
-        self._current_record.to_state = self._state
-        self.state_entry_actions_and_counter(self._state)
-        self._current_record.processing_time = time.monotonic() - start_time
-        self.store_current_record()
+        record = self.new_record(None, transition, 0.0, start_time)
+        self._current_record = record
+        record.to_state = self._state
+        self.enter_state(transition)
+        record.processing_time = time.monotonic() - start_time
+        self.store_current_record(transition)
 
     def push_event(self, event, event_data=None):
         fsm = self
@@ -268,8 +394,10 @@ class Fsm:
         else:
             # Normal (external) event
             self._event_queue.append(event_tuple)
-            verbose = (event in self._verbose_events)
-            self.info_or_debug(verbose, "FSM push event, event=%s", event.name)
+            if self._log:
+                verbose = (event in self._verbose_events)
+                if self.will_log(verbose):
+                    self.info_or_debug(verbose, "FSM push event, event=%s", event.name)
 
     @staticmethod
     def events_pending():
@@ -290,105 +418,110 @@ class Fsm:
             schedule_time = event_tuple[3]
             fsm.process_event(event, event_data, schedule_time)
 
-    def invoke_actions(self, actions, event_data=None):
-        for action in actions:
-            if self._current_record:
-                self._current_record.actions_and_pushed_events.append(_action_to_name(action))
+    def invoke_actions(self, actions, action_names, event_data=None):
+        recorded_names = self._current_record.actions_and_pushed_events
+        for (action, action_name) in zip(actions, action_names):
+            recorded_names.append(action_name)
             if event_data:
                 action(self._action_handler, event_data)
             else:
                 action(self._action_handler)
 
-    def state_entry_actions_and_counter(self, state):
-        # Update state entry counter
-        if state not in self._state_entry_counters:
-            description = "Enter {}".format(_state_to_name(state))
-            self._state_entry_counters[state] = stats.Counter(self._stats_group, description,
-                                                              "Entry", "Entries")
-        self._state_entry_counters[state].increase()
-        # Invoke the state entry actions
-        if state in self._state_actions:
-            (state_entry_actions, _) = self._state_actions[state]
-            self.invoke_actions(state_entry_actions)
-
-    def state_exit_actions_and_counter(self, state):
-        # Update state exit counter
-        if state not in self._state_exit_counters:
-            description = "Exit {}".format(_state_to_name(state))
-            self._state_exit_counters[state] = stats.Counter(self._stats_group, description, "Exit")
-        self._state_exit_counters[state].increase()
-        # Invoke the state exit actions
-        if state in self._state_actions:
-            (_, state_exit_actions) = self._state_actions[state]
-            self.invoke_actions(state_exit_actions)
-
-    def store_current_record(self):
+    def enter_state(self, transition):
+        # Update state entry counter and invoke the state entry actions of the to-state
+        counter = self._state_entry_counters[transition.to_state_index]
+        if counter is None:
+            description = "Enter {}".format(_state_to_name(transition.to_state))
+            counter = stats.Counter(self._stats_group, description, "Entry", "Entries")
+            self._state_entry_counters[transition.to_state_index] = counter
+        counter.increase()
+        self.invoke_actions(transition.entry_actions, transition.entry_action_names)
+
+    def exit_state(self, transition):
+        # Update state exit counter and invoke the state exit actions of the from-state
+        counter = self._state_exit_counters[transition.from_state_index]
+        if counter is None:
+            description = "Exit {}".format(_state_to_name(self._state))
+            counter = stats.Counter(self._stats_group, description, "Exit")
+            self._state_exit_counters[transition.from_state_index] = counter
+        counter.increase()
+        self.invoke_actions(transition.exit_actions, transition.exit_action_names)
+
+    def new_record(self, from_state, transition, queue_time, now):
+        # Take the next slot in the record ring. The record in the slot is reused if it is verbose.
+        # Non-verbose records are also in the non-verbose history, so they must not be overwritten
+        # and a new record is allocated instead.
+        ring = self._record_ring
+        index = self._record_ring_next
+        if index < len(ring):
+            record = ring[index]
+            if record.verbose:
+                record.actions_and_pushed_events.clear()
+            else:
+                record = FsmRecord()
+                ring[index] = record
+        else:
+            record = FsmRecord()
+            ring.append(record)
+        self._record_ring_next = (index + 1) % _MAX_RECORDS
+        record.reset(from_state, transition, queue_time, now)
+        return record
+
+    def verbose_records(self):
+        # All recent records, most recent first
+        ring = self._record_ring
+        nr_records = len(ring)
+        newest = self._record_ring_next - 1
+        return [ring[(newest - offset) % nr_records] for offset in range(nr_records)]
+
+    def store_current_record(self, transition):
         record = self._current_record
         assert record is not None
-        self._verbose_records.appendleft(record)
         if record.verbose:
             self._verbose_records_skipped += 1
         else:
             record.skipped = self._verbose_records_skipped
             self._verbose_records_skipped = 0
             self._records.appendleft(record)
-        # TODO check for will log before calling log_str
-        self.info_or_debug(record.verbose, record.log_str())
-        # Also count the transition for statistics. We create a counter on the fly the first time
-        # a particular transition (from-state, to-state) has been seen to avoid have N^2 counters
-        # where N is the number of states.
-        to_state = record.to_state
-        if to_state is None:
-            to_state = record.from_state
-        pair = (record.from_state, to_state)
-        if pair not in self._transition_counters:
-            description = "Transitions {} -> {}".format(_state_to_name(record.from_state),
-                                                        _state_to_name(to_state))
-            self._transition_counters[pair] = stats.Counter(self._stats_group,
-                                                            description,
-                                                            "Transition")
-        self._transition_counters[pair].increase()
-        triple = (record.from_state, record.event, to_state)
-        if triple not in self._event_transition_counters:
-            description = ("Event-Transitions {} -[{}]-> {}"
-                           .format(_state_to_name(record.from_state),
-                                   _event_to_name(record.event),
-                                   _state_to_name(to_state)))
-            self._event_transition_counters[triple] = stats.Counter(self._stats_group,
-                                                                    description,
-                                                                    "Transition")
-        self._event_transition_counters[triple].increase()
+        if self.will_log(record.verbose):
+            self.info_or_debug(record.verbose, record.log_str())
+        # Also count the transition (from-state, to-state) and the event-transition (from-state,
+        # event, to-state) for statistics
+        counter = self._transition_counters[transition.transition_index]
+        if counter is None:
+            counter = stats.Counter(self._stats_group, transition.transition_description,
+                                    "Transition")
+            self._transition_counters[transition.transition_index] = counter
+        counter.increase()
+        counter = self._event_transition_counters[transition.event_transition_index]
+        if counter is None:
+            counter = stats.Counter(self._stats_group, transition.event_transition_description,
+                                    "Transition")
+            self._event_transition_counters[transition.event_transition_index] = counter
+        counter.increase()
         self._current_record = None
 
     def process_event(self, event, event_data, schedule_time):
         assert self._current_record is None
-        self._event_counters[event].increase()
         from_state = self._state
-        verbose = (event in self._verbose_events)
-        queue_time = time.monotonic() - schedule_time
-        self._current_record = FsmRecord(self, from_state, event, verbose, queue_time)
+        transition = self._dispatch_table[from_state][event]
+        self._event_counters[transition.event_index].increase()
         start_time = time.monotonic()
-        if from_state in self._transitions:
-            from_state_transitions = self._transitions[from_state]
-        else:
-            from_state_transitions = []
-        if event in from_state_transitions:
-            transition = from_state_transitions[event]
-            (to_state, actions, push_events) = FsmDefinition.parse_transition(transition)
-            self.invoke_actions(actions, event_data)
-            for push_event in push_events:
+        record = self.new_record(from_state, transition, start_time - schedule_time, start_time)
+        self._current_record = record
+        if not transition.implicit:
+            self.invoke_actions(transition.actions, transition.action_names, event_data)
+            for push_event in transition.push_events:
                 self.push_event(push_event, None)
-            if to_state is not None:
-                self._current_record.to_state = to_state
-                if to_state != self._state:
-                    self.state_exit_actions_and_counter(self._state)
-                    self._state = to_state
-                    self._last_state_change_time = time.time()
-                    self.state_entry_actions_and_counter(to_state)
-        else:
-            self._current_record.implicit = True
-        self._current_record.processing_time = time.monotonic() - start_time
-        self.store_current_record()
+            if transition.to_state is not None:
+                record.to_state = transition.to_state
+                if transition.state_change:
+                    self.exit_state(transition)
+                    self._state = transition.to_state
+                    self._last_state_change_time = stats.TIME_FUNCTION()
+                    self.enter_state(transition)
+        record.processing_time = time.monotonic() - start_time
+        self.store_current_record(transition)
 
     def history_table(self, verbose):
         tab = table.Table()
@@ -406,7 +539,7 @@ class Fsm:
                     ["Implicit"]])
         tab.add_row(row)
         if verbose:
-            records_to_show = self._verbose_records
+            records_to_show = self.verbose_records()
         else:
             records_to_show = self._records
         if not records_to_show:
@@ -447,17 +580,19 @@ class Fsm:
         return self._state
 
     def number_of_state_entries(self, state):
-        if state in self._state_entry_counters:
-            return self._state_entry_counters[state].value()
+        counter = self._state_entry_counters[self._definition.state_index(state)]
+        if counter is not None:
+            return counter.value()
         else:
             return 0
 
     def number_of_state_exits(self, state):
-        if state in self._state_exit_counters:
-            return self._state_exit_counters[state].value()
+        counter = self._state_exit_counters[self._definition.state_index(state)]
+        if counter is not None:
+            return counter.value()
         else:
             return 0
 
     def time_in_current_state_str(self):
-        secs_in_current_state = time.time() - self._last_state_change_time
+        secs_in_current_state = stats.TIME_FUNCTION() - self._last_state_change_time
         return utils.secs_to_dmhs_str(secs_in_current_state)
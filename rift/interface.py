@@ -15,8 +15,10 @@ import msg_queues
 import neighbor_lie
 import offer
 import packet_common
+import scheduler
 import stats
 import table
+import tide_ranges
 import timer
 import udp_rx_handler
 import utils
@@ -169,7 +171,9 @@ class Interface:
             remote_address="0.0.0.0",
             receive_function=self.receive_flood_message,
             log=self._rx_log,
-            log_id=self._log_id)
+            log_id=self._log_id,
+            handler_type="Flood",
+            backlog_counter=self._rx_flood_backlog_counter)
         self.rx_info("Start IPv6 flooding: receive on port %d", rx_flood_port)
         self._flood_rx_ipv6_handler = udp_rx_handler.UdpRxHandler(
             interface_name=self.physical_interface_name,
@@ -179,7 +183,11 @@ class Interface:
             remote_address="::",
             receive_function=self.receive_flood_message,
             log=self._rx_log,
-            log_id=self._log_id)
+            log_id=self._log_id,
+            handler_type="Flood",
+            backlog_counter=self._rx_flood_backlog_counter)
+        # The adjacencies changed; see Node.forget_flood_scope_decisions
+        self.node.forget_flood_scope_decisions()
         # Update the node TIEs originated by this node to include this neighbor
         self.node.regenerate_my_node_ties()
         # Update the south prefix TIE: we may have to start or stop originating a default route
@@ -205,6 +213,8 @@ class Interface:
         if self._flood_tx_ipv6_socket:
             self._flood_tx_ipv6_socket.close()
             self._flood_tx_ipv6_socket = None
+        self.node.forget_received_tide_end(self.name)
+        self.node.forget_flood_scope_decisions()
         # Update the node TIEs originated by this node to exclude this neighbor. We have to pass
         # interface_going_down to regenerate_my_node_ties because the state of this interface is
         # still THREE_WAY at this point.
@@ -651,6 +661,13 @@ class Interface:
             self.bump_family_counter(sock, self._tx_ipv4_tire_counter, self._tx_ipv6_tire_counter,
                                      nr_bytes)
 
+    def bump_tx_tide_range_counter(self, packet_info, regenerated):
+        nr_bytes = len(packet_info.encoded_protocol_packet)
+        if regenerated:
+            self._tx_tide_regenerated_counter.add([1, nr_bytes])
+        else:
+            self._tx_tide_reused_counter.add([1, nr_bytes])
+
     def bump_rx_counters(self, protocol_packet, sock, nr_bytes):
         if protocol_packet.content.lie:
             self.bump_family_counter(sock, self._rx_ipv4_lie_counter, self._rx_ipv6_lie_counter,
@@ -886,7 +903,10 @@ class Interface:
         self._rx_log.error("[%s] %s" % (self._log_id, msg), *args)
 
     def tx_debug(self, msg, *args):
-        self._tx_log.debug("[%s] %s" % (self._log_id, msg), *args)
+        # Transmit decisions are logged at a high rate; don't format the message unless it is
+        # actually going to be logged
+        if self._tx_log.isEnabledFor(logging.DEBUG):
+            self._tx_log.debug("[%s] %s" % (self._log_id, msg), *args)
 
     def tx_warning(self, msg, *args):
         self._tx_log.warning("[%s] %s" % (self._log_id, msg), *args)
@@ -958,6 +978,8 @@ class Interface:
         self._fsm_log = self._log.getChild("fsm")
         self.local_id = parent_node.allocate_interface_id()
         self._mtu = self.get_mtu()
+        self.tide_ranges = tide_ranges.TIDERanges(self._mtu, self.node.MIN_TIE_ID,
+                                                  self.node.MAX_TIE_ID)
         self._pod = self.UNDEFINED_OR_ANY_POD
         self.neighbor_lie = None
         self._next_tx_packet_nr = {}    # Indexed (address-family, packet-type)
@@ -1037,6 +1059,10 @@ class Interface:
         self._rx_tide_counter = stats.MultiCounter(
             None, "Total RX TIDE Packets", pab,
             sum_counters=[self._rx_flooding_counter])
+        self._tx_tide_regenerated_counter = stats.MultiCounter(
+            stg, "TX TIDE Packets Regenerated", pab)
+        self._tx_tide_reused_counter = stats.MultiCounter(
+            stg, "TX TIDE Packets Reused", pab)
         self._tx_tie_counter = stats.MultiCounter(
             None, "Total TX TIE Packets", pab,
             sum_counters=[self._tx_flooding_counter])
@@ -1166,6 +1192,10 @@ class Interface:
         self._ipv4_misorders_counter.add_to_group(stg)
         self._ipv6_misorders_counter.add_to_group(stg)
         self._total_misorders_counter.add_to_group(stg)
+        # Counters for the number of times that a receive socket used up its read budget, i.e. that
+        # it may still have had packets waiting after the scheduler read a batch of packets
+        self._rx_lie_backlog_counter = stats.Counter(stg, "RX LIE Backlogs", "Backlog")
+        self._rx_flood_backlog_counter = stats.Counter(stg, "RX Flooding Backlogs", "Backlog")
         # Counters for security errors
         self._security_stats_group = stats.Group(self.node.intf_security_stats_group)
         stg = self._security_stats_group
@@ -1182,6 +1212,11 @@ class Interface:
             stg, "Empty outer fingerprint accepted", pab)
         self._origin_empty_auth_ok_counter = stats.MultiCounter(
             stg, "Empty origin fingerprint accepted", pab)
+        # Counters for the verified TIE cache (see verified_tie_cache)
+        self._origin_cache_hit_counter = stats.MultiCounter(
+            stg, "Origin fingerprint cache hits", pab)
+        self._origin_cache_miss_counter = stats.MultiCounter(
+            stg, "Origin fingerprint cache misses", pab)
 
         self.fsm = fsm.Fsm(
             definition=self.fsm_definition,
@@ -1211,7 +1246,10 @@ class Interface:
             remote_address=None,
             receive_function=self.receive_lie_message,
             log=self._rx_log,
-            log_id=self._log_id)
+            log_id=self._log_id,
+            handler_type="LIE",
+            handler_priority=scheduler.Scheduler.PRIORITY_HIGH,
+            backlog_counter=self._rx_lie_backlog_counter)
         self._lie_rx_ipv6_handler = udp_rx_handler.UdpRxHandler(
             interface_name=self.physical_interface_name,
             local_port=self._rx_lie_port,
@@ -1220,12 +1258,18 @@ class Interface:
             remote_address=None,
             receive_function=self.receive_lie_message,
             log=self._rx_log,
-            log_id=self._log_id)
+            log_id=self._log_id,
+            handler_type="LIE",
+            handler_priority=scheduler.Scheduler.PRIORITY_HIGH,
+            backlog_counter=self._rx_lie_backlog_counter)
         self._flood_rx_ipv4_handler = None
         self._flood_tx_ipv4_socket = None
         self._one_second_timer = timer.Timer(
             1.0,
-            lambda: self.fsm.push_event(self.Event.TIMER_TICK))
+            lambda: self.fsm.push_event(self.Event.TIMER_TICK),
+            name="Interface timer tick",
+            jitter=timer.PERIODIC_JITTER,
+            spread_phase=timer.PERIODIC_SPREAD_PHASE)
 
     def get_config_attribute(self, config, attribute, default):
         if attribute in config:
@@ -1247,7 +1291,8 @@ class Interface:
             active_outer_key=self.active_outer_key,
             accept_outer_keys=self.accept_outer_keys,
             active_origin_key=self.node.active_origin_key,
-            accept_origin_keys=self.node.accept_origin_keys)
+            accept_origin_keys=self.node.accept_origin_keys,
+            verified_tie_cache=self.node.verified_tie_cache)
         if packet_info.error:
             self.log_and_count_error(packet_info, nr_bytes)
             return None
@@ -1303,6 +1348,12 @@ class Interface:
             else:
                 counter = self._origin_auth_ok_counter
             counter.add([1, nr_bytes])
+        if packet_info.origin_fingerprint_cache_hit is not None:
+            if packet_info.origin_fingerprint_cache_hit:
+                counter = self._origin_cache_hit_counter
+            else:
+                counter = self._origin_cache_miss_counter
+            counter.add([1, nr_bytes])
 
     def update_last_rx_lie_nonce_local(self, packet_info):
         if packet_info.protocol_packet and packet_info.protocol_packet.content.lie:
@@ -1425,7 +1476,7 @@ class Interface:
             self.ack_tie(tie_header_lifetime)
 
     def process_rx_tide_packet(self, tide_packet):
-        result = self.node.process_rx_tide_packet(tide_packet)
+        result = self.node.process_rx_tide_packet(tide_packet, self.name)
         (request_tie_headers, start_sending_tie_headers, stop_sending_tie_headers) = result
         for tie_header in start_sending_tie_headers:
             self.try_to_transmit_tie(tie_header)
@@ -1831,16 +1882,16 @@ class Interface:
     def send_tides_table(self):
         tab = table.Table()
         tab.add_row(self.cli_tides_summary_headers())
-        # TODO: Make this code common with Node.send_tides_on_interface (avoid code duplication)
         if self.fsm.state == self.State.THREE_WAY:
-            tide_packet = self.node.generate_tide_packet(
-                neighbor_direction=self.neighbor_direction(),
-                neighbor_system_id=self.neighbor_lie.system_id,
-                neighbor_level=self.neighbor_lie.level,
-                neighbor_is_top_of_fabric=self.neighbor_lie.top_of_fabric(),
-                my_level=self.node.level_value(),
-                i_am_top_of_fabric=self.node.top_of_fabric())
-            tab.add_row(self.cli_tides_summary_attributes(tide_packet))
+            # Show the TIDEs as they were last sent. Updating the ranges here would change the
+            # TIDEs that are sent next.
+            for tide_range in self.tide_ranges.ranges():
+                if tide_range.packet_info is None:
+                    # Not sent yet (e.g. the adjacency just came up)
+                    tide_packet = self.node.make_tide_packet_for_range(tide_range)
+                else:
+                    tide_packet = tide_range.packet_info.protocol_packet.content.tide
+                tab.add_row(self.cli_tides_summary_attributes(tide_packet))
         return tab
 
     @staticmethod
@@ -24,28 +24,27 @@ class Key:
         self.key_id = key_id
         self.algorithm = algorithm
         self.secret = secret
+        # The state of the HMAC or hash after the secret has been processed. It only depends on the
+        # key, so it is computed once; each digest starts from a copy of it.
+        if algorithm == "null":
+            self._initial_state = None
+        elif "hmac" in algorithm:
+            digestmod = ALGORITHM_TO_DIGESTMOD[algorithm]
+            self._initial_state = hmac.new(secret.encode(), digestmod=digestmod)
+        else:
+            digestmod = ALGORITHM_TO_DIGESTMOD[algorithm]
+            self._initial_state = hashlib.new(name=digestmod)
+            self._initial_state.update(secret.encode())
 
     def digest(self, message_parts):
         if self.key_id == 0:
             assert self.algorithm == "null"
             return b''
-        elif "hmac" in self.algorithm:
-            assert self.algorithm in ALGORITHMS
-            digestmod = ALGORITHM_TO_DIGESTMOD[self.algorithm]
-            the_hmac = hmac.new(self.secret.encode(), digestmod=digestmod)
-            for message_part in message_parts:
-                if message_part is not None:
-                    the_hmac.update(message_part)
-            return the_hmac.digest()
-        else:
-            assert self.algorithm in ALGORITHMS
-            digestmod = ALGORITHM_TO_DIGESTMOD[self.algorithm]
-            the_hash = hashlib.new(name=digestmod)
-            the_hash.update(self.secret.encode())
-            for message_part in message_parts:
-                if message_part is not None:
-                    the_hash.update(message_part)
-            return the_hash.digest()
+        state = self._initial_state.copy()
+        for message_part in message_parts:
+            if message_part is not None:
+                state.update(message_part)
+        return state.digest()
 
     def padded_digest(self, message_parts):
         dig = self.digest(message_parts)
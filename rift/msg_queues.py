@@ -1,8 +1,9 @@
-import collections
 import datetime
 import inspect
+import time
 import encoding.ttypes
 import packet_common
+import stats
 import table
 import timer
 
@@ -18,6 +19,12 @@ DEBUG_TIE_DIRECTION = None         # None for all directions, or direction const
 DEBUG_TIE_ORIGINATOR = None        # None for all originators, or system id or originator
 DEBUG_TIE_TYPE = None              # None for all tie types, or tie type constant
 
+# When True, a TIE message is sent as soon as the TIE is put on the transmit queue (or replaced on
+# the queue by a newer version) instead of at the next timer tick; only the retransmissions wait for
+# the timer. TIE requests and TIE acknowledgements still wait for the next tick, so that multiple of
+# them can be packed into a single TIRE message.
+IMMEDIATE_TIE_FLOODING = False
+
 class _MsgQueueBase:
 
     """
@@ -34,11 +41,12 @@ class _MsgQueueBase:
       packing of multiple items into a single message.
     - After that, as long as the item remains in the queue, it is re-transmitted every
       RETRANSMIT_DELAY_TICKS timer ticks after that.
+    - For TIE messages (but not TIRE messages), if IMMEDIATE_TIE_FLOODING is True: send them
+      immediately instead of after a short delay when they are first enqueued (TIREs messages need
+      packing, but TIE messages not).
 
     It may seem like overkill to put all of this in a base class, but it opens up the path to
     potential enhancements in the future, such as:
-    - For TIE messages (but not TIRE messages): send them immediately instead of after a short
-      delay when they are first enqueued (TIREs messages need packing, but TIE messages not).
     - Combine the TIE-request TIRE message and the TIE-ack TIRE message into a single TIRE message.
     - Pacing messages (i.e. avoiding large bursts of messages).
     - Dynamic pacing, based on the drop rate inferred from gaps in the sequence number in received
@@ -50,8 +58,20 @@ class _MsgQueueBase:
         self._interface = interface
         self._with_lifetime = with_lifetime
         # Queue key is TIE-ID
-        # Queue value is (delay_ticks, TIEHeaderWithLifeTime)
-        self._queue = collections.OrderedDict()
+        # Queue value is (due_tick, TIEHeaderWithLifeTime)
+        self._queue = {}
+        # The entries of the queue are also kept in retransmission slots, one for each tick at
+        # which entries are due to be sent. Each slot is indexed by TIE-ID (in the order in which
+        # the entries were put in the slot), and the value is the TIEHeaderWithLifeTime. This way,
+        # servicing the queue at a tick only touches the entries that are due at that tick.
+        self._slots = {}
+        self._tick = 0
+        # Statistics
+        self.max_depth = 0
+        self.serviced_ticks = 0
+        self.serviced_entries = 0
+        self.immediate_entries = 0
+        self.service_time_histogram = stats.Histogram()
 
     def _debug_tie_id(self, tie_id):
         node_name = self._interface.node.name
@@ -96,24 +116,44 @@ class _MsgQueueBase:
         tie_header = tie_header_lifetime.header
         tie_id = tie_header.tieid
         # Decide how fast we want to send the message
-        if tie_id in self._queue:
-            (old_delay_ticks, old_tie_header_lifetime) = self._queue[tie_id]
-            if tie_header.seq_nr > old_tie_header_lifetime.header.seq_nr:
-                # Message is newer version than the one on the queue. Short delay.
-                new_delay_ticks = _SHORT_DELAY_TICKS
-            else:
-                # Message is same version as the one on the queue. Keep same delay as queued msg.
-                new_delay_ticks = old_delay_ticks
+        old_entry = self._queue.get(tie_id)
+        if old_entry is not None and tie_header.seq_nr <= old_entry[1].header.seq_nr:
+            # Message is same version as the one on the queue. Keep same delay as queued msg.
+            new_due_tick = old_entry[0]
+        elif self._send_immediately():
+            # Message is not yet on queue or is newer version than the one on the queue. Send it
+            # right now, and retransmit it after the long delay.
+            self.start_message()
+            self.add_to_message(tie_header_lifetime)
+            self.end_message()
+            self.immediate_entries += 1
+            new_due_tick = self._tick + _LONG_DELAY_TICKS
         else:
-            # Message is not yet on queue. Short delay.
-            new_delay_ticks = _SHORT_DELAY_TICKS
+            # Message is not yet on queue or is newer version than the one on the queue. Short
+            # delay.
+            new_due_tick = self._tick + _SHORT_DELAY_TICKS
+        if old_entry is not None and new_due_tick != old_entry[0]:
+            self._remove_from_slot(tie_id, old_entry[0])
         # Put message on queue with updated delay.
-        self._queue[tie_id] = (new_delay_ticks, tie_header_lifetime)
+        self._queue[tie_id] = (new_due_tick, tie_header_lifetime)
+        self._slots.setdefault(new_due_tick, {})[tie_id] = tie_header_lifetime
+        self.max_depth = max(self.max_depth, len(self._queue))
         self._debug("add to", tie_header.tieid, tie_header.seq_nr)
 
+    def _send_immediately(self):
+        # Overridden by the queues which may send a new message without waiting for the next tick
+        return False
+
+    def _remove_from_slot(self, tie_id, due_tick):
+        slot = self._slots[due_tick]
+        del slot[tie_id]
+        if not slot:
+            del self._slots[due_tick]
+
     def remove_tie_id(self, tie_id):
         if tie_id in self._queue:
-            del self._queue[tie_id]
+            (due_tick, _tie_header_lifetime) = self._queue.pop(tie_id)
+            self._remove_from_slot(tie_id, due_tick)
             self._debug("remove from", tie_id, None)
 
     def search_tie_id(self, tie_id):
@@ -125,33 +165,40 @@ class _MsgQueueBase:
 
     def clear(self):
         self._queue.clear()
+        self._slots.clear()
 
     def need_timer(self):
         return len(self._queue) > 0
 
+    def depth(self):
+        return len(self._queue)
+
     def service_queue(self):
-        # This is not the most efficient implementation in the world. We iterate over the entire
-        # queue every time tick. But that is okay. Most of the time, these queues are empty, and
-        # when they are not, they tend to be very short.
-        if not self._queue:
+        # Called every timer tick. Only the entries in the slot of this tick are (re)transmitted;
+        # they are moved to the slot of the tick at which they are due to be retransmitted.
+        self._tick += 1
+        slot = self._slots.pop(self._tick, None)
+        if slot is None:
             return
-        new_queue = collections.OrderedDict()
+        start_time = time.monotonic()
+        retransmit_tick = self._tick + _LONG_DELAY_TICKS
         added_at_least_one = False
-        for tie_id, value in self._queue.items():
-            (delay_ticks, tie_header_lifetime) = value
-            assert tie_header_lifetime.header.tieid == tie_id
-            assert delay_ticks > 0
-            delay_ticks -= 1
-            if delay_ticks == 0:
-                if not added_at_least_one:
-                    self.start_message()
-                if self.add_to_message(tie_header_lifetime):
-                    added_at_least_one = True
-                delay_ticks = _LONG_DELAY_TICKS
-            new_queue[tie_id] = (delay_ticks, tie_header_lifetime)
+        for tie_id, tie_header_lifetime in slot.items():
+            if not added_at_least_one:
+                self.start_message()
+            if self.add_to_message(tie_header_lifetime):
+                added_at_least_one = True
+            self._queue[tie_id] = (retransmit_tick, tie_header_lifetime)
         if added_at_least_one:
             self.end_message()
-        self._queue = new_queue
+        retransmit_slot = self._slots.get(retransmit_tick)
+        if retransmit_slot is None:
+            self._slots[retransmit_tick] = slot
+        else:
+            retransmit_slot.update(slot)
+        self.serviced_ticks += 1
+        self.serviced_entries += len(slot)
+        self.service_time_histogram.record(time.monotonic() - start_time)
 
     def _add_row_to_cli_table(self, tab, delay_ticks, tie_header_lifetime):
         header = tie_header_lifetime.header
@@ -174,8 +221,8 @@ class _MsgQueueBase:
         header_row.append(["Send", "Delay"])
         tab.add_row(header_row)
         for value in self._queue.values():
-            (delay_ticks, tie_header_lifetime) = value
-            self._add_row_to_cli_table(tab, delay_ticks, tie_header_lifetime)
+            (due_tick, tie_header_lifetime) = value
+            self._add_row_to_cli_table(tab, due_tick - self._tick, tie_header_lifetime)
         return tab
 
 
@@ -184,6 +231,9 @@ class _TIEQueue(_MsgQueueBase):
     def __init__(self, interface):
         _MsgQueueBase.__init__(self, "tie", interface, with_lifetime=False)
 
+    def _send_immediately(self):
+        return IMMEDIATE_TIE_FLOODING
+
     def start_message(self):
         pass
 
@@ -204,7 +254,7 @@ class _TIEQueue(_MsgQueueBase):
                 print("{} {}: interface {} could not send tie-id {} (not in tie-db)"
                       .format(self._timestamp(), self._interface.node.name, self._interface.name,
                               tie_id))
-                return False
+            return False
         if DEBUG_PRINT and self._debug_tie_id(tie_id):
             # Print a message for debugging
             print("{} {}: interface {} send tie-id {} tie {}"
@@ -371,6 +421,20 @@ class MsgQueues:
     def _tie_ack_table(self):
         return self._tie_ack_queue.cli_table()
 
+    def _named_queues(self):
+        return [("Transmit", self._tie_queue),
+                ("Request", self._tie_req_queue),
+                ("Acknowledge", self._tie_ack_queue)]
+
+    def _statistics_table(self):
+        tab = table.Table()
+        tab.add_row(["Queue", "Depth", ["Maximum", "Depth"], ["Serviced", "Ticks"],
+                     ["Serviced", "Entries"], ["Immediate", "Entries"]])
+        for (name, queue) in self._named_queues():
+            tab.add_row([name, queue.depth(), queue.max_depth, queue.serviced_ticks,
+                         queue.serviced_entries, queue.immediate_entries])
+        return tab
+
     def command_show_intf_queues(self, cli_session):
         cli_session.print("Transmit queue:")
         tab = self._tie_table()
@@ -381,3 +445,10 @@ class MsgQueues:
         cli_session.print("Acknowledge queue:")
         tab = self._tie_ack_table()
         cli_session.print(tab.to_string())
+        cli_session.print("Queue statistics:")
+        tab = self._statistics_table()
+        cli_session.print(tab.to_string())
+        cli_session.print("Queue service time per tick:")
+        tab = stats.histograms_table("Queue", [(name, queue.service_time_histogram)
+                                               for (name, queue) in self._named_queues()])
+        cli_session.print(tab.to_string())
@@ -0,0 +1,230 @@
+# Multi-process mode: the nodes in the configuration are partitioned over several worker processes,
+# so that the simulation of a large topology is not limited to a single CPU core.
+#
+# Each worker process runs its own RIFT engine, scheduler, and timers, but only for the nodes in
+# its partition. Nodes in different worker processes exchange packets in exactly the same way as
+# nodes in the same process (over simulated interfaces, i.e. multicast and UDP on the physical
+# interface), so no node state is shared between processes.
+#
+# The parent process does not run any nodes; it only runs the Command Line Interface (CLI). The
+# parent forwards commands for the current node to the worker process that runs that node, and it
+# executes engine-wide commands (e.g. "show engine") in every worker process.
+
+import copy
+import multiprocessing
+import sys
+
+import node
+import scheduler
+
+# The worker processes must inherit the state of the parent (in particular the parsed
+# configuration) without re-importing the __main__ module, hence fork.
+CONTEXT = multiprocessing.get_context("fork")
+
+def partition_nodes(config, nr_processes):
+    # Return a list with, for each worker process, the list of indexes of the nodes that the
+    # process runs (the index is the position of the node in the configuration). If the
+    # configuration has more than one shard, all nodes in a shard are run by the same process.
+    # Otherwise, the nodes are split into consecutive partitions of (almost) equal size.
+    units = []
+    nr_nodes = 0
+    for shard_config in config.get('shards', []):
+        nr_shard_nodes = len(shard_config.get('nodes', []))
+        if nr_shard_nodes > 0:
+            units.append(list(range(nr_nodes, nr_nodes + nr_shard_nodes)))
+        nr_nodes += nr_shard_nodes
+    if len(units) <= 1:
+        units = [[node_index] for node_index in range(nr_nodes)]
+    if not units:
+        return []
+    nr_processes = max(1, min(nr_processes, len(units)))
+    partitions = [[] for _ in range(nr_processes)]
+    for unit in units:
+        # Assign the unit to the partition that contains the middle of the unit
+        partition_index = ((2 * unit[0] + len(unit)) * nr_processes) // (2 * nr_nodes)
+        partitions[partition_index].extend(unit)
+    return [partition for partition in partitions if partition]
+
+def worker_engine_kwargs(engine_kwargs, worker_nr):
+    # Return the engine arguments for the given worker process. A worker process runs its nodes
+    # itself (it does not start worker processes of its own). If the random number generator is
+    # seeded, each worker process gets its own seed (derived from the base seed and the worker
+    # number), so that the workers do not all draw the same sequence of random numbers (e.g. the
+    # same nonces).
+    options = engine_kwargs['options']
+    worker_options = copy.copy(options)
+    worker_options.processes = 1
+    if options.seed is not None:
+        worker_options.seed = options.seed + worker_nr
+    return dict(engine_kwargs, options=worker_options)
+
+def start_workers(engine_class, engine_kwargs, config, nr_processes):
+    # Start the worker processes and wait until all of them have created their nodes
+    workers = []
+    for (worker_index, node_indexes) in enumerate(partition_nodes(config, nr_processes)):
+        worker_nr = worker_index + 1
+        workers.append(Worker(worker_nr, engine_class,
+                              worker_engine_kwargs(engine_kwargs, worker_nr), node_indexes,
+                              workers))
+    for worker in workers:
+        worker.wait_ready()
+    return workers
+
+def run_worker(engine_class, engine_kwargs, node_indexes, connection, parent_connections):
+    # Entry point of a worker process. Close the parent's ends of the connections to this worker
+    # and to the workers that were started earlier (inherited through fork), so that each worker
+    # sees end-of-file as soon as the parent exits.
+    for parent_connection in parent_connections:
+        parent_connection.close()
+    eng = engine_class(node_indexes=node_indexes, worker_connection=connection, **engine_kwargs)
+    eng.run()
+    print("DBG run returned", file=sys.stderr, flush=True)
+
+def forwarding_parse_tree(parse_tree, parent_process_commands, all_workers_commands):
+    # Return a copy of the CLI parse tree for the parent process, in which each command that the
+    # parent does not execute itself is replaced by a function that forwards it to the workers
+    if callable(parse_tree):
+        command_function = parse_tree
+        if command_function in parent_process_commands:
+            return command_function
+        all_workers = command_function in all_workers_commands
+        def forward_command(command_handler, cli_session, parameters=None):
+            command_handler.forward_command(cli_session, command_function.__name__, parameters,
+                                            all_workers)
+        return forward_command
+    return {token: forwarding_parse_tree(subtree, parent_process_commands, all_workers_commands)
+            for (token, subtree) in parse_tree.items()}
+
+class Worker:
+
+    # The parent process' view of a worker process
+
+    def __init__(self, worker_nr, engine_class, engine_kwargs, node_indexes, earlier_workers):
+        self.worker_nr = worker_nr
+        self.node_names = []
+        (self._connection, child_connection) = CONTEXT.Pipe()
+        parent_connections = [self._connection]
+        parent_connections.extend(worker.connection() for worker in earlier_workers)
+        self._process = CONTEXT.Process(
+            target=run_worker,
+            args=(engine_class, engine_kwargs, node_indexes, child_connection, parent_connections),
+            name="rift-worker-{}".format(worker_nr),
+            daemon=True)
+        self._process.start()
+        child_connection.close()
+
+    def connection(self):
+        return self._connection
+
+    def pid(self):
+        return self._process.pid
+
+    def wait_ready(self):
+        # The worker reports the names of its nodes once it has created them
+        try:
+            self.node_names = self._connection.recv()
+        except EOFError:
+            print("Worker process {} failed to start".format(self.worker_nr), file=sys.stderr)
+            sys.exit(1)
+
+    def request(self, request):
+        # Returns None if the worker process is no longer running
+        try:
+            self._connection.send(request)
+            return self._connection.recv()
+        except (EOFError, OSError):
+            return None
+
+    def execute_command(self, node_name, function_name, parameters):
+        output = self.request(("command", node_name, function_name, parameters))
+        if output is None:
+            return "Worker process {} is not running\n".format(self.worker_nr)
+        return output
+
+    def description(self):
+        return "Worker process {} (pid {}, {} nodes)".format(
+            self.worker_nr, self.pid(), len(self.node_names))
+
+class RemoteNode:
+
+    # Stands in for a node in the parent process; the node itself runs in a worker process. Only
+    # provides what the parent process needs to execute "set node", "show nodes", and
+    # "show nodes level" itself.
+
+    def __init__(self, name, worker):
+        self.name = name
+        self.worker = worker
+
+    def _remote_attributes(self, method_name, headers):
+        attributes = self.worker.request(("attributes", self.name, method_name, None))
+        if attributes is None:
+            attributes = [self.name] + ["?"] * (len(headers) - 1)
+        return attributes
+
+    def cli_summary_attributes(self):
+        return self._remote_attributes("cli_summary_attributes", node.Node.cli_summary_headers())
+
+    def cli_level_attributes(self):
+        return self._remote_attributes("cli_level_attributes", node.Node.cli_level_headers())
+
+class CaptureCliSession:
+
+    # Stands in for the CLI session when a worker process executes a forwarded command; the output
+    # is captured and sent back to the parent process
+
+    def __init__(self, current_node):
+        self.current_node = current_node
+        self._output = []
+
+    def print(self, message, add_newline=True):
+        self._output.append(message)
+        if add_newline:
+            self._output.append('\n')
+
+    def set_current_node(self, current_node):
+        self.current_node = current_node
+
+    def output(self):
+        return "".join(self._output)
+
+class WorkerHandler:
+
+    # Receives the requests from the parent process in a worker process
+
+    handler_type = "Worker requests"    # For the scheduler histograms
+
+    def __init__(self, connection, engine, nodes):
+        self._connection = connection
+        self._engine = engine
+        self._nodes = nodes
+        self._connection.send(list(nodes.keys()))
+        scheduler.SCHEDULER.register_handler(self)
+
+    def rx_fd(self):
+        return self._connection.fileno()
+
+    def ready_to_read(self):
+        try:
+            request = self._connection.recv()
+        except EOFError:
+            print("DBG EOF", file=sys.stderr, flush=True)
+            # The parent process has exited, so stop the scheduler; the worker process exits when
+            # the engine returns from run
+            scheduler.SCHEDULER.unregister_handler(self)
+            self._connection.close()
+            scheduler.SCHEDULER.stop()
+            return
+        (request_type, node_name, name, parameters) = request
+        current_node = self._nodes.get(node_name)
+        if request_type == "command":
+            cli_session = CaptureCliSession(current_node)
+            command_function = getattr(self._engine, name)
+            if parameters:
+                command_function(cli_session, parameters)
+            else:
+                command_function(cli_session)
+            reply = cli_session.output()
+        else:
+            assert request_type == "attributes"
+            reply = getattr(current_node, name)()
+        self._connection.send(reply)
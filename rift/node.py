@@ -4,6 +4,7 @@
 
 import collections
 import enum
+import heapq
 import logging
 import os
 import socket
@@ -29,8 +30,11 @@ import rib_route
 import spf_dest
 import stats
 import table
+import tide_cache
+import tie_db
 import timer
 import utils
+import verified_tie_cache
 
 MY_NODE_TIE_NR = 1
 MY_PREFIX_TIE_NR = 2
@@ -88,6 +92,10 @@ class Node:
 
     SEND_TIDES_INTERVAL = 2.0
 
+    # The maximum number of received TIEs whose origin fingerprint is remembered as verified, see
+    # verified_tie_cache
+    MAX_VERIFIED_TIE_CACHE_SIZE = 1024
+
     # TODO: Use constant from Thrift file (it is currently not there, but Tony said he added it)
     # Don't use the actual lowest value 0 (which is enum value Illegal) for direction or tietype,
     # but value 1 (direction South) or value 2 (tietype TieTypeNode). Juniper RIFT doesn't accept
@@ -290,6 +298,7 @@ class Node:
         self._leaf_only = leaf_only
         self.leaf_2_leaf = leaf_2_leaf
         self._top_of_fabric_flag = top_of_fabric_flag
+        self.forget_flood_scope_decisions()
 
     def action_purge_offers(self):
         for purged_offer in self._rx_offers.values():
@@ -304,6 +313,7 @@ class Node:
             self._derived_level = self._highest_available_level - 1
         else:
             self._derived_level = 0
+        self.forget_flood_scope_decisions()
 
     def any_southbound_adjacencies(self):
         # We define a southbound adjacency as any adjacency between this node and a node that has
@@ -528,10 +538,13 @@ class Node:
                                       self.system_id,
                                       common.ttypes.TIETypeType.NegativeDisaggregationPrefixTIEType,
                                       MY_NEG_DISAGG_TIE_NR))
-        self.peer_node_tie_packet_infos = {}  # Same-level nodes, indexed by tie_id
         self._parent_neighbors = None
-        self.tie_packet_infos = sortedcontainers.SortedDict()  # Indexed by tie_id
-        self._last_received_tide_end = self.MIN_TIE_ID
+        self.tie_packet_infos = tie_db.TIEDB()  # Indexed by tie_id
+        self._tide_caches = {}  # Indexed by neighbor class, see generate_tide_packet
+        self._flood_scope_decisions = {}  # Indexed by decision key, see is_flood_allowed
+        self._last_received_tide_ends = {}  # Indexed by interface name, see process_rx_tide_packet
+        self.verified_tie_cache = verified_tie_cache.VerifiedTIECache(
+            self.MAX_VERIFIED_TIE_CACHE_SIZE)
         self._defer_spf_timer = None
         self._spf_triggers_count = 0
         self._spf_triggers_deferred_count = 0
@@ -572,7 +585,9 @@ class Node:
             interval=1.0,
             expire_function=self.age_ties,
             periodic=True,
-            start=True)
+            start=True,
+            jitter=timer.PERIODIC_JITTER,
+            spread_phase=timer.PERIODIC_SPREAD_PHASE)
         self.fsm = fsm.Fsm(
             definition=self.fsm_definition,
             action_handler=self,
@@ -583,14 +598,21 @@ class Node:
             interval=self.DEFAULT_HOLD_DOWN_TIME,
             expire_function=lambda: self.fsm.push_event(self.Event.HOLD_DOWN_EXPIRED),
             periodic=False,
-            start=False)
+            start=False,
+            name="Node hold-down")
         self._send_tides_timer = timer.Timer(
             interval=self.SEND_TIDES_INTERVAL,
             expire_function=self.send_tides,
             periodic=True,
-            start=True)
+            start=True,
+            jitter=timer.PERIODIC_JITTER,
+            spread_phase=timer.PERIODIC_SPREAD_PHASE)
         self.fsm.start()
 
+    @staticmethod
+    def skip_node_nr():
+        Node._next_node_nr += 1
+
     def add_my_tie_state(self, tie_id):
         assert tie_id.originator == self.system_id
         self._my_tie_states[tie_id] = MyTIEState(tie_id)
@@ -824,8 +846,6 @@ class Node:
         self._next_interface_id += 1
         return interface_id
 
-    # TODO: Need to re-evaluate peer_node_tie_packet_infos when the level of this node changes
-
     def is_same_level_tie(self, tie_packet):
         if tie_packet.header.tieid.tietype != common.ttypes.TIETypeType.NodeTIEType:
             # Not a node TIE
@@ -845,6 +865,13 @@ class Node:
             return False
         return True
 
+    def peer_node_tie_packet_infos(self):
+        # The south node TIEs of the other nodes at the same level as this node (see
+        # is_same_level_tie)
+        return [node_tie_packet_info for node_tie_packet_info
+                in self.tie_packet_infos.node_ties_at_level(constants.DIR_SOUTH, self.level_value())
+                if tie_db.tie_packet_info_tie_id(node_tie_packet_info).originator != self.system_id]
+
     def up_interfaces(self, interface_going_down):
         for intf in self.interfaces_by_name.values():
             if ((intf.fsm.state == interface.Interface.State.THREE_WAY) and
@@ -1154,10 +1181,11 @@ class Node:
 
     def other_nodes_are_overloaded(self):
         # Are all the other nodes at my level overloaded?
-        if not self.peer_node_tie_packet_infos:
+        peer_node_tie_packet_infos = self.peer_node_tie_packet_infos()
+        if not peer_node_tie_packet_infos:
             # There are no other nodes at my level
             return False
-        for node_tie_packet_info in self.peer_node_tie_packet_infos.values():
+        for node_tie_packet_info in peer_node_tie_packet_infos:
             node_tie_packet = node_tie_packet_info.protocol_packet.content.tie
             flags = node_tie_packet.element.node.flags
             if flags is None:
@@ -1168,12 +1196,13 @@ class Node:
 
     def other_nodes_have_no_n_adjacency(self):
         # Do all the other nodes at my level have NO north-bound adjacencies?
-        if not self.peer_node_tie_packet_infos:
+        peer_node_tie_packet_infos = self.peer_node_tie_packet_infos()
+        if not peer_node_tie_packet_infos:
             # There are no other nodes at my level. The RIFT draft is not abundantly clear what to
             # do in this case, but if we want the various test cases with only 1 node in the
             # superspine to work correctly, we *do* need to originate a default in this case.
             return True
-        for node_tie_packet_info in self.peer_node_tie_packet_infos.values():
+        for node_tie_packet_info in peer_node_tie_packet_infos:
             node_tie_packet = node_tie_packet_info.protocol_packet.content.tie
             neighbors = node_tie_packet.element.node.neighbors or {}
             for check_neighbor in neighbors.values():
@@ -1194,32 +1223,89 @@ class Node:
         return rte is not None
 
     def send_tides(self):
-        # The current implementation prepares, encodes, and sends a unique TIDE packet for each
-        # individual neighbor. We do NOT (yet) have any optimization that attempts to prepare and
-        # encode a TIDE only once in total or once per direction (N, S, EW). See the comment in the
-        # function is_flood_allowed for a more detailed discussion on why not.
+        # The current implementation prepares and sends a unique set of TIDE packets for each
+        # individual neighbor. The set of TIE headers in the TIDEs is maintained incrementally per
+        # neighbor class (see generate_tide_tie_ids), because of the one flooding scope rule that
+        # depends on the system-id of the neighbor (see the comment in the function
+        # is_flood_allowed). The TIE headers are split into ranges that fit in the MTU of the
+        # interface, and the TIDE of a range is only regenerated when the range changes (see
+        # tide_ranges).
+        for cache in self._tide_caches.values():
+            cache.used = False
         for intf in self.interfaces_by_name.values():
             self.send_tides_on_interface(intf)
+        # Forget the TIDE caches of neighbor classes that no longer occur (e.g. after a level
+        # change)
+        self._tide_caches = {neighbor_class: cache
+                             for (neighbor_class, cache) in self._tide_caches.items()
+                             if cache.used}
 
     def send_tides_on_interface(self, intf):
         if intf.fsm.state != interface.Interface.State.THREE_WAY:
             return
-        tide_packet = self.generate_tide_packet(
+        for tide_range in self.update_tide_ranges(intf):
+            # A reuse count of zero means that the TIDE was just regenerated
+            intf.bump_tx_tide_range_counter(tide_range.packet_info,
+                                            regenerated=(tide_range.reuse_count == 0))
+            intf.send_packet_info(tide_range.packet_info, flood=True)
+
+    def update_tide_ranges(self, intf):
+        # Return the list of TIDE ranges for the neighbor on the interface, after regenerating the
+        # TIDE of each range that changed
+        tie_ids = self.generate_tide_tie_ids(
             neighbor_direction=intf.neighbor_direction(),
             neighbor_system_id=intf.neighbor_lie.system_id,
             neighbor_level=intf.neighbor_lie.level,
             neighbor_is_top_of_fabric=intf.neighbor_lie.top_of_fabric(),
             my_level=self.level_value(),
             i_am_top_of_fabric=self.top_of_fabric())
-        self.debug("Regenerated TIDE for neighbor %s: %s", intf.neighbor_lie.system_id, tide_packet)
-        packet_content = encoding.ttypes.PacketContent(tide=tide_packet)
-        packet_header = encoding.ttypes.PacketHeader(
-            sender=self.system_id,
-            level=self.level_value())
-        protocol_packet = encoding.ttypes.ProtocolPacket(
-            header=packet_header,
-            content=packet_content)
-        intf.send_protocol_packet(protocol_packet, flood=True)
+        tide_ranges = intf.tide_ranges.update(tie_ids, self.tie_packet_infos, self.level_value())
+        for tide_range in tide_ranges:
+            if tide_range.packet_info is None:
+                tide_packet = self.make_tide_packet_for_range(tide_range)
+                self.debug("Regenerated TIDE for neighbor %s: %s", intf.neighbor_lie.system_id,
+                           tide_packet)
+                packet_content = encoding.ttypes.PacketContent(tide=tide_packet)
+                packet_header = encoding.ttypes.PacketHeader(
+                    sender=self.system_id,
+                    level=self.level_value())
+                protocol_packet = encoding.ttypes.ProtocolPacket(
+                    header=packet_header,
+                    content=packet_content)
+            elif not self.refresh_tide_lifetimes(tide_range):
+                continue
+            else:
+                protocol_packet = tide_range.packet_info.protocol_packet
+            tide_range.packet_info = packet_common.encode_protocol_packet(
+                protocol_packet, intf.active_outer_key)
+        return tide_ranges
+
+    @staticmethod
+    def refresh_tide_lifetimes(tide_range):
+        # The TIEs in the range did not change, but they may have aged since the TIDE was encoded.
+        # Update the remaining lifetimes in the TIDE, so that it reports the same lifetimes as the
+        # TIE-DB, and return True if any of them changed (i.e. if the TIDE must be encoded again).
+        tide_packet = tide_range.packet_info.protocol_packet.content.tide
+        changed = False
+        for (tie_header, tie_packet_info) in zip(tide_packet.headers, tide_range.tie_packet_infos):
+            remaining_lifetime = tie_packet_info.remaining_tie_lifetime
+            if tie_header.remaining_lifetime != remaining_lifetime:
+                tie_header.remaining_lifetime = remaining_lifetime
+                changed = True
+        return changed
+
+    @staticmethod
+    def make_tide_packet_for_range(tide_range):
+        tide_packet = packet_common.make_tide_packet(
+            start_range=tide_range.start_range,
+            end_range=tide_range.end_range)
+        for tie_packet_info in tide_range.tie_packet_infos:
+            packet_common.add_tie_header_to_tide(
+                tide_packet,
+                packet_common.expand_tie_header_with_lifetime(
+                    tie_packet_info.protocol_packet.content.tie.header,
+                    tie_packet_info.remaining_tie_lifetime))
+        return tide_packet
 
     @staticmethod
     def cli_summary_headers():
@@ -1880,7 +1966,9 @@ class Node:
         self.log.info("[%s] %s" % (self.log_id, msg), *args)
 
     def db_debug(self, msg, *args):
-        if self._tie_db_log is not None:
+        # Flooding decisions are logged at a high rate; don't format the message unless it is
+        # actually going to be logged
+        if self._tie_db_log is not None and self._tie_db_log.isEnabledFor(logging.DEBUG):
             self._tie_db_log.debug("[%s] %s" % (self.log_id, msg), *args)
 
     def spf_debug(self, msg, *args):
@@ -1928,17 +2016,16 @@ class Node:
         tie_id = tie_packet.header.tieid
         tie_type = tie_id.tietype
         reason = ""
-        if tie_id in self.tie_packet_infos:
-            old_tie_packet_info = self.tie_packet_infos[tie_id]
+        old_tie_packet_info = self.tie_packet_infos.store(tie_packet_info)
+        if old_tie_packet_info is not None:
             trigger_spf = self.ties_differ_enough_for_spf(old_tie_packet_info, tie_packet_info)
             if trigger_spf:
                 reason = "TIE " + packet_common.tie_id_str(tie_id) + " changed"
         else:
             trigger_spf = True
             reason = "TIE " + packet_common.tie_id_str(tie_id) + " added"
-        self.tie_packet_infos[tie_id] = tie_packet_info
+        self.mark_tide_caches_dirty(tie_id)
         if self.is_same_level_tie(tie_packet):
-            self.peer_node_tie_packet_infos[tie_packet.header.tieid] = tie_packet_info
             self.update_partially_conn_all_intfs()
             self.regenerate_my_south_prefix_tie()
         if tie_type == common.ttypes.TIETypeType.NegativeDisaggregationPrefixTIEType:
@@ -1958,12 +2045,13 @@ class Node:
         rx_prefixes = neg_tie.element.negative_disaggregation_prefixes.prefixes
         if rx_prefixes is None:
             rx_prefixes = {}
+        # Get the negative disaggregation ties of each parent neighbor
+        parents_neg_ties = [self.ties_of_type(constants.DIR_SOUTH, neighbor_system_id,
+                                              neg_disagg_type)
+                            for neighbor_system_id in self._parent_neighbors.keys()]
         for prefix, attrs in rx_prefixes.items():
             must_propagate = True
-            for neighbor_system_id in self._parent_neighbors.keys():
-                # Get neighbor negative disaggregation ties
-                nbr_neg_ties = self.ties_of_type(constants.DIR_SOUTH, neighbor_system_id,
-                                                 neg_disagg_type)
+            for nbr_neg_ties in parents_neg_ties:
                 # If neighbor ties list is empty, prefix is not present. So nothing to propagate
                 if not nbr_neg_ties:
                     must_propagate = False
@@ -1993,15 +2081,15 @@ class Node:
     def remove_tie(self, tie_id):
         # Remove the TIE from the TIE database (TIE-DB), if present
         # It is not an error to attempt to delete a TIE which is not in the database
-        if tie_id in self.tie_packet_infos:
-            del self.tie_packet_infos[tie_id]
+        tie_packet_info = self.tie_packet_infos.remove(tie_id)
+        if tie_packet_info is not None:
+            self.mark_tide_caches_dirty(tie_id)
             reason = "TIE " + packet_common.tie_id_str(tie_id) + " removed"
             self.trigger_spf(reason)
-        # Remove the TIE from the same-level-neighbor (peer) information, if present
-        if tie_id in self.peer_node_tie_packet_infos:
-            del self.peer_node_tie_packet_infos[tie_id]
-            self.update_partially_conn_all_intfs()
-            self.regenerate_my_south_prefix_tie()
+            # If the TIE was the node TIE of a same-level-neighbor (peer), re-evaluate the peers
+            if self.is_same_level_tie(tie_packet_info.protocol_packet.content.tie):
+                self.update_partially_conn_all_intfs()
+                self.regenerate_my_south_prefix_tie()
         # Remove the TIE from all interface queues, if present
         for intf in self.interfaces_by_name.values():
             intf.remove_tie_from_all_queues(tie_id)
@@ -2012,33 +2100,53 @@ class Node:
 
     def start_sending_db_ties_in_range(self, start_sending_tie_headers, start_id, start_incl,
                                        end_id, end_incl):
-        db_tie_ids = self.tie_packet_infos.irange(start_id, end_id, (start_incl, end_incl))
-        for db_tie_id in db_tie_ids:
-            db_tie_packet_info = self.tie_packet_infos[db_tie_id]
+        db_tie_packet_infos = self.tie_packet_infos.tie_packet_infos_in_range(
+            start_id, end_id, (start_incl, end_incl))
+        for db_tie_packet_info in db_tie_packet_infos:
             db_tie_packet = db_tie_packet_info.protocol_packet.content.tie
             # TODO: Make sure that lifetime is decreased by at least one before propagating
             # TODO: Maybe do that when TIE is received and stored in tie-db?
             start_sending_tie_headers.append(db_tie_packet.header)
 
-    def process_rx_tide_packet(self, tide_packet):
-        request_tie_headers = []
-        start_sending_tie_headers = []
-        stop_sending_tie_headers = []
+    def start_sending_db_ties_before_tide(self, start_sending_tie_headers, tide_packet,
+                                          rx_intf_name):
         # It is assumed TIDEs are sent and received in increasing order or range. If we observe
-        # a gap between the end of the range of the last TIDE (if any) and the start of the range
-        # of this TIDE, then we must start sending all TIEs in our database that fall in that gap.
-        if tide_packet.start_range < self._last_received_tide_end:
-            # The neighbor has wrapped around: it has sent its last TIDE and is not sending the
-            # first TIDE again (look for comment "wrap-around" in test_tie_db.py for an example)
+        # a gap between the end of the range of the last TIDE (if any) received from the same
+        # neighbor and the start of the range of this TIDE, then we must start sending all TIEs in
+        # our database that fall in that gap.
+        last_received_tide_end = self._last_received_tide_ends.get(rx_intf_name)
+        if (last_received_tide_end is not None and
+                tide_packet.start_range < last_received_tide_end):
+            # The neighbor has wrapped around: it has sent its last TIDE and is now sending the
+            # first TIDE again. If the last TIDE did not cover the range up to MAX_TIE_ID, then we
+            # must start sending all TIEs in our database that fall after it.
             # Note - I am not completely happy with this rule since it may lead to unnecessarily
             # putting TIEs on the send queue if TIDEs are received out of order.
-            self._last_received_tide_end = self.MIN_TIE_ID
-        if tide_packet.start_range > self._last_received_tide_end:
-            # There is a gap between the end of the previous TIDE and the start of this TIDE
+            if last_received_tide_end < self.MAX_TIE_ID:
+                self.start_sending_db_ties_in_range(start_sending_tie_headers,
+                                                    last_received_tide_end, False,
+                                                    self.MAX_TIE_ID, True)
+            last_received_tide_end = None
+        if last_received_tide_end is None:
+            # This is the first TIDE (of a round of TIDEs); the gap starts at MIN_TIE_ID (inclusive)
+            if tide_packet.start_range > self.MIN_TIE_ID:
+                self.start_sending_db_ties_in_range(start_sending_tie_headers,
+                                                    self.MIN_TIE_ID, True,
+                                                    tide_packet.start_range, False)
+        elif tide_packet.start_range > last_received_tide_end:
+            # There is a gap between the end of the previous TIDE and the start of this TIDE. The
+            # previous TIDE covered its end of range, so the gap excludes it.
             self.start_sending_db_ties_in_range(start_sending_tie_headers,
-                                                self._last_received_tide_end, True,
+                                                last_received_tide_end, False,
                                                 tide_packet.start_range, False)
-        self._last_received_tide_end = tide_packet.end_range
+        self._last_received_tide_ends[rx_intf_name] = tide_packet.end_range
+
+    def process_rx_tide_packet(self, tide_packet, rx_intf_name=None):
+        request_tie_headers = []
+        start_sending_tie_headers = []
+        stop_sending_tie_headers = []
+        self.start_sending_db_ties_before_tide(start_sending_tie_headers, tide_packet,
+                                               rx_intf_name)
         # The first gap that we need to consider starts at start_range (inclusive)
         last_processed_tie_id = tide_packet.start_range
         minimum_inclusive = True
@@ -2101,6 +2209,10 @@ class Node:
                                             tide_packet.end_range, True)
         return (request_tie_headers, start_sending_tie_headers, stop_sending_tie_headers)
 
+    def forget_received_tide_end(self, rx_intf_name):
+        # Called when flooding stops on the interface; the next TIDE is the first one again
+        self._last_received_tide_ends.pop(rx_intf_name, None)
+
     def process_rx_tire_packet(self, tire_packet):
         request_tie_headers = []
         start_sending_tie_headers = []
@@ -2207,9 +2319,6 @@ class Node:
                 ack_tie_header = db_tie_packet.header
         return (start_sending_tie_header, ack_tie_header)
 
-    def tie_is_originated_by_node(self, tie_header, node_system_id):
-        return tie_header.tieid.originator == node_system_id
-
     def tie_originator_level(self, tie_header):
         # We cannot determine the level of the originator just by looking at the TIE header; we have
         # to look in the TIE-DB to determine it. We can be confident the TIE is in the TIE-DB
@@ -2242,20 +2351,60 @@ class Node:
         # better understood (correctness first, performance later).
         # See https://www.dropbox.com/s/b07dnhbxawaizpi/zoom_0.mp4?dl=0 for a video recording of a
         # discussion where these complications were discussed in detail.
-        if tie_header.tieid.direction == constants.DIR_SOUTH:
+        #
+        # This is called for every TIE and adjacency when flooding, requesting, and building TIDEs,
+        # but the decision only depends on a handful of attributes. So, the decisions (including
+        # the reason, which is a constant string) are memoized, keyed by those attributes. The
+        # level of the originator is only looked up for the rules which need it.
+        tie_id = tie_header.tieid
+        is_node_tie = tie_id.tietype == common.ttypes.TIETypeType.NodeTIEType
+        if (is_node_tie and tie_id.direction == constants.DIR_SOUTH and
+                to_node_direction in (constants.DIR_SOUTH, constants.DIR_NORTH)):
+            originator_level = self.tie_originator_level(tie_header)
+        else:
+            originator_level = None
+        decision_key = (tie_id.direction,
+                        is_node_tie,
+                        to_node_direction,
+                        from_node_level,
+                        from_node_is_top_of_fabric,
+                        originator_level,
+                        tie_id.originator == from_node_system_id,
+                        tie_id.originator == to_node_system_id)
+        decision = self._flood_scope_decisions.get(decision_key)
+        if decision is None:
+            decision = self.decide_flood_allowed(*decision_key)
+            self._flood_scope_decisions[decision_key] = decision
+        return decision
+
+    def forget_flood_scope_decisions(self):
+        # The memoized decisions never become wrong (the key contains everything they depend on),
+        # but they are forgotten when the level or the adjacencies change, so that decisions for
+        # levels and neighbors that no longer occur do not accumulate.
+        self._flood_scope_decisions.clear()
+
+    @staticmethod
+    def decide_flood_allowed(tie_direction,
+                             is_node_tie,
+                             to_node_direction,
+                             from_node_level,
+                             from_node_is_top_of_fabric,
+                             originator_level,
+                             originated_by_from_node,
+                             originated_by_to_node):
+        if tie_direction == constants.DIR_SOUTH:
             # S-TIE
-            if tie_header.tieid.tietype == common.ttypes.TIETypeType.NodeTIEType:
+            if is_node_tie:
                 # Node S-TIE
                 if to_node_direction == constants.DIR_SOUTH:
                     # Node S-TIE to S: Flood if level of originator is same as level of this node
-                    if self.tie_originator_level(tie_header) == from_node_level:
+                    if originator_level == from_node_level:
                         return (True, "Node S-TIE to S: originator level is same as from-node")
                     else:
                         return (False, "Node S-TIE to S: originator level is not same as from-node")
                 elif to_node_direction == constants.DIR_NORTH:
                     # Node S-TIE to N: flood if level of originator is higher than level of this
                     # node
-                    originator_level = self.tie_originator_level(tie_header)
                     if originator_level is None:
                         return (False, "Node S-TIE to N: could not determine originator level")
                     elif originator_level > from_node_level:
@@ -2277,14 +2426,14 @@ class Node:
                 # Non-Node S-TIE
                 if to_node_direction == constants.DIR_SOUTH:
                     # Non-Node S-TIE to S: Flood self-originated only
-                    if self.tie_is_originated_by_node(tie_header, from_node_system_id):
+                    if originated_by_from_node:
                         return (True, "Non-node S-TIE to S: self-originated")
                     else:
                         return (False, "Non-node S-TIE to S: not self-originated")
                 elif to_node_direction == constants.DIR_NORTH:
                     # [*] Non-Node S-TIE to N: Flood only if the neighbor is the originator of
                     # the TIE
-                    if to_node_system_id == tie_header.tieid.originator:
+                    if originated_by_to_node:
                         return (True, "Non-node S-TIE to N: to-node is originator of TIE")
                     else:
                         return (False, "Non-node S-TIE to N: to-node is not originator of TIE")
@@ -2293,7 +2442,7 @@ class Node:
                     # ToF
                     if from_node_is_top_of_fabric:
                         return (False, "Non-node S-TIE to EW: this top of fabric")
-                    elif self.tie_is_originated_by_node(tie_header, from_node_system_id):
+                    elif originated_by_from_node:
                         return (True, "Non-node S-TIE to EW: self-originated and not top of fabric")
                     else:
                         return (False, "Non-node S-TIE to EW: not self-originated")
@@ -2303,7 +2452,7 @@ class Node:
                     return (False, "None-node S-TIE to ?: never flood")
         else:
             # S-TIE
-            assert tie_header.tieid.direction == constants.DIR_NORTH
+            assert tie_direction == constants.DIR_NORTH
             if to_node_direction == constants.DIR_SOUTH:
                 # S-TIE to S: Never flood
                 return (False, "N-TIE to S: never flood")
@@ -2398,6 +2547,10 @@ class Node:
                 self.db_debug("TIE %s received on %s flooded to %d interfaces", tie_packet.header,
                               tie_packet_info.rx_intf.name, flood_count)
 
+    def mark_tide_caches_dirty(self, tie_id):
+        for cache in self._tide_caches.values():
+            cache.mark_dirty(tie_id)
+
     def generate_tide_packet(self,
                              neighbor_direction,
                              neighbor_system_id,
@@ -2405,68 +2558,121 @@ class Node:
                              neighbor_is_top_of_fabric,
                              my_level,
                              i_am_top_of_fabric):
-        # The algorithm for deciding which TIE headers go into a TIDE packet are based on what is
-        # described as "the solution to oscillation #1" in slide deck
+        # Generate a single TIDE packet which covers the entire range and which reports all TIE
+        # headers. The TIDEs which are actually sent are split into ranges that fit in the MTU of
+        # the interface (see update_tide_ranges).
+        tide_packet = packet_common.make_tide_packet(
+            start_range=self.MIN_TIE_ID,
+            end_range=self.MAX_TIE_ID)
+        tie_ids = self.generate_tide_tie_ids(neighbor_direction, neighbor_system_id,
+                                             neighbor_level, neighbor_is_top_of_fabric, my_level,
+                                             i_am_top_of_fabric)
+        for tie_id in tie_ids:
+            tie_packet_info = self.tie_packet_infos[tie_id]
+            packet_common.add_tie_header_to_tide(
+                tide_packet,
+                packet_common.expand_tie_header_with_lifetime(
+                    tie_packet_info.protocol_packet.content.tie.header,
+                    tie_packet_info.remaining_tie_lifetime))
+        return tide_packet
+
+    def generate_tide_tie_ids(self,
+                              neighbor_direction,
+                              neighbor_system_id,
+                              neighbor_level,
+                              neighbor_is_top_of_fabric,
+                              my_level,
+                              i_am_top_of_fabric):
+        # Return the sorted TIE-IDs of the TIE headers that are reported in the TIDEs to the
+        # neighbor. The algorithm for deciding which TIE headers go into a TIDE packet are based on
+        # what is described as "the solution to oscillation #1" in slide deck
         # http://bit.ly/rift-flooding-oscillations-v1. During the RIFT core team conference call on
         # 19 Oct 2018, Tony reported that the RIFT specification was already updated with the same
         # rules, but IMHO sections Table 3 / B.3.1. / B.3.2.1 in the draft are still ambiguous and
         # I am not sure if they specify the same behavior.
         #
-        # We generate a single TIDE packet which covers the entire range and we report all TIE
-        # headers in that single TIDE packet. We simple assume that it will fit in a single UDP
-        # packet which can be up to 64K. And if a single TIE gets added or removed we swallow the
-        # cost of regenerating and resending the entire TIDE packet.
-        tide_packet = packet_common.make_tide_packet(
-            start_range=self.MIN_TIE_ID,
-            end_range=self.MAX_TIE_ID)
-        # Look at every TIE in our database, and decide whether or not we want to include it in the
-        # TIDE packet. This is a rather expensive process, which is why we want to minimize the
-        # the number of times this function is run.
-        for tie_packet_info in self.tie_packet_infos.values():
-            tie_packet = tie_packet_info.protocol_packet.content.tie
-            tie_header = tie_packet.header
-            # The first possible reason for including a TIE header in the TIDE is to announce that
-            # we have a TIE that we want to send to the neighbor. In other words the TIE in the
-            # flooding scope from us to the neighbor.
-            (allowed, reason1) = self.flood_allowed_from_node_to_nbr(
-                tie_header=tie_header,
-                neighbor_direction=neighbor_direction,
-                neighbor_system_id=neighbor_system_id,
-                node_system_id=self.system_id,
-                node_level=my_level,
-                node_is_top_of_fabric=i_am_top_of_fabric)
-            if allowed:
-                self.db_debug("Include TIE %s in TIDE because %s (perspective us to neighbor)",
-                              tie_header, reason1)
-                packet_common.add_tie_header_to_tide(
-                    tide_packet,
-                    packet_common.expand_tie_header_with_lifetime(
-                        tie_header,
-                        tie_packet_info.remaining_tie_lifetime))
-                continue
-            # The second possible reason for including a TIE header in the TIDE is because the
-            # neighbor might be considering to send the TIE to us, and we want to let the neighbor
-            # know that we already have the TIE and what version it it.
-            (allowed, reason2) = self.flood_allowed_from_nbr_to_node(
-                tie_header=tie_header,
-                neighbor_direction=neighbor_direction,
-                neighbor_system_id=neighbor_system_id,
-                neighbor_level=neighbor_level,
-                neighbor_is_top_of_fabric=neighbor_is_top_of_fabric,
-                node_system_id=self.system_id)
-            if allowed:
-                self.db_debug("Include TIE %s in TIDE because %s (perspective neighbor to us)",
-                              tie_header, reason2)
-                packet_common.add_tie_header_to_tide(
-                    tide_packet,
-                    packet_common.expand_tie_header_with_lifetime(
-                        tie_header,
-                        tie_packet_info.remaining_tie_lifetime))
-                continue
-            # If we get here, we decided not to include the TIE header in the TIDE
-            self.db_debug("Exclude TIE %s from TIDE because %s (perspective us to neighbor) and "
-                          "%s (perspective neighbor to us)", tie_header, reason1, reason2)
-        return tide_packet
+        # Deciding for every TIE in our database whether or not to include it in the TIDE packet is
+        # a rather expensive process. So, the decisions are cached per neighbor class, and only the
+        # TIEs which were added, replaced, or removed since the previous TIDE are reconsidered (see
+        # tide_cache). The cached decisions are made for a neighbor system-id that does not match
+        # any originator.
+        neighbor_class = (neighbor_direction, neighbor_level, neighbor_is_top_of_fabric, my_level,
+                          i_am_top_of_fabric)
+        cache = self._tide_caches.get(neighbor_class)
+        if cache is None:
+            cache = tide_cache.TIDECache(
+                lambda tie_packet_info: self.include_tie_in_tide(tie_packet_info,
+                                                                 neighbor_direction, None,
+                                                                 neighbor_level,
+                                                                 neighbor_is_top_of_fabric,
+                                                                 my_level, i_am_top_of_fabric))
+            self._tide_caches[neighbor_class] = cache
+        cache.used = True
+        cached_tie_ids = cache.tie_ids(self.tie_packet_infos)
+        # The decisions for south TIEs which are originated by the neighbor depend on the system-id
+        # of the neighbor, so they are made for each TIDE. The TIE-IDs are merged by tie_id_tup (as
+        # in the TIE-DB), which compares tuples instead of calling TIEID.__lt__.
+        neighbor_tie_packet_infos = self.tie_packet_infos.ties_of_originator(neighbor_system_id,
+                                                                             constants.DIR_SOUTH)
+        if not neighbor_tie_packet_infos:
+            return cached_tie_ids.values()
+        neighbor_tie_ids = [tie_db.tie_packet_info_tie_id(tie_packet_info)
+                            for tie_packet_info in neighbor_tie_packet_infos]
+        excluded_keys = set(packet_common.tie_id_tup(tie_id) for tie_id in neighbor_tie_ids)
+        included_neighbor_items = [
+            (packet_common.tie_id_tup(tie_id), tie_id)
+            for (tie_id, tie_packet_info) in zip(neighbor_tie_ids, neighbor_tie_packet_infos)
+            if self.include_tie_in_tide(tie_packet_info, neighbor_direction,
+                                        neighbor_system_id, neighbor_level,
+                                        neighbor_is_top_of_fabric, my_level,
+                                        i_am_top_of_fabric)]
+        # The keys are unique, so the TIE-IDs in the items are never compared
+        merged_items = heapq.merge(
+            (item for item in cached_tie_ids.items() if item[0] not in excluded_keys),
+            included_neighbor_items)
+        return (tie_id for (_key, tie_id) in merged_items)
+
+    def include_tie_in_tide(self,
+                            tie_packet_info,
+                            neighbor_direction,
+                            neighbor_system_id,
+                            neighbor_level,
+                            neighbor_is_top_of_fabric,
+                            my_level,
+                            i_am_top_of_fabric):
+        tie_header = tie_packet_info.protocol_packet.content.tie.header
+        # The first possible reason for including a TIE header in the TIDE is to announce that
+        # we have a TIE that we want to send to the neighbor. In other words the TIE in the
+        # flooding scope from us to the neighbor.
+        (allowed, reason1) = self.flood_allowed_from_node_to_nbr(
+            tie_header=tie_header,
+            neighbor_direction=neighbor_direction,
+            neighbor_system_id=neighbor_system_id,
+            node_system_id=self.system_id,
+            node_level=my_level,
+            node_is_top_of_fabric=i_am_top_of_fabric)
+        if allowed:
+            self.db_debug("Include TIE %s in TIDE because %s (perspective us to neighbor)",
+                          tie_header, reason1)
+            return True
+        # The second possible reason for including a TIE header in the TIDE is because the
+        # neighbor might be considering to send the TIE to us, and we want to let the neighbor
+        # know that we already have the TIE and what version it it.
+        (allowed, reason2) = self.flood_allowed_from_nbr_to_node(
+            tie_header=tie_header,
+            neighbor_direction=neighbor_direction,
+            neighbor_system_id=neighbor_system_id,
+            neighbor_level=neighbor_level,
+            neighbor_is_top_of_fabric=neighbor_is_top_of_fabric,
+            node_system_id=self.system_id)
+        if allowed:
+            self.db_debug("Include TIE %s in TIDE because %s (perspective neighbor to us)",
+                          tie_header, reason2)
+            return True
+        # If we get here, we decided not to include the TIE header in the TIDE
+        self.db_debug("Exclude TIE %s from TIDE because %s (perspective us to neighbor) and "
+                      "%s (perspective neighbor to us)", tie_header, reason1, reason2)
+        return False
 
     def check_sysid_partially_connected(self, look_for_sysid):
         # Check every other node and the same level, and if there is at least one other node that
@@ -2474,7 +2680,7 @@ class Node:
         # partially connected. Note: if there are no other nodes at the same level, then the sysid
         # is not partially connected.
         node_adj_with_look_for_sysid = {}  # Indexed by sysid of other node at same level
-        for node_tie_packet_info in self.peer_node_tie_packet_infos.values():
+        for node_tie_packet_info in self.peer_node_tie_packet_infos():
             node_tie_packet = node_tie_packet_info.protocol_packet.content.tie
             node_sysid = node_tie_packet.header.tieid.originator
             node_level = node_tie_packet.element.node.level
@@ -2518,11 +2724,12 @@ class Node:
             ["Missing", "South-bound", "Adjacencies"],
             ["Extra", "South-bound", "Adjacencies"]])
         # If there are no other nodes at my level; return empty table.
-        if not self.peer_node_tie_packet_infos:
+        peer_node_tie_packet_infos = self.peer_node_tie_packet_infos()
+        if not peer_node_tie_packet_infos:
             return tab
         # Collect all north- and south-bound adjacencies of nodes at the same level
         nodes = {}
-        for node_tie_packet_info in self.peer_node_tie_packet_infos.values():
+        for node_tie_packet_info in peer_node_tie_packet_infos:
             node_tie_packet = node_tie_packet_info.protocol_packet.content.tie
             node_sysid = node_tie_packet.header.tieid.originator
             node_level = node_tie_packet.element.node.level
@@ -2647,7 +2854,15 @@ class Node:
         tab = table.Table()
         found_something = False
         tab.add_row(self.cli_tie_db_summary_headers())
-        for tie_packet_info in self.tie_packet_infos.values():
+        if filter_originator:
+            tie_packet_infos = self.tie_packet_infos.ties_of_originator(filter_originator,
+                                                                        filter_direction)
+        elif filter_direction and filter_tie_type:
+            tie_packet_infos = self.tie_packet_infos.ties_of_direction_and_type(filter_direction,
+                                                                                filter_tie_type)
+        else:
+            tie_packet_infos = self.tie_packet_infos.values()
+        for tie_packet_info in tie_packet_infos:
             tie_packet = tie_packet_info.protocol_packet.content.tie
             tie_id = tie_packet.header.tieid
             if filter_direction and tie_id.direction != filter_direction:
@@ -2664,14 +2879,11 @@ class Node:
         return tab
 
     def age_ties(self):
-        expired_key_ids = []
-        for tie_id, tie_packet_info in self.tie_packet_infos.items():
-            tie_packet_info.remaining_tie_lifetime -= 1
-            if tie_packet_info.remaining_tie_lifetime <= 0:
-                expired_key_ids.append(tie_id)
-        for key_id in expired_key_ids:
+        # The remaining lifetimes are derived from the aging clock of the TIE-DB (see tie_db), so
+        # only the TIEs that expire are looked at
+        for tie_id in self.tie_packet_infos.age():
             # TODO: log a message
-            self.remove_tie(key_id)
+            self.remove_tie(tie_id)
 
     @staticmethod
     def cli_tie_db_summary_headers():
@@ -2727,16 +2939,9 @@ class Node:
     def ties_of_type(self, direction, system_id, prefix_type):
         # Return an ordered list of TIEs from the given node and in the given direction
         # and of the given type
-        node_ties = []
-        start_tie_id = packet_common.make_tie_id(direction, system_id, prefix_type, 0)
-        end_tie_id = packet_common.make_tie_id(direction, system_id, prefix_type,
-                                               packet_common.MAX_U32)
-        node_tie_ids = self.tie_packet_infos.irange(start_tie_id, end_tie_id, (True, True))
-        for node_tie_id in node_tie_ids:
-            node_tie_packet_info = self.tie_packet_infos[node_tie_id]
-            node_tie_packet = node_tie_packet_info.protocol_packet.content.tie
-            node_ties.append(node_tie_packet)
-        return node_ties
+        return [tie_packet_info.protocol_packet.content.tie
+                for tie_packet_info in self.tie_packet_infos.ties_of_type(direction, system_id,
+                                                                          prefix_type)]
 
     def node_ties(self, direction, system_id):
         # Return an ordered list of all node TIEs from the given node and in the given direction
@@ -13,6 +13,10 @@ import constants
 import encoding.ttypes
 import encoding.constants
 import key
+import thrift_accelerated
+import thrift_decoder
+import thrift_encoder
+import thrift_fixer
 import utils
 
 RIFT_MAGIC = 0xA1F7
@@ -76,14 +80,21 @@ class PacketInfo:
         self.outer_key_id = None
         self.nonce_local = None
         self.nonce_remote = None
-        self.remaining_tie_lifetime = None
+        # While a TIE is aging in a TIE-DB (see start_aging), its remaining lifetime is not stored
+        # but derived from its expiry time on the aging clock of the TIE-DB
+        self._lifetime_clock = None
+        self._expiry_time = None
+        self._remaining_tie_lifetime = None
         self.outer_fingerprint_len = None
         self.outer_fingerprint = None
+        self._outer_sec_env_inputs = None
         # Origin security envelope header
         self.origin_sec_env_header = None
         self.origin_key_id = None
         self.origin_fingerprint_len = None
         self.origin_fingerprint = None
+        # Was the origin fingerprint found in the verified TIE cache? (None if not looked up)
+        self.origin_fingerprint_cache_hit = None
 
     def __str__(self):
         result_str = ""
@@ -110,6 +121,43 @@ class PacketInfo:
             result_str += "protocol-packet={}".format(self.protocol_packet)
         return result_str
 
+    @property
+    def remaining_tie_lifetime(self):
+        if self._lifetime_clock is None:
+            return self._remaining_tie_lifetime
+        return self._expiry_time - self._lifetime_clock.time
+
+    @remaining_tie_lifetime.setter
+    def remaining_tie_lifetime(self, remaining_tie_lifetime):
+        if self._lifetime_clock is None:
+            self._remaining_tie_lifetime = remaining_tie_lifetime
+        else:
+            # Sending a TIE sets its remaining lifetime to the value it already has; don't schedule
+            # another expiry for that
+            expiry_time = self._lifetime_clock.time + remaining_tie_lifetime
+            if expiry_time != self._expiry_time:
+                self._expiry_time = expiry_time
+                self._lifetime_clock.schedule_expiry(self)
+
+    @property
+    def expiry_time(self):
+        return self._expiry_time
+
+    def start_aging(self, lifetime_clock):
+        # From now on, the remaining lifetime decreases as the time of the clock increases. The
+        # clock must have a time attribute, and a schedule_expiry method which is called with this
+        # packet info whenever its expiry time changes.
+        self._expiry_time = lifetime_clock.time + self._remaining_tie_lifetime
+        self._lifetime_clock = lifetime_clock
+        lifetime_clock.schedule_expiry(self)
+
+    def stop_aging(self):
+        # Freeze the remaining lifetime at its current value
+        if self._lifetime_clock is not None:
+            self._remaining_tie_lifetime = self.remaining_tie_lifetime
+            self._lifetime_clock = None
+            self._expiry_time = None
+
     def message_parts(self):
         assert self.env_header
         assert self.outer_sec_env_header
@@ -135,6 +183,15 @@ class PacketInfo:
         else:
             remaining_tie_lifetime = 0xffffffff
         post = struct.pack("!HHL", nonce_local, nonce_remote, remaining_tie_lifetime)
+        # The same packet info is often sent again with the same outer key, nonces and remaining
+        # lifetime (e.g. an unchanged TIDE, or a TIE on several interfaces between nonce changes).
+        # In that case the outer security header from the previous update is still correct, and
+        # the outer fingerprint is not recomputed.
+        outer_sec_env_inputs = (outer_key, post, self.origin_sec_env_header,
+                                self.encoded_protocol_packet)
+        if outer_sec_env_inputs == self._outer_sec_env_inputs:
+            return
+        self._outer_sec_env_inputs = outer_sec_env_inputs
         if outer_key:
             self.outer_key_id = outer_key.key_id
             self.outer_fingerprint = outer_key.padded_digest(
@@ -255,24 +312,16 @@ def encode_protocol_packet(protocol_packet, origin_key):
 
 def reencode_packet_info(packet_info, origin_key):
     # Since Thrift does not support unsigned integer, we need to "fix" unsigned integers to be
-    # encoded as signed integers.
-    # We have to make a deep copy of the non-encoded packet, but this "fixing" involves changing
-    # various fields in the non-encoded packet from the range (0...MAX_UNSIGNED_INT) to
-    # (MIN_SIGNED_INT...MAX_SIGNED_INT) for various sizes of integers.
-    # For the longest time, I tried to avoid making a deep copy of the non-encoded packets, at least
-    # for some of the packets. For transient messages (e.g. LIEs) that is easier than for persistent
-    # messages (e.g. TIE which are stored in the database, or TIDEs which are encoded once and sent
-    # multiple times). However, in the end this turned out to be impossible or at least a
-    # bountiful source of bugs, because transient messages contain direct or indirect references
-    # to persistent objects. So, I gave up, and now always do a deep copy of the message to be
-    # encoded.
+    # encoded as signed integers. The Thrift encoder (see thrift_encode_protocol_packet) can only do
+    # that on a deep copy of the packet, which is expensive. Instead, the packet is encoded with our
+    # own encoder (see thrift_encoder), which converts the unsigned integers while it writes them,
+    # and which does not touch the packet itself. In verify mode, the encoded packet is checked
+    # against the output of the Thrift encoder.
     protocol_packet = packet_info.protocol_packet
-    fixed_protocol_packet = copy.deepcopy(protocol_packet)
-    fix_prot_packet_before_encode(fixed_protocol_packet)
-    transport_out = thrift.transport.TTransport.TMemoryBuffer()
-    protocol_out = thrift.protocol.TBinaryProtocol.TBinaryProtocol(transport_out)
-    fixed_protocol_packet.write(protocol_out)
-    packet_info.encoded_protocol_packet = transport_out.getvalue()
+    encoded_protocol_packet = encode_protocol_packet_fast(protocol_packet)
+    if VERIFY_ENCODE:
+        verify_encoded_protocol_packet(protocol_packet, encoded_protocol_packet)
+    packet_info.encoded_protocol_packet = encoded_protocol_packet
     # If it is a TIE, update the origin security header. We do this here since it only needs to be
     # done once when the packet is encoded. However, for the envelope header and for the outer
     # security header it is up to the caller to call the corresponding update function before
@@ -284,8 +333,54 @@ def reencode_packet_info(packet_info, origin_key):
         packet_info.update_origin_sec_env_header(origin_key)
     return packet_info
 
+def thrift_encode_protocol_packet(protocol_packet):
+    # Encode the packet using the Thrift encoder. We have to make a deep copy of the non-encoded
+    # packet, because the "fixing" involves changing various fields in the non-encoded packet from
+    # the range (0...MAX_UNSIGNED_INT) to (MIN_SIGNED_INT...MAX_SIGNED_INT) for various sizes of
+    # integers. Transient messages (e.g. LIEs) contain direct or indirect references to persistent
+    # objects (e.g. TIEs which are stored in the database), so the copy cannot be avoided.
+    fixed_protocol_packet = copy.deepcopy(protocol_packet)
+    fix_prot_packet_before_encode(fixed_protocol_packet)
+    if ACCELERATED_CODEC is not None:
+        return ACCELERATED_CODEC.encode(fixed_protocol_packet)
+    transport_out = thrift.transport.TTransport.TMemoryBuffer()
+    protocol_out = thrift.protocol.TBinaryProtocol.TBinaryProtocol(transport_out)
+    fixed_protocol_packet.write(protocol_out)
+    return transport_out.getvalue()
+
+def verify_encoded_protocol_packet(protocol_packet, encoded_protocol_packet):
+    # Sets are encoded in iteration order, and the Thrift encoder iterates over a copy of each set,
+    # which is not always in the same order as the original set. If the bytes differ, the packets
+    # must still decode to the same packet.
+    thrift_encoded_protocol_packet = thrift_encode_protocol_packet(protocol_packet)
+    if encoded_protocol_packet == thrift_encoded_protocol_packet:
+        return
+    decoded = decode_protocol_packet_bytes(encoded_protocol_packet)
+    thrift_decoded = decode_protocol_packet_bytes(thrift_encoded_protocol_packet)
+    assert decoded == thrift_decoded, \
+        "Fast encoder output {} differs from Thrift encoder output {} for packet {}".format(
+            encoded_protocol_packet.hex(), thrift_encoded_protocol_packet.hex(), protocol_packet)
+
+def decode_protocol_packet_bytes(encoded_protocol_packet):
+    protocol_packet = thrift_decode_protocol_packet(encoded_protocol_packet)
+    fix_prot_packet_after_decode(protocol_packet)
+    return protocol_packet
+
+def thrift_decode_protocol_packet(encoded_protocol_packet):
+    # Decode the packet using the active codec (see set_codec); the caller must fix the decoded
+    # packet
+    if ACCELERATED_CODEC is not None:
+        return ACCELERATED_CODEC.decode(encoded_protocol_packet)
+    transport_in = thrift.transport.TTransport.TMemoryBuffer(encoded_protocol_packet)
+    protocol_in = thrift.protocol.TBinaryProtocol.TBinaryProtocol(transport_in)
+    protocol_packet = encoding.ttypes.ProtocolPacket()
+    protocol_packet.read(protocol_in)
+    return protocol_packet
+
 def decode_message(rx_intf, from_info, message, active_outer_key, accept_outer_keys,
-                   active_origin_key, accept_origin_keys):
+                   active_origin_key, accept_origin_keys, verified_tie_cache=None):
+    # The message is either bytes or a memoryview (see UdpRxHandler.ready_to_read). The headers are
+    # decoded in place; only the parts that are kept in the packet info are copied.
     packet_info = PacketInfo()
     record_source_info(packet_info, rx_intf, from_info)
     continue_offset = decode_envelope_header(packet_info, message)
@@ -298,15 +393,41 @@ def decode_message(rx_intf, from_info, message, active_outer_key, accept_outer_k
         continue_offset = decode_origin_security_header(packet_info, message, continue_offset)
         if continue_offset == -1:
             return packet_info
-    continue_offset = decode_protocol_packet(packet_info, message, continue_offset)
+    use_verified_tie_cache = verified_tie_cache is not None and packet_info.origin_fingerprint
+    verified_encoded_protocol_packet = None
+    if use_verified_tie_cache:
+        verified_encoded_protocol_packet = lookup_verified_tie(
+            packet_info, message, continue_offset, active_origin_key, accept_origin_keys,
+            verified_tie_cache)
+    # A TIE which is found in the verified TIE cache is a duplicate of a TIE that was received
+    # (and decoded) before, so only its header is decoded: the element is decoded when it is
+    # needed, which for a duplicate is normally never (see TIE_PASS_THROUGH)
+    verified = verified_encoded_protocol_packet is not None
+    continue_offset = decode_protocol_packet(packet_info, message, continue_offset,
+                                             verified_encoded_protocol_packet, verified)
     if continue_offset == -1:
         return packet_info
     if not check_outer_fingerprint(packet_info, active_outer_key, accept_outer_keys):
         return packet_info
-    if not check_origin_fingerprint(packet_info, active_origin_key, accept_origin_keys):
+    if not check_origin_fingerprint(packet_info, active_origin_key, accept_origin_keys, verified):
         return packet_info
+    if use_verified_tie_cache and not packet_info.error:
+        if not verified:
+            origin_key = find_key_id(packet_info.origin_key_id, active_origin_key,
+                                     accept_origin_keys)
+            verified_tie_cache.add(packet_info, origin_key)
+        packet_info.origin_fingerprint_cache_hit = verified
     return packet_info
 
+def lookup_verified_tie(packet_info, message, offset, active_origin_key, accept_origin_keys,
+                        verified_tie_cache):
+    # If the TIE is in the verified TIE cache, return the cached encoded TIE (so that the message
+    # does not have to be copied, the element does not have to be decoded, and the origin
+    # fingerprint does not have to be checked again), otherwise return None
+    origin_key = find_key_id(packet_info.origin_key_id, active_origin_key, accept_origin_keys)
+    return verified_tie_cache.lookup(packet_info.origin_key_id, packet_info.origin_fingerprint,
+                                     message[offset:], origin_key)
+
 def set_lifetime(packet_info, lifetime):
     packet_info.remaining_tie_lifetime = lifetime
 
@@ -326,12 +447,12 @@ def decode_envelope_header(packet_info, message):
         packet_info.error = packet_info.ERR_MSG_TOO_SHORT
         packet_info.error_details = "Missing magic and packet number"
         return -1
-    (magic, packet_nr) = struct.unpack("!HH", message[0:4])
+    (magic, packet_nr) = struct.unpack_from("!HH", message, 0)
     if magic != RIFT_MAGIC:
         packet_info.error = packet_info.ERR_WRONG_MAGIC
         packet_info.error_details = "Expected 0x{:x}, got 0x{:x}".format(RIFT_MAGIC, magic)
         return -1
-    packet_info.env_header = message[0:4]
+    packet_info.env_header = bytes(message[0:4])
     packet_info.packet_nr = packet_nr
     return 4
 
@@ -344,7 +465,7 @@ def decode_outer_security_header(packet_info, message, offset):
             "Missing major version, outer key id and outer fingerprint length"
         return -1
     (_reserved, major_version, outer_key_id, outer_fingerprint_len) = \
-        struct.unpack("!BBBB", message[offset:offset+4])
+        struct.unpack_from("!BBBB", message, offset)
     offset += 4
     expected_major_version = encoding.constants.protocol_major_version
     if major_version != expected_major_version:
@@ -357,7 +478,6 @@ def decode_outer_security_header(packet_info, message, offset):
         packet_info.error = packet_info.ERR_MSG_TOO_SHORT
         packet_info.error_details = "Missing outer fingerprint"
         return -1
-    outer_fingerprint = message[offset:offset+outer_fingerprint_len]
     offset += outer_fingerprint_len
     if offset + 8 > message_len:
         packet_info.error = packet_info.ERR_MSG_TOO_SHORT
@@ -365,9 +485,11 @@ def decode_outer_security_header(packet_info, message, offset):
             "Missing nonce local, nonce remote and remaining tie lifetime"
         return -1
     (nonce_local, nonce_remote, remaining_tie_lifetime) = \
-        struct.unpack("!HHL", message[offset:offset+8])
+        struct.unpack_from("!HHL", message, offset)
     offset += 8
-    packet_info.outer_sec_env_header = message[start_header_offset:offset]
+    outer_sec_env_header = bytes(message[start_header_offset:offset])
+    outer_fingerprint = outer_sec_env_header[4:-8]
+    packet_info.outer_sec_env_header = outer_sec_env_header
     packet_info.outer_key_id = outer_key_id
     packet_info.nonce_local = nonce_local
     packet_info.nonce_remote = nonce_remote
@@ -384,7 +506,7 @@ def decode_origin_security_header(packet_info, message, offset):
         packet_info.error_details = \
             "Missing TIE origin key id and TIE origin fingerprint length"
         return -1
-    (byte1, byte2, byte3, origin_fingerprint_len) = struct.unpack("!BBBB", message[offset:offset+4])
+    (byte1, byte2, byte3, origin_fingerprint_len) = struct.unpack_from("!BBBB", message, offset)
     origin_key_id = (byte1 << 16) | (byte2 << 8) | byte3
     offset += 4
     if ((origin_key_id == 0 and origin_fingerprint_len != 0) or
@@ -396,34 +518,48 @@ def decode_origin_security_header(packet_info, message, offset):
         packet_info.error = packet_info.ERR_MSG_TOO_SHORT
         packet_info.error_details = "Missing TIE origin fingerprint"
         return -1
-    origin_fingerprint = message[offset:offset+origin_fingerprint_len]
     offset += origin_fingerprint_len
-    packet_info.origin_sec_env_header = message[start_header_offset:offset]
+    origin_sec_env_header = bytes(message[start_header_offset:offset])
+    origin_fingerprint = origin_sec_env_header[4:]
+    packet_info.origin_sec_env_header = origin_sec_env_header
     packet_info.origin_key_id = origin_key_id
     packet_info.origin_fingerprint_len = origin_fingerprint_len
     packet_info.origin_fingerprint = origin_fingerprint
     return offset
 
-def decode_protocol_packet(packet_info, message, offset):
-    encoded_protocol_packet = message[offset:]
-    transport_in = thrift.transport.TTransport.TMemoryBuffer(encoded_protocol_packet)
-    protocol_in = thrift.protocol.TBinaryProtocol.TBinaryProtocol(transport_in)
-    protocol_packet = encoding.ttypes.ProtocolPacket()
-    try:
-        protocol_packet.read(protocol_in)
-    # We don't know what exception Thrift might throw
-    # pylint: disable=broad-except
-    except Exception as err:
-        packet_info.error = packet_info.ERR_TRIFT_DECODE
-        packet_info.error_details = str(err)
-        return -1
+def decode_protocol_packet(packet_info, message, offset, encoded_protocol_packet=None,
+                           pass_through=False):
+    # The message may be a memoryview of the receive buffer, which is reused for the next message.
+    # The encoded protocol packet outlives this call (it is kept in the packet info, for the packet
+    # trace and for re-flooding the TIEs from the TIE-DB), so it is copied (at most once), unless
+    # the caller already has an identical copy (see lookup_verified_tie).
+    if encoded_protocol_packet is None:
+        encoded_protocol_packet = bytes(message[offset:])
+    # Try the fast path for LIEs, TIDEs, and TIREs (and for TIEs in TIE pass-through mode, or if
+    # the caller asks for it) first; it produces an already fixed packet. If it gives up, decode the
+    # packet using the generic path (which does the error handling).
+    if TIE_PASS_THROUGH or pass_through:
+        protocol_packet = decode_protocol_packet_pass_through(encoded_protocol_packet)
+    else:
+        protocol_packet = decode_protocol_packet_fast(encoded_protocol_packet)
+    fixed = protocol_packet is not None
+    if not fixed:
+        try:
+            protocol_packet = thrift_decode_protocol_packet(encoded_protocol_packet)
+        # We don't know what exception Thrift might throw
+        # pylint: disable=broad-except
+        except Exception as err:
+            packet_info.error = packet_info.ERR_TRIFT_DECODE
+            packet_info.error_details = str(err)
+            return -1
     try:
         protocol_packet.validate()
     except thrift.protocol.TProtocol.TProtocolException as err:
         packet_info.error = packet_info.ERR_TRIFT_VALIDATE
         packet_info.error_details = str(err)
         return -1
-    fix_prot_packet_after_decode(protocol_packet)
+    if not fixed:
+        fix_prot_packet_after_decode(protocol_packet)
     packet_info.encoded_protocol_packet = encoded_protocol_packet
     packet_info.protocol_packet = protocol_packet
     if protocol_packet.content.lie:
@@ -456,7 +592,9 @@ def check_outer_fingerprint(packet_info, active_outer_key, accept_outer_keys):
         return False
     return True
 
-def check_origin_fingerprint(packet_info, active_origin_key, accept_origin_keys):
+def check_origin_fingerprint(packet_info, active_origin_key, accept_origin_keys, verified=False):
+    # If verified is True, the origin fingerprint of the same encoded TIE has already been verified
+    # using the same key (see verified_tie_cache), so it is not computed again
     if packet_info.protocol_packet:
         if packet_info.protocol_packet.content.tie:
             if not packet_info.origin_sec_env_header:
@@ -476,6 +614,8 @@ def check_origin_fingerprint(packet_info, active_origin_key, accept_origin_keys)
             packet_info.error = packet_info.ERR_NON_ZERO_ORIGIN_KEY_ID_NOT_ACCEPTED
             packet_info.error_details = "TIE origin key id is " + str(packet_info.origin_key_id)
         return False
+    if verified:
+        return True
     expected = use_key.padded_digest([packet_info.encoded_protocol_packet])
     if packet_info.origin_fingerprint != expected:
         packet_info.error = packet_info.ERR_INCORRECT_ORIGIN_FINGERPRINT
@@ -682,6 +822,17 @@ PREFIX_TIE_ELEMENT_FIXES = [
     ('prefixes', (IP_PREFIX_FIXES, PREFIX_ATTRIBUTES_FIXES))
 ]
 
+TIE_ELEMENT_FIXES = [
+    ('node', [
+        ('level', 16),
+        ('neighbors', (64, NODE_NEIGHBORS_TIE_ELEMENT_FIXES))
+    ]),
+    ('prefixes', PREFIX_TIE_ELEMENT_FIXES),
+    ('positive_disaggregation_prefixes', PREFIX_TIE_ELEMENT_FIXES),
+    ('negative_disaggregation_prefixes', PREFIX_TIE_ELEMENT_FIXES),
+    ('external_prefixes', PREFIX_TIE_ELEMENT_FIXES),
+]
+
 PROTOCOL_PACKET_FIXES = [
     ('header', [
         ('major_version', 8),
@@ -711,25 +862,120 @@ PROTOCOL_PACKET_FIXES = [
         ]),
         ('tie', [
             ('header', TIE_HEADER_FIXES),
-            ('element', [
-                ('node', [
-                    ('level', 16),
-                    ('neighbors', (64, NODE_NEIGHBORS_TIE_ELEMENT_FIXES))
-                ]),
-                ('prefixes', PREFIX_TIE_ELEMENT_FIXES),
-                ('positive_disaggregation_prefixes', PREFIX_TIE_ELEMENT_FIXES),
-                ('negative_disaggregation_prefixes', PREFIX_TIE_ELEMENT_FIXES),
-                ('external_prefixes', PREFIX_TIE_ELEMENT_FIXES),
-            ])
+            ('element', TIE_ELEMENT_FIXES)
         ])
     ])
 ]
 
+# Encodes a protocol packet, including the fixes for the unsigned fields, and returns the bytes
+encode_protocol_packet_fast = thrift_encoder.make_struct_encoder(encoding.ttypes.ProtocolPacket,
+                                                                 PROTOCOL_PACKET_FIXES)
+
+# Check the output of the fast encoder against the output of the Thrift encoder
+VERIFY_ENCODE = False
+
+# Decodes a LIE, TIDE, or TIRE protocol packet, including the fixes for the unsigned fields, and
+# returns the packet, or None if the packet must be decoded using the generic path
+decode_protocol_packet_fast = thrift_decoder.make_struct_decoder(encoding.ttypes.ProtocolPacket,
+                                                                 PROTOCOL_PACKET_FIXES,
+                                                                 [encoding.ttypes.TIEPacket])
+
+# Decodes a TIE element, including the fixes for the unsigned fields, and returns the element, or
+# None if the element must be decoded using the generic path
+decode_tie_element_fast = thrift_decoder.make_struct_decoder(encoding.ttypes.TIEElement,
+                                                             TIE_ELEMENT_FIXES)
+
+FIX_TIE_ELEMENT_AFTER_DECODE = thrift_fixer.make_struct_fixer(encoding.ttypes.TIEElement,
+                                                              TIE_ELEMENT_FIXES, False)
+
+def decode_tie_element(encoded_tie_element):
+    # The pass-through decoder only accepts TIE elements which the fast decoder can decode, so the
+    # generic path should never be needed here
+    tie_element = decode_tie_element_fast(encoded_tie_element)
+    if tie_element is None:
+        transport_in = thrift.transport.TTransport.TMemoryBuffer(encoded_tie_element)
+        protocol_in = thrift.protocol.TBinaryProtocol.TBinaryProtocol(transport_in)
+        tie_element = encoding.ttypes.TIEElement.read(protocol_in)
+        FIX_TIE_ELEMENT_AFTER_DECODE(tie_element)
+    return tie_element
+
+class LazyTIEElement(thrift_decoder.LazyStruct, encoding.ttypes.TIEElement):
+    # The element of a received TIE, which is only decoded when it is needed (see TIE_PASS_THROUGH)
+    STRUCT_CLASS = encoding.ttypes.TIEElement
+    DECODE = decode_tie_element
+
+# Decodes a LIE, TIDE, TIRE, or TIE protocol packet in the same way as decode_protocol_packet_fast,
+# except that the element of a TIE is not decoded, but stored as a LazyTIEElement
+decode_protocol_packet_pass_through = thrift_decoder.make_struct_decoder(
+    encoding.ttypes.ProtocolPacket, PROTOCOL_PACKET_FIXES,
+    lazy_classes={encoding.ttypes.TIEElement: LazyTIEElement})
+
+# In TIE pass-through mode, the header of a received TIE is decoded right away (it is needed for
+# flooding), but the element is only decoded when it is actually used (e.g. by SPF, or by the CLI).
+# A received TIE is reflooded using the received encoded packet, so a TIE which is only flooded
+# through this node is never fully decoded. Pass-through mode is off by default.
+TIE_PASS_THROUGH = False
+
+# Compiled versions of fix_packet_before_encode and fix_packet_after_decode for protocol packets
+FIX_PROT_PACKET_BEFORE_ENCODE = thrift_fixer.make_struct_fixer(encoding.ttypes.ProtocolPacket,
+                                                               PROTOCOL_PACKET_FIXES, True)
+FIX_PROT_PACKET_AFTER_DECODE = thrift_fixer.make_struct_fixer(encoding.ttypes.ProtocolPacket,
+                                                              PROTOCOL_PACKET_FIXES, False)
+
 def fix_prot_packet_before_encode(protocol_packet):
-    fix_packet_before_encode(protocol_packet, PROTOCOL_PACKET_FIXES)
+    FIX_PROT_PACKET_BEFORE_ENCODE(protocol_packet)
 
 def fix_prot_packet_after_decode(protocol_packet):
-    fix_packet_after_decode(protocol_packet, PROTOCOL_PACKET_FIXES)
+    FIX_PROT_PACKET_AFTER_DECODE(protocol_packet)
+
+CODEC_PYTHON = "python"
+CODEC_ACCELERATED = "accelerated"
+CODECS = [CODEC_ACCELERATED, CODEC_PYTHON]
+DEFAULT_CODEC = CODEC_ACCELERATED
+
+# The codec which is used to decode protocol packets (and to encode them in verify mode). The
+# accelerated codec uses the fastbinary C extension of the thrift package; if that is not available
+# (or does not work with the generated Thrift structures), the pure-Python codec is used instead.
+# Protocol packets are encoded by the fast encoder (see thrift_encoder) in either case: it is faster
+# than making the fixed deep copy which the accelerated encoder needs.
+CODEC = CODEC_PYTHON
+ACCELERATED_CODEC = None
+
+def set_codec(codec):
+    # Select the codec and return the codec that is actually used
+    global CODEC, ACCELERATED_CODEC   # pylint:disable=global-statement
+    assert codec in CODECS
+    ACCELERATED_CODEC = None
+    if codec == CODEC_ACCELERATED:
+        ACCELERATED_CODEC = thrift_accelerated.make_codec(encoding.ttypes.ProtocolPacket,
+                                                          codec_sample_packet())
+    if ACCELERATED_CODEC is not None:
+        CODEC = CODEC_ACCELERATED
+    else:
+        CODEC = CODEC_PYTHON
+    return CODEC
+
+def codec_sample_packet():
+    # A (fixed) packet to check that the accelerated codec works
+    lie_packet = encoding.ttypes.LIEPacket(
+        name="sample",
+        local_id=-1,
+        flood_port=constants.DEFAULT_TIE_PORT,
+        link_mtu_size=1400,
+        neighbor=encoding.ttypes.Neighbor(originator=-2, remote_id=3),
+        pod=0,
+        node_capabilities=encoding.ttypes.NodeCapabilities(
+            protocol_minor_version=encoding.constants.protocol_minor_version,
+            flood_reduction=True),
+        holdtime=3,
+        not_a_ztp_offer=False)
+    return encoding.ttypes.ProtocolPacket(
+        header=encoding.ttypes.PacketHeader(
+            major_version=encoding.constants.protocol_major_version,
+            minor_version=encoding.constants.protocol_minor_version,
+            sender=-3,
+            level=-4),
+        content=encoding.ttypes.PacketContent(lie=lie_packet))
 
 def make_tie_id(direction, originator, tie_type, tie_nr):
     tie_id = encoding.ttypes.TIEID(
@@ -1,13 +1,66 @@
+import abc
+import asyncio
 import select
+import selectors
 import time
-from timer import TIMER_SCHEDULER
+
+import stats
+import timer
+import watchdog
 from fsm import Fsm
 
-class Scheduler:
+class Scheduler(abc.ABC):
+
+    # Abstract base class for the schedulers: keeps track of the handlers and the statistics.
+    # Derived classes decide how to wait for file descriptors to become ready to read; see
+    # PollingScheduler (and its derived classes SelectScheduler and EpollScheduler) and
+    # AsyncioScheduler.
+
+    # Interval for the timer that measures event loop latency (i.e. how late timers expire)
+    LATENCY_PROBE_INTERVAL = 0.1
+
+    # The phases of an iteration of the scheduler loop, in the order that they are reported
+    PHASE_PENDING_EVENTS = "Process pending events"
+    PHASE_EXPIRED_TIMERS = "Process expired timers"
+    PHASE_SELECT = "Wait for ready to read (select)"
+    PHASE_READY_TO_READ = "Process ready to read"
+    PHASE_TIMER_SLIP = "Timer slip"
+    PHASES = [PHASE_PENDING_EVENTS, PHASE_EXPIRED_TIMERS, PHASE_SELECT, PHASE_READY_TO_READ,
+              PHASE_TIMER_SLIP]
+
+    # The work (i.e. the processing time) of the scheduler loop is also accounted by the position
+    # within the second at which it was done, in WORK_SLOTS_PER_SECOND slots, and by window of one
+    # slot. When the periodic timers of many nodes and interfaces expire in lockstep, most of the
+    # work is done in a few slots, and the busiest windows see much more work than average.
+    WORK_SLOTS_PER_SECOND = 10
+
+    # Handler priorities: a handler can define its priority in a handler_priority attribute;
+    # otherwise it has normal priority. A lower number is a higher priority.
+    PRIORITY_HIGH = 0
+    PRIORITY_NORMAL = 1
 
     def __init__(self):
         self._handlers_by_rx_fd = {}
-        self._rx_fds = []
+        self._handler_priorities_by_rx_fd = {}
+        # Each time a handler is ready to read, it reads at most read_budget messages, so that a
+        # busy socket cannot starve the other sockets and the timers. The receive policy determines
+        # the order in which the ready handlers are served (see PollingScheduler._service_order).
+        self.read_budget = DEFAULT_READ_BUDGET
+        self.rx_policy = DEFAULT_RX_POLICY
+        # Processing time histograms for each phase of the loop, and for each type of handler (a
+        # handler can define its type in a handler_type attribute; otherwise its class name is used)
+        self.phase_histograms = {phase: stats.Histogram() for phase in self.PHASES}
+        self.handler_histograms = {}
+        self._handler_histograms_by_rx_fd = {}
+        self._handler_types_by_rx_fd = {}
+        self.work_by_slot = [0.0] * self.WORK_SLOTS_PER_SECOND
+        self.work_window_histogram = stats.Histogram()
+        self._work_window = None
+        self._work_window_work = 0.0
+        self._latency_probe_timer = None
+        self.latency_samples = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
         self.slip_count_10ms = 0
         self.slip_count_100ms = 0
         self.slip_count_1000ms = 0
@@ -19,49 +72,408 @@ class Scheduler:
     def register_handler(self, handler):
         rx_fd = handler.rx_fd()
         self._handlers_by_rx_fd[rx_fd] = handler
-        self._rx_fds.append(rx_fd)
+        self._handler_priorities_by_rx_fd[rx_fd] = getattr(handler, 'handler_priority',
+                                                           self.PRIORITY_NORMAL)
+        handler_type = getattr(handler, 'handler_type', type(handler).__name__)
+        histogram = self.handler_histograms.get(handler_type)
+        if histogram is None:
+            histogram = stats.Histogram()
+            self.handler_histograms[handler_type] = histogram
+        self._handler_histograms_by_rx_fd[rx_fd] = histogram
+        self._handler_types_by_rx_fd[rx_fd] = handler_type
+        self._register_fd(rx_fd)
 
     def unregister_handler(self, handler):
         rx_fd = handler.rx_fd()
         if rx_fd is not None and rx_fd in self._handlers_by_rx_fd:
             del self._handlers_by_rx_fd[rx_fd]
-            self._rx_fds.remove(rx_fd)
+            del self._handler_priorities_by_rx_fd[rx_fd]
+            del self._handler_histograms_by_rx_fd[rx_fd]
+            del self._handler_types_by_rx_fd[rx_fd]
+            self._unregister_fd(rx_fd)
+
+    def nr_handlers(self):
+        return len(self._handlers_by_rx_fd)
+
+    def create_timer_scheduler(self):
+        return timer.TimingWheelTimerScheduler()
+
+    def close(self):
+        pass
+
+    def start_latency_probe(self):
+        if self._latency_probe_timer is None:
+            self._latency_probe_timer = timer.Timer(
+                interval=self.LATENCY_PROBE_INTERVAL,
+                expire_function=self._latency_probe_expired)
+
+    def _latency_probe_expired(self):
+        # While the expire function runs, the timer still reports the time at which it should
+        # have expired
+        latency = max(timer.TIMER_SCHEDULER.now() - self._latency_probe_timer.expire_time(), 0.0)
+        self.latency_samples += 1
+        self.latency_sum += latency
+        self.latency_max = max(self.latency_max, latency)
+
+    def clear_latency_stats(self):
+        self.latency_samples = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+
+    def latency_average(self):
+        if self.latency_samples == 0:
+            return 0.0
+        return self.latency_sum / self.latency_samples
+
+    def clear_histograms(self):
+        for histogram in self.phase_histograms.values():
+            histogram.clear()
+        for histogram in self.handler_histograms.values():
+            histogram.clear()
+        timer.TIMER_SCHEDULER.clear_expire_histograms()
+        self.work_by_slot = [0.0] * self.WORK_SLOTS_PER_SECOND
+        self.work_window_histogram.clear()
+        self._work_window = None
+        self._work_window_work = 0.0
+
+    def _record_work(self, duration):
+        # The work in a window is recorded in the histogram when the first work in a later window
+        # is done; windows without any work are not recorded
+        window = int(timer.TIMER_SCHEDULER.now() * self.WORK_SLOTS_PER_SECOND)
+        if window != self._work_window:
+            if self._work_window is not None:
+                self.work_window_histogram.record(self._work_window_work)
+            self._work_window = window
+            self._work_window_work = 0.0
+        self._work_window_work += duration
+        self.work_by_slot[window % self.WORK_SLOTS_PER_SECOND] += duration
+
+    def _handler_ready_to_read(self, rx_fd):
+        start_time = time.monotonic()
+        # An earlier handler in this same iteration may have unregistered this handler
+        handler = self._handlers_by_rx_fd.get(rx_fd)
+        if handler is None:
+            return
+        watchdog.callback_started(self._handler_types_by_rx_fd[rx_fd])
+        handler.ready_to_read()
+        watchdog.callback_finished()
+        duration = time.monotonic() - start_time
+        self.max_ready_to_read_proc_time = max(self.max_ready_to_read_proc_time, duration)
+        self.phase_histograms[self.PHASE_READY_TO_READ].record(duration)
+        self._record_work(duration)
+        # The handler may have unregistered itself
+        histogram = self._handler_histograms_by_rx_fd.get(rx_fd)
+        if histogram is not None:
+            histogram.record(duration)
+
+    @abc.abstractmethod
+    def _register_fd(self, rx_fd):
+        # Start watching the file descriptor for ready to read
+        pass
+
+    @abc.abstractmethod
+    def _unregister_fd(self, rx_fd):
+        # Stop watching the file descriptor for ready to read
+        pass
 
+    @abc.abstractmethod
+    def run_one_iteration(self):
+        pass
+
+    @abc.abstractmethod
     def run(self):
+        # Run until stop is called
+        pass
+
+    @abc.abstractmethod
+    def stop(self):
+        # Make run return (e.g. from a handler, when the engine has nothing left to do)
+        pass
+
+class PollingScheduler(Scheduler):
+
+    # Base class for the schedulers that run their own loop: each iteration processes the queued
+    # events and the expired timers, waits until a file descriptor is ready to read or until the
+    # next timer expires, and then serves the ready handlers. Derived classes decide how to wait;
+    # see SelectScheduler and EpollScheduler.
+
+    def __init__(self):
+        Scheduler.__init__(self)
+        self._round_robin_offset = 0
+        self.stop_requested = False
+
+    def _service_order(self, rx_ready):
+        # Return the order in which to serve the handlers that are ready to read. The start of the
+        # order rotates each time (round-robin), so that no handler is always served first. With
+        # the priority receive policy, handlers with a higher priority (e.g. LIE sockets) are
+        # served before handlers with a lower priority (e.g. flooding sockets). Handlers that
+        # used up their read budget are still ready to read in the next iteration.
+        rx_ready = sorted(rx_ready)
+        if len(rx_ready) > 1:
+            self._round_robin_offset += 1
+            offset = self._round_robin_offset % len(rx_ready)
+            rx_ready = rx_ready[offset:] + rx_ready[:offset]
+            if self.rx_policy == RX_POLICY_PRIORITY:
+                priorities = self._handler_priorities_by_rx_fd
+                rx_ready.sort(key=lambda rx_fd: priorities.get(rx_fd, self.PRIORITY_NORMAL))
+        return rx_ready
+
+    @abc.abstractmethod
+    def _wait_ready_fds(self, timeout):
+        # Wait until at least one registered file descriptor is ready to read, or until the timeout
+        # expires. Return the list of file descriptors that are ready to read.
+        pass
+
+    def process_events_and_timers(self):
+        # Process all queued events and all expired timers, and return the time until the next
+        # timer expires (None if no timer is running).
+        # This needs to be a loop because processing an event can create a timer and processing
+        # an expired timer can create an event.
         while True:
-            # This needs to be a loop because processing an event can create a timer and processing
-            # an expired timer can create an event.
-            while Fsm.events_pending() or TIMER_SCHEDULER.expired_timers_pending():
-                # Process all queued events
-                start_time = time.monotonic()
-                Fsm.process_queued_events()
-                duration = time.monotonic() - start_time
-                self.max_pending_events_proc_time = max(self.max_pending_events_proc_time, duration)
-                # Process all expired timers
-                start_time = time.monotonic()
-                timeout = TIMER_SCHEDULER.trigger_all_expired_timers()
-                duration = time.monotonic() - start_time
-                self.max_expired_timers_proc_time = max(self.max_expired_timers_proc_time, duration)
-            # Wait for ready to read or expired timer
+            # Process all queued events
             start_time = time.monotonic()
-            rx_ready, _, _ = select.select(self._rx_fds, [], [], timeout)
+            watchdog.callback_started(self.PHASE_PENDING_EVENTS)
+            Fsm.process_queued_events()
+            watchdog.callback_finished()
             duration = time.monotonic() - start_time
-            self.max_select_proc_time = max(self.max_select_proc_time, duration)
-            # Check for timer slips
-            if timeout is not None:
-                slip_time = duration - timeout
-                if slip_time > 0.01:
-                    self.slip_count_10ms += 1
-                if slip_time > 0.1:
-                    self.slip_count_100ms += 1
-                if slip_time > 1.0:
-                    self.slip_count_1000ms += 1
-            # Process all handlers that are ready to read
-            for rx_fd in rx_ready:
-                start_time = time.monotonic()
-                handler = self._handlers_by_rx_fd[rx_fd]
-                handler.ready_to_read()
-                duration = time.monotonic() - start_time
-                self.max_ready_to_read_proc_time = max(self.max_ready_to_read_proc_time, duration)
-
-SCHEDULER = Scheduler()
+            self.max_pending_events_proc_time = max(self.max_pending_events_proc_time, duration)
+            self.phase_histograms[self.PHASE_PENDING_EVENTS].record(duration)
+            self._record_work(duration)
+            # Process all expired timers
+            start_time = time.monotonic()
+            timeout = timer.TIMER_SCHEDULER.trigger_all_expired_timers()
+            duration = time.monotonic() - start_time
+            self.max_expired_timers_proc_time = max(self.max_expired_timers_proc_time, duration)
+            self.phase_histograms[self.PHASE_EXPIRED_TIMERS].record(duration)
+            self._record_work(duration)
+            if not (Fsm.events_pending() or timer.TIMER_SCHEDULER.expired_timers_pending()):
+                return timeout
+
+    def run_one_iteration(self):
+        timeout = self.process_events_and_timers()
+        if timer.TIMER_SCHEDULER.virtual_clock_enabled():
+            self._run_one_virtual_clock_iteration(timeout)
+            return
+        # Wait for ready to read or expired timer
+        start_time = time.monotonic()
+        rx_ready = self._wait_ready_fds(timeout)
+        duration = time.monotonic() - start_time
+        self.max_select_proc_time = max(self.max_select_proc_time, duration)
+        self.phase_histograms[self.PHASE_SELECT].record(duration)
+        # Check for timer slips
+        if timeout is not None:
+            slip_time = duration - timeout
+            if slip_time >= 0.0:
+                # Woke up because the timeout expired (not early because a handler became ready)
+                self.phase_histograms[self.PHASE_TIMER_SLIP].record(slip_time)
+            if slip_time > 0.01:
+                self.slip_count_10ms += 1
+            if slip_time > 0.1:
+                self.slip_count_100ms += 1
+            if slip_time > 1.0:
+                self.slip_count_1000ms += 1
+        # Process all handlers that are ready to read
+        for rx_fd in self._service_order(rx_ready):
+            self._handler_ready_to_read(rx_fd)
+
+    def _run_one_virtual_clock_iteration(self, timeout):
+        # With the virtual clock there is never a real wait for a timer. If no file descriptor is
+        # ready right now, then nothing can happen until the next timer expires, so the virtual
+        # clock jumps straight to that expire time. Packets on simulated interfaces are looped back
+        # by the kernel before the send call returns, so a packet that was sent is always ready to
+        # be read before the clock moves on. The order in which ready handlers are served only
+        # depends on the file descriptors, which makes runs reproducible. A real wait only happens
+        # when there are no running timers or when the virtual clock has stopped (e.g. to wait for
+        # a CLI command).
+        start_time = time.monotonic()
+        rx_ready = self._wait_ready_fds(0.0)
+        if not rx_ready:
+            if timeout is not None and timer.TIMER_SCHEDULER.advance_virtual_clock(timeout):
+                return
+            rx_ready = self._wait_ready_fds(None)
+        duration = time.monotonic() - start_time
+        self.max_select_proc_time = max(self.max_select_proc_time, duration)
+        self.phase_histograms[self.PHASE_SELECT].record(duration)
+        for rx_fd in self._service_order(rx_ready):
+            self._handler_ready_to_read(rx_fd)
+
+    def run(self):
+        self.start_latency_probe()
+        while not self.stop_requested:
+            self.run_one_iteration()
+        self.stop_requested = False
+
+    def stop(self):
+        # The iteration that is running is finished first
+        self.stop_requested = True
+
+class SelectScheduler(PollingScheduler):
+
+    # Uses select.select(). Simple and portable, but the cost of each wait is O(number of file
+    # descriptors) and it cannot handle file descriptors above FD_SETSIZE (usually 1024).
+
+    TYPE = "select"
+
+    def __init__(self):
+        PollingScheduler.__init__(self)
+        self._rx_fds = []
+
+    def _register_fd(self, rx_fd):
+        self._rx_fds.append(rx_fd)
+
+    def _unregister_fd(self, rx_fd):
+        self._rx_fds.remove(rx_fd)
+
+    def _wait_ready_fds(self, timeout):
+        rx_ready, _, _ = select.select(self._rx_fds, [], [], timeout)
+        return rx_ready
+
+class EpollScheduler(PollingScheduler):
+
+    # Uses selectors.EpollSelector (or the best selector for the platform if epoll is not
+    # available, e.g. kqueue on macOS). Register and unregister are O(1), the cost of each wait
+    # only depends on the number of ready file descriptors, and there is no FD_SETSIZE limit.
+
+    TYPE = "epoll"
+
+    def __init__(self):
+        PollingScheduler.__init__(self)
+        if hasattr(selectors, 'EpollSelector'):
+            self._selector = selectors.EpollSelector()
+        else:
+            self._selector = selectors.DefaultSelector()
+
+    def _register_fd(self, rx_fd):
+        try:
+            self._selector.register(rx_fd, selectors.EVENT_READ)
+        except KeyError:
+            # The file descriptor was closed and re-used without being unregistered first
+            self._selector.unregister(rx_fd)
+            self._selector.register(rx_fd, selectors.EVENT_READ)
+
+    def _unregister_fd(self, rx_fd):
+        try:
+            self._selector.unregister(rx_fd)
+        except KeyError:
+            pass
+
+    def _wait_ready_fds(self, timeout):
+        if timeout is not None and timeout <= 0.0:
+            # A timeout of zero means poll; a negative timeout would mean wait forever for epoll
+            timeout = 0.0
+        return [key.fd for (key, _events) in self._selector.select(timeout)]
+
+class AsyncioScheduler(Scheduler):
+
+    # Lets an asyncio event loop drive the RIFT engine, so that it can run next to other asyncio
+    # services in the same thread. The event loop does the waiting, so this scheduler does not
+    # derive from PollingScheduler. File descriptors are watched with loop.add_reader, which calls
+    # the existing ready-to-read handlers (they are not rewritten as asyncio datagram protocols or
+    # streams), and timers are asyncio timer handles (see timer.AsyncioTimerScheduler).
+    #
+    # Queued FSM events are processed in a callback which is scheduled with loop.call_soon after
+    # each ready-to-read handler and each expired timer. Thus, as in the other schedulers, all
+    # callbacks which are ready at the same time run first, and then Fsm.process_queued_events
+    # processes the events (chained events before other events).
+    #
+    # The read budget applies as in the other schedulers, but the receive policy does not: the
+    # event loop decides in which order the ready handlers are served. The work accounting does
+    # not include the expire functions of the timers, which the event loop calls directly.
+
+    TYPE = "asyncio"
+
+    def __init__(self):
+        Scheduler.__init__(self)
+        try:
+            self.loop = asyncio.get_running_loop()
+            self._own_loop = False
+        except RuntimeError:
+            self.loop = asyncio.new_event_loop()
+            self._own_loop = True
+        self._event_processing_requested = False
+        self._stopped_future = None
+
+    def create_timer_scheduler(self):
+        return timer.AsyncioTimerScheduler(self.loop, self.request_event_processing)
+
+    def close(self):
+        if self._own_loop and not self.loop.is_closed():
+            self.loop.close()
+
+    def _register_fd(self, rx_fd):
+        self.loop.add_reader(rx_fd, self._fd_ready_to_read, rx_fd)
+
+    def _unregister_fd(self, rx_fd):
+        self.loop.remove_reader(rx_fd)
+
+    def _fd_ready_to_read(self, rx_fd):
+        self._handler_ready_to_read(rx_fd)
+        self.request_event_processing()
+
+    def request_event_processing(self):
+        if not self._event_processing_requested:
+            self._event_processing_requested = True
+            self.loop.call_soon(self._process_queued_events)
+
+    def _process_queued_events(self):
+        self._event_processing_requested = False
+        start_time = time.monotonic()
+        watchdog.callback_started(self.PHASE_PENDING_EVENTS)
+        Fsm.process_queued_events()
+        watchdog.callback_finished()
+        duration = time.monotonic() - start_time
+        self.max_pending_events_proc_time = max(self.max_pending_events_proc_time, duration)
+        self.phase_histograms[self.PHASE_PENDING_EVENTS].record(duration)
+        self._record_work(duration)
+
+    def run_one_iteration(self):
+        # Run a single iteration of the asyncio event loop (used for testing and benchmarking)
+        self.loop.call_soon(self.loop.stop)
+        self.loop.run_forever()
+
+    async def run_async(self):
+        # Run the engine in the (already running) asyncio event loop until stop is called
+        self.start_latency_probe()
+        self.request_event_processing()
+        self._stopped_future = self.loop.create_future()
+        await self._stopped_future
+
+    def stop(self):
+        if self._stopped_future is not None and not self._stopped_future.done():
+            self._stopped_future.set_result(None)
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self.run_async())
+
+DEFAULT_READ_BUDGET = 16
+
+# Receive policies: serve all ready handlers round-robin (fair), or serve the ready handlers with a
+# higher priority first and round-robin within each priority (priority)
+RX_POLICY_FAIR = "fair"
+RX_POLICY_PRIORITY = "priority"
+RX_POLICIES = [RX_POLICY_FAIR, RX_POLICY_PRIORITY]
+DEFAULT_RX_POLICY = RX_POLICY_PRIORITY
+
+SCHEDULER_CLASSES = {
+    SelectScheduler.TYPE: SelectScheduler,
+    EpollScheduler.TYPE: EpollScheduler,
+    AsyncioScheduler.TYPE: AsyncioScheduler
+}
+
+SCHEDULER_TYPES = list(SCHEDULER_CLASSES.keys())
+
+DEFAULT_SCHEDULER_TYPE = SelectScheduler.TYPE
+
+SCHEDULER = SelectScheduler()
+
+def set_scheduler_type(scheduler_type):
+    # Must be called before any handler is registered
+    global SCHEDULER    # pylint:disable=global-statement
+    assert scheduler_type in SCHEDULER_CLASSES
+    assert SCHEDULER.nr_handlers() == 0
+    if SCHEDULER.TYPE != scheduler_type:
+        assert timer.TIMER_SCHEDULER.nr_timers() == 0
+        SCHEDULER.close()
+        SCHEDULER = SCHEDULER_CLASSES[scheduler_type]()
+        timer.TIMER_SCHEDULER = SCHEDULER.create_timer_scheduler()
@@ -1,3 +1,4 @@
+import math
 import operator
 import time
 
@@ -216,3 +217,80 @@ class Counter(StatBase):
 
     def value(self):
         return self._values[0]
+
+class Histogram:
+
+    # Log-linear (HDR-style) histogram of durations in seconds. Durations are recorded as a whole
+    # number of microseconds. Durations below 2^SUB_BUCKET_BITS microseconds each have their own
+    # bucket. Above that, each power of two is split into 2^(SUB_BUCKET_BITS-1) equal buckets, so
+    # the relative error of a reported percentile is at most 1/2^(SUB_BUCKET_BITS-1). Only buckets
+    # that contain at least one sample are stored.
+
+    SUB_BUCKET_BITS = 6
+
+    def __init__(self):
+        self._buckets = {}   # Number of samples, indexed by bucket index
+        self.count = 0
+        self._sum = 0.0
+        self.max = 0.0
+
+    def clear(self):
+        self._buckets = {}
+        self.count = 0
+        self._sum = 0.0
+        self.max = 0.0
+
+    @staticmethod
+    def bucket_index(usecs):
+        # The index of a bucket is (shift << SUB_BUCKET_BITS) + (usecs >> shift), where shift is
+        # chosen such that (usecs >> shift) has at most SUB_BUCKET_BITS bits
+        shift = max(usecs.bit_length() - Histogram.SUB_BUCKET_BITS, 0)
+        return (shift << Histogram.SUB_BUCKET_BITS) + (usecs >> shift)
+
+    @staticmethod
+    def bucket_upper_bound(index):
+        # The highest number of microseconds that maps to the bucket
+        shift = index >> Histogram.SUB_BUCKET_BITS
+        mantissa = index & ((1 << Histogram.SUB_BUCKET_BITS) - 1)
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, secs):
+        usecs = max(int(secs * 1000000.0), 0)
+        index = self.bucket_index(usecs)
+        self._buckets[index] = self._buckets.get(index, 0) + 1
+        self.count += 1
+        self._sum += secs
+        if secs > self.max:
+            self.max = secs
+
+    def average(self):
+        if self.count == 0:
+            return 0.0
+        return self._sum / self.count
+
+    def percentile(self, percent):
+        # Return the duration (in seconds) below which the given percentage of the samples fall
+        if self.count == 0:
+            return 0.0
+        rank = max(int(math.ceil(self.count * percent / 100.0)), 1)
+        seen = 0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if seen >= rank:
+                return min(self.bucket_upper_bound(index) / 1000000.0, self.max)
+        return self.max
+
+HISTOGRAM_PERCENTILES = [50.0, 90.0, 99.0, 99.9]
+
+def histograms_table(first_column_header, named_histograms):
+    # Table with one row for each (name, histogram) pair in named_histograms
+    tab = table.Table()
+    tab.add_row([first_column_header, "Count", ["Average", "(secs)"]] +
+                [["{:g}%".format(percent), "(secs)"] for percent in HISTOGRAM_PERCENTILES] +
+                [["Maximum", "(secs)"]])
+    for (name, histogram) in named_histograms:
+        tab.add_row([name, histogram.count, "{:06f}".format(histogram.average())] +
+                    ["{:06f}".format(histogram.percentile(percent))
+                     for percent in HISTOGRAM_PERCENTILES] +
+                    ["{:06f}".format(histogram.max)])
+    return tab
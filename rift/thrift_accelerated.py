@@ -0,0 +1,109 @@
+# Thrift binary protocol codec using the C extension module (fastbinary) of the thrift package.
+#
+# The generated read and write methods of the Thrift structures (see encoding/ttypes.py and
+# common/ttypes.py) only use fastbinary when the protocol is TBinaryProtocolAccelerated. However,
+# the structures were generated by an older Thrift compiler, which describes nested structures in
+# the thrift_spec as a (class, spec) tuple, whereas current versions of fastbinary insist on a
+# [class, spec] list; with TBinaryProtocolAccelerated every encode and decode fails. So, this module
+# converts the thrift_spec of each structure into the form that fastbinary expects, and calls
+# fastbinary directly.
+#
+# Fastbinary creates each nested structure by calling its class with the decoded fields as keyword
+# arguments, so the constructor fills in the IDL default value of each absent optional field. The
+# pure-Python decoder (and the fast decoder, see thrift_decoder) leave absent fields set to None,
+# which is what the RIFT code checks for. So, for structures with default values, the converted spec
+# contains a factory which sets all absent fields to None, and the default values in the converted
+# spec are None as well.
+#
+# The codec is only used if fastbinary can be imported and if it passes a self-test (see
+# make_codec); otherwise the caller falls back to the pure-Python TBinaryProtocol.
+
+from thrift.Thrift import TType
+import thrift.protocol.TBinaryProtocol
+import thrift.transport.TTransport
+
+try:
+    from thrift.protocol import fastbinary as FASTBINARY
+except ImportError:
+    FASTBINARY = None
+
+class StructCodec:
+
+    def __init__(self, struct_class):
+        self._specs = {}   # Converted thrift_spec, indexed by structure class
+        self._type_args = [struct_factory(struct_class), self._convert_spec(struct_class)]
+
+    def _convert_spec(self, struct_class):
+        spec = self._specs.get(struct_class)
+        if spec is not None:
+            return spec
+        fields = []
+        for field_spec in struct_class.thrift_spec:
+            if field_spec is None:
+                fields.append(None)
+            else:
+                (field_id, field_type, field_name, field_type_args, _default) = field_spec
+                fields.append((field_id, field_type, field_name,
+                               self._convert_type_args(field_type, field_type_args), None))
+        spec = tuple(fields)
+        self._specs[struct_class] = spec
+        return spec
+
+    def _convert_type_args(self, value_type, type_args):
+        if value_type == TType.STRUCT:
+            (struct_class, _spec) = type_args
+            return [struct_factory(struct_class), self._convert_spec(struct_class)]
+        if value_type in (TType.LIST, TType.SET):
+            (element_type, element_type_args, is_binary) = type_args
+            return (element_type, self._convert_type_args(element_type, element_type_args),
+                    is_binary)
+        if value_type == TType.MAP:
+            (key_type, key_type_args, map_value_type, map_value_type_args, is_binary) = type_args
+            return (key_type, self._convert_type_args(key_type, key_type_args),
+                    map_value_type, self._convert_type_args(map_value_type, map_value_type_args),
+                    is_binary)
+        return type_args
+
+    def encode(self, value):
+        # The value must already have been fixed (i.e. unsigned integers converted to signed)
+        return FASTBINARY.encode_binary(value, self._type_args)
+
+    def decode(self, encoded):
+        # The decoded value still has to be fixed (i.e. signed integers converted to unsigned)
+        transport_in = thrift.transport.TTransport.TMemoryBuffer(encoded)
+        protocol_in = thrift.protocol.TBinaryProtocol.TBinaryProtocolAccelerated(transport_in)
+        value = self._type_args[0]()
+        FASTBINARY.decode_binary(value, protocol_in, self._type_args)
+        return value
+
+def struct_factory(struct_class):
+    # Return a callable which creates a structure of the given class from the decoded fields, with
+    # all absent fields set to None (instead of to their default values)
+    absent_fields = {field_spec[2]: None
+                     for field_spec in struct_class.thrift_spec
+                     if field_spec is not None and field_spec[4] is not None}
+    if not absent_fields:
+        return struct_class
+    def make_struct(**fields):
+        return struct_class(**dict(absent_fields, **fields))
+    return make_struct
+
+def make_codec(struct_class, sample_value):
+    # Return an accelerated codec for the structure class, or None if the accelerated codec is not
+    # available. The codec must reproduce the pure-Python encoding of the (fixed) sample value, and
+    # decode it back to the same value.
+    if FASTBINARY is None:
+        return None
+    codec = StructCodec(struct_class)
+    transport_out = thrift.transport.TTransport.TMemoryBuffer()
+    protocol_out = thrift.protocol.TBinaryProtocol.TBinaryProtocol(transport_out)
+    sample_value.write(protocol_out)
+    expected = transport_out.getvalue()
+    # We don't know what exception fastbinary might throw
+    # pylint: disable=broad-except
+    try:
+        if codec.encode(sample_value) != expected or codec.decode(expected) != sample_value:
+            return None
+    except Exception:
+        return None
+    return codec
@@ -0,0 +1,44 @@
+# Common part of the code generators for Thrift structures (see thrift_encoder, thrift_fixer, and
+# thrift_decoder).
+#
+# Each code generator generates the Python source code of functions for structure classes (and
+# the fixes for their unsigned fields), and compiles it. The generated functions are compiled into
+# a namespace of their own, which also holds the helper functions and constants that the generated
+# code refers to.
+
+class CodeGenerator:
+
+    def __init__(self, source_name, namespace=None):
+        self._source_name = source_name
+        self._namespace = dict(namespace) if namespace else {}
+        self._function_names = {}    # Indexed by a key which identifies the function
+        self._keep_alive = []        # Keeps the fixes alive, so that their ids are not re-used
+        self._nr_variables = 0
+
+    def _existing_function_name(self, function_key):
+        # Return the name of the function which was generated for the key, or None
+        return self._function_names.get(function_key)
+
+    def _new_function_name(self, function_key, prefix, struct_class, fixes):
+        # Return the name for a new function for the key. The key contains the id of the fixes, so
+        # the fixes are kept alive.
+        function_name = "{}_{}_{}".format(prefix, struct_class.__name__, len(self._function_names))
+        self._function_names[function_key] = function_name
+        self._keep_alive.append(fixes)
+        return function_name
+
+    def _add_to_namespace(self, name, value):
+        # Make the value available to the generated code under the given name
+        self._namespace[name] = value
+
+    def _new_variable(self):
+        self._nr_variables += 1
+        return "v{}".format(self._nr_variables)
+
+    def _compile(self, lines):
+        source = "\n".join(lines) + "\n"
+        # pylint:disable=exec-used
+        exec(compile(source, "<{}>".format(self._source_name), "exec"), self._namespace)
+
+    def function(self, function_name):
+        return self._namespace[function_name]
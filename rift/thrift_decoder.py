@@ -0,0 +1,413 @@
+# Fast-path decoder for Thrift structures in the Thrift binary protocol, which produces exactly the
+# same structures as the pure-Python Thrift TBinaryProtocol followed by the fixes for unsigned
+# fields (see PROTOCOL_PACKET_FIXES in packet_common), for the messages that the decoder expects.
+#
+# For a given structure class and fixes, the decoder generates the Python source code of a decode
+# function and compiles it (the same approach as thrift_encoder, see thrift_codegen). The decode
+# function reads the fields straight from the received bytes using struct, in the order of the
+# Thrift spec, which is the order in which RIFT implementations send them: each field is present if
+# the next bytes are the header (type and id) of that field. The decoding of nested structures is
+# written in-line, and the structure objects are created without calling their constructor.
+# Unsigned fields are read using unsigned formats, so there is no need to fix the decoded structure
+# afterwards.
+#
+# Structures of a lazy class (e.g. the elements of TIEs, which are only needed when SPF runs or when
+# they are shown in the CLI) are not decoded: the decoder only checks that they have the expected
+# layout while it skips over them, and it stores an object of the lazy class, which holds the
+# encoded structure, and which decodes itself the first time that it is needed (see LazyStruct).
+#
+# The decoder only handles the common case. On anything unusual (fields out of order, unknown
+# fields, unexpected types, truncated messages, structures of a fallback class, etc.) it gives up,
+# and the caller must decode the message using the generic (Thrift) path, which deals with the
+# unusual case in the usual way.
+
+import struct
+
+from thrift.Thrift import TType
+
+import thrift_codegen
+
+INT_SIZES = {
+    TType.BYTE: 1,
+    TType.I16: 2,
+    TType.I32: 4,
+    TType.I64: 8
+}
+
+UNPACK_NAMES = {
+    # Indexed by (size, unsigned)
+    (1, False): "UNPACK_I8",
+    (1, True): "UNPACK_U8",
+    (2, False): "UNPACK_I16",
+    (2, True): "UNPACK_U16",
+    (4, False): "UNPACK_I32",
+    (4, True): "UNPACK_U32",
+    (8, False): "UNPACK_I64",
+    (8, True): "UNPACK_U64"
+}
+
+RUN_FORMATS = {
+    # The format and size of the types of fields that can be decoded in runs (see _emit_run); the
+    # format of integers is converted to upper case to read unsigned integers
+    TType.BOOL: ("?", 1),
+    TType.BYTE: ("b", 1),
+    TType.I16: ("h", 2),
+    TType.I32: ("i", 4),
+    TType.I64: ("q", 8),
+    TType.DOUBLE: ("d", 8)
+}
+
+# Nested structures are written in-line, so a recursive structure cannot be decoded
+MAX_NESTING = 16
+
+class Fallback(Exception):
+    pass
+
+class LazyStruct:
+    # Base class for lazily decoded Thrift structures. A lazy class derives from LazyStruct and from
+    # a Thrift structure class (its STRUCT_CLASS), and has a DECODE function which decodes the
+    # encoded structure (including the fixes for unsigned fields). An object of the lazy class only
+    # holds the encoded structure. As soon as one of the fields is accessed, or the object is
+    # compared, hashed, or printed, the structure is decoded and the object turns into a regular
+    # object of STRUCT_CLASS (see decode_lazy_struct).
+
+    def __init__(self, encoded):
+        # pylint:disable=super-init-not-called
+        self.__dict__["_lazy_encoded"] = encoded
+
+    def __getattr__(self, name):
+        # Only called for attributes which the object does not have, i.e. for the fields
+        if name == "_lazy_encoded":
+            raise AttributeError(name)
+        decode_lazy_struct(self)
+        return getattr(self, name)
+
+    def __eq__(self, other):
+        # Two lazy structures with the same encoding are equal without decoding them; otherwise
+        # they have to be decoded, because sets may have been encoded in a different order
+        if isinstance(other, LazyStruct) and self._lazy_encoded == other._lazy_encoded:
+            return True
+        decode_lazy_struct(self)
+        decode_lazy_struct(other)
+        return self == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        decode_lazy_struct(self)
+        return hash(self)
+
+    def __repr__(self):
+        decode_lazy_struct(self)
+        return repr(self)
+
+def decode_lazy_struct(value):
+    # Decode the value in place if it is a lazy structure which has not been decoded yet
+    if isinstance(value, LazyStruct):
+        lazy_class = type(value)
+        decoded = lazy_class.DECODE(value.__dict__.pop("_lazy_encoded"))
+        value.__dict__.update(decoded.__dict__)
+        value.__class__ = lazy_class.STRUCT_CLASS
+    return value
+
+def is_lazy_struct(value):
+    # True if the value is a lazy structure which has not been decoded yet
+    return isinstance(value, LazyStruct)
+
+class StructDecoderCompiler(thrift_codegen.CodeGenerator):
+
+    def __init__(self, fallback_classes, lazy_classes):
+        thrift_codegen.CodeGenerator.__init__(self, "thrift_decoder", {
+            "UNPACK_I8": struct.Struct("!b").unpack_from,
+            "UNPACK_U8": struct.Struct("!B").unpack_from,
+            "UNPACK_I16": struct.Struct("!h").unpack_from,
+            "UNPACK_U16": struct.Struct("!H").unpack_from,
+            "UNPACK_I32": struct.Struct("!i").unpack_from,
+            "UNPACK_U32": struct.Struct("!I").unpack_from,
+            "UNPACK_I64": struct.Struct("!q").unpack_from,
+            "UNPACK_U64": struct.Struct("!Q").unpack_from,
+            "UNPACK_DOUBLE": struct.Struct("!d").unpack_from,
+            "NEW": object.__new__,
+            "Fallback": Fallback
+        })
+        self._fallback_classes = fallback_classes
+        self._lazy_classes = lazy_classes
+        self._class_names = {}
+        self._run_names = []
+
+    def decode_function(self, struct_class, fixes):
+        # Generate the decode function, which takes the data, and returns the decoded structure and
+        # the position after the structure in the data
+        fixes_key = (struct_class, id(fixes))
+        function_name = self._existing_function_name(fixes_key)
+        if function_name is None:
+            function_name = self._new_function_name(fixes_key, "decode", struct_class, fixes)
+            lines = ["def {}(data):".format(function_name),
+                     "    pos = 0"]
+            self._emit_struct(lines, "    ", "value", struct_class, fixes, 0)
+            lines.append("    return (value, pos)")
+            self._compile(lines)
+        return self.function(function_name)
+
+    def _class_name(self, struct_class):
+        class_name = self._class_names.get(struct_class)
+        if class_name is None:
+            class_name = "CLASS_{}_{}".format(struct_class.__name__, len(self._class_names))
+            self._class_names[struct_class] = class_name
+            self._add_to_namespace(class_name, struct_class)
+        return class_name
+
+    def _emit_struct(self, lines, indent, variable, struct_class, fixes, nesting):
+        # pylint:disable=too-many-arguments
+        assert nesting < MAX_NESTING, "Thrift structure {} nested too deeply".format(struct_class)
+        if struct_class in self._fallback_classes:
+            lines.append("{}raise Fallback".format(indent))
+            return
+        if struct_class in self._lazy_classes:
+            start = self._new_variable()
+            lines.append("{}{} = pos".format(indent, start))
+            self._emit_skip_struct(lines, indent, struct_class, nesting)
+            lines.append("{}{} = {}(data[{}:pos])".format(
+                indent, variable, self._class_name(self._lazy_classes[struct_class]), start))
+            return
+        field_fixes = dict(fixes) if fixes else {}
+        lines.append("{}{} = NEW({})".format(indent, variable, self._class_name(struct_class)))
+        field_specs = [field_spec for field_spec in struct_class.thrift_spec
+                       if field_spec is not None]
+        # Consecutive fixed-size fields are decoded together, if they are all present
+        run = []
+        for field_spec in field_specs:
+            if field_spec[1] in RUN_FORMATS:
+                run.append(field_spec)
+                continue
+            self._emit_run(lines, indent, variable, run, field_fixes, nesting)
+            run = []
+            self._emit_field(lines, indent, variable, field_spec, field_fixes, nesting)
+        self._emit_run(lines, indent, variable, run, field_fixes, nesting)
+        # Anything but the end of the structure means that there are unexpected fields
+        lines.append("{}if data[pos] != 0:".format(indent))
+        lines.append("{}    raise Fallback".format(indent))
+        lines.append("{}pos += 1".format(indent))
+
+    def _emit_field(self, lines, indent, variable, field_spec, field_fixes, nesting):
+        # pylint:disable=too-many-arguments
+        (field_id, field_type, field_name, field_type_args, _default) = field_spec
+        field_header = struct.pack("!bh", field_type, field_id)
+        lines.append("{}if data.startswith({!r}, pos):".format(indent, field_header))
+        lines.append("{}    pos += 3".format(indent))
+        field_variable = self._new_variable()
+        self._emit_value(lines, indent + "    ", field_variable, field_type, field_type_args,
+                         field_fixes.get(field_name), nesting)
+        lines.append("{}    {}.{} = {}".format(indent, variable, field_name, field_variable))
+        lines.append("{}else:".format(indent))
+        lines.append("{}    {}.{} = None".format(indent, variable, field_name))
+
+    def _emit_run(self, lines, indent, variable, run, field_fixes, nesting):
+        # Emit code which decodes a run of consecutive fixed-size fields using a single unpack of
+        # the field headers and values, if all fields of the run are present; otherwise the fields
+        # are decoded one by one
+        # pylint:disable=too-many-arguments,too-many-locals
+        if len(run) < 2:
+            for field_spec in run:
+                self._emit_field(lines, indent, variable, field_spec, field_fixes, nesting)
+            return
+        run_format = "!"
+        conditions = []
+        assignments = []
+        for (index, field_spec) in enumerate(run):
+            (field_id, field_type, field_name, _field_type_args, _default) = field_spec
+            fix = field_fixes.get(field_name)
+            (value_format, size) = RUN_FORMATS[field_type]
+            unsigned = fix is not None and fix == 8 * size
+            if unsigned:
+                value_format = value_format.upper()
+            run_format += "3s" + value_format
+            header_name = "HEADER_{}_{}".format(field_type, field_id)
+            self._add_to_namespace(header_name, struct.pack("!bh", field_type, field_id))
+            conditions.append("{}[{}] == {}".format("run", 2 * index, header_name))
+            value = "run[{}]".format(2 * index + 1)
+            if fix is not None and not unsigned:
+                value = "({0} if {0} >= 0 else {0} + {1})".format(value, 1 << fix)
+            assignments.append("{}.{} = {}".format(variable, field_name, value))
+        run_struct = struct.Struct(run_format)
+        run_name = "UNPACK_RUN_{}".format(len(self._run_names))
+        self._run_names.append(run_name)
+        self._add_to_namespace(run_name, run_struct.unpack_from)
+        lines.append("{}if len(data) - pos >= {}:".format(indent, run_struct.size))
+        lines.append("{}    run = {}(data, pos)".format(indent, run_name))
+        lines.append("{}    present = {}".format(indent, " and ".join(conditions)))
+        lines.append("{}else:".format(indent))
+        lines.append("{}    present = False".format(indent))
+        lines.append("{}if present:".format(indent))
+        for assignment in assignments:
+            lines.append("{}    {}".format(indent, assignment))
+        lines.append("{}    pos += {}".format(indent, run_struct.size))
+        lines.append("{}else:".format(indent))
+        for field_spec in run:
+            self._emit_field(lines, indent + "    ", variable, field_spec, field_fixes, nesting)
+
+    def _emit_value(self, lines, indent, variable, value_type, type_args, fix, nesting):
+        # Emit code which reads a value of the given type at pos into the variable, and advances pos
+        # pylint:disable=too-many-arguments,too-many-statements
+        if value_type in INT_SIZES:
+            # Read unsigned fields using an unsigned format, unless the fix has a different size
+            # than the field (then the field is read as signed and converted, as fix_int does)
+            size = INT_SIZES[value_type]
+            unsigned = fix == 8 * size
+            lines.append("{}{} = {}(data, pos)[0]".format(indent, variable,
+                                                          UNPACK_NAMES[(size, unsigned)]))
+            lines.append("{}pos += {}".format(indent, size))
+            if fix is not None and not unsigned:
+                lines.append("{}if {} < 0:".format(indent, variable))
+                lines.append("{}    {} += {}".format(indent, variable, 1 << fix))
+        elif value_type == TType.DOUBLE:
+            lines.append("{}{} = UNPACK_DOUBLE(data, pos)[0]".format(indent, variable))
+            lines.append("{}pos += 8".format(indent))
+        elif value_type == TType.BOOL:
+            lines.append("{}{} = data[pos] != 0".format(indent, variable))
+            lines.append("{}pos += 1".format(indent))
+        elif value_type == TType.STRING:
+            size = self._new_variable()
+            lines.append("{}{} = UNPACK_U32(data, pos)[0]".format(indent, size))
+            lines.append("{}pos += 4".format(indent))
+            if type_args == 'BINARY':
+                lines.append("{}{} = data[pos:pos + {}]".format(indent, variable, size))
+            else:
+                lines.append("{}{} = str(data[pos:pos + {}], 'utf-8')".format(indent, variable,
+                                                                             size))
+            lines.append("{}pos += {}".format(indent, size))
+        elif value_type == TType.STRUCT:
+            (struct_class, _spec) = type_args
+            self._emit_struct(lines, indent, variable, struct_class, fix, nesting + 1)
+        elif value_type in (TType.LIST, TType.SET):
+            (element_type, element_type_args, _is_binary) = type_args
+            size = self._new_variable()
+            lines.append("{}if data[pos] != {}:".format(indent, element_type))
+            lines.append("{}    raise Fallback".format(indent))
+            lines.append("{}{} = UNPACK_U32(data, pos + 1)[0]".format(indent, size))
+            lines.append("{}pos += 5".format(indent))
+            if value_type == TType.LIST:
+                (add_method, empty) = ("append", "[]")
+            else:
+                (add_method, empty) = ("add", "set()")
+            lines.append("{}{} = {}".format(indent, variable, empty))
+            add = self._new_variable()
+            lines.append("{}{} = {}.{}".format(indent, add, variable, add_method))
+            element = self._new_variable()
+            lines.append("{}for _ in range({}):".format(indent, size))
+            self._emit_value(lines, indent + "    ", element, element_type, element_type_args,
+                             fix, nesting)
+            lines.append("{}    {}({})".format(indent, add, element))
+        elif value_type == TType.MAP:
+            (key_type, key_type_args, map_value_type, map_value_type_args, _is_binary) = type_args
+            if fix is None:
+                (key_fix, value_fix) = (None, None)
+            else:
+                (key_fix, value_fix) = fix
+            size = self._new_variable()
+            lines.append("{}if data[pos] != {} or data[pos + 1] != {}:".format(indent, key_type,
+                                                                               map_value_type))
+            lines.append("{}    raise Fallback".format(indent))
+            lines.append("{}{} = UNPACK_U32(data, pos + 2)[0]".format(indent, size))
+            lines.append("{}pos += 6".format(indent))
+            lines.append("{}{} = {{}}".format(indent, variable))
+            (key, value) = (self._new_variable(), self._new_variable())
+            lines.append("{}for _ in range({}):".format(indent, size))
+            self._emit_value(lines, indent + "    ", key, key_type, key_type_args, key_fix,
+                             nesting)
+            self._emit_value(lines, indent + "    ", value, map_value_type, map_value_type_args,
+                             value_fix, nesting)
+            lines.append("{}    {}[{}] = {}".format(indent, variable, key, value))
+        else:
+            lines.append("{}raise Fallback".format(indent))
+
+    def _emit_skip_struct(self, lines, indent, struct_class, nesting):
+        # Emit code which skips over a structure at pos, checking that it has the same layout as
+        # the decoder expects (see _emit_struct), without decoding it
+        assert nesting < MAX_NESTING, "Thrift structure {} nested too deeply".format(struct_class)
+        if struct_class in self._fallback_classes:
+            lines.append("{}raise Fallback".format(indent))
+            return
+        for field_spec in struct_class.thrift_spec:
+            if field_spec is None:
+                continue
+            (field_id, field_type, _field_name, field_type_args, _default) = field_spec
+            field_header = struct.pack("!bh", field_type, field_id)
+            lines.append("{}if data.startswith({!r}, pos):".format(indent, field_header))
+            lines.append("{}    pos += 3".format(indent))
+            self._emit_skip_value(lines, indent + "    ", field_type, field_type_args, nesting)
+        lines.append("{}if data[pos] != 0:".format(indent))
+        lines.append("{}    raise Fallback".format(indent))
+        lines.append("{}pos += 1".format(indent))
+
+    def _emit_skip_value(self, lines, indent, value_type, type_args, nesting):
+        # Emit code which skips over a value of the given type at pos. Containers of fixed-size
+        # values are skipped in one step.
+        # pylint:disable=too-many-arguments
+        if value_type in RUN_FORMATS:
+            lines.append("{}pos += {}".format(indent, RUN_FORMATS[value_type][1]))
+        elif value_type == TType.STRING:
+            size = self._new_variable()
+            lines.append("{}{} = UNPACK_U32(data, pos)[0]".format(indent, size))
+            lines.append("{}pos += 4".format(indent))
+            if type_args != 'BINARY':
+                # Strings must be valid UTF-8, otherwise the lazy structure cannot be decoded
+                lines.append("{}str(data[pos:pos + {}], 'utf-8')".format(indent, size))
+            lines.append("{}pos += {}".format(indent, size))
+        elif value_type == TType.STRUCT:
+            (struct_class, _spec) = type_args
+            self._emit_skip_struct(lines, indent, struct_class, nesting + 1)
+        elif value_type in (TType.LIST, TType.SET):
+            (element_type, element_type_args, _is_binary) = type_args
+            size = self._new_variable()
+            lines.append("{}if data[pos] != {}:".format(indent, element_type))
+            lines.append("{}    raise Fallback".format(indent))
+            lines.append("{}{} = UNPACK_U32(data, pos + 1)[0]".format(indent, size))
+            lines.append("{}pos += 5".format(indent))
+            if element_type in RUN_FORMATS:
+                lines.append("{}pos += {} * {}".format(indent, size,
+                                                       RUN_FORMATS[element_type][1]))
+            else:
+                lines.append("{}for _ in range({}):".format(indent, size))
+                self._emit_skip_value(lines, indent + "    ", element_type, element_type_args,
+                                      nesting)
+        elif value_type == TType.MAP:
+            (key_type, key_type_args, map_value_type, map_value_type_args, _is_binary) = type_args
+            size = self._new_variable()
+            lines.append("{}if data[pos] != {} or data[pos + 1] != {}:".format(indent, key_type,
+                                                                               map_value_type))
+            lines.append("{}    raise Fallback".format(indent))
+            lines.append("{}{} = UNPACK_U32(data, pos + 2)[0]".format(indent, size))
+            lines.append("{}pos += 6".format(indent))
+            if key_type in RUN_FORMATS and map_value_type in RUN_FORMATS:
+                lines.append("{}pos += {} * {}".format(
+                    indent, size, RUN_FORMATS[key_type][1] + RUN_FORMATS[map_value_type][1]))
+            else:
+                lines.append("{}for _ in range({}):".format(indent, size))
+                self._emit_skip_value(lines, indent + "    ", key_type, key_type_args, nesting)
+                self._emit_skip_value(lines, indent + "    ", map_value_type,
+                                      map_value_type_args, nesting)
+        else:
+            lines.append("{}raise Fallback".format(indent))
+
+def make_struct_decoder(struct_class, fixes, fallback_classes=(), lazy_classes=None):
+    # Return a function which decodes a structure of the given class (with the given fixes for
+    # unsigned fields) from the data, and which returns the decoded structure, or None if the
+    # caller must decode the data using the generic path instead. The decoder falls back to the
+    # generic path for structures of the fallback classes. Lazy classes is a dict which maps
+    # structure classes to the lazy classes (see LazyStruct) which are used instead.
+    compiler = StructDecoderCompiler(frozenset(fallback_classes), lazy_classes or {})
+    decode_function = compiler.decode_function(struct_class, fixes)
+    def decode(data):
+        if not isinstance(data, bytes):
+            data = bytes(data)
+        try:
+            (value, pos) = decode_function(data)
+        except (Fallback, struct.error, IndexError, ValueError):
+            return None
+        # Trailing garbage is unusual too
+        if pos != len(data):
+            return None
+        return value
+    return decode
@@ -0,0 +1,140 @@
+# Encoder for Thrift structures in the Thrift binary protocol, which produces exactly the same bytes
+# as the Thrift TBinaryProtocol, but which is much faster.
+#
+# Thrift does not support unsigned integers, so RIFT encodes unsigned integers as signed integers of
+# the same size. The fixes (see PROTOCOL_PACKET_FIXES in packet_common) describe which fields are
+# unsigned. The Thrift encoder needs the fixed (i.e. signed) values in the structure itself, which
+# means that the structure must be deep copied and fixed before it is encoded. This encoder instead
+# converts the unsigned values while it writes them, so the structure is left untouched.
+#
+# For each combination of structure class and fixes, the encoder generates the Python source code
+# of an encode function (which writes the fields of the structure, the conversions of unsigned
+# values, and the loops over containers in-line) and compiles it. The encode functions append to a
+# bytearray.
+
+import struct
+
+from thrift.Thrift import TType
+
+import thrift_codegen
+
+PACK_BYTE = struct.Struct("!b").pack
+PACK_I16 = struct.Struct("!h").pack
+PACK_I32 = struct.Struct("!i").pack
+PACK_I64 = struct.Struct("!q").pack
+PACK_DOUBLE = struct.Struct("!d").pack
+PACK_BYTE_I32 = struct.Struct("!bi").pack
+PACK_BYTE_BYTE_I32 = struct.Struct("!bbi").pack
+
+PACK_FUNCTION_NAMES = {
+    TType.BYTE: "PACK_BYTE",
+    TType.I16: "PACK_I16",
+    TType.I32: "PACK_I32",
+    TType.I64: "PACK_I64",
+    TType.DOUBLE: "PACK_DOUBLE"
+}
+
+class StructEncoderCompiler(thrift_codegen.CodeGenerator):
+
+    def __init__(self):
+        thrift_codegen.CodeGenerator.__init__(self, "thrift_encoder", {
+            "PACK_BYTE": PACK_BYTE,
+            "PACK_I16": PACK_I16,
+            "PACK_I32": PACK_I32,
+            "PACK_I64": PACK_I64,
+            "PACK_DOUBLE": PACK_DOUBLE,
+            "PACK_BYTE_I32": PACK_BYTE_I32,
+            "PACK_BYTE_BYTE_I32": PACK_BYTE_BYTE_I32
+        })
+
+    def struct_function_name(self, struct_class, fixes):
+        # Return the name of the encode function for the structure class with the given fixes,
+        # generating it first if needed. The encode function takes a bytearray and a structure.
+        fixes_key = (struct_class, id(fixes))
+        function_name = self._existing_function_name(fixes_key)
+        if function_name is not None:
+            return function_name
+        function_name = self._new_function_name(fixes_key, "encode", struct_class, fixes)
+        field_fixes = dict(fixes) if fixes else {}
+        lines = ["def {}(out, value):".format(function_name)]
+        for field_spec in struct_class.thrift_spec:
+            if field_spec is None:
+                continue
+            (field_id, field_type, field_name, field_type_args, _default) = field_spec
+            variable = self._new_variable()
+            lines.append("    {} = value.{}".format(variable, field_name))
+            lines.append("    if {} is not None:".format(variable))
+            lines.append("        out += {!r}".format(struct.pack("!bh", field_type, field_id)))
+            self._emit_value(lines, "        ", variable, field_type, field_type_args,
+                             field_fixes.get(field_name))
+        lines.append("    out.append(0)")
+        self._compile(lines)
+        return function_name
+
+    @staticmethod
+    def _signed_expression(expression, fix):
+        # An expression which converts the unsigned integer to a signed integer of fix bits (the
+        # same conversion as u64_to_s64 etc. in packet_common)
+        if fix is None:
+            return expression
+        max_signed = (1 << (fix - 1)) - 1
+        modulus = 1 << fix
+        return "({0} if {0} <= {1} else {0} - {2})".format(expression, max_signed, modulus)
+
+    def _emit_value(self, lines, indent, expression, value_type, type_args, fix):
+        # pylint:disable=too-many-arguments
+        if value_type in PACK_FUNCTION_NAMES:
+            lines.append("{}out += {}({})".format(indent, PACK_FUNCTION_NAMES[value_type],
+                                                  self._signed_expression(expression, fix)))
+        elif value_type == TType.BOOL:
+            lines.append("{}out.append(1 if {} else 0)".format(indent, expression))
+        elif value_type == TType.STRING:
+            if type_args == 'BINARY':
+                data = expression
+            else:
+                data = self._new_variable()
+                lines.append("{}{} = {}.encode('utf-8')".format(indent, data, expression))
+            lines.append("{}out += PACK_I32(len({}))".format(indent, data))
+            lines.append("{}out += {}".format(indent, data))
+        elif value_type == TType.STRUCT:
+            (struct_class, _spec) = type_args
+            function_name = self.struct_function_name(struct_class, fix)
+            lines.append("{}{}(out, {})".format(indent, function_name, expression))
+        elif value_type in (TType.LIST, TType.SET):
+            (element_type, element_type_args, _is_binary) = type_args
+            lines.append("{}out += PACK_BYTE_I32({}, len({}))".format(indent, element_type,
+                                                                     expression))
+            element = self._new_variable()
+            lines.append("{}for {} in {}:".format(indent, element, expression))
+            self._emit_value(lines, indent + "    ", element, element_type, element_type_args,
+                             fix)
+        elif value_type == TType.MAP:
+            (key_type, key_type_args, map_value_type, map_value_type_args, _is_binary) = type_args
+            if fix is None:
+                (key_fix, value_fix) = (None, None)
+            else:
+                (key_fix, value_fix) = fix
+            lines.append("{}out += PACK_BYTE_BYTE_I32({}, {}, len({}))".format(
+                indent, key_type, map_value_type, expression))
+            (key, value) = (self._new_variable(), self._new_variable())
+            lines.append("{}for {}, {} in {}.items():".format(indent, key, value, expression))
+            self._emit_value(lines, indent + "    ", key, key_type, key_type_args, key_fix)
+            self._emit_value(lines, indent + "    ", value, map_value_type, map_value_type_args,
+                             value_fix)
+        else:
+            assert False, "Unsupported Thrift type {}".format(value_type)
+
+    def encode_function(self, struct_class, fixes):
+        return self.function(self.struct_function_name(struct_class, fixes))
+
+COMPILER = StructEncoderCompiler()
+
+def make_struct_encoder(struct_class, fixes):
+    # Return a function which encodes a structure of the given class (with the given fixes for
+    # unsigned fields) and returns the encoded bytes
+    encode_function = COMPILER.encode_function(struct_class, fixes)
+    def encode(value):
+        out = bytearray()
+        encode_function(out, value)
+        return bytes(out)
+    return encode
@@ -0,0 +1,130 @@
+# Compiled fixers for the unsigned fields of Thrift structures.
+#
+# Thrift does not support unsigned integers, so RIFT encodes unsigned integers as signed integers of
+# the same size. After a packet is decoded, the signed values have to be converted back to unsigned
+# values (and before a packet is encoded by the Thrift encoder, the other way around). The fixes
+# (see PROTOCOL_PACKET_FIXES in packet_common) describe which fields are unsigned.
+#
+# The generic fixer in packet_common (fix_struct, fix_value, etc.) interprets the fixes for every
+# packet: for each field it looks up the fix, checks the type of the value, and dispatches on it.
+# Instead, for each combination of structure class, fixes, and direction, this module generates
+# the Python source code of a fix function (using the Thrift spec of the structure to know the
+# types of the fields), and compiles it. The fix functions fix structures in place and return them.
+# Containers are replaced by fixed copies, because the elements of sets and the keys of maps must
+# be re-hashed after they have been fixed.
+
+from thrift.Thrift import TType
+
+import thrift_codegen
+
+INT_TYPES = (TType.BYTE, TType.I16, TType.I32, TType.I64)
+
+class StructFixerCompiler(thrift_codegen.CodeGenerator):
+
+    def __init__(self):
+        thrift_codegen.CodeGenerator.__init__(self, "thrift_fixer")
+
+    def struct_function_name(self, struct_class, fixes, encode):
+        # Return the name of the fix function for the structure class with the given fixes,
+        # generating it first if needed. The fix function takes a structure, fixes it in place, and
+        # returns it.
+        fixes_key = (struct_class, id(fixes), encode)
+        function_name = self._existing_function_name(fixes_key)
+        if function_name is not None:
+            return function_name
+        function_name = self._new_function_name(fixes_key, "fix", struct_class, fixes)
+        field_specs = {}
+        for field_spec in struct_class.thrift_spec:
+            if field_spec is not None:
+                field_specs[field_spec[2]] = field_spec
+        lines = ["def {}(value):".format(function_name)]
+        for (field_name, field_fix) in fixes:
+            if field_name not in field_specs:
+                continue
+            (_id, field_type, _name, field_type_args, _default) = field_specs[field_name]
+            variable = self._new_variable()
+            lines.append("    {} = value.{}".format(variable, field_name))
+            if field_type in INT_TYPES:
+                # Only assign the field if the value actually changes
+                lines.append("    if {} is not None and {}:".format(
+                    variable, self._needs_fix_condition(variable, field_fix, encode)))
+                lines.append("        value.{} = {}".format(
+                    field_name, self._int_expression(variable, field_fix, encode)))
+            elif field_type == TType.STRUCT:
+                # The nested structure is fixed in place
+                lines.append("    if {} is not None:".format(variable))
+                lines.append("        {}".format(
+                    self._value_expression(variable, field_type, field_type_args, field_fix,
+                                           encode)))
+            else:
+                lines.append("    if {} is not None:".format(variable))
+                lines.append("        value.{} = {}".format(
+                    field_name, self._value_expression(variable, field_type, field_type_args,
+                                                       field_fix, encode)))
+        lines.append("    return value")
+        self._compile(lines)
+        return function_name
+
+    @staticmethod
+    def _needs_fix_condition(expression, fix, encode):
+        # A condition which is true if the integer has to be converted
+        if encode:
+            return "{} > {}".format(expression, (1 << (fix - 1)) - 1)
+        return "{} < 0".format(expression)
+
+    @staticmethod
+    def _int_expression(expression, fix, encode):
+        # An expression which converts an integer of fix bits from unsigned to signed (encode) or
+        # from signed to unsigned (decode), the same conversions as u64_to_s64, s64_to_u64, etc. in
+        # packet_common
+        if encode:
+            return "({0} if {0} <= {1} else {0} - {2})".format(expression, (1 << (fix - 1)) - 1,
+                                                               1 << fix)
+        return "({0} if {0} >= 0 else {0} + {1})".format(expression, 1 << fix)
+
+    def _value_expression(self, expression, value_type, type_args, fix, encode):
+        # An expression for the fixed value
+        # pylint:disable=too-many-arguments
+        if value_type in INT_TYPES:
+            return self._int_expression(expression, fix, encode)
+        if value_type == TType.STRUCT:
+            (struct_class, _spec) = type_args
+            return "{}({})".format(self.struct_function_name(struct_class, fix, encode),
+                                   expression)
+        if value_type in (TType.LIST, TType.SET):
+            (element_type, element_type_args, _is_binary) = type_args
+            element = self._new_variable()
+            element_expression = self._value_expression(element, element_type, element_type_args,
+                                                        fix, encode)
+            if value_type == TType.LIST:
+                return "[{} for {} in {}]".format(element_expression, element, expression)
+            return "{{{} for {} in {}}}".format(element_expression, element, expression)
+        if value_type == TType.MAP:
+            (key_type, key_type_args, map_value_type, map_value_type_args, _is_binary) = type_args
+            (key_fix, value_fix) = fix
+            (key, value) = (self._new_variable(), self._new_variable())
+            if key_fix is None:
+                key_expression = key
+            else:
+                key_expression = self._value_expression(key, key_type, key_type_args, key_fix,
+                                                        encode)
+            if value_fix is None:
+                value_expression = value
+            else:
+                value_expression = self._value_expression(value, map_value_type,
+                                                          map_value_type_args, value_fix, encode)
+            return "{{{}: {} for {}, {} in {}.items()}}".format(key_expression, value_expression,
+                                                                key, value, expression)
+        assert False, "Unsupported Thrift type {} for fix".format(value_type)
+        return None  # Unreachable, stop pylint complaining about inconsistent-return-statements
+
+    def fix_function(self, struct_class, fixes, encode):
+        return self.function(self.struct_function_name(struct_class, fixes, encode))
+
+COMPILER = StructFixerCompiler()
+
+def make_struct_fixer(struct_class, fixes, encode):
+    # Return a function which fixes the unsigned fields of a structure of the given class in place,
+    # before encode (unsigned to signed) if encode is True, or after decode (signed to unsigned)
+    # otherwise
+    return COMPILER.fix_function(struct_class, fixes, encode)
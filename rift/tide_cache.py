@@ -0,0 +1,59 @@
+# Incremental computation of the TIE-IDs which a node reports in the TIDEs that it sends.
+#
+# Whether the header of a TIE is reported in the TIDE to a neighbor is decided by the flooding scope
+# rules (see Node.is_flood_allowed). For a given TIE, the decision only depends on the TIE itself
+# (its TIE-ID, and for node TIEs the level of the originator) and on the neighbor class: the
+# direction, level, and top-of-fabric flag of the neighbor, and the level and top-of-fabric flag of
+# the node itself. The rules also depend on the system-id of the neighbor, but only for TIEs which
+# are originated by the neighbor; those few TIEs are evaluated separately for each neighbor (see
+# Node.generate_tide_packet).
+#
+# A TIDE cache holds the set of reported TIE-IDs for one neighbor class. Whenever a TIE is added
+# to, replaced in, or removed from the TIE-DB, the node marks the TIE-ID as dirty in each TIDE
+# cache, and the next time that a TIDE is generated the cache only re-evaluates the dirty TIE-IDs
+# instead of every TIE in the TIE-DB.
+#
+# As in the TIE-DB (see tie_db.TIEDB), the TIE-IDs are indexed by tie_id_tup, so that sorting them
+# compares tuples instead of calling TIEID.__lt__.
+
+import sortedcontainers
+
+import packet_common
+
+class TIDECache:
+
+    def __init__(self, include_function):
+        # The include function takes a TIE packet info, and returns True if the TIE header must be
+        # reported in the TIDE
+        self._include_function = include_function
+        self._tie_ids = sortedcontainers.SortedDict()   # Indexed by tie_id_tup
+        self._dirty_tie_ids = {}                        # Indexed by tie_id_tup
+        self._all_dirty = True
+        self.used = True                   # Used since the previous round of TIDEs?
+        self.full_evaluations = 0          # Number of times that the whole TIE-DB was evaluated
+        self.incremental_evaluations = 0   # Number of times that only dirty TIE-IDs were evaluated
+
+    def mark_dirty(self, tie_id):
+        if not self._all_dirty:
+            self._dirty_tie_ids[packet_common.tie_id_tup(tie_id)] = tie_id
+
+    def tie_ids(self, tie_packet_infos):
+        # Return the reported TIE-IDs as a sorted dictionary indexed by tie_id_tup, after
+        # re-evaluating the dirty TIE-IDs. The caller must not modify the returned dictionary.
+        if self._all_dirty:
+            self._tie_ids = sortedcontainers.SortedDict(
+                (packet_common.tie_id_tup(tie_id), tie_id)
+                for (tie_id, tie_packet_info) in tie_packet_infos.items()
+                if self._include_function(tie_packet_info))
+            self._all_dirty = False
+            self.full_evaluations += 1
+        elif self._dirty_tie_ids:
+            for (key, tie_id) in self._dirty_tie_ids.items():
+                tie_packet_info = tie_packet_infos.get(tie_id)
+                if tie_packet_info is not None and self._include_function(tie_packet_info):
+                    self._tie_ids[key] = tie_id
+                else:
+                    self._tie_ids.pop(key, None)
+            self._dirty_tie_ids.clear()
+            self.incremental_evaluations += 1
+        return self._tie_ids
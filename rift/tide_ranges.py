@@ -0,0 +1,154 @@
+# Splitting of the TIDEs that a node sends to a neighbor into ranges which fit in the MTU of the
+# interface.
+#
+# The TIE headers which are reported to a neighbor (see Node.generate_tide_tie_ids) are divided
+# into consecutive ranges of TIE-IDs which together cover MIN_TIE_ID up to and including
+# MAX_TIE_ID; one TIDE packet is sent for each range. The boundaries of the ranges are kept stable
+# from one round of TIDEs to the next: a range is only split when it has more TIE headers than fit
+# in the MTU, and two adjacent ranges are only merged when they have both become small. As a
+# result, adding or removing a TIE only affects the range that contains it, and not all ranges
+# that follow it.
+#
+# The TIDE packet of each range is kept, and it is only regenerated when the set of TIEs in the
+# range changes (a TIE is added, replaced, or removed) or when the level of the node changes. When
+# the TIDE of an unchanged range is reused, the remaining lifetimes in it are refreshed first (see
+# Node.refresh_tide_lifetimes), so that the TIDE reports the same lifetimes as the TIE-DB; the
+# TIDE is only encoded again if a lifetime changed.
+#
+# The TIE-IDs are compared as tuples (see packet_common.tie_id_tup), as in the TIE-DB.
+
+import common.ttypes
+import encoding.ttypes
+import packet_common
+
+# The overhead of a TIDE packet on the wire, on top of the encoded protocol packet: IPv6 header (40
+# bytes), UDP header (8 bytes), RIFT envelope header (4 bytes), outer security envelope header (12
+# bytes), and the longest possible outer fingerprint (64 bytes for SHA-512).
+TIDE_PACKET_OVERHEAD = 128
+
+# The largest UDP payload that the receiver accepts (see udp_rx_handler)
+MAX_UDP_PAYLOAD_SIZE = 65535 - 8
+
+def encoded_tide_size(nr_headers):
+    # Size of an encoded TIDE protocol packet with the given number of TIE headers. The Thrift
+    # binary protocol uses a fixed size for each integer field, so the size only depends on which
+    # optional fields are present. All optional fields are filled in, which makes this an upper
+    # bound.
+    tide_packet = packet_common.make_tide_packet(
+        start_range=packet_common.make_tie_id(common.ttypes.TieDirectionType.South, 0,
+                                              common.ttypes.TIETypeType.NodeTIEType, 0),
+        end_range=packet_common.make_tie_id(common.ttypes.TieDirectionType.North,
+                                            packet_common.MAX_U64,
+                                            common.ttypes.TIETypeType.KeyValueTIEType,
+                                            packet_common.MAX_U32))
+    for _ in range(nr_headers):
+        tie_header = packet_common.make_tie_header_with_lifetime(
+            common.ttypes.TieDirectionType.North, packet_common.MAX_U64,
+            common.ttypes.TIETypeType.KeyValueTIEType, packet_common.MAX_U32,
+            packet_common.MAX_U64, packet_common.MAX_U32,
+            origination_time=common.ttypes.IEEE802_1ASTimeStampType(AS_sec=0, AS_nsec=0))
+        tie_header.header.origination_lifetime = packet_common.MAX_U32
+        packet_common.add_tie_header_to_tide(tide_packet, tie_header)
+    protocol_packet = encoding.ttypes.ProtocolPacket(
+        header=encoding.ttypes.PacketHeader(sender=packet_common.MAX_U64, level=0),
+        content=encoding.ttypes.PacketContent(tide=tide_packet))
+    return len(packet_common.encode_protocol_packet_fast(protocol_packet))
+
+def max_headers_per_tide(mtu):
+    # The number of TIE headers that always fit in a TIDE packet on an interface with the given MTU
+    # (at least one, so that progress is always made)
+    max_tide_size = min(mtu - TIDE_PACKET_OVERHEAD, MAX_UDP_PAYLOAD_SIZE)
+    empty_tide_size = encoded_tide_size(0)
+    header_size = encoded_tide_size(1) - empty_tide_size
+    return max(1, (max_tide_size - empty_tide_size) // header_size)
+
+# The range of TIE types that are used in TIE-IDs (see Node.MIN_TIE_ID and Node.MAX_TIE_ID)
+MIN_TIE_TYPE = common.ttypes.TIETypeType.NodeTIEType
+MAX_TIE_TYPE = common.ttypes.TIETypeType.KeyValueTIEType
+
+def tie_id_successor(tie_id):
+    # The smallest TIE-ID that is bigger than the given TIE-ID (which is never Node.MAX_TIE_ID).
+    # Only valid TIE types are used: after the highest TIE number of the highest TIE type comes the
+    # next originator, and after the highest originator comes the next direction.
+    (direction, originator, tietype, tie_nr) = packet_common.tie_id_tup(tie_id)
+    if tie_nr < packet_common.MAX_U32:
+        return packet_common.make_tie_id(direction, originator, tietype, tie_nr + 1)
+    if tietype < MAX_TIE_TYPE:
+        return packet_common.make_tie_id(direction, originator, tietype + 1, 0)
+    if originator < packet_common.MAX_U64:
+        return packet_common.make_tie_id(direction, originator + 1, MIN_TIE_TYPE, 0)
+    assert direction < common.ttypes.TieDirectionType.North
+    return packet_common.make_tie_id(direction + 1, 0, MIN_TIE_TYPE, 0)
+
+class TIDERange:
+
+    def __init__(self, start_range, end_range):
+        self.start_range = start_range
+        self.end_range = end_range
+        self.tie_packet_infos = []     # The TIEs reported in the TIDE, sorted by TIE-ID
+        self.packet_info = None        # The encoded TIDE, None if it must be regenerated
+        self.reuse_count = 0           # Number of times that the TIDE was reused
+
+class TIDERanges:
+
+    def __init__(self, mtu, min_tie_id, max_tie_id):
+        self.max_headers = max_headers_per_tide(mtu)
+        self._ranges = [TIDERange(min_tie_id, max_tie_id)]
+        self._level = None
+
+    def update(self, tie_ids, tie_packet_infos, level):
+        # Divide the (sorted) TIE-IDs over the ranges, and return the list of ranges. The caller
+        # must regenerate the TIDE of each range whose packet_info is None.
+        if level != self._level:
+            # The level is in the packet header of each TIDE
+            for tide_range in self._ranges:
+                tide_range.packet_info = None
+            self._level = level
+        parts = [[] for _ in self._ranges]
+        end_keys = [packet_common.tie_id_tup(tide_range.end_range) for tide_range in self._ranges]
+        range_index = 0
+        for tie_id in tie_ids:
+            key = packet_common.tie_id_tup(tie_id)
+            while key > end_keys[range_index]:
+                range_index += 1
+            parts[range_index].append(tie_packet_infos[tie_id])
+        new_ranges = []
+        new_parts = []
+        for (tide_range, part) in zip(self._ranges, parts):
+            if len(part) > self.max_headers:
+                self._split(tide_range.start_range, tide_range.end_range, part, new_ranges,
+                            new_parts)
+            elif new_parts and len(new_parts[-1]) + len(part) <= self.max_headers // 2:
+                new_ranges[-1] = TIDERange(new_ranges[-1].start_range, tide_range.end_range)
+                new_parts[-1] = new_parts[-1] + part
+            else:
+                new_ranges.append(tide_range)
+                new_parts.append(part)
+        for (tide_range, part) in zip(new_ranges, new_parts):
+            if (tide_range.packet_info is not None and
+                    len(part) == len(tide_range.tie_packet_infos) and
+                    all(new is old for (new, old) in zip(part, tide_range.tie_packet_infos))):
+                tide_range.reuse_count += 1
+            else:
+                tide_range.tie_packet_infos = part
+                tide_range.packet_info = None
+                tide_range.reuse_count = 0
+        self._ranges = new_ranges
+        return new_ranges
+
+    def ranges(self):
+        # Return the list of ranges as of the last update, without updating them
+        return self._ranges
+
+    def _split(self, start_range, end_range, part, new_ranges, new_parts):
+        # Split the range in halves until each half fits in a TIDE. Splitting in halves instead of
+        # in full TIDEs leaves room for TIEs to be added without immediately splitting again.
+        if len(part) <= self.max_headers:
+            new_ranges.append(TIDERange(start_range, end_range))
+            new_parts.append(part)
+            return
+        middle = len(part) // 2
+        middle_tie_id = part[middle - 1].protocol_packet.content.tie.header.tieid
+        self._split(start_range, middle_tie_id, part[:middle], new_ranges, new_parts)
+        self._split(tie_id_successor(middle_tie_id), end_range, part[middle:], new_ranges,
+                    new_parts)
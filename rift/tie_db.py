@@ -0,0 +1,224 @@
+# The TIE database (TIE-DB) of a node.
+#
+# The TIEs are stored in a sorted dictionary, which is keyed by the TIE-ID as a native tuple
+# (direction, originator, TIE type, TIE number) (see packet_common.tie_id_tup) instead of by the
+# Thrift TIEID object. The ordering of the tuples is the same as the ordering of TIEID objects,
+# but comparing tuples does not involve calling Python code.
+#
+# In addition to the sorted dictionary, the TIE-DB maintains the following secondary indexes:
+#
+# * By originator: for each originator, the TIEs of each (direction, TIE type), by TIE number.
+#   This makes looking up e.g. all south node TIEs of a given node (which is done for
+#   every node during SPF) or all negative disaggregation TIEs of a given parent an O(1) operation.
+#
+# * By (direction, TIE type): e.g. all south negative disaggregation TIEs.
+#
+# * By originator level: for node TIEs, the level that the originator reports in the node TIE.
+#   This is used to find the node TIEs of the other nodes at the same level.
+#
+# The TIE-DB also supports the operations of a read-only mapping keyed by TIEID objects (in, [],
+# get, len, keys, values, items), in TIE-ID order.
+#
+# Finally, the TIE-DB ages the TIEs. Instead of decrementing the remaining lifetime of every TIE
+# every second, the TIE-DB has an aging clock (time), which is advanced by one second each time
+# that age is called. Each stored TIE has an expiry time on that clock, and its remaining lifetime
+# is derived from it whenever it is needed (see PacketInfo.start_aging). The expiry times are kept
+# in a min-heap, so that aging only has to look at the TIEs which actually expire. Heap entries of
+# TIEs which have been replaced or removed, or whose expiry time has changed, are skipped when they
+# reach the top of the heap.
+
+import heapq
+
+import sortedcontainers
+
+import common.ttypes
+import packet_common
+
+def tie_packet_info_tie_id(tie_packet_info):
+    return tie_packet_info.protocol_packet.content.tie.header.tieid
+
+class TIEDB:
+
+    def __init__(self):
+        self._tie_packet_infos = sortedcontainers.SortedDict()  # Indexed by tie_id_tup
+        # Indexed by originator, then by (direction, tietype), then by tie_nr. Most originators have
+        # only one or a few TIEs of each direction and type, so these are plain dictionaries which
+        # are sorted when they are read.
+        self._by_originator = {}
+        # Indexed by (direction, tietype), then by tie_id_tup
+        self._by_direction_and_type = {}
+        # Node TIEs, indexed by (direction, level of originator), then by tie_id_tup
+        self._node_ties_by_level = {}
+        # The aging clock, and a min-heap of (expiry time, entry nr, packet info) entries. The entry
+        # nr is only there to avoid comparing packet infos.
+        self.time = 0
+        self._expiry_heap = []
+        self._next_expiry_entry_nr = 0
+
+    def __len__(self):
+        return len(self._tie_packet_infos)
+
+    def __contains__(self, tie_id):
+        return packet_common.tie_id_tup(tie_id) in self._tie_packet_infos
+
+    def __getitem__(self, tie_id):
+        return self._tie_packet_infos[packet_common.tie_id_tup(tie_id)]
+
+    def __iter__(self):
+        return self.keys()
+
+    def get(self, tie_id, default=None):
+        return self._tie_packet_infos.get(packet_common.tie_id_tup(tie_id), default)
+
+    def keys(self):
+        for tie_packet_info in self._tie_packet_infos.values():
+            yield tie_packet_info_tie_id(tie_packet_info)
+
+    def values(self):
+        return self._tie_packet_infos.values()
+
+    def items(self):
+        for tie_packet_info in self._tie_packet_infos.values():
+            yield (tie_packet_info_tie_id(tie_packet_info), tie_packet_info)
+
+    def clear(self):
+        for tie_packet_info in self._tie_packet_infos.values():
+            tie_packet_info.stop_aging()
+        self._expiry_heap = []
+        self._tie_packet_infos.clear()
+        self._by_originator.clear()
+        self._by_direction_and_type.clear()
+        self._node_ties_by_level.clear()
+
+    def store(self, tie_packet_info):
+        # Store the TIE, replacing the TIE with the same TIE-ID (if any). Returns the replaced TIE,
+        # or None if there was no TIE with the same TIE-ID.
+        tie_id = tie_packet_info_tie_id(tie_packet_info)
+        key = packet_common.tie_id_tup(tie_id)
+        old_tie_packet_info = self._tie_packet_infos.get(key)
+        if old_tie_packet_info is not None:
+            self._remove_from_level_index(key, old_tie_packet_info)
+            old_tie_packet_info.stop_aging()
+        self._tie_packet_infos[key] = tie_packet_info
+        if tie_packet_info.remaining_tie_lifetime is not None:
+            tie_packet_info.start_aging(self)
+        direction_and_type = (tie_id.direction, tie_id.tietype)
+        originator_ties = self._by_originator.setdefault(tie_id.originator, {})
+        originator_ties.setdefault(direction_and_type, {})[tie_id.tie_nr] = tie_packet_info
+        self._by_direction_and_type.setdefault(direction_and_type, {})[key] = tie_packet_info
+        if tie_id.tietype == common.ttypes.TIETypeType.NodeTIEType:
+            level_key = (tie_id.direction, self._node_tie_level(tie_packet_info))
+            self._node_ties_by_level.setdefault(level_key, {})[key] = tie_packet_info
+        return old_tie_packet_info
+
+    def remove(self, tie_id):
+        # Remove the TIE. Returns the removed TIE, or None if there was no such TIE.
+        key = packet_common.tie_id_tup(tie_id)
+        tie_packet_info = self._tie_packet_infos.pop(key, None)
+        if tie_packet_info is None:
+            return None
+        direction_and_type = (tie_id.direction, tie_id.tietype)
+        originator_ties = self._by_originator[tie_id.originator]
+        type_ties = originator_ties[direction_and_type]
+        del type_ties[tie_id.tie_nr]
+        if not type_ties:
+            del originator_ties[direction_and_type]
+            if not originator_ties:
+                del self._by_originator[tie_id.originator]
+        type_index = self._by_direction_and_type[direction_and_type]
+        del type_index[key]
+        if not type_index:
+            del self._by_direction_and_type[direction_and_type]
+        self._remove_from_level_index(key, tie_packet_info)
+        tie_packet_info.stop_aging()
+        return tie_packet_info
+
+    @staticmethod
+    def _node_tie_level(tie_packet_info):
+        return tie_packet_info.protocol_packet.content.tie.element.node.level
+
+    def _remove_from_level_index(self, key, tie_packet_info):
+        (direction, _originator, tietype, _tie_nr) = key
+        if tietype != common.ttypes.TIETypeType.NodeTIEType:
+            return
+        level_key = (direction, self._node_tie_level(tie_packet_info))
+        level_index = self._node_ties_by_level[level_key]
+        del level_index[key]
+        if not level_index:
+            del self._node_ties_by_level[level_key]
+
+    def tie_packet_infos_in_range(self, start_tie_id, end_tie_id, inclusive=(True, True)):
+        # Yield the TIEs with a TIE-ID in the given range, in TIE-ID order
+        start_key = packet_common.tie_id_tup(start_tie_id)
+        end_key = packet_common.tie_id_tup(end_tie_id)
+        for key in self._tie_packet_infos.irange(start_key, end_key, inclusive):
+            yield self._tie_packet_infos[key]
+
+    def ties_of_type(self, direction, originator, tietype):
+        # Return the TIEs of the given originator, direction, and TIE type, in TIE-ID order
+        originator_ties = self._by_originator.get(originator)
+        if originator_ties is None:
+            return []
+        type_ties = originator_ties.get((direction, tietype))
+        if type_ties is None:
+            return []
+        return [type_ties[tie_nr] for tie_nr in sorted(type_ties.keys())]
+
+    def ties_of_originator(self, originator, direction=None):
+        # Return the TIEs of the given originator (only those in the given direction, if any), in
+        # TIE-ID order
+        originator_ties = self._by_originator.get(originator)
+        if originator_ties is None:
+            return []
+        result = []
+        for direction_and_type in sorted(originator_ties.keys()):
+            if direction is None or direction_and_type[0] == direction:
+                type_ties = originator_ties[direction_and_type]
+                result.extend(type_ties[tie_nr] for tie_nr in sorted(type_ties.keys()))
+        return result
+
+    def ties_of_direction_and_type(self, direction, tietype):
+        # Return the TIEs of the given direction and TIE type (of all originators), in TIE-ID order
+        type_index = self._by_direction_and_type.get((direction, tietype))
+        if type_index is None:
+            return []
+        return [type_index[key] for key in sorted(type_index.keys())]
+
+    def node_ties_at_level(self, direction, level):
+        # Return the node TIEs of the given direction whose originator reports the given level, in
+        # TIE-ID order
+        level_index = self._node_ties_by_level.get((direction, level))
+        if level_index is None:
+            return []
+        return [level_index[key] for key in sorted(level_index.keys())]
+
+    def schedule_expiry(self, tie_packet_info):
+        # Called by the packet info when it starts aging or when its expiry time changes
+        entry = (tie_packet_info.expiry_time, self._next_expiry_entry_nr, tie_packet_info)
+        self._next_expiry_entry_nr += 1
+        heapq.heappush(self._expiry_heap, entry)
+        if len(self._expiry_heap) > 2 * len(self._tie_packet_infos) + 64:
+            # Too many skipped entries (e.g. TIEs which were replaced by a newer version long
+            # before they would have expired); get rid of them
+            self._expiry_heap = [entry for entry in self._expiry_heap if self._is_current(entry)]
+            heapq.heapify(self._expiry_heap)
+
+    def _is_current(self, entry):
+        (expiry_time, _entry_nr, tie_packet_info) = entry
+        if tie_packet_info.expiry_time != expiry_time:
+            return False
+        key = packet_common.tie_id_tup(tie_packet_info_tie_id(tie_packet_info))
+        return self._tie_packet_infos.get(key) is tie_packet_info
+
+    def age(self):
+        # Advance the aging clock by one second. Returns the TIE-IDs (in TIE-ID order) of the TIEs
+        # whose remaining lifetime has dropped to zero or less; it is up to the caller to remove
+        # them.
+        self.time += 1
+        expired_keys = set()
+        while self._expiry_heap and self._expiry_heap[0][0] <= self.time:
+            entry = heapq.heappop(self._expiry_heap)
+            if self._is_current(entry):
+                expired_keys.add(packet_common.tie_id_tup(tie_packet_info_tie_id(entry[2])))
+        return [tie_packet_info_tie_id(self._tie_packet_infos[key])
+                for key in sorted(expired_keys)]
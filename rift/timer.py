@@ -1,14 +1,101 @@
+import operator
+import random
 import time
+
 import sortedcontainers
 
+import stats
+import watchdog
+
 class TimerScheduler:
 
+    # Base class for the timer schedulers. A timer scheduler keeps track of all running timers and
+    # triggers them when they expire. Derived classes must implement schedule, unschedule,
+    # expired_timers_pending, trigger_all_expired_timers, and stop_all_timers.
+    #
+    # The timer scheduler also keeps a histogram of the processing time of the expire functions,
+    # for each timer name.
+    #
+    # Normally, the timer scheduler uses the real (monotonic) clock. When the virtual clock is
+    # enabled, time stands still until the scheduler explicitly advances it, which it does whenever
+    # there is nothing else to do than to wait for the next timer to expire (see
+    # Scheduler.run_one_iteration). This allows a simulated topology to run faster than real time.
+
     def __init__(self):
-        self._timers_by_expire_time = sortedcontainers.SortedDict()
+        self.expire_histograms = {}   # Indexed by timer name
+        self._virtual_time = None
+        self._virtual_start_time = None
+        self._virtual_start_wall_time = None
+        self._virtual_stop_time = None
 
     def now(self):
+        if self._virtual_time is not None:
+            return self._virtual_time
         return time.monotonic()
 
+    def enable_virtual_clock(self, stop_secs=None):
+        # The virtual clock starts at the current real time, so that timers that are already
+        # running are not affected. If stop_secs is not None, the virtual clock stops advancing
+        # after stop_secs virtual seconds.
+        now = time.monotonic()
+        self._virtual_time = now
+        self._virtual_start_time = now
+        self._virtual_start_wall_time = time.time()
+        if stop_secs is None:
+            self._virtual_stop_time = None
+        else:
+            self._virtual_stop_time = now + stop_secs
+
+    def virtual_clock_enabled(self):
+        return self._virtual_time is not None
+
+    def virtual_clock_elapsed_secs(self):
+        return self._virtual_time - self._virtual_start_time
+
+    def virtual_clock_stop_secs(self):
+        if self._virtual_stop_time is None:
+            return None
+        return self._virtual_stop_time - self._virtual_start_time
+
+    def advance_virtual_clock(self, secs):
+        # Move the virtual clock forward by secs seconds (but not beyond the stop time). Return
+        # False if the virtual clock has stopped and cannot be moved forward anymore.
+        assert self._virtual_time is not None
+        new_time = self._virtual_time + max(secs, 0.0)
+        if self._virtual_stop_time is not None and new_time > self._virtual_stop_time:
+            if self._virtual_time >= self._virtual_stop_time:
+                return False
+            new_time = self._virtual_stop_time
+        self._virtual_time = new_time
+        return True
+
+    def wall_time(self):
+        # The equivalent of time.time() which follows the virtual clock when it is enabled
+        if self._virtual_time is None:
+            return time.time()
+        return self._virtual_start_wall_time + self._virtual_time - self._virtual_start_time
+
+    def record_expire_time(self, timer_name, secs):
+        histogram = self.expire_histograms.get(timer_name)
+        if histogram is None:
+            histogram = stats.Histogram()
+            self.expire_histograms[timer_name] = histogram
+        histogram.record(secs)
+
+    def clear_expire_histograms(self):
+        self.expire_histograms = {}
+
+class SortedDictTimerScheduler(TimerScheduler):
+
+    # The original timer scheduler: keeps the running timers in a SortedDict indexed by expire
+    # time. Schedule costs O(log n) and unschedule costs O(log n) plus a linear search in the list
+    # of timers with the same expire time. It is kept around as a reference implementation for
+    # the timer benchmark (tools/benchmark_timer.py).
+
+    def __init__(self):
+        TimerScheduler.__init__(self)
+        self._timers_by_expire_time = sortedcontainers.SortedDict()
+
     def schedule(self, timer):
         expire_time = timer.expire_time()
         assert expire_time is not None
@@ -55,16 +142,372 @@ class TimerScheduler:
             for timer in timers:
                 timer.stop()
 
-TIMER_SCHEDULER = TimerScheduler()
+    def nr_timers(self):
+        return sum(len(timers) for timers in self._timers_by_expire_time.values())
+
+class _WheelEntry:
+
+    # An entry in a slot of the timing wheel. When the timer is stopped (or restarted) before it
+    # expires, the entry is not removed from its slot (that would be a linear search); instead
+    # the timer is set to None, which turns the entry into a tombstone that is discarded when the
+    # slot is visited.
+
+    __slots__ = ['expire_time', 'expire_tick', 'seq_nr', 'timer']
+
+    def __init__(self, expire_time, expire_tick, seq_nr, timer):
+        self.expire_time = expire_time
+        self.expire_tick = expire_tick
+        self.seq_nr = seq_nr    # To trigger timers with the same expire time in scheduling order
+        self.timer = timer
+
+_ENTRY_ORDER = operator.attrgetter('expire_time', 'seq_nr')
+
+class TimingWheelTimerScheduler(TimerScheduler):
+
+    # A hierarchical hashed timing wheel (in the style of the classic Linux kernel timer wheel).
+    #
+    # Time is divided into ticks of TICK_SECS seconds. There are NR_WHEELS wheels of
+    # SLOTS_PER_WHEEL slots each. A slot in wheel 0 covers a single tick; a slot in wheel N covers
+    # SLOTS_PER_WHEEL^N ticks. A timer is put into the lowest wheel that can cover the distance
+    # between the current tick and its expire tick. Whenever the current tick crosses a boundary of
+    # wheel N (N > 0), the slot of wheel N that corresponds to the new tick is "cascaded": its
+    # timers are re-inserted, which moves them to a lower wheel.
+    #
+    # Both schedule and unschedule are O(1). Unschedule uses lazy tombstone cancellation (see
+    # _WheelEntry). Timers are never triggered before their exact expire time; the tick granularity
+    # only determines in which slot they live.
+
+    TICK_SECS = 0.01
+    SLOT_BITS = 8
+    SLOTS_PER_WHEEL = 1 << SLOT_BITS
+    SLOT_MASK = SLOTS_PER_WHEEL - 1
+    NR_WHEELS = 4
+
+    # Compact all slots when there are more tombstones than this plus twice the number of timers
+    TOMBSTONE_SLACK = 1024
+
+    def __init__(self):
+        TimerScheduler.__init__(self)
+        self._wheels = [[[] for _ in range(self.SLOTS_PER_WHEEL)]
+                        for _ in range(self.NR_WHEELS)]
+        self._nr_entries_in_wheel = [0] * self.NR_WHEELS   # Including tombstones
+        self._nr_timers = 0
+        self._nr_tombstones = 0
+        self._next_seq_nr = 0
+        # All ticks before the current tick have been completely processed
+        self._current_tick = self._time_to_tick(self.now())
+        # Cached earliest expire time of all running timers (None if there are no running timers);
+        # only meaningful if _next_expire_time_valid is True
+        self._next_expire_time = None
+        self._next_expire_time_valid = True
+
+    def _time_to_tick(self, at_time):
+        return int(at_time / self.TICK_SECS)
+
+    def _insert_entry(self, entry):
+        expire_tick = entry.expire_tick
+        delta = expire_tick - self._current_tick
+        if delta < 0:
+            expire_tick = self._current_tick
+        for wheel_nr in range(self.NR_WHEELS):
+            if delta < (1 << (self.SLOT_BITS * (wheel_nr + 1))):
+                break
+        else:
+            # Beyond the range of the top wheel. Park it in the furthest slot of the top wheel; it
+            # will be re-inserted (and parked again if needed) when that slot is cascaded.
+            wheel_nr = self.NR_WHEELS - 1
+            expire_tick = self._current_tick + (1 << (self.SLOT_BITS * self.NR_WHEELS)) - 1
+        index = (expire_tick >> (self.SLOT_BITS * wheel_nr)) & self.SLOT_MASK
+        self._wheels[wheel_nr][index].append(entry)
+        self._nr_entries_in_wheel[wheel_nr] += 1
+
+    def schedule(self, timer):
+        expire_time = timer.expire_time()
+        assert expire_time is not None
+        assert timer.scheduler_entry is None
+        self._next_seq_nr += 1
+        expire_tick = int(expire_time / self.TICK_SECS)
+        entry = _WheelEntry(expire_time, expire_tick, self._next_seq_nr, timer)
+        timer.scheduler_entry = entry
+        self._nr_timers += 1
+        if expire_tick - self._current_tick < self.SLOTS_PER_WHEEL:
+            # Fast path for the common case of a timer that goes into wheel 0
+            self._wheels[0][max(expire_tick, self._current_tick) & self.SLOT_MASK].append(entry)
+            self._nr_entries_in_wheel[0] += 1
+        else:
+            self._insert_entry(entry)
+        if self._next_expire_time_valid:
+            if self._next_expire_time is None or expire_time < self._next_expire_time:
+                self._next_expire_time = expire_time
+
+    def unschedule(self, timer):
+        entry = timer.scheduler_entry
+        assert entry is not None
+        assert entry.timer is timer
+        entry.timer = None
+        timer.scheduler_entry = None
+        self._nr_timers -= 1
+        self._nr_tombstones += 1
+        if entry.expire_time == self._next_expire_time:
+            self._next_expire_time_valid = False
+        if self._nr_tombstones > self.TOMBSTONE_SLACK + 2 * self._nr_timers:
+            self._compact()
+
+    def _compact(self):
+        for wheel_nr, wheel in enumerate(self._wheels):
+            for index, slot in enumerate(wheel):
+                if slot:
+                    live_entries = [entry for entry in slot if entry.timer is not None]
+                    nr_discarded = len(slot) - len(live_entries)
+                    self._nr_entries_in_wheel[wheel_nr] -= nr_discarded
+                    self._nr_tombstones -= nr_discarded
+                    wheel[index] = live_entries
+
+    def _take_slot(self, wheel_nr, index):
+        # Remove all entries from a slot, discard the tombstones, and return the live entries
+        slot = self._wheels[wheel_nr][index]
+        if not slot:
+            return slot
+        self._wheels[wheel_nr][index] = []
+        self._nr_entries_in_wheel[wheel_nr] -= len(slot)
+        live_entries = []
+        for entry in slot:
+            if entry.timer is None:
+                self._nr_tombstones -= 1
+            else:
+                live_entries.append(entry)
+        return live_entries
+
+    def _cascade(self):
+        # Called each time the current tick is advanced. Cascade the higher wheels whose boundary
+        # was crossed.
+        for wheel_nr in range(1, self.NR_WHEELS):
+            shift = self.SLOT_BITS * wheel_nr
+            if self._current_tick & ((1 << shift) - 1):
+                return
+            index = (self._current_tick >> shift) & self.SLOT_MASK
+            for entry in self._take_slot(wheel_nr, index):
+                self._insert_entry(entry)
+
+    def _expire_entry(self, entry):
+        timer = entry.timer
+        timer.scheduler_entry = None
+        self._nr_timers -= 1
+        self._next_expire_time_valid = False
+        timer.trigger_expire()
+
+    def _expire_current_slot(self, now):
+        # Trigger the timers in the slot of the current tick, in order of expire time. If now is
+        # None, trigger all of them, otherwise only trigger those that have an expire time before or
+        # at now. Triggered timers may schedule new timers in the same slot (e.g. a periodic timer
+        # catching up), so merge those in as we go along.
+        index = self._current_tick & self.SLOT_MASK
+        wheel = self._wheels[0]
+        entries = self._take_slot(0, index)
+        entries.sort(key=_ENTRY_ORDER)
+        entry_nr = 0
+        while entry_nr < len(entries):
+            if wheel[index]:
+                entries = entries[entry_nr:] + self._take_slot(0, index)
+                entries.sort(key=_ENTRY_ORDER)
+                entry_nr = 0
+                continue
+            entry = entries[entry_nr]
+            if now is not None and entry.expire_time > now:
+                break
+            entry_nr += 1
+            if entry.timer is None:
+                # Stopped by a timer that was triggered earlier in this same loop
+                self._nr_tombstones -= 1
+                continue
+            self._expire_entry(entry)
+        # Put the entries that have not expired yet back into the slot
+        if entry_nr < len(entries):
+            wheel[index].extend(entries[entry_nr:])
+            self._nr_entries_in_wheel[0] += len(entries) - entry_nr
+
+    def _compute_next_expire_time(self):
+        if self._nr_timers == 0:
+            return None
+        best = None
+        for wheel_nr in range(self.NR_WHEELS):
+            if self._nr_entries_in_wheel[wheel_nr] == 0:
+                continue
+            # Wheel 0 starts at the current tick; higher wheels start at the slot after the current
+            # one (the current slot of a higher wheel was already cascaded and can only contain
+            # timers that are one full rotation away).
+            shift = self.SLOT_BITS * wheel_nr
+            start = self._current_tick >> shift
+            if wheel_nr > 0:
+                start += 1
+            wheel = self._wheels[wheel_nr]
+            for offset in range(self.SLOTS_PER_WHEEL):
+                slot = wheel[(start + offset) & self.SLOT_MASK]
+                if not slot:
+                    continue
+                slot_best = None
+                for entry in slot:
+                    if entry.timer is not None:
+                        if slot_best is None or entry.expire_time < slot_best:
+                            slot_best = entry.expire_time
+                if slot_best is not None:
+                    if best is None or slot_best < best:
+                        best = slot_best
+                    break
+        return best
+
+    def _next_expire(self):
+        if not self._next_expire_time_valid:
+            self._next_expire_time = self._compute_next_expire_time()
+            self._next_expire_time_valid = True
+        return self._next_expire_time
+
+    def expired_timers_pending(self):
+        next_expire_time = self._next_expire()
+        if next_expire_time is None:
+            return False
+        return next_expire_time <= self.now()
+
+    def trigger_all_expired_timers(self):
+        # Trigger all expired timers and return time until next expire
+        now = self.now()
+        now_tick = self._time_to_tick(now)
+        while self._current_tick < now_tick:
+            if self._nr_timers == 0:
+                # Nothing left but tombstones; discard them and jump straight ahead
+                self._discard_all_entries()
+                self._current_tick = now_tick
+                break
+            if self._nr_entries_in_wheel[0] > 0:
+                self._expire_current_slot(None)
+                self._current_tick += 1
+            else:
+                # Wheel 0 is empty, so nothing can expire before the next boundary of wheel 1
+                next_boundary_tick = ((self._current_tick >> self.SLOT_BITS) + 1) << self.SLOT_BITS
+                if next_boundary_tick > now_tick:
+                    self._current_tick = now_tick
+                    break
+                self._current_tick = next_boundary_tick
+            self._cascade()
+        self._expire_current_slot(now)
+        next_expire_time = self._next_expire()
+        if next_expire_time is None:
+            return None
+        return max(next_expire_time - now, 0.0)
+
+    def stop_all_timers(self):
+        for wheel in self._wheels:
+            for slot in wheel:
+                for entry in slot:
+                    if entry.timer is not None:
+                        entry.timer.stop()
+        self._discard_all_entries()
+
+    def _discard_all_entries(self):
+        assert self._nr_timers == 0
+        self._wheels = [[[] for _ in range(self.SLOTS_PER_WHEEL)]
+                        for _ in range(self.NR_WHEELS)]
+        self._nr_entries_in_wheel = [0] * self.NR_WHEELS
+        self._nr_tombstones = 0
+        self._next_expire_time = None
+        self._next_expire_time_valid = True
+
+    def nr_timers(self):
+        return self._nr_timers
+
+class AsyncioTimerScheduler(TimerScheduler):
+
+    # Timer scheduler for the asyncio scheduler: each running timer is an asyncio TimerHandle
+    # created with loop.call_at, and the asyncio event loop triggers the timers. After each
+    # expired timer, after_expire_function is called (the asyncio scheduler uses it to process the
+    # FSM events that the expired timer may have pushed).
+
+    def __init__(self, loop, after_expire_function):
+        TimerScheduler.__init__(self)
+        self._loop = loop
+        self._after_expire_function = after_expire_function
+        self._running_timers = set()
+
+    def now(self):
+        return self._loop.time()
+
+    def schedule(self, timer):
+        expire_time = timer.expire_time()
+        assert expire_time is not None
+        assert timer.scheduler_entry is None
+        timer.scheduler_entry = self._loop.call_at(expire_time, self._expire, timer)
+        self._running_timers.add(timer)
+
+    def unschedule(self, timer):
+        handle = timer.scheduler_entry
+        assert handle is not None
+        handle.cancel()
+        timer.scheduler_entry = None
+        self._running_timers.discard(timer)
+
+    def _expire(self, timer):
+        timer.scheduler_entry = None
+        self._running_timers.discard(timer)
+        timer.trigger_expire()
+        self._after_expire_function()
+
+    def expired_timers_pending(self):
+        # The asyncio event loop triggers expired timers itself
+        return False
+
+    def trigger_all_expired_timers(self):
+        # The asyncio event loop triggers expired timers itself
+        return None
+
+    def stop_all_timers(self):
+        for timer in list(self._running_timers):
+            timer.stop()
+
+    def nr_timers(self):
+        return len(self._running_timers)
+
+TIMER_SCHEDULER = TimingWheelTimerScheduler()
+
+def enable_virtual_clock(stop_secs=None):
+    # Must be called after the timer scheduler has been chosen (see scheduler.set_scheduler_type).
+    # The statistics follow the virtual clock too, so that rates are per virtual second.
+    TIMER_SCHEDULER.enable_virtual_clock(stop_secs)
+    stats.TIME_FUNCTION = TIMER_SCHEDULER.wall_time
+
+# The jitter and phase spreading of the periodic timers of nodes and interfaces (see Timer). These
+# are set by the engine from the command line options. Both are off by default, so that the timing
+# of LIEs, TIDEs, and aging is unchanged unless the user opts in.
+DEFAULT_PERIODIC_JITTER = 0.0
+PERIODIC_JITTER = DEFAULT_PERIODIC_JITTER
+PERIODIC_SPREAD_PHASE = False
 
 class Timer:
 
-    def __init__(self, interval, expire_function, periodic=True, start=True):
+    # For periodic timers only: if jitter is non-zero, each expiry is delayed by a random amount of
+    # at most jitter times the interval, and if spread_phase is True, the first expiry is at a
+    # random point in the first interval instead of at the end of it. Without these, the periodic
+    # timers of all nodes and interfaces that are created at the same time expire in lockstep. The
+    # jitter does not accumulate: the expiries stay on a grid of one interval apart, so the timer
+    # still expires exactly once per interval on average.
+
+    def __init__(self, interval, expire_function, periodic=True, start=True, name=None,
+                 jitter=0.0, spread_phase=False):
+        assert 0.0 <= jitter < 1.0
         self._running = False
         self._periodic = periodic
         self._interval = interval
+        self._jitter = jitter if periodic else 0.0
+        self._spread_phase = spread_phase and periodic
+        self._grid_time = None
         self._expire_time = None
         self._expire_function = expire_function
+        # The name identifies the timer in the expire function processing time histograms. It
+        # defaults to the qualified name of the expire function (e.g. "Node.age_ties"); timers with
+        # a lambda expire function should be given an explicit name.
+        if name is None and expire_function is not None:
+            name = expire_function.__qualname__
+        self._name = name
+        self.scheduler_entry = None    # Owned by the timer scheduler
         if start:
             self.start()
 
@@ -87,28 +530,44 @@ class Timer:
         else:
             return "Stopped"
 
+    def _random_delay(self):
+        if self._jitter == 0.0:
+            return 0.0
+        return random.random() * self._jitter * self._interval
+
     def start(self):
         if self._running:
             self.stop()
         self._running = True
-        self._expire_time = TIMER_SCHEDULER.now() + self._interval
+        if self._spread_phase:
+            self._grid_time = TIMER_SCHEDULER.now() + random.random() * self._interval
+        else:
+            self._grid_time = TIMER_SCHEDULER.now() + self._interval
+        self._expire_time = self._grid_time + self._random_delay()
         TIMER_SCHEDULER.schedule(self)
 
     def stop(self):
         if self._running:
             TIMER_SCHEDULER.unschedule(self)
             self._running = False
+            self._grid_time = None
             self._expire_time = None
 
     def trigger_expire(self):
         if self._expire_function is not None:
+            start_time = time.monotonic()
+            watchdog.callback_started(self._name)
             self._expire_function()
+            watchdog.callback_finished()
+            TIMER_SCHEDULER.record_expire_time(self._name, time.monotonic() - start_time)
         if self._periodic:
-            # Next expire is not now + interval but current expire_time + interval because the
-            # expire function may be called too late when the system is busy, in which case we
-            # try to catch up.
-            self._expire_time += self._interval
+            # Next expire is not now + interval but the next point on the grid (plus jitter)
+            # because the expire function may be called too late when the system is busy, in which
+            # case we try to catch up.
+            self._grid_time += self._interval
+            self._expire_time = self._grid_time + self._random_delay()
             TIMER_SCHEDULER.schedule(self)
         else:
             self._running = False
+            self._grid_time = None
             self._expire_time = None
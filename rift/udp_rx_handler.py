@@ -83,8 +83,15 @@ class UdpRxHandler:
 
     MAX_SIZE = 65535
 
+    # The only ancillary message that we ask for is IP_PKTINFO or IPV6_PKTINFO
+    ANCILLARY_SIZE = socket.CMSG_SPACE(max(ctypes.sizeof(in_pktinfo), ctypes.sizeof(in6_pktinfo)))
+
     def __init__(self, interface_name, local_port, ipv4, multicast_address, remote_address,
-                 receive_function, log, log_id, use_broadcast=False):
+                 receive_function, log, log_id, use_broadcast=False, handler_type="UDP",
+                 handler_priority=scheduler.Scheduler.PRIORITY_NORMAL, backlog_counter=None):
+        self.handler_type = handler_type              # For the scheduler histograms
+        self.handler_priority = handler_priority      # For the scheduler receive policy
+        self._backlog_counter = backlog_counter       # Increased when the read budget is used up
         self._interface_name = interface_name
         self._local_port = local_port
         self._ipv4 = ipv4                             # IPv4 if True, IPv6 if False
@@ -93,6 +100,9 @@ class UdpRxHandler:
         self._receive_function = receive_function
         self._log = log
         self._log_id = log_id
+        # Messages are received into a buffer which is allocated once and reused for every message,
+        # instead of allocating a new maximum-sized bytes object for every message
+        self._rx_buffer = memoryview(bytearray(self.MAX_SIZE))
         self._local_ipv4_address, _mask = utils.interface_ipv4_address(interface_name)
         self._local_ipv6_address = utils.interface_ipv6_address(interface_name)
         try:
@@ -129,11 +139,13 @@ class UdpRxHandler:
             return None
 
     def ready_to_read(self):
-        while True:
-            ancillary_size = socket.CMSG_LEN(self.MAX_SIZE)
+        # Read at most the scheduler read budget of messages. If there are more messages waiting,
+        # the socket is still ready to read in the next scheduler iteration, after the other ready
+        # sockets and the timers have had their turn.
+        for _ in range(scheduler.SCHEDULER.read_budget):
             try:
-                message, ancillary_messages, _msg_flags, from_info = \
-                    self.sock.recvmsg(self.MAX_SIZE, ancillary_size)
+                nr_bytes, ancillary_messages, _msg_flags, from_info = \
+                    self.sock.recvmsg_into([self._rx_buffer], self.ANCILLARY_SIZE)
             except (IOError, OSError) as err:
                 if err.args[0] != errno.EWOULDBLOCK:
                     self.warning("Socket receive failed: %s", err)
@@ -151,7 +163,14 @@ class UdpRxHandler:
                 if rx_interface_index and (rx_interface_index != self._interface_index):
                     # Message received on "wrong" interface; ignore
                     return
-            self._receive_function(message, from_info, self.sock)
+            # The message is a view on the receive buffer, which is overwritten by the next message.
+            # The receive function must copy whatever it keeps (see packet_common.decode_message).
+            self._receive_function(self._rx_buffer[:nr_bytes], from_info, self.sock)
+            if self.sock is None:
+                # The receive function closed this handler
+                return
+        if self._backlog_counter is not None:
+            self._backlog_counter.increase()
 
     @staticmethod
     def enable_addr_and_port_reuse(sock):
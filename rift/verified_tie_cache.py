@@ -0,0 +1,58 @@
+# Cache of recently received TIEs whose origin fingerprint has been verified.
+#
+# With redundant flooding, a node receives the same version of a TIE from several neighbors. All
+# copies carry the same encoded TIE (TIEs are reflooded using the received encoding) and hence the
+# same origin key id and origin fingerprint. The verified TIE cache recognizes such a copy: if the
+# origin key id and origin fingerprint are in the cache, the received encoded TIE is byte-for-byte
+# the same as the cached one (which also means that it has the same TIE-ID and sequence number),
+# and it would be verified using the same key, then the origin fingerprint is known to be correct
+# and it is not computed again, and the element of the TIE is not decoded unless it is needed (as
+# in TIE pass-through mode). The outer fingerprint is still verified for every received packet (it
+# covers the nonces).
+#
+# The byte comparison is needed: the origin fingerprint is sent in the clear, so a packet can carry
+# the fingerprint of a verified TIE without carrying that TIE. The comparison is done in C (memcmp)
+# and costs much less than computing the fingerprint.
+#
+# Only the encoded TIE is cached, not the decoded TIE: the decoded TIE is modified after it has
+# been received (e.g. its remaining lifetime), so each copy is decoded into its own object (except
+# for the element), and it goes through the same checks as any other received packet.
+#
+# The cache holds at most max_size entries; the least recently used entry is evicted first.
+
+import collections
+
+class VerifiedTIECache:
+
+    def __init__(self, max_size):
+        self._max_size = max_size
+        # (origin key id, origin fingerprint) -> (encoded protocol packet, key)
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, origin_key_id, origin_fingerprint, encoded_protocol_packet, origin_key):
+        # Return the (immutable) encoded protocol packet of the cached TIE, or None if the TIE is
+        # not in the cache. The encoded protocol packet that is passed in may be a memoryview.
+        cache_key = (origin_key_id, origin_fingerprint)
+        entry = self._entries.get(cache_key)
+        if entry is None:
+            return None
+        (cached_encoded_protocol_packet, cached_origin_key) = entry
+        if cached_origin_key is not origin_key:
+            return None
+        if cached_encoded_protocol_packet != encoded_protocol_packet:
+            return None
+        self._entries.move_to_end(cache_key)
+        return cached_encoded_protocol_packet
+
+    def add(self, packet_info, origin_key):
+        cache_key = (packet_info.origin_key_id, packet_info.origin_fingerprint)
+        self._entries[cache_key] = (packet_info.encoded_protocol_packet, origin_key)
+        self._entries.move_to_end(cache_key)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,135 @@
+# Sampling watchdog profiler: finds out where the time goes in scheduler callbacks (ready-to-read
+# handlers, timer expire functions, and the processing of queued FSM events) that run for a long
+# time, without the overhead of running a full profiler all the time.
+#
+# When the watchdog is enabled, the main thread tells the watchdog each time it starts and finishes
+# a callback. A separate watchdog thread wakes up every sample interval, and if the current
+# callback has been running for longer than the threshold, it takes a sample of the stack of the
+# main thread (using sys._current_frames). The samples are aggregated into collapsed stacks (one
+# line per distinct stack, with the frames separated by semicolons, followed by the number of
+# samples), which is the input format of flamegraph tools such as flamegraph.pl and speedscope.
+
+import os
+import sys
+import threading
+import time
+
+import stats
+
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+# The watchdog is disabled when this is None (see enable)
+WATCHDOG = None
+
+def frame_name(frame):
+    code = frame.f_code
+    return "{}:{}".format(os.path.basename(code.co_filename),
+                          getattr(code, 'co_qualname', code.co_name))
+
+def collapsed_stack(callback_name, frame, caller_frame):
+    # The root of the stack is the name of the callback, followed by the frames from the outermost
+    # to the innermost one. The frames of the caller of the callback (i.e. the scheduler loop) and
+    # its callers are the same for all samples, so they are left out.
+    names = []
+    while frame is not None and frame is not caller_frame:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    names.append(callback_name)
+    names.reverse()
+    # Semicolons and spaces have a special meaning in the collapsed stack format
+    return ";".join(name.replace(";", ":").replace(" ", "_") for name in names)
+
+class Watchdog:
+
+    def __init__(self, threshold_secs, sample_interval_secs=DEFAULT_SAMPLE_INTERVAL):
+        self.threshold_secs = threshold_secs
+        self.sample_interval_secs = sample_interval_secs
+        self._main_thread_id = threading.get_ident()
+        # The (name, start time, caller frame) of the callback that the main thread is running, or
+        # None. The main thread replaces the whole tuple, so the watchdog thread always sees a
+        # consistent value without locking.
+        self._current_callback = None
+        # Histograms of the duration of the callbacks that ran longer than the threshold, indexed
+        # by callback name; only accessed by the main thread
+        self.long_callback_histograms = {}
+        # Number of samples, indexed by collapsed stack; protected by the lock because it is
+        # updated by the watchdog thread
+        self._lock = threading.Lock()
+        self._stack_counts = {}
+        self._nr_samples = 0
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rift-watchdog", daemon=True)
+        self._thread.start()
+
+    def callback_started(self, name, caller_frame):
+        self._current_callback = (name, time.monotonic(), caller_frame)
+
+    def callback_finished(self):
+        (name, start_time, _caller_frame) = self._current_callback
+        self._current_callback = None
+        duration = time.monotonic() - start_time
+        if duration > self.threshold_secs:
+            histogram = self.long_callback_histograms.get(name)
+            if histogram is None:
+                histogram = stats.Histogram()
+                self.long_callback_histograms[name] = histogram
+            histogram.record(duration)
+
+    def _run(self):
+        while not self._stop_event.wait(self.sample_interval_secs):
+            self.take_sample()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+
+    def take_sample(self):
+        current_callback = self._current_callback
+        if current_callback is None:
+            return
+        (name, start_time, caller_frame) = current_callback
+        if time.monotonic() - start_time < self.threshold_secs:
+            return
+        # pylint:disable=protected-access
+        frame = sys._current_frames().get(self._main_thread_id)
+        if frame is None:
+            return
+        stack = collapsed_stack(name, frame, caller_frame)
+        # Discard the sample if the main thread moved on to another callback in the meantime
+        if self._current_callback is not current_callback:
+            return
+        with self._lock:
+            self._stack_counts[stack] = self._stack_counts.get(stack, 0) + 1
+            self._nr_samples += 1
+
+    def nr_samples(self):
+        with self._lock:
+            return self._nr_samples
+
+    def collapsed_stacks(self):
+        # Return the samples as lines in collapsed stack format
+        with self._lock:
+            stack_counts = dict(self._stack_counts)
+        return ["{} {}".format(stack, count) for (stack, count) in sorted(stack_counts.items())]
+
+    def clear(self):
+        self.long_callback_histograms = {}
+        with self._lock:
+            self._stack_counts = {}
+            self._nr_samples = 0
+
+def enable(threshold_secs, sample_interval_secs=DEFAULT_SAMPLE_INTERVAL):
+    # Must be called from the main thread (the thread that runs the scheduler)
+    global WATCHDOG   # pylint:disable=global-statement
+    WATCHDOG = Watchdog(threshold_secs, sample_interval_secs)
+
+def callback_started(name):
+    # Called by the main thread just before it calls a callback
+    if WATCHDOG is not None:
+        # pylint:disable=protected-access
+        WATCHDOG.callback_started(name, sys._getframe(1))
+
+def callback_finished():
+    # Called by the main thread just after a callback returns
+    if WATCHDOG is not None:
+        WATCHDOG.callback_finished()
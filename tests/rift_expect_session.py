@@ -25,10 +25,17 @@ class RiftExpectSession:
     expect_timeout = 5.0
 
     def __init__(self, topology_file=None, start_converge_secs=DEFAULT_START_CONVERGE_SECS,
-                 reconverge_secs=DEFAULT_RECONVERGE_SECS, log_debug=True):
+                 reconverge_secs=DEFAULT_RECONVERGE_SECS, log_debug=True, processes=1,
+                 virtual_clock_stop=None, seed=None):
         rift_cmd = "rift --interactive --non-passive"
         if log_debug:
             rift_cmd += " --log-level debug"
+        if processes > 1:
+            rift_cmd += " --processes {}".format(processes)
+        if virtual_clock_stop is not None:
+            rift_cmd += " --virtual-clock --virtual-clock-stop {}".format(virtual_clock_stop)
+        if seed is not None:
+            rift_cmd += " --seed {}".format(seed)
         self._topology_file = topology_file
         if topology_file is not None:
             rift_cmd += " topology/{}.yaml".format(topology_file)
@@ -261,3 +261,37 @@ def test_fsm_basic(dog):
     assert dog.poops == 1
     assert dog.total_actions == 1
     dog.reset_action_counters()
+
+def test_history_records_reused(dog):
+    dog.fsm_instance.start()
+    dog.fsm_instance.push_event(dog.Event.SEE_SQUIRREL)
+    fsm.Fsm.process_queued_events()
+    # Verbose events (the chained WAIT event) are recorded from the start, even though nobody has
+    # looked at the verbose history yet
+    assert [record.event for record in dog.fsm_instance.verbose_records()] == [
+        dog.Event.WAIT, dog.Event.SEE_SQUIRREL, None]
+    # Push enough verbose events to wrap around the ring of recent records several times
+    for _ in range(250):
+        dog.fsm_instance.push_event(dog.Event.WAIT)
+    fsm.Fsm.process_queued_events()
+    # The verbose history contains the most recent records, most recent first
+    verbose_records = dog.fsm_instance.verbose_records()
+    assert len(verbose_records) == fsm._MAX_RECORDS  # pylint:disable=protected-access
+    seq_nrs = [record.seq_nr for record in verbose_records]
+    assert seq_nrs == list(range(seq_nrs[0], seq_nrs[0] - len(seq_nrs), -1))
+    for record in verbose_records:
+        assert record.event == dog.Event.WAIT
+        assert record.actions_and_pushed_events == ["bark"]
+    # Reusing the records of verbose events did not overwrite the non-verbose history
+    dog.fsm_instance.push_event(dog.Event.PET)
+    fsm.Fsm.process_queued_events()
+    # pylint:disable=protected-access
+    records = list(dog.fsm_instance._records)
+    assert len(records) == 3
+    assert records[0].event == dog.Event.PET
+    assert records[0].skipped == 251
+    assert records[1].event == dog.Event.SEE_SQUIRREL
+    assert records[1].actions_and_pushed_events == ["growl", "jump", "WAIT", "bark"]
+    assert records[1].to_state == dog.State.BARKING
+    assert records[2].event is None
+    assert records[2].actions_and_pushed_events == ["sit"]
@@ -0,0 +1,121 @@
+import msg_queues
+import packet_common
+
+import common.ttypes
+import constants
+
+SOUTH = constants.DIR_SOUTH
+PREFIX = common.ttypes.TIETypeType.PrefixTIEType
+
+# pylint:disable=protected-access
+
+class RecordingQueue(msg_queues._MsgQueueBase):
+
+    # Records the messages that would have been sent, as lists of (originator, seq_nr)
+
+    def __init__(self, immediate=False):
+        msg_queues._MsgQueueBase.__init__(self, "test", None, with_lifetime=False)
+        self.messages = []
+        self._message = None
+        self._immediate = immediate
+
+    def _send_immediately(self):
+        return self._immediate
+
+    def start_message(self):
+        self._message = []
+
+    def end_message(self):
+        self.messages.append(self._message)
+        self._message = None
+
+    def add_to_message(self, tie_header_lifetime):
+        header = tie_header_lifetime.header
+        self._message.append((header.tieid.originator, header.seq_nr))
+        return True
+
+def make_header(originator, seq_nr):
+    return packet_common.make_tie_header(SOUTH, originator, PREFIX, 1, seq_nr)
+
+def tick(queue):
+    queue.messages = []
+    queue.service_queue()
+    return queue.messages
+
+def test_service_queue():
+    packet_common.add_missing_methods_to_thrift()
+    queue = RecordingQueue()
+    assert not queue.need_timer()
+    assert not tick(queue)
+    # New entries are sent after a short delay, and then retransmitted after a long delay
+    queue.add_tie_header(make_header(1, 10))
+    queue.add_tie_header(make_header(2, 20))
+    assert queue.need_timer()
+    assert tick(queue) == [[(1, 10), (2, 20)]]
+    for _ in range(msg_queues._LONG_DELAY_TICKS - 1):
+        assert not tick(queue)
+    assert tick(queue) == [[(1, 10), (2, 20)]]
+    # Re-adding the same version does not change when it is sent; a newer version is sent after a
+    # short delay
+    queue.add_tie_header(make_header(1, 10))
+    queue.add_tie_header(make_header(2, 21))
+    queue.add_tie_header(make_header(3, 30))
+    assert queue.search_tie_id(make_header(2, 0).tieid).header.seq_nr == 21
+    assert tick(queue) == [[(2, 21), (3, 30)]]
+    for _ in range(msg_queues._LONG_DELAY_TICKS - 2):
+        assert not tick(queue)
+    assert tick(queue) == [[(1, 10)]]
+    # Removed entries are no longer sent
+    queue.remove_tie_id(make_header(2, 0).tieid)
+    queue.remove_tie_id(make_header(4, 0).tieid)
+    assert queue.search_tie_id(make_header(2, 0).tieid) is None
+    assert tick(queue) == [[(3, 30)]]
+    assert queue.depth() == 2
+    assert queue.max_depth == 3
+    assert queue.serviced_ticks == 5
+    assert queue.serviced_entries == 8
+    assert queue.service_time_histogram.count == 5
+    queue.clear()
+    assert not queue.need_timer()
+    for _ in range(2 * msg_queues._LONG_DELAY_TICKS):
+        assert not tick(queue)
+
+def test_cli_table_send_delay():
+    packet_common.add_missing_methods_to_thrift()
+    queue = RecordingQueue()
+    queue.add_tie_header(make_header(1, 10))
+    tick(queue)
+    tick(queue)
+    # Sent one tick ago, so it will be retransmitted after the long delay minus one tick
+    expected_delay = (msg_queues._LONG_DELAY_TICKS - 1) * msg_queues._TICK_INTERVAL
+    assert "| {:.2f} ".format(expected_delay) in queue.cli_table().to_string()
+
+def test_immediate_first_transmission():
+    packet_common.add_missing_methods_to_thrift()
+    queue = RecordingQueue(immediate=True)
+    # New entries are sent right away, and then retransmitted after a long delay
+    queue.add_tie_header(make_header(1, 10))
+    assert queue.messages == [[(1, 10)]]
+    queue.add_tie_header(make_header(1, 10))
+    assert queue.messages == [[(1, 10)]]
+    for _ in range(msg_queues._LONG_DELAY_TICKS - 1):
+        assert not tick(queue)
+    # A newer version is also sent right away
+    queue.add_tie_header(make_header(1, 11))
+    assert queue.messages == [[(1, 11)]]
+    for _ in range(msg_queues._LONG_DELAY_TICKS - 1):
+        assert not tick(queue)
+    assert tick(queue) == [[(1, 11)]]
+    assert queue.immediate_entries == 2
+    assert queue.serviced_entries == 1
+
+def test_immediate_tie_flooding_only_for_ties():
+    saved_immediate_tie_flooding = msg_queues.IMMEDIATE_TIE_FLOODING
+    try:
+        for immediate_tie_flooding in [False, True]:
+            msg_queues.IMMEDIATE_TIE_FLOODING = immediate_tie_flooding
+            assert msg_queues._TIEQueue(None)._send_immediately() == immediate_tie_flooding
+            assert not msg_queues._TIEReqQueue(None)._send_immediately()
+            assert not msg_queues._TIEAckQueue(None)._send_immediately()
+    finally:
+        msg_queues.IMMEDIATE_TIE_FLOODING = saved_immediate_tie_flooding
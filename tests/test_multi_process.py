@@ -0,0 +1,102 @@
+import multiprocessing
+import time
+
+import engine
+import multi_process
+import scheduler
+
+def make_config(shard_sizes):
+    shards = []
+    node_nr = 1
+    for shard_size in shard_sizes:
+        nodes = []
+        for _ in range(shard_size):
+            nodes.append({'name': "node{}".format(node_nr)})
+            node_nr += 1
+        shards.append({'id': len(shards), 'nodes': nodes})
+    return {'shards': shards}
+
+def test_partition_single_shard():
+    config = make_config([10])
+    assert multi_process.partition_nodes(config, 1) == [list(range(10))]
+    assert multi_process.partition_nodes(config, 2) == [[0, 1, 2, 3, 4], [5, 6, 7, 8, 9]]
+    assert multi_process.partition_nodes(config, 3) == [[0, 1, 2], [3, 4, 5, 6], [7, 8, 9]]
+    # Never more processes than nodes
+    assert multi_process.partition_nodes(config, 20) == [[index] for index in range(10)]
+
+def test_partition_multiple_shards():
+    # Each shard is run by a single process
+    config = make_config([3, 3, 2])
+    assert multi_process.partition_nodes(config, 3) == [[0, 1, 2], [3, 4, 5], [6, 7]]
+    assert multi_process.partition_nodes(config, 2) == [[0, 1, 2], [3, 4, 5, 6, 7]]
+    assert multi_process.partition_nodes(config, 8) == [[0, 1, 2], [3, 4, 5], [6, 7]]
+
+def test_partition_no_nodes():
+    assert multi_process.partition_nodes({}, 4) == []
+    assert multi_process.partition_nodes(make_config([0]), 4) == []
+
+def test_worker_engine_kwargs():
+    # Each worker process gets its own seed, and does not start worker processes of its own
+    options = engine.EngineOptions(seed=10, processes=2, codec="python")
+    engine_kwargs = {'options': options, 'interactive': False}
+    for worker_nr in [1, 2]:
+        worker_kwargs = multi_process.worker_engine_kwargs(engine_kwargs, worker_nr)
+        assert worker_kwargs['options'].seed == 10 + worker_nr
+        assert worker_kwargs['options'].processes == 1
+        assert worker_kwargs['options'].codec == "python"
+        assert worker_kwargs['interactive'] is False
+    # The options of the parent process are not changed
+    assert options.seed == 10
+    assert options.processes == 2
+    # Without a seed, the workers are not seeded either
+    engine_kwargs = {'options': engine.EngineOptions()}
+    assert multi_process.worker_engine_kwargs(engine_kwargs, 1)['options'].seed is None
+
+class EofEngine:
+
+    # Stands in for the engine in a worker process: reports no nodes and then waits for the parent
+    # process to exit
+
+    def __init__(self, node_indexes, worker_connection):
+        self._node_indexes = node_indexes
+        self._connection = worker_connection
+
+    def run(self):
+        self._connection.send([])
+        try:
+            self._connection.recv()
+        except EOFError:
+            pass
+
+def test_worker_sees_parent_exit():
+    # A worker process must not hold the parent's end of its own connection (or of the connections
+    # to the other workers), otherwise it never sees end-of-file when the parent exits
+    workers = []
+    for worker_nr in [1, 2]:
+        workers.append(multi_process.Worker(worker_nr, EofEngine, {}, [], workers))
+    for worker in workers:
+        worker.wait_ready()
+    for worker in workers:
+        worker.connection().close()
+    deadline = time.monotonic() + 10.0
+    pids = [worker.pid() for worker in workers]
+    while any(child.pid in pids for child in multiprocessing.active_children()):
+        assert time.monotonic() < deadline, "Worker process did not exit"
+        time.sleep(0.05)
+
+def test_worker_handler_parent_exit():
+    # When the parent process exits, the worker handler stops the scheduler instead of exiting
+    saved_scheduler = scheduler.SCHEDULER
+    (parent_connection, child_connection) = multiprocessing.Pipe()
+    try:
+        scheduler.SCHEDULER = scheduler.SelectScheduler()
+        handler = multi_process.WorkerHandler(child_connection, None, {})
+        assert parent_connection.recv() == []
+        assert scheduler.SCHEDULER.nr_handlers() == 1
+        parent_connection.close()
+        handler.ready_to_read()
+        assert scheduler.SCHEDULER.stop_requested
+        assert scheduler.SCHEDULER.nr_handlers() == 0
+        assert child_connection.closed
+    finally:
+        scheduler.SCHEDULER = saved_scheduler
@@ -5,6 +5,7 @@ import constants
 import encoding.ttypes
 import node
 import packet_common
+import tide_ranges
 import timer
 
 # pylint: disable=line-too-long
@@ -576,6 +577,51 @@ def test_is_flood_allowed():
         assert allowed == expected_allowed, expected_reason
         assert reason == expected_reason
 
+def test_is_flood_allowed_memoized():
+    packet_common.add_missing_methods_to_thrift()
+    test_node = make_test_node()
+    node_66_tie_packet = packet_common.make_node_tie_packet(
+        name="node66",
+        level=MY_LEVEL,
+        direction=SOUTH,
+        originator=66,
+        tie_nr=5,
+        seq_nr=7)
+    store_tie_packet(test_node, node_66_tie_packet, 300)
+    def is_flood_allowed(tie_header):
+        return test_node.is_flood_allowed(
+            tie_header=tie_header,
+            to_node_direction=SOUTH,
+            to_node_system_id=22,
+            from_node_system_id=MY_SYSTEM_ID,
+            from_node_level=MY_LEVEL,
+            from_node_is_top_of_fabric=False)
+    # The same decision is returned for TIEs in the same equivalence class
+    decision = is_flood_allowed(node_66_tie_packet.header)
+    assert decision == (True, "Node S-TIE to S: originator level is same as from-node")
+    other_prefix_header = packet_common.make_tie_header(SOUTH, 55, PREFIX, 2, 4)
+    self_prefix_header = packet_common.make_tie_header(SOUTH, MY_SYSTEM_ID, PREFIX, 2, 4)
+    assert is_flood_allowed(other_prefix_header) == (False, "Non-node S-TIE to S: not self-originated")
+    assert is_flood_allowed(self_prefix_header) == (True, "Non-node S-TIE to S: self-originated")
+    assert is_flood_allowed(node_66_tie_packet.header) is decision
+    assert is_flood_allowed(packet_common.make_tie_header(SOUTH, 56, PREFIX, 3, 1)) == \
+           (False, "Non-node S-TIE to S: not self-originated")
+    # The level of the originator is part of the equivalence class
+    node_66_tie_packet = packet_common.make_node_tie_packet(
+        name="node66",
+        level=MY_LEVEL + 1,
+        direction=SOUTH,
+        originator=66,
+        tie_nr=5,
+        seq_nr=8)
+    store_tie_packet(test_node, node_66_tie_packet, 300)
+    assert is_flood_allowed(node_66_tie_packet.header) == \
+           (False, "Node S-TIE to S: originator level is not same as from-node")
+    # pylint:disable=protected-access
+    assert len(test_node._flood_scope_decisions) == 4
+    test_node.forget_flood_scope_decisions()
+    assert not test_node._flood_scope_decisions
+
 def test_generate_tide_packet():
     packet_common.add_missing_methods_to_thrift()
     db_tie_info_list = [
@@ -596,6 +642,264 @@ def test_generate_tide_packet():
     expected_header = packet_common.make_tie_header_with_lifetime(SOUTH, MY_SYSTEM_ID, PREFIX, 18, 903, 400)
     assert tide_packet.headers[0] == expected_header
 
+def check_generate_tide_packet(test_node, neighbor_classes):
+    # The incrementally generated TIDE packets contain the same TIE headers as TIDE packets which
+    # are generated by considering every TIE in the TIE-DB
+    for neighbor_class in neighbor_classes:
+        # The TIE-IDs are sorted by tie_id_tup, without comparing TIEID objects
+        saved_lt = encoding.ttypes.TIEID.__lt__
+        try:
+            encoding.ttypes.TIEID.__lt__ = None
+            tide_packet = test_node.generate_tide_packet(*neighbor_class)
+        finally:
+            encoding.ttypes.TIEID.__lt__ = saved_lt
+        expected_headers = [
+            packet_common.expand_tie_header_with_lifetime(
+                tie_packet_info.protocol_packet.content.tie.header,
+                tie_packet_info.remaining_tie_lifetime)
+            for tie_packet_info in test_node.tie_packet_infos.values()
+            if test_node.include_tie_in_tide(tie_packet_info, *neighbor_class)]
+        assert tide_packet.headers == expected_headers
+
+def test_generate_tide_packet_incremental():
+    packet_common.add_missing_methods_to_thrift()
+    db_tie_info_list = [
+        # Direction Origin         Type     TieNr SeqNr Lifetime
+        ( SOUTH,     55,           NODE,    1,    4,    600),
+        ( SOUTH,     55,           PREFIX,  2,    4,    600),
+        ( SOUTH,     66,           NODE,    1,    5,    600),
+        ( SOUTH,     66,           PREFIX,  2,    5,    600),
+        ( SOUTH,     MY_SYSTEM_ID, PREFIX,  18,   903,  400),
+        ( NORTH,     55,           NODE,    1,    4,    600),
+        ( NORTH,     55,           PREFIX,  2,    4,    600),
+        ( NORTH,     77,           PREFIX,  3,    7,    600)]
+    test_node = make_test_node(db_tie_info_list)
+    neighbor_classes = []
+    for neighbor_direction in [SOUTH, NORTH, EW]:
+        for neighbor_system_id in [55, 66]:
+            for i_am_top_of_fabric in [False, True]:
+                neighbor_classes.append((neighbor_direction, neighbor_system_id, MY_LEVEL - 1,
+                                         False, MY_LEVEL, i_am_top_of_fabric))
+    check_generate_tide_packet(test_node, neighbor_classes)
+    # Neighbors in the same class share the cached decisions
+    # pylint:disable=protected-access
+    assert len(test_node._tide_caches) == len(neighbor_classes) // 2
+    # Add, replace, remove, and age TIEs
+    store_tie_packet(test_node, packet_common.make_prefix_tie_packet(SOUTH, 66, 3, 1), 500)
+    store_tie_packet(test_node, packet_common.make_prefix_tie_packet(SOUTH, 55, 2, 5), 500)
+    store_tie_packet(test_node, packet_common.make_node_tie_packet(MY_NAME, MY_LEVEL + 1, SOUTH,
+                                                                   66, 1, 6), 500)
+    test_node.remove_tie(packet_common.make_tie_id(NORTH, 77, PREFIX, 3))
+    test_node.age_ties()
+    check_generate_tide_packet(test_node, neighbor_classes)
+    for cache in test_node._tide_caches.values():
+        assert cache.full_evaluations == 1
+        assert cache.incremental_evaluations == 1
+    # Caches of neighbor classes which no longer occur are forgotten after the next round of TIDEs
+    test_node.send_tides()
+    assert not test_node._tide_caches
+
+def in_tide_range(tie_id, start_range, end_range):
+    return not tie_id < start_range and not end_range < tie_id
+
+def update_tide_ranges(test_node, tide_ranges_under_test, level=MY_LEVEL):
+    # Update the TIDE ranges for all TIEs in the TIE-DB, check that the ranges are consistent, and
+    # return the ranges and the indexes of the ranges whose TIDE had to be regenerated
+    tie_ids = list(test_node.tie_packet_infos.keys())
+    ranges = tide_ranges_under_test.update(tie_ids, test_node.tie_packet_infos, level)
+    regenerated = []
+    for (index, tide_range) in enumerate(ranges):
+        if tide_range.packet_info is None:
+            tide_range.packet_info = "encoded-tide-{}".format(index)
+            regenerated.append(index)
+    assert ranges[0].start_range == node.Node.MIN_TIE_ID
+    assert ranges[-1].end_range == node.Node.MAX_TIE_ID
+    for (tide_range, next_tide_range) in zip(ranges, ranges[1:]):
+        assert next_tide_range.start_range == tide_ranges.tie_id_successor(tide_range.end_range)
+    range_tie_ids = []
+    for tide_range in ranges:
+        assert len(tide_range.tie_packet_infos) <= tide_ranges_under_test.max_headers
+        for tie_packet_info in tide_range.tie_packet_infos:
+            tie_id = tie_packet_info.protocol_packet.content.tie.header.tieid
+            assert in_tide_range(tie_id, tide_range.start_range, tide_range.end_range)
+            range_tie_ids.append(tie_id)
+    assert range_tie_ids == tie_ids
+    return (ranges, regenerated)
+
+def test_tide_ranges():
+    packet_common.add_missing_methods_to_thrift()
+    db_tie_info_list = [(NORTH, originator, PREFIX, 1, 1, 600) for originator in range(2, 402, 2)]
+    test_node = make_test_node(db_tie_info_list)
+    tide_ranges_under_test = tide_ranges.TIDERanges(1400, node.Node.MIN_TIE_ID,
+                                                    node.Node.MAX_TIE_ID)
+    # The TIDE with the maximum number of headers fits in the MTU, one more header does not
+    max_headers = tide_ranges_under_test.max_headers
+    max_tide_size = 1400 - tide_ranges.TIDE_PACKET_OVERHEAD
+    assert tide_ranges.encoded_tide_size(max_headers) <= max_tide_size
+    assert tide_ranges.encoded_tide_size(max_headers + 1) > max_tide_size
+    # Initially, the TIE headers are split over multiple ranges, which are all generated
+    (ranges, regenerated) = update_tide_ranges(test_node, tide_ranges_under_test)
+    assert len(ranges) > 1
+    assert regenerated == list(range(len(ranges)))
+    # Nothing changed, so nothing is regenerated
+    (_ranges, regenerated) = update_tide_ranges(test_node, tide_ranges_under_test)
+    assert not regenerated
+    # Looking at the ranges (as the CLI does) does not update them
+    reuse_counts = [tide_range.reuse_count for tide_range in ranges]
+    assert tide_ranges_under_test.ranges() == ranges
+    assert [tide_range.reuse_count for tide_range in ranges] == reuse_counts
+    # Adding a TIE only regenerates the range that contains it
+    new_tie_id = packet_common.make_tie_id(NORTH, 201, PREFIX, 1)
+    index = next(index for (index, tide_range) in enumerate(ranges)
+                 if in_tide_range(new_tie_id, tide_range.start_range, tide_range.end_range))
+    assert len(ranges[index].tie_packet_infos) < max_headers
+    store_tie_packet(test_node, packet_common.make_prefix_tie_packet(NORTH, 201, 1, 1), 600)
+    (new_ranges, regenerated) = update_tide_ranges(test_node, tide_ranges_under_test)
+    assert len(new_ranges) == len(ranges)
+    assert regenerated == [index]
+    # Replacing a TIE only regenerates the range that contains it
+    store_tie_packet(test_node, packet_common.make_prefix_tie_packet(NORTH, 201, 1, 2), 600)
+    (_ranges, regenerated) = update_tide_ranges(test_node, tide_ranges_under_test)
+    assert regenerated == [index]
+    # Adding TIEs until the range overflows splits the range
+    tie_nr = 2
+    while True:
+        store_tie_packet(test_node, packet_common.make_prefix_tie_packet(NORTH, 201, tie_nr, 1),
+                         600)
+        tie_nr += 1
+        (new_ranges, regenerated) = update_tide_ranges(test_node, tide_ranges_under_test)
+        if len(new_ranges) != len(ranges):
+            break
+        assert regenerated == [index]
+    assert len(new_ranges) == len(ranges) + 1
+    assert regenerated == [index, index + 1]
+    # A level change regenerates all ranges
+    (ranges, regenerated) = update_tide_ranges(test_node, tide_ranges_under_test, MY_LEVEL - 1)
+    assert regenerated == list(range(len(ranges)))
+    # Removing most TIEs merges the ranges
+    for tie_id in list(test_node.tie_packet_infos.keys())[3:]:
+        test_node.remove_tie(tie_id)
+    (ranges, regenerated) = update_tide_ranges(test_node, tide_ranges_under_test, MY_LEVEL - 1)
+    assert len(ranges) == 1
+    assert regenerated == [0]
+    # Removing all TIEs leaves a single empty range
+    for tie_id in list(test_node.tie_packet_infos.keys()):
+        test_node.remove_tie(tie_id)
+    (ranges, regenerated) = update_tide_ranges(test_node, tide_ranges_under_test, MY_LEVEL - 1)
+    assert len(ranges) == 1
+    assert not ranges[0].tie_packet_infos
+    assert regenerated == [0]
+
+def test_tide_range_lifetimes():
+    # A reused TIDE reports the same remaining lifetimes as the TIE-DB
+    packet_common.add_missing_methods_to_thrift()
+    db_tie_info_list = [(NORTH, originator, PREFIX, 1, 1, 600) for originator in range(2, 12)]
+    test_node = make_test_node(db_tie_info_list)
+    tide_ranges_under_test = tide_ranges.TIDERanges(1400, node.Node.MIN_TIE_ID,
+                                                    node.Node.MAX_TIE_ID)
+    ranges = tide_ranges_under_test.update(list(test_node.tie_packet_infos.keys()),
+                                           test_node.tie_packet_infos, MY_LEVEL)
+    assert len(ranges) == 1
+    tide_range = ranges[0]
+    protocol_packet = encoding.ttypes.ProtocolPacket(
+        header=encoding.ttypes.PacketHeader(sender=MY_SYSTEM_ID, level=MY_LEVEL),
+        content=encoding.ttypes.PacketContent(
+            tide=node.Node.make_tide_packet_for_range(tide_range)))
+    tide_range.packet_info = packet_common.encode_protocol_packet(protocol_packet, None)
+    # Nothing aged, so nothing needs to be encoded again
+    assert not node.Node.refresh_tide_lifetimes(tide_range)
+    test_node.age_ties()
+    test_node.age_ties()
+    assert tide_ranges_under_test.update(list(test_node.tie_packet_infos.keys()),
+                                         test_node.tie_packet_infos, MY_LEVEL) == [tide_range]
+    assert tide_range.reuse_count == 1
+    assert node.Node.refresh_tide_lifetimes(tide_range)
+    tide_headers = tide_range.packet_info.protocol_packet.content.tide.headers
+    assert [tie_header.remaining_lifetime for tie_header in tide_headers] == \
+           [tie_packet_info.remaining_tie_lifetime
+            for tie_packet_info in test_node.tie_packet_infos.values()]
+    assert tide_headers[0].remaining_lifetime == 598
+    assert not node.Node.refresh_tide_lifetimes(tide_range)
+
+def test_tie_id_successor():
+    max_u32 = packet_common.MAX_U32
+    max_u64 = packet_common.MAX_U64
+    key_value = common.ttypes.TIETypeType.KeyValueTIEType
+    successor = tide_ranges.tie_id_successor
+    assert successor(packet_common.make_tie_id(SOUTH, 5, PREFIX, 7)) == \
+           packet_common.make_tie_id(SOUTH, 5, PREFIX, 8)
+    assert successor(packet_common.make_tie_id(SOUTH, 5, PREFIX, max_u32)) == \
+           packet_common.make_tie_id(SOUTH, 5, PREFIX + 1, 0)
+    # The TIE type never goes beyond the highest valid TIE type
+    assert successor(packet_common.make_tie_id(SOUTH, 5, key_value, max_u32)) == \
+           packet_common.make_tie_id(SOUTH, 6, NODE, 0)
+    assert successor(packet_common.make_tie_id(SOUTH, max_u64, key_value, max_u32)) == \
+           packet_common.make_tie_id(NORTH, 0, NODE, 0)
+
+def make_range_tide_packets(test_node, mtu):
+    # Make the TIDE packets which report all TIE headers in the TIE-DB, split into ranges that fit
+    # in the MTU
+    tide_ranges_under_test = tide_ranges.TIDERanges(mtu, node.Node.MIN_TIE_ID, node.Node.MAX_TIE_ID)
+    ranges = tide_ranges_under_test.update(list(test_node.tie_packet_infos.keys()),
+                                     test_node.tie_packet_infos, MY_LEVEL)
+    return [node.Node.make_tide_packet_for_range(tide_range) for tide_range in ranges]
+
+def process_rx_tide_packets(test_node, tide_packets, rx_intf_name):
+    # Return the TIE-IDs of the TIEs which the node starts sending after receiving the TIDEs
+    start_sending_tie_ids = []
+    for tide_packet in tide_packets:
+        (request_tie_headers, start_sending_tie_headers, _stop_sending_tie_headers) = \
+            test_node.process_rx_tide_packet(tide_packet, rx_intf_name)
+        assert not request_tie_headers
+        start_sending_tie_ids.extend(tie_header.tieid for tie_header in start_sending_tie_headers)
+    return start_sending_tie_ids
+
+def test_process_tide_ranges():
+    packet_common.add_missing_methods_to_thrift()
+    db_tie_info_list = [(NORTH, originator, PREFIX, 1, 1, 600) for originator in range(2, 202, 2)]
+    tx_node = make_test_node(db_tie_info_list)
+    tide_packets = make_range_tide_packets(tx_node, 1400)
+    assert len(tide_packets) > 2
+    # The receiver has the same TIEs: it does not start sending any TIE, including the TIEs at the
+    # end of each range, not even when the TIDEs from two neighbors are interleaved, and not when
+    # the neighbors wrap around
+    rx_node = make_test_node(db_tie_info_list)
+    for _ in range(2):
+        for tide_packet in tide_packets:
+            assert not process_rx_tide_packets(rx_node, [tide_packet], "if1")
+            assert not process_rx_tide_packets(rx_node, [tide_packet], "if2")
+    # The receiver has extra TIEs: it starts sending exactly those
+    extra_tie_ids = [packet_common.make_tie_id(NORTH, originator, PREFIX, 1)
+                     for originator in [1, 51, 151, 1001]]
+    for tie_id in extra_tie_ids:
+        store_tie_packet(rx_node, packet_common.make_prefix_tie_packet(NORTH, tie_id.originator,
+                                                                       1, 1), 600)
+    assert process_rx_tide_packets(rx_node, tide_packets, "if1") == extra_tie_ids
+    # A TIDE is lost: the receiver also starts sending the TIEs in the range of the lost TIDE
+    lost_tide_packet = tide_packets[1]
+    lost_tie_ids = [tie_id for tie_id in rx_node.tie_packet_infos.keys()
+                    if in_tide_range(tie_id, lost_tide_packet.start_range,
+                                     lost_tide_packet.end_range)]
+    assert lost_tie_ids
+    start_sending_tie_ids = process_rx_tide_packets(rx_node,
+                                                    tide_packets[:1] + tide_packets[2:], "if1")
+    assert set(start_sending_tie_ids) == set(extra_tie_ids + lost_tie_ids)
+    # The last TIDE is lost: when the neighbor wraps around, the receiver starts sending the TIEs
+    # after the end of the TIDE before it
+    lost_tide_packet = tide_packets[-1]
+    lost_tie_ids = [tie_id for tie_id in rx_node.tie_packet_infos.keys()
+                    if not tie_id < lost_tide_packet.start_range]
+    start_sending_tie_ids = process_rx_tide_packets(rx_node, tide_packets[:-1], "if2")
+    start_sending_tie_ids += process_rx_tide_packets(rx_node, tide_packets[:1], "if2")
+    assert set(start_sending_tie_ids) == set(extra_tie_ids + lost_tie_ids)
+    # When flooding stops, the next TIDE is considered to be the first one again
+    rx_node.forget_received_tide_end("if2")
+    assert process_rx_tide_packets(rx_node, tide_packets[1:2], "if2") == \
+        [tie_id for tie_id in rx_node.tie_packet_infos.keys()
+         if tie_id < tide_packets[1].start_range] + \
+        [tie_id for tie_id in extra_tie_ids
+         if in_tide_range(tie_id, tide_packets[1].start_range, tide_packets[1].end_range)]
+
 def test_age_ties():
     packet_common.add_missing_methods_to_thrift()
     db_tie_info_list = [
@@ -1,5 +1,18 @@
+import copy
+import hashlib
+import hmac
+import random
+
+import thrift.protocol.TBinaryProtocol
+import thrift.transport.TTransport
+
 import common.ttypes
+import constants
+import key
 import packet_common
+import thrift_accelerated
+import thrift_decoder
+import verified_tie_cache
 
 import encoding.ttypes
 
@@ -115,6 +128,103 @@ def max_prefix_tie_element():
         }
     )
 
+def check_fast_encoder(protocol_packet):
+    # The fast encoder leaves the packet untouched, and produces the same bytes as the Thrift
+    # encoder, except that the elements of sets may be in a different order
+    original_protocol_packet = copy.deepcopy(protocol_packet)
+    encoded = packet_common.encode_protocol_packet_fast(protocol_packet)
+    assert protocol_packet == original_protocol_packet
+    thrift_encoded = packet_common.thrift_encode_protocol_packet(protocol_packet)
+    assert len(encoded) == len(thrift_encoded)
+    assert (packet_common.decode_protocol_packet_bytes(encoded) ==
+            packet_common.decode_protocol_packet_bytes(thrift_encoded))
+    packet_common.verify_encoded_protocol_packet(protocol_packet, encoded)
+    return encoded == thrift_encoded
+
+def python_decode(encoded):
+    # Decode using the pure-Python Thrift decoder, followed by the fixes (which turn the tuples and
+    # frozensets produced by the Thrift decoder into lists and sets)
+    transport_in = thrift.transport.TTransport.TMemoryBuffer(encoded)
+    protocol_in = thrift.protocol.TBinaryProtocol.TBinaryProtocol(transport_in)
+    protocol_packet = encoding.ttypes.ProtocolPacket()
+    protocol_packet.read(protocol_in)
+    packet_common.fix_prot_packet_after_decode(protocol_packet)
+    return protocol_packet
+
+def check_fast_decoder(protocol_packet):
+    # The fast decoder decodes LIEs, TIDEs, and TIREs exactly like the pure-Python Thrift decoder,
+    # and falls back to the generic path for TIEs
+    encoded = packet_common.encode_protocol_packet_fast(protocol_packet)
+    decoded = packet_common.decode_protocol_packet_fast(encoded)
+    check_pass_through_decoder(protocol_packet)
+    if protocol_packet.content.tie is not None:
+        assert decoded is None
+        return
+    expected = python_decode(encoded)
+    assert decoded == expected
+    # The same fields in the same order (except for the order of the elements of sets)
+    if protocol_packet.content.tire is None:
+        assert repr(decoded) == repr(expected)
+    assert decoded == protocol_packet
+
+def check_pass_through_decoder(protocol_packet):
+    # The pass-through decoder decodes packets like the fast decoder, except that it decodes the
+    # element of a TIE only when it is needed, and then exactly like the pure-Python Thrift decoder
+    encoded = packet_common.encode_protocol_packet_fast(protocol_packet)
+    decoded = packet_common.decode_protocol_packet_pass_through(encoded)
+    expected = python_decode(encoded)
+    if protocol_packet.content.tie is None:
+        assert decoded == expected
+        return
+    element = decoded.content.tie.element
+    assert thrift_decoder.is_lazy_struct(element)
+    assert decoded.header == expected.header
+    assert decoded.content.tie.header == expected.content.tie.header
+    # Elements with the same encoding are equal without being decoded
+    other_element = packet_common.decode_protocol_packet_pass_through(encoded).content.tie.element
+    assert element == other_element
+    assert thrift_decoder.is_lazy_struct(element)
+    assert thrift_decoder.is_lazy_struct(other_element)
+    # Accessing a field decodes the element
+    assert element.node == expected.content.tie.element.node
+    assert not thrift_decoder.is_lazy_struct(element)
+    assert isinstance(element, encoding.ttypes.TIEElement)
+    assert repr(element) == repr(expected.content.tie.element)
+    assert decoded == expected
+    # Comparing a lazy element with a decoded element decodes the lazy element
+    assert other_element == element
+    assert not thrift_decoder.is_lazy_struct(other_element)
+    assert decoded == protocol_packet
+
+def check_compiled_fixers(protocol_packet):
+    # The compiled fixers produce the same packets as the generic (interpreted) fixers
+    fixes = packet_common.PROTOCOL_PACKET_FIXES
+    interpreted = copy.deepcopy(protocol_packet)
+    compiled = copy.deepcopy(protocol_packet)
+    packet_common.fix_packet_before_encode(interpreted, fixes)
+    packet_common.fix_prot_packet_before_encode(compiled)
+    assert compiled == interpreted
+    assert compiled != protocol_packet
+    packet_common.fix_packet_after_decode(interpreted, fixes)
+    packet_common.fix_prot_packet_after_decode(compiled)
+    assert compiled == interpreted
+    assert compiled == protocol_packet
+
+def check_codecs(protocol_packet):
+    # The accelerated codec (if it is available) and the pure-Python codec decode the same packets
+    encoded = packet_common.encode_protocol_packet_fast(protocol_packet)
+    try:
+        decoded_by_codec = {}
+        for codec in packet_common.CODECS:
+            if packet_common.set_codec(codec) == codec:
+                decoded_by_codec[codec] = packet_common.decode_protocol_packet_bytes(encoded)
+                assert decoded_by_codec[codec] == protocol_packet
+                thrift_encoded = packet_common.thrift_encode_protocol_packet(protocol_packet)
+                assert packet_common.decode_protocol_packet_bytes(thrift_encoded) == protocol_packet
+        assert packet_common.CODEC_PYTHON in decoded_by_codec
+    finally:
+        packet_common.set_codec(packet_common.CODEC_PYTHON)
+
 def test_fix_lie_packet():
     packet_common.add_missing_methods_to_thrift()
     lie_protocol_packet = encoding.ttypes.ProtocolPacket(
@@ -156,6 +266,10 @@ def test_fix_lie_packet():
             tie=None
         )
     )
+    check_compiled_fixers(lie_protocol_packet)
+    check_codecs(lie_protocol_packet)
+    check_fast_decoder(lie_protocol_packet)
+    assert check_fast_encoder(lie_protocol_packet)
     packet_info = packet_common.encode_protocol_packet(lie_protocol_packet, None)
     packet_info.update_env_header(0)
     packet_info.update_outer_sec_env_header(None, 111, 222)
@@ -188,6 +302,10 @@ def test_fix_tide_packet():
             tie=None
         )
     )
+    check_compiled_fixers(tide_protocol_packet)
+    check_codecs(tide_protocol_packet)
+    check_fast_decoder(tide_protocol_packet)
+    assert check_fast_encoder(tide_protocol_packet)
     packet_info = packet_common.encode_protocol_packet(tide_protocol_packet, None)
     packet_info.update_env_header(0)
     packet_info.update_outer_sec_env_header(None, 111, 222)
@@ -218,6 +336,10 @@ def test_fix_tire_packet():
             tie=None
         )
     )
+    check_compiled_fixers(tire_protocol_packet)
+    check_codecs(tire_protocol_packet)
+    check_fast_decoder(tire_protocol_packet)
+    check_fast_encoder(tire_protocol_packet)
     packet_info = packet_common.encode_protocol_packet(tire_protocol_packet, None)
     packet_info.update_env_header(0)
     packet_info.update_outer_sec_env_header(None, 111, 222)
@@ -268,6 +390,10 @@ def test_fix_node_tie_packet():
             )
         )
     )
+    check_compiled_fixers(tie_protocol_packet)
+    check_codecs(tie_protocol_packet)
+    check_fast_decoder(tie_protocol_packet)
+    check_fast_encoder(tie_protocol_packet)
     packet_info = packet_common.encode_protocol_packet(tie_protocol_packet, None)
     packet_info.update_env_header(0)
     packet_info.update_outer_sec_env_header(None, 111, 222, 10)
@@ -302,6 +428,10 @@ def test_fix_prefixes_tie_packet():
             )
         )
     )
+    check_compiled_fixers(tie_protocol_packet)
+    check_codecs(tie_protocol_packet)
+    check_fast_decoder(tie_protocol_packet)
+    check_fast_encoder(tie_protocol_packet)
     packet_info = packet_common.encode_protocol_packet(tie_protocol_packet, None)
     packet_info.update_env_header(0)
     packet_info.update_outer_sec_env_header(None, 111, 222, 10)
@@ -336,6 +466,10 @@ def test_fix_positive_disaggregation_prefixes_tie_packet():
             )
         )
     )
+    check_compiled_fixers(tie_protocol_packet)
+    check_codecs(tie_protocol_packet)
+    check_fast_decoder(tie_protocol_packet)
+    check_fast_encoder(tie_protocol_packet)
     packet_info = packet_common.encode_protocol_packet(tie_protocol_packet, None)
     packet_info.update_env_header(0)
     packet_info.update_outer_sec_env_header(None, 111, 222, 10)
@@ -370,6 +504,10 @@ def test_fix_negative_disaggregation_prefixes_tie_packet():
             )
         )
     )
+    check_compiled_fixers(tie_protocol_packet)
+    check_codecs(tie_protocol_packet)
+    check_fast_decoder(tie_protocol_packet)
+    check_fast_encoder(tie_protocol_packet)
     packet_info = packet_common.encode_protocol_packet(tie_protocol_packet, None)
     packet_info.update_env_header(0)
     packet_info.update_outer_sec_env_header(None, 111, 222, 10)
@@ -404,6 +542,10 @@ def test_fix_external_prefixes_tie_packet():
             )
         )
     )
+    check_compiled_fixers(tie_protocol_packet)
+    check_codecs(tie_protocol_packet)
+    check_fast_decoder(tie_protocol_packet)
+    check_fast_encoder(tie_protocol_packet)
     packet_info = packet_common.encode_protocol_packet(tie_protocol_packet, None)
     packet_info.update_env_header(0)
     packet_info.update_outer_sec_env_header(None, 111, 222, 10)
@@ -443,6 +585,10 @@ def test_fix_key_value_tie_packet():
             )
         )
     )
+    check_compiled_fixers(tie_protocol_packet)
+    check_codecs(tie_protocol_packet)
+    check_fast_decoder(tie_protocol_packet)
+    check_fast_encoder(tie_protocol_packet)
     packet_info = packet_common.encode_protocol_packet(tie_protocol_packet, None)
     packet_info.update_env_header(0)
     packet_info.update_outer_sec_env_header(None, 111, 222, 10)
@@ -450,3 +596,375 @@ def test_fix_key_value_tie_packet():
     decoded_packet_info = packet_common.decode_message(None, None, message, None, None, None, None)
     assert not decoded_packet_info.error
     assert packet_info.protocol_packet == decoded_packet_info.protocol_packet
+
+def test_codec_fallback():
+    packet_common.add_missing_methods_to_thrift()
+    saved_fastbinary = thrift_accelerated.FASTBINARY
+    try:
+        thrift_accelerated.FASTBINARY = None
+        assert packet_common.set_codec(packet_common.CODEC_ACCELERATED) == \
+               packet_common.CODEC_PYTHON
+        assert packet_common.CODEC == packet_common.CODEC_PYTHON
+        assert packet_common.ACCELERATED_CODEC is None
+    finally:
+        thrift_accelerated.FASTBINARY = saved_fastbinary
+        packet_common.set_codec(packet_common.CODEC_PYTHON)
+
+def absent_optional_fields_packets():
+    # Packets which leave out all optional fields that have a default value in the IDL
+    lie = encoding.ttypes.LIEPacket(
+        name="if1", local_id=1, flood_port=None, link_mtu_size=None, link_bandwidth=None, pod=None,
+        node_capabilities=encoding.ttypes.NodeCapabilities(
+            protocol_minor_version=protocol_minor_version, flood_reduction=None),
+        link_capabilities=encoding.ttypes.LinkCapabilities(bfd=None, ipv4_forwarding_capable=None),
+        holdtime=None, not_a_ztp_offer=None, you_are_flood_repeater=None,
+        you_are_sending_too_quickly=None, fabric_id=None)
+    neighbor = encoding.ttypes.NodeNeighborsTIEElement(level=1, cost=None, bandwidth=None)
+    node_element = encoding.ttypes.NodeTIEElement(
+        level=2, neighbors={3: neighbor}, flags=encoding.ttypes.NodeFlags(overload=None),
+        fabric_id=None, auto_evpn_model=None)
+    tie = encoding.ttypes.TIEPacket(header=max_tie_header(),
+                                    element=encoding.ttypes.TIEElement(node=node_element))
+    header = encoding.ttypes.PacketHeader(major_version=None, minor_version=None, sender=1,
+                                          level=2)
+    return [encoding.ttypes.ProtocolPacket(header=header,
+                                           content=encoding.ttypes.PacketContent(lie=lie)),
+            encoding.ttypes.ProtocolPacket(header=header,
+                                           content=encoding.ttypes.PacketContent(tie=tie))]
+
+def test_decoders_absent_optional_fields():
+    # All decoders leave absent optional fields set to None, instead of filling in the IDL default
+    packet_common.add_missing_methods_to_thrift()
+    for protocol_packet in absent_optional_fields_packets():
+        encoded = packet_common.encode_protocol_packet_fast(protocol_packet)
+        expected = python_decode(encoded)
+        assert expected == protocol_packet
+        assert expected.header.major_version is None
+        decoded = [packet_common.decode_protocol_packet_pass_through(encoded)]
+        if protocol_packet.content.lie is not None:
+            assert expected.content.lie.flood_port is None
+            assert expected.content.lie.link_bandwidth is None
+            decoded.append(packet_common.decode_protocol_packet_fast(encoded))
+        try:
+            for codec in packet_common.CODECS:
+                if packet_common.set_codec(codec) == codec:
+                    decoded.append(packet_common.decode_protocol_packet_bytes(encoded))
+        finally:
+            packet_common.set_codec(packet_common.CODEC_PYTHON)
+        for decoded_packet in decoded:
+            assert repr(decoded_packet) == repr(expected)
+
+def random_unsigned(bits):
+    return random.choice([0, 1, random.getrandbits(bits), (1 << bits) - 1])
+
+def random_optional(value):
+    return random.choice([value, None])
+
+def random_tie_header_lifetime():
+    return encoding.ttypes.TIEHeaderWithLifeTime(
+        header=encoding.ttypes.TIEHeader(
+            tieid=encoding.ttypes.TIEID(
+                direction=random.choice([common.ttypes.TieDirectionType.South,
+                                         common.ttypes.TieDirectionType.North]),
+                originator=random_unsigned(64),
+                tietype=common.ttypes.TIETypeType.PrefixTIEType,
+                tie_nr=random_unsigned(32)),
+            seq_nr=random_unsigned(64),
+            origination_time=random_optional(common.ttypes.IEEE802_1ASTimeStampType(
+                AS_sec=random_unsigned(64),
+                AS_nsec=random_unsigned(32))),
+            origination_lifetime=random_optional(random_unsigned(32))),
+        remaining_lifetime=random_unsigned(32))
+
+def random_content():
+    choice = random.choice(["lie", "tide", "tire", "tie"])
+    if choice == "lie":
+        lie = encoding.ttypes.LIEPacket(
+            name=random_optional(random.choice(["", "if1", "\u00e9\u00e8"])),
+            local_id=random_unsigned(32),
+            flood_port=random_unsigned(16),
+            link_mtu_size=random_optional(random_unsigned(32)),
+            link_bandwidth=random_optional(random_unsigned(32)),
+            neighbor=random_optional(encoding.ttypes.Neighbor(originator=random_unsigned(64),
+                                                              remote_id=random_unsigned(32))),
+            pod=random_optional(random_unsigned(32)),
+            node_capabilities=encoding.ttypes.NodeCapabilities(
+                protocol_minor_version=protocol_minor_version,
+                flood_reduction=random_optional(random.choice([True, False]))),
+            link_capabilities=random_optional(encoding.ttypes.LinkCapabilities(bfd=True)),
+            holdtime=random_unsigned(16),
+            label=random_optional(random_unsigned(32)),
+            not_a_ztp_offer=random_optional(random.choice([True, False])),
+            you_are_flood_repeater=random_optional(random.choice([True, False])))
+        return encoding.ttypes.PacketContent(lie=lie)
+    if choice == "tide":
+        tide = encoding.ttypes.TIDEPacket(
+            start_range=random_tie_header_lifetime().header.tieid,
+            end_range=random_tie_header_lifetime().header.tieid,
+            headers=[random_tie_header_lifetime() for _ in range(random.randint(0, 5))])
+        return encoding.ttypes.PacketContent(tide=tide)
+    if choice == "tie":
+        if random.choice([True, False]):
+            element = encoding.ttypes.TIEElement(node=encoding.ttypes.NodeTIEElement(
+                level=random.randint(0, 24),
+                neighbors={random_unsigned(64): max_neighbor()
+                           for _ in range(random.randint(0, 3))},
+                name=random_optional("node1")))
+        else:
+            element = encoding.ttypes.TIEElement(prefixes=max_prefix_tie_element())
+        tie = encoding.ttypes.TIEPacket(header=random_tie_header_lifetime().header,
+                                        element=element)
+        return encoding.ttypes.PacketContent(tie=tie)
+    tire = encoding.ttypes.TIREPacket(
+        headers=set(random_tie_header_lifetime() for _ in range(random.randint(0, 5))))
+    return encoding.ttypes.PacketContent(tire=tire)
+
+def random_protocol_packet():
+    return encoding.ttypes.ProtocolPacket(
+        header=encoding.ttypes.PacketHeader(
+            major_version=random_unsigned(8),
+            minor_version=random_unsigned(16),
+            sender=random_unsigned(64),
+            level=random_optional(random.randint(0, 24))),
+        content=random_content())
+
+def test_fast_decoder_random():
+    packet_common.add_missing_methods_to_thrift()
+    random.seed(1)
+    for _ in range(500):
+        check_fast_decoder(random_protocol_packet())
+
+def test_fast_decoder_fallback():
+    packet_common.add_missing_methods_to_thrift()
+    random.seed(2)
+    protocol_packet = random_protocol_packet()
+    protocol_packet.content = encoding.ttypes.PacketContent(
+        lie=encoding.ttypes.LIEPacket(name="if1", local_id=1, flood_port=912, holdtime=3))
+    encoded = packet_common.encode_protocol_packet_fast(protocol_packet)
+    assert packet_common.decode_protocol_packet_fast(encoded) == python_decode(encoded)
+    # Truncated packet
+    assert packet_common.decode_protocol_packet_fast(encoded[:-1]) is None
+    # Trailing bytes
+    assert packet_common.decode_protocol_packet_fast(encoded + b"\x00") is None
+    # Unknown field (an i32 with id 99) at the end of the LIE packet, which is followed by the end
+    # of the packet content and the end of the protocol packet
+    unknown_field = b"\x08\x00\x63\x00\x00\x00\x01"
+    with_unknown_field = encoded[:-3] + unknown_field + encoded[-3:]
+    assert packet_common.decode_protocol_packet_fast(with_unknown_field) is None
+    assert python_decode(with_unknown_field) == python_decode(encoded)
+    # Fields out of order: the header (field 1) after the content (field 2)
+    header = packet_common.encode_protocol_packet_fast(
+        encoding.ttypes.ProtocolPacket(header=protocol_packet.header))[:-1]
+    content = encoded[len(header):-1]
+    out_of_order = content + header + b"\x00"
+    assert packet_common.decode_protocol_packet_fast(out_of_order) is None
+    assert python_decode(out_of_order) == python_decode(encoded)
+    # Memory views are decoded as well
+    assert packet_common.decode_protocol_packet_fast(memoryview(encoded)) == python_decode(encoded)
+
+def test_pass_through_decoder_fallback():
+    packet_common.add_missing_methods_to_thrift()
+    element = encoding.ttypes.TIEElement(prefixes=max_prefix_tie_element())
+    protocol_packet = encoding.ttypes.ProtocolPacket(
+        header=encoding.ttypes.PacketHeader(major_version=1, minor_version=0, sender=1, level=0),
+        content=encoding.ttypes.PacketContent(
+            tie=encoding.ttypes.TIEPacket(header=max_tie_header(), element=element)))
+    encoded = packet_common.encode_protocol_packet_fast(protocol_packet)
+    # Unknown field (an i32 with id 99) at the end of the TIE element, which is followed by the end
+    # of the TIE packet, of the packet content, and of the protocol packet
+    unknown_field = b"\x08\x00\x63\x00\x00\x00\x01"
+    with_unknown_field = encoded[:-4] + unknown_field + encoded[-4:]
+    assert packet_common.decode_protocol_packet_pass_through(with_unknown_field) is None
+    assert python_decode(with_unknown_field) == protocol_packet
+    # Truncated element
+    assert packet_common.decode_protocol_packet_pass_through(encoded[:-4]) is None
+
+def test_pass_through_mode():
+    packet_common.add_missing_methods_to_thrift()
+    element = encoding.ttypes.TIEElement(prefixes=max_prefix_tie_element())
+    protocol_packet = encoding.ttypes.ProtocolPacket(
+        header=encoding.ttypes.PacketHeader(major_version=1, minor_version=0, sender=1, level=0),
+        content=encoding.ttypes.PacketContent(
+            tie=encoding.ttypes.TIEPacket(header=max_tie_header(), element=element)))
+    packet_info = packet_common.encode_protocol_packet(protocol_packet, None)
+    packet_info.update_env_header(0)
+    packet_info.update_outer_sec_env_header(None, 111, 222, 10)
+    message = b''.join(packet_info.message_parts())
+    try:
+        for pass_through in [True, False]:
+            packet_common.TIE_PASS_THROUGH = pass_through
+            decoded_packet_info = packet_common.decode_message(None, None, message, None, None,
+                                                               None, None)
+            assert not decoded_packet_info.error
+            decoded_element = decoded_packet_info.protocol_packet.content.tie.element
+            assert thrift_decoder.is_lazy_struct(decoded_element) == pass_through
+            assert decoded_packet_info.protocol_packet == protocol_packet
+    finally:
+        packet_common.TIE_PASS_THROUGH = False
+
+def test_decode_message_from_buffer():
+    # A message that is received into a reused buffer (see UdpRxHandler) is decoded from a
+    # memoryview; the decoded packet info must not refer to the buffer
+    packet_common.add_missing_methods_to_thrift()
+    outer_key = key.Key(1, "hmac-sha-256", "outer-secret")
+    origin_key = key.Key(2, "sha-1", "origin-secret")
+    element = encoding.ttypes.TIEElement(prefixes=max_prefix_tie_element())
+    protocol_packet = encoding.ttypes.ProtocolPacket(
+        header=encoding.ttypes.PacketHeader(major_version=1, minor_version=0, sender=1, level=0),
+        content=encoding.ttypes.PacketContent(
+            tie=encoding.ttypes.TIEPacket(header=max_tie_header(), element=element)))
+    packet_info = packet_common.encode_protocol_packet(protocol_packet, origin_key)
+    packet_info.update_env_header(7)
+    packet_info.update_outer_sec_env_header(outer_key, 111, 222, 10)
+    message = b''.join(packet_info.message_parts())
+    rx_buffer = memoryview(bytearray(65535))
+    rx_buffer[:len(message)] = message
+    decoded_packet_info = packet_common.decode_message(None, None, rx_buffer[:len(message)],
+                                                       outer_key, None, origin_key, None)
+    assert not decoded_packet_info.error
+    # Overwrite the buffer, as the next received message would
+    rx_buffer[:len(message)] = bytes(len(message))
+    assert decoded_packet_info.message_parts() == packet_info.message_parts()
+    for part in decoded_packet_info.message_parts():
+        assert isinstance(part, bytes)
+    assert decoded_packet_info.outer_fingerprint == packet_info.outer_fingerprint
+    assert decoded_packet_info.origin_fingerprint == packet_info.origin_fingerprint
+    assert decoded_packet_info.packet_nr == 7
+    assert decoded_packet_info.protocol_packet == protocol_packet
+    # Truncated messages are still detected
+    for length in [2, 6, 20, 50]:
+        rx_buffer[:length] = message[:length]
+        decoded_packet_info = packet_common.decode_message(None, None, rx_buffer[:length],
+                                                           outer_key, None, origin_key, None)
+        assert decoded_packet_info.error == packet_common.PacketInfo.ERR_MSG_TOO_SHORT
+
+def test_key_digest():
+    # The digest starts from a precomputed state; it must be the same as a digest computed from
+    # scratch, and independent of the digests computed before it
+    message_parts = [b'part-one', None, b'part-two']
+    for algorithm in key.ALGORITHMS:
+        if algorithm == "null":
+            continue
+        digestmod = key.ALGORITHM_TO_DIGESTMOD[algorithm]
+        if "hmac" in algorithm:
+            expected = hmac.new(b'secret', b'part-onepart-two', digestmod=digestmod).digest()
+        else:
+            expected = hashlib.new(digestmod, b'secretpart-onepart-two').digest()
+        test_key = key.Key(1, algorithm, "secret")
+        assert test_key.digest(message_parts) == expected
+        assert test_key.digest([b'other-part']) != expected
+        assert test_key.digest(message_parts) == expected
+    assert key.Key(0, "null", "").digest(message_parts) == b''
+
+def test_reuse_outer_sec_env_header():
+    packet_common.add_missing_methods_to_thrift()
+    outer_key = key.Key(1, "hmac-sha-512", "outer-secret")
+    protocol_packet = encoding.ttypes.ProtocolPacket(
+        header=encoding.ttypes.PacketHeader(major_version=1, minor_version=0, sender=1, level=0),
+        content=encoding.ttypes.PacketContent(tide=packet_common.make_tide_packet(
+            packet_common.make_tie_id(common.ttypes.TieDirectionType.South, 0,
+                                      common.ttypes.TIETypeType.NodeTIEType, 0),
+            packet_common.make_tie_id(common.ttypes.TieDirectionType.North,
+                                      packet_common.MAX_U64,
+                                      common.ttypes.TIETypeType.KeyValueTIEType,
+                                      packet_common.MAX_U32))))
+    packet_info = packet_common.encode_protocol_packet(protocol_packet, None)
+    packet_info.update_outer_sec_env_header(outer_key, 1, 2)
+    outer_sec_env_header = packet_info.outer_sec_env_header
+    # Same key, nonces, and lifetime: the outer security envelope header is reused
+    packet_info.update_outer_sec_env_header(outer_key, 1, 2)
+    assert packet_info.outer_sec_env_header is outer_sec_env_header
+    # Anything else changes: the outer fingerprint is recomputed
+    for (update_key, nonce_local, nonce_remote) in [(outer_key, 3, 2),
+                                                    (outer_key, 1, 2),
+                                                    (key.Key(2, "hmac-sha-512", "other"), 1, 2),
+                                                    (None, 1, 2)]:
+        packet_info.update_outer_sec_env_header(update_key, nonce_local, nonce_remote)
+        expected_packet_info = packet_common.encode_protocol_packet(protocol_packet, None)
+        expected_packet_info.update_outer_sec_env_header(update_key, nonce_local, nonce_remote)
+        assert packet_info.outer_sec_env_header == expected_packet_info.outer_sec_env_header
+    assert packet_info.outer_sec_env_header != outer_sec_env_header
+    # A new encoding of the packet also causes the outer fingerprint to be recomputed
+    packet_info.update_outer_sec_env_header(outer_key, 1, 2)
+    protocol_packet.header.sender = 2
+    packet_common.reencode_packet_info(packet_info, None)
+    packet_info.update_outer_sec_env_header(outer_key, 1, 2)
+    assert packet_info.outer_sec_env_header != outer_sec_env_header
+    packet_info.update_env_header(1)
+    decoded_packet_info = packet_common.decode_message(None, None,
+                                                       b''.join(packet_info.message_parts()),
+                                                       outer_key, None, None, None)
+    assert not decoded_packet_info.error
+
+def encode_tie_message(protocol_packet, outer_key, origin_key, nonce_local):
+    packet_info = packet_common.encode_protocol_packet(protocol_packet, origin_key)
+    packet_info.update_env_header(1)
+    packet_info.update_outer_sec_env_header(outer_key, nonce_local, 2, 600)
+    return b''.join(packet_info.message_parts())
+
+def test_verified_tie_cache():
+    packet_common.add_missing_methods_to_thrift()
+    outer_key = key.Key(1, "hmac-sha-256", "outer-secret")
+    origin_key = key.Key(2, "hmac-sha-512", "origin-secret")
+    protocol_packets = []
+    for seq_nr in range(1, 4):
+        header = max_tie_header()
+        header.seq_nr = seq_nr
+        protocol_packets.append(encoding.ttypes.ProtocolPacket(
+            header=encoding.ttypes.PacketHeader(major_version=1, minor_version=0, sender=1,
+                                                level=0),
+            content=encoding.ttypes.PacketContent(tie=encoding.ttypes.TIEPacket(
+                header=header,
+                element=encoding.ttypes.TIEElement(prefixes=max_prefix_tie_element())))))
+    cache = verified_tie_cache.VerifiedTIECache(2)
+    def decode(message, accept_origin_keys=None):
+        return packet_common.decode_message(None, None, memoryview(message), outer_key, None,
+                                            None, accept_origin_keys, cache)
+    # The first copy of a TIE is verified and added to the cache
+    first_packet_info = decode(encode_tie_message(protocol_packets[0], outer_key, origin_key, 10),
+                               [origin_key])
+    assert not first_packet_info.error
+    assert first_packet_info.origin_fingerprint_cache_hit is False
+    assert len(cache) == 1
+    # Another copy of the same TIE (with different nonces) is found in the cache
+    packet_info = decode(encode_tie_message(protocol_packets[0], outer_key, origin_key, 11),
+                         [origin_key])
+    assert not packet_info.error
+    assert packet_info.origin_fingerprint_cache_hit is True
+    assert packet_info.encoded_protocol_packet is first_packet_info.encoded_protocol_packet
+    assert packet_info.packet_type == constants.PACKET_TYPE_TIE
+    # The element of the copy is not decoded until it is needed
+    assert not thrift_decoder.is_lazy_struct(first_packet_info.protocol_packet.content.tie.element)
+    assert thrift_decoder.is_lazy_struct(packet_info.protocol_packet.content.tie.element)
+    # The copy is decoded into its own protocol packet, so changing one does not change the other
+    assert packet_info.protocol_packet == first_packet_info.protocol_packet
+    assert packet_info.protocol_packet is not first_packet_info.protocol_packet
+    packet_info.protocol_packet.content.tie.header.seq_nr += 1
+    assert first_packet_info.protocol_packet.content.tie.header.seq_nr == 1
+    # The outer fingerprint is still checked for a copy which is found in the cache
+    message = bytearray(encode_tie_message(protocol_packets[0], outer_key, origin_key, 12))
+    message[8] ^= 0xff
+    packet_info = decode(bytes(message), [origin_key])
+    assert packet_info.error == packet_common.PacketInfo.ERR_INCORRECT_OUTER_FINGERPRINT
+    # A copy with the same fingerprint but a different encoded TIE is not found in the cache
+    message = bytearray(encode_tie_message(protocol_packets[0], outer_key, origin_key, 12))
+    message[-1] ^= 0xff
+    packet_info = decode(bytes(message), [origin_key])
+    assert packet_info.error
+    assert packet_info.origin_fingerprint_cache_hit is None
+    # A copy which would no longer be verified with the same key is not found in the cache
+    packet_info = decode(encode_tie_message(protocol_packets[0], outer_key, origin_key, 13))
+    assert packet_info.error == packet_common.PacketInfo.ERR_NON_ZERO_ORIGIN_KEY_ID_NOT_ACCEPTED
+    # The least recently used TIE is evicted when the cache is full
+    for protocol_packet in protocol_packets[1:]:
+        packet_info = decode(encode_tie_message(protocol_packet, outer_key, origin_key, 14),
+                             [origin_key])
+        assert packet_info.origin_fingerprint_cache_hit is False
+    assert len(cache) == 2
+    packet_info = decode(encode_tie_message(protocol_packets[0], outer_key, origin_key, 15),
+                         [origin_key])
+    assert packet_info.origin_fingerprint_cache_hit is False
+    # Packets without an origin fingerprint do not use the cache
+    packet_info = decode(encode_tie_message(protocol_packets[0], outer_key, None, 16))
+    assert not packet_info.error
+    assert packet_info.origin_fingerprint_cache_hit is None
@@ -0,0 +1,237 @@
+import asyncio
+import random
+import socket
+import time
+
+import pytest
+
+import scheduler
+import stats
+import timer
+
+class Handler:
+
+    def __init__(self, sched, sock):
+        self.sched = sched
+        self.sock = sock
+        self.ready_count = 0
+        self.unregister_on_ready = None
+        sched.register_handler(self)
+
+    def rx_fd(self):
+        return self.sock.fileno()
+
+    def ready_to_read(self):
+        self.ready_count += 1
+        self.sock.recv(16)
+        if self.unregister_on_ready:
+            self.sched.unregister_handler(self.unregister_on_ready)
+
+class TypedHandler(Handler):
+
+    handler_type = "Typed"
+
+class OrderHandler(Handler):
+
+    # Records the order in which the ready handlers are served, and does not read the socket, so
+    # that it stays ready to read
+
+    def __init__(self, sched, sock, name, served, handler_priority):
+        self.name = name
+        self.served = served
+        self.handler_priority = handler_priority
+        Handler.__init__(self, sched, sock)
+
+    def ready_to_read(self):
+        self.served.append(self.name)
+
+# pylint: disable=redefined-outer-name
+@pytest.fixture(params=scheduler.SCHEDULER_TYPES)
+def sched_and_socket_pairs(request):
+    sched = scheduler.SCHEDULER_CLASSES[request.param]()
+    socket_pairs = [socket.socketpair() for _ in range(3)]
+    yield (sched, socket_pairs)
+    for (rx_sock, tx_sock) in socket_pairs:
+        rx_sock.close()
+        tx_sock.close()
+
+def test_ready_to_read(sched_and_socket_pairs):
+    (sched, socket_pairs) = sched_and_socket_pairs
+    handlers = [Handler(sched, rx_sock) for (rx_sock, _tx_sock) in socket_pairs]
+    assert sched.nr_handlers() == 3
+    socket_pairs[1][1].send(b'x')
+    sched.run_one_iteration()
+    assert [handler.ready_count for handler in handlers] == [0, 1, 0]
+    # Unregistered handlers are not called anymore
+    sched.unregister_handler(handlers[1])
+    assert sched.nr_handlers() == 2
+    socket_pairs[1][1].send(b'x')
+    socket_pairs[2][1].send(b'x')
+    sched.run_one_iteration()
+    assert [handler.ready_count for handler in handlers] == [0, 1, 1]
+
+def test_unregister_while_ready(sched_and_socket_pairs):
+    # A handler which is ready to read, but which is unregistered by another handler in the same
+    # scheduler iteration, must not be called.
+    (sched, socket_pairs) = sched_and_socket_pairs
+    handlers = [Handler(sched, rx_sock) for (rx_sock, _tx_sock) in socket_pairs[:2]]
+    handlers[0].unregister_on_ready = handlers[1]
+    handlers[1].unregister_on_ready = handlers[0]
+    socket_pairs[0][1].send(b'x')
+    socket_pairs[1][1].send(b'x')
+    sched.run_one_iteration()
+    assert sorted(handler.ready_count for handler in handlers) == [0, 1]
+    assert sched.nr_handlers() == 1
+
+def test_handler_histograms(sched_and_socket_pairs):
+    # The processing time of handlers is recorded per handler type
+    (sched, socket_pairs) = sched_and_socket_pairs
+    handler = Handler(sched, socket_pairs[0][0])
+    typed_handler = TypedHandler(sched, socket_pairs[1][0])
+    socket_pairs[0][1].send(b'x')
+    socket_pairs[1][1].send(b'x')
+    sched.run_one_iteration()
+    assert handler.ready_count == 1
+    assert typed_handler.ready_count == 1
+    assert sched.handler_histograms["Handler"].count == 1
+    assert sched.handler_histograms["Typed"].count == 1
+    assert sched.phase_histograms[sched.PHASE_READY_TO_READ].count == 2
+    sched.clear_histograms()
+    assert sched.handler_histograms["Typed"].count == 0
+
+def test_asyncio_run_async():
+    # The asyncio scheduler runs inside an event loop which is owned by someone else
+    expired = []
+
+    async def other_service():
+        await asyncio.sleep(0.01)
+        expired.append("other")
+
+    async def main():
+        sched = scheduler.AsyncioScheduler()
+        saved_timer_scheduler = timer.TIMER_SCHEDULER
+        timer.TIMER_SCHEDULER = sched.create_timer_scheduler()
+        try:
+            def expire():
+                expired.append("rift")
+                sched.stop()
+            timer.Timer(interval=0.05, expire_function=expire, periodic=False)
+            await asyncio.gather(sched.run_async(), other_service())
+        finally:
+            timer.TIMER_SCHEDULER.stop_all_timers()
+            timer.TIMER_SCHEDULER = saved_timer_scheduler
+
+    asyncio.run(main())
+    assert expired == ["other", "rift"]
+
+def test_abstract_schedulers():
+    # Only the concrete schedulers can be instantiated
+    for abstract_class in [scheduler.Scheduler, scheduler.PollingScheduler]:
+        with pytest.raises(TypeError):
+            abstract_class()    # pylint:disable=abstract-class-instantiated
+    for scheduler_class in scheduler.SCHEDULER_CLASSES.values():
+        scheduler_class().close()
+
+def test_round_robin(sched_and_socket_pairs):
+    # With the fair receive policy, the handler which is served first changes every iteration
+    (sched, socket_pairs) = sched_and_socket_pairs
+    if not isinstance(sched, scheduler.PollingScheduler):
+        # The asyncio event loop decides in which order the ready handlers are served
+        return
+    sched.rx_policy = scheduler.RX_POLICY_FAIR
+    served = []
+    for (index, (rx_sock, tx_sock)) in enumerate(socket_pairs):
+        OrderHandler(sched, rx_sock, index, served, scheduler.Scheduler.PRIORITY_NORMAL)
+        tx_sock.send(b'x')
+    first_served = []
+    for _ in range(3):
+        del served[:]
+        sched.run_one_iteration()
+        assert sorted(served) == [0, 1, 2]
+        first_served.append(served[0])
+    assert sorted(first_served) == [0, 1, 2]
+
+def test_priority(sched_and_socket_pairs):
+    # With the priority receive policy, high priority handlers are always served first
+    (sched, socket_pairs) = sched_and_socket_pairs
+    if not isinstance(sched, scheduler.PollingScheduler):
+        # The asyncio event loop decides in which order the ready handlers are served
+        return
+    sched.rx_policy = scheduler.RX_POLICY_PRIORITY
+    served = []
+    priorities = [scheduler.Scheduler.PRIORITY_NORMAL, scheduler.Scheduler.PRIORITY_HIGH,
+                  scheduler.Scheduler.PRIORITY_NORMAL]
+    for (index, (rx_sock, tx_sock)) in enumerate(socket_pairs):
+        OrderHandler(sched, rx_sock, index, served, priorities[index])
+        tx_sock.send(b'x')
+    for _ in range(3):
+        del served[:]
+        sched.run_one_iteration()
+        assert served[0] == 1
+        assert sorted(served) == [0, 1, 2]
+
+@pytest.fixture
+def virtual_clock_sched():
+    saved_timer_scheduler = timer.TIMER_SCHEDULER
+    saved_time_function = stats.TIME_FUNCTION
+    sched = scheduler.SelectScheduler()
+    timer.TIMER_SCHEDULER = sched.create_timer_scheduler()
+    timer.enable_virtual_clock(stop_secs=100.0)
+    yield sched
+    timer.TIMER_SCHEDULER.stop_all_timers()
+    timer.TIMER_SCHEDULER = saved_timer_scheduler
+    stats.TIME_FUNCTION = saved_time_function
+
+def test_virtual_clock(virtual_clock_sched):
+    # With the virtual clock, the scheduler jumps to the next timer expiry instead of waiting
+    sched = virtual_clock_sched
+    expired = []
+    timer.Timer(interval=10.0, expire_function=lambda: expired.append(timer.TIMER_SCHEDULER.now()),
+                name="test")
+    start_time = timer.TIMER_SCHEDULER.now()
+    start_wall_time = stats.TIME_FUNCTION()
+    real_start_time = time.monotonic()
+    while len(expired) < 5:
+        sched.run_one_iteration()
+    assert time.monotonic() - real_start_time < 5.0
+    assert [expire_time - start_time for expire_time in expired] == pytest.approx(
+        [10.0, 20.0, 30.0, 40.0, 50.0])
+    # The iteration that triggered the last expiry also jumped to the next expiry
+    assert stats.TIME_FUNCTION() - start_wall_time == pytest.approx(60.0)
+    assert timer.TIMER_SCHEDULER.virtual_clock_elapsed_secs() == pytest.approx(60.0)
+
+def test_virtual_clock_stop(virtual_clock_sched):
+    # The virtual clock does not move beyond the stop time
+    for _ in range(12):
+        virtual_clock_sched.process_events_and_timers()
+        timer.TIMER_SCHEDULER.advance_virtual_clock(10.0)
+    assert timer.TIMER_SCHEDULER.virtual_clock_elapsed_secs() == pytest.approx(100.0)
+    assert timer.TIMER_SCHEDULER.advance_virtual_clock(10.0) is False
+    assert timer.TIMER_SCHEDULER.virtual_clock_stop_secs() == pytest.approx(100.0)
+
+def busy_timers(nr_timers, spread_phase):
+    # Periodic timers with an expire function that takes some time
+    return [timer.Timer(interval=1.0, expire_function=lambda: time.sleep(0.002), name="busy",
+                        spread_phase=spread_phase)
+            for _ in range(nr_timers)]
+
+def test_work_lockstep(virtual_clock_sched):
+    # Periodic timers that are started at the same time do all their work in the same slot
+    sched = virtual_clock_sched
+    sched.clear_histograms()
+    _timers = busy_timers(10, spread_phase=False)
+    while timer.TIMER_SCHEDULER.virtual_clock_elapsed_secs() < 5.0:
+        sched.run_one_iteration()
+    assert max(sched.work_by_slot) > 0.9 * sum(sched.work_by_slot)
+    assert sched.work_window_histogram.max > 0.02
+
+def test_work_spread_phase(virtual_clock_sched):
+    # Periodic timers with a spread phase do their work in many different slots
+    random.seed(1)
+    sched = virtual_clock_sched
+    sched.clear_histograms()
+    _timers = busy_timers(10, spread_phase=True)
+    while timer.TIMER_SCHEDULER.virtual_clock_elapsed_secs() < 5.0:
+        sched.run_one_iteration()
+    assert max(sched.work_by_slot) < 0.5 * sum(sched.work_by_slot)
+    assert len([work for work in sched.work_by_slot if work > 0.005]) >= 5
@@ -335,3 +335,38 @@ def test_incompatible_sum_groups():
     group_2 = stats.Group(sum_group)
     with pytest.raises(Exception):
         stats.Counter(group_2, "Chasing Foxes", "Fox", "Foxen")
+
+def test_histogram_buckets():
+    # Small values have their own bucket
+    for usecs in range(64):
+        index = stats.Histogram.bucket_index(usecs)
+        assert stats.Histogram.bucket_upper_bound(index) == usecs
+    # Larger values are within the bucket and the relative error is bounded
+    previous_index = stats.Histogram.bucket_index(63)
+    for usecs in [64, 65, 100, 1000, 12345, 999999, 10000000]:
+        index = stats.Histogram.bucket_index(usecs)
+        assert index >= previous_index
+        previous_index = index
+        upper_bound = stats.Histogram.bucket_upper_bound(index)
+        assert usecs <= upper_bound <= usecs * (1.0 + 1.0 / 32)
+
+def test_histogram_percentiles():
+    histogram = stats.Histogram()
+    assert histogram.count == 0
+    assert histogram.percentile(50.0) == 0.0
+    assert histogram.average() == 0.0
+    for usecs in range(1, 101):
+        histogram.record(usecs / 1000000.0)
+    assert histogram.count == 100
+    assert histogram.average() == pytest.approx(50.5e-6)
+    assert histogram.max == pytest.approx(100e-6)
+    assert histogram.percentile(50.0) == pytest.approx(50e-6)
+    assert histogram.percentile(90.0) == pytest.approx(91e-6)
+    assert histogram.percentile(100.0) == pytest.approx(100e-6)
+    # A single spike does not hide the other samples
+    histogram.record(1.0)
+    assert histogram.max == 1.0
+    assert histogram.percentile(99.0) == pytest.approx(100e-6, rel=1.0 / 32)
+    histogram.clear()
+    assert histogram.count == 0
+    assert histogram.max == 0.0
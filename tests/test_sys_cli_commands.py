@@ -121,6 +121,10 @@ def check_show_interface_queues(res):
     res.table_expect("Transmit queue:")
     res.table_expect("Request queue:")
     res.table_expect("Acknowledge queue:")
+    res.table_expect("Queue statistics:")
+    res.table_expect("| Transmit | [0-9]+ | [0-9]+ | [0-9]+ | [0-9]+ | [0-9]+ |")
+    res.table_expect("Queue service time per tick:")
+    res.table_expect("| Acknowledge | [0-9]+ | [0-9.]+ |")
     res.wait_prompt()
 
 def check_show_interface_sockets(res):
@@ -0,0 +1,51 @@
+# System test: test_sys_multi_process
+
+# Run topology 3n_l0_l1_l2 with the nodes distributed over multiple worker processes, and check that
+# the nodes in different processes form adjacencies and exchange routes, and that the CLI in the
+# parent process reaches every node.
+
+# Allow long test names
+# pylint: disable=invalid-name
+
+from rift_expect_session import RiftExpectSession
+
+def check_nodes(res):
+    res.sendline("show nodes")
+    res.table_expect("| node1 | 1 | True |")
+    res.table_expect("| node2 | 2 | True |")
+    res.table_expect("| node3 | 3 | True |")
+    res.wait_prompt()
+
+def check_engine(res):
+    # Engine-wide commands are executed in every worker process
+    res.sendline("show engine")
+    res.expect("Worker process 1")
+    res.table_expect("| Number of Nodes | 3 |")
+    res.expect("Worker process 2")
+    res.table_expect("| Number of Nodes | 3 |")
+    res.wait_prompt()
+
+def test_multi_process():
+    res = RiftExpectSession("3n_l0_l1_l2", processes=2)
+    check_nodes(res)
+    check_engine(res)
+    res.check_adjacency_3way(node="node1", interface="if1")
+    res.check_adjacency_3way(node="node2", interface="if1")
+    res.check_adjacency_3way(node="node2", interface="if2")
+    res.check_adjacency_3way(node="node3", interface="if1")
+    res.check_level(node="node1", configured_level=2, hal="(1///None)", hat="(1///None)",
+                    level_value=2)
+    res.check_level(node="node3", configured_level=0, hal=1, hat=1, level_value=0)
+    res.check_rib("node1", [
+        r"| 2.2.2.2/32 | South SPF | Positive | if1",
+        r"| 3.3.3.3/32 | South SPF | Positive | if1",
+    ])
+    res.check_rib("node3", [
+        r"| 0.0.0.0/0 | North SPF | Positive | if1",
+    ])
+    # Node node1 runs in another process than node2 and node3
+    res.interface_failure("node1", "if1", "failed")
+    res.check_adjacency_1way(node="node1", interface="if1")
+    res.interface_failure("node1", "if1", "ok")
+    res.check_adjacency_3way(node="node1", interface="if1")
+    res.stop()
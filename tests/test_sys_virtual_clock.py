@@ -0,0 +1,36 @@
+# System test: test_sys_virtual_clock
+
+# Run topology 3n_l0_l1_l2 with the virtual clock, which stops after 60 virtual seconds. The
+# topology converges in much less than 60 seconds of real time, after which the CLI can be used
+# to inspect the (frozen) converged state.
+
+# Allow long test names
+# pylint: disable=invalid-name
+
+from rift_expect_session import RiftExpectSession
+
+def check_engine(res):
+    res.sendline("show engine")
+    res.table_expect("| Random Seed | 1 |")
+    res.table_expect("| Virtual Clock | True |")
+    res.table_expect("| Virtual Clock Elapsed Time | 60.000000 |")
+    res.table_expect("| Virtual Clock Stop Time | 60.0 |")
+    res.wait_prompt()
+
+def test_virtual_clock():
+    res = RiftExpectSession("3n_l0_l1_l2", start_converge_secs=5.0, virtual_clock_stop=60,
+                            seed=1)
+    check_engine(res)
+    res.check_adjacency_3way(node="node1", interface="if1")
+    res.check_adjacency_3way(node="node2", interface="if1")
+    res.check_adjacency_3way(node="node2", interface="if2")
+    res.check_adjacency_3way(node="node3", interface="if1")
+    res.check_level(node="node3", configured_level=0, hal=1, hat=1, level_value=0)
+    res.check_rib("node1", [
+        r"| 2.2.2.2/32 | South SPF | Positive | if1",
+        r"| 3.3.3.3/32 | South SPF | Positive | if1",
+    ])
+    res.check_rib("node3", [
+        r"| 0.0.0.0/0 | North SPF | Positive | if1",
+    ])
+    res.stop()
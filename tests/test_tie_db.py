@@ -0,0 +1,133 @@
+import random
+
+import common.ttypes
+import constants
+import encoding.ttypes
+import packet_common
+import tie_db
+
+NODE = common.ttypes.TIETypeType.NodeTIEType
+PREFIX = common.ttypes.TIETypeType.PrefixTIEType
+NEG_DISAGG = common.ttypes.TIETypeType.NegativeDisaggregationPrefixTIEType
+
+def make_tie_packet_info(direction, originator, tie_type, tie_nr, seq_nr, level=None):
+    if tie_type == NODE:
+        tie_packet = packet_common.make_node_tie_packet("node", level, direction, originator,
+                                                        tie_nr, seq_nr)
+    else:
+        tie_packet = packet_common.make_prefix_tie_packet(direction, originator, tie_nr, seq_nr)
+        tie_packet.header.tieid.tietype = tie_type
+    packet_info = packet_common.PacketInfo()
+    packet_info.protocol_packet = encoding.ttypes.ProtocolPacket(
+        header=encoding.ttypes.PacketHeader(sender=originator, level=level),
+        content=encoding.ttypes.PacketContent(tie=tie_packet))
+    return packet_info
+
+def node_level_of(tie_packet_info):
+    return tie_packet_info.protocol_packet.content.tie.element.node.level
+
+def check_tie_db(tie_database, expected):
+    # Compare each query on the TIE-DB with the same query on a plain dictionary
+    sorted_tie_ids = sorted(expected.keys())
+    assert len(tie_database) == len(expected)
+    assert list(tie_database.keys()) == sorted_tie_ids
+    assert list(tie_database.values()) == [expected[tie_id] for tie_id in sorted_tie_ids]
+    assert list(tie_database.items()) == [(tie_id, expected[tie_id]) for tie_id in sorted_tie_ids]
+    for tie_id in sorted_tie_ids:
+        assert tie_id in tie_database
+        assert tie_database[tie_id] is expected[tie_id]
+    for originator in range(1, 6):
+        assert (tie_database.ties_of_originator(originator) ==
+                [expected[tie_id] for tie_id in sorted_tie_ids if tie_id.originator == originator])
+        for direction in [constants.DIR_SOUTH, constants.DIR_NORTH]:
+            assert (tie_database.ties_of_originator(originator, direction) ==
+                    [expected[tie_id] for tie_id in sorted_tie_ids
+                     if tie_id.originator == originator and tie_id.direction == direction])
+            for tie_type in [NODE, PREFIX, NEG_DISAGG]:
+                assert (tie_database.ties_of_type(direction, originator, tie_type) ==
+                        [expected[tie_id] for tie_id in sorted_tie_ids
+                         if (tie_id.originator, tie_id.direction, tie_id.tietype) ==
+                         (originator, direction, tie_type)])
+    for direction in [constants.DIR_SOUTH, constants.DIR_NORTH]:
+        for tie_type in [NODE, PREFIX, NEG_DISAGG]:
+            assert (tie_database.ties_of_direction_and_type(direction, tie_type) ==
+                    [expected[tie_id] for tie_id in sorted_tie_ids
+                     if (tie_id.direction, tie_id.tietype) == (direction, tie_type)])
+        for level in range(3):
+            assert (tie_database.node_ties_at_level(direction, level) ==
+                    [expected[tie_id] for tie_id in sorted_tie_ids
+                     if (tie_id.direction, tie_id.tietype) == (direction, NODE) and
+                     node_level_of(expected[tie_id]) == level])
+
+def test_tie_db():
+    packet_common.add_missing_methods_to_thrift()
+    rand = random.Random(1)
+    tie_database = tie_db.TIEDB()
+    expected = {}
+    check_tie_db(tie_database, expected)
+    for seq_nr in range(1, 300):
+        direction = rand.choice([constants.DIR_SOUTH, constants.DIR_NORTH])
+        originator = rand.randint(1, 5)
+        tie_type = rand.choice([NODE, PREFIX, NEG_DISAGG])
+        tie_nr = rand.randint(1, 3)
+        tie_id = packet_common.make_tie_id(direction, originator, tie_type, tie_nr)
+        if rand.random() < 0.3:
+            removed = tie_database.remove(tie_id)
+            assert removed is expected.pop(tie_id, None)
+        else:
+            # Replacing a node TIE may change the level of its originator
+            tie_packet_info = make_tie_packet_info(direction, originator, tie_type, tie_nr, seq_nr,
+                                                   rand.randint(0, 2))
+            replaced = tie_database.store(tie_packet_info)
+            assert replaced is expected.get(tie_id)
+            expected[tie_id] = tie_packet_info
+        check_tie_db(tie_database, expected)
+    start_tie_id = packet_common.make_tie_id(constants.DIR_SOUTH, 2, PREFIX, 2)
+    end_tie_id = packet_common.make_tie_id(constants.DIR_NORTH, 4, NODE, 1)
+    for inclusive in [(True, True), (False, False)]:
+        assert (list(tie_database.tie_packet_infos_in_range(start_tie_id, end_tie_id, inclusive)) ==
+                [expected[tie_id] for tie_id in sorted(expected.keys())
+                 if ((start_tie_id < tie_id or (inclusive[0] and tie_id == start_tie_id)) and
+                     (tie_id < end_tie_id or (inclusive[1] and tie_id == end_tie_id)))])
+    tie_database.clear()
+    check_tie_db(tie_database, {})
+    assert tie_database.remove(start_tie_id) is None
+
+def test_tie_db_aging():
+    packet_common.add_missing_methods_to_thrift()
+    tie_database = tie_db.TIEDB()
+    infos = {}
+    for (tie_nr, lifetime) in [(1, 3), (2, 1), (3, 5), (4, 3)]:
+        infos[tie_nr] = make_tie_packet_info(constants.DIR_SOUTH, 1, PREFIX, tie_nr, 1)
+        infos[tie_nr].remaining_tie_lifetime = lifetime
+        tie_database.store(infos[tie_nr])
+    def tie_id(tie_nr):
+        return packet_common.make_tie_id(constants.DIR_SOUTH, 1, PREFIX, tie_nr)
+    # TIE 2 expires after one second, the other remaining lifetimes decrease
+    assert tie_database.age() == [tie_id(2)]
+    assert tie_database.remove(tie_id(2)) is infos[2]
+    assert [info.remaining_tie_lifetime for info in tie_database.values()] == [2, 4, 2]
+    # Once removed, the remaining lifetime no longer decreases
+    assert tie_database.remove(tie_id(4)) is infos[4]
+    # Replacing a TIE restarts its lifetime; the old version is no longer aging
+    new_info_1 = make_tie_packet_info(constants.DIR_SOUTH, 1, PREFIX, 1, 2)
+    new_info_1.remaining_tie_lifetime = 10
+    assert tie_database.store(new_info_1) is infos[1]
+    # Setting the remaining lifetime of a stored TIE changes its expiry time
+    infos[3].remaining_tie_lifetime = 2
+    assert tie_database.age() == []
+    assert tie_database.age() == [tie_id(3)]
+    tie_database.remove(tie_id(3))
+    assert infos[4].remaining_tie_lifetime == 2
+    assert infos[1].remaining_tie_lifetime == 2
+    assert new_info_1.remaining_tie_lifetime == 8
+    for _ in range(7):
+        assert tie_database.age() == []
+    assert tie_database.age() == [tie_id(1)]
+    # Repeatedly replacing TIEs does not make the expiry heap grow without bounds
+    for seq_nr in range(1000):
+        info = make_tie_packet_info(constants.DIR_SOUTH, 1, PREFIX, 1, seq_nr)
+        info.remaining_tie_lifetime = 100
+        tie_database.store(info)
+    # pylint:disable=protected-access
+    assert len(tie_database._expiry_heap) <= 2 * len(tie_database) + 65
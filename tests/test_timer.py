@@ -223,3 +223,127 @@ def test_attributes(context):
     assert timer2.running() is False
     assert timer2.interval() == pytest.approx(0.7)
     assert timer2.remaining_time_str() == "Stopped"
+
+class FakeClockTimingWheel(timer.TimingWheelTimerScheduler):
+
+    def __init__(self):
+        self.fake_now = 1000.0
+        timer.TimingWheelTimerScheduler.__init__(self)
+
+    def now(self):
+        return self.fake_now
+
+@pytest.fixture
+def fake_clock_wheel():
+    saved_timer_scheduler = timer.TIMER_SCHEDULER
+    wheel = FakeClockTimingWheel()
+    timer.TIMER_SCHEDULER = wheel
+    yield wheel
+    wheel.stop_all_timers()
+    timer.TIMER_SCHEDULER = saved_timer_scheduler
+
+def test_wheel_cascade(fake_clock_wheel):
+    # Timers far enough in the future to end up in each of the higher wheels
+    expired = []
+    intervals = [0.005, 1.0, 3.0, 700.0, 200000.0]
+    for interval in intervals:
+        timer.Timer(
+            interval=interval,
+            expire_function=lambda interval=interval: expired.append(interval),
+            periodic=False)
+    assert fake_clock_wheel.nr_timers() == len(intervals)
+    for interval in intervals:
+        # Just before the expire time: nothing new expires
+        fake_clock_wheel.fake_now = 1000.0 + interval - 0.001
+        time_to_next_expire = fake_clock_wheel.trigger_all_expired_timers()
+        assert interval not in expired
+        assert time_to_next_expire == pytest.approx(0.001)
+        # Exactly at the expire time: expires
+        fake_clock_wheel.fake_now = 1000.0 + interval
+        fake_clock_wheel.trigger_all_expired_timers()
+        assert expired[-1] == interval
+    assert expired == intervals
+    assert fake_clock_wheel.nr_timers() == 0
+
+def test_wheel_stop_and_restart(fake_clock_wheel):
+    counts = {"one": 0, "two": 0}
+    timer1 = timer.Timer(
+        interval=5.0,
+        expire_function=lambda: counts.update(one=counts["one"] + 1),
+        periodic=False)
+    timer2 = timer.Timer(
+        interval=5.0,
+        expire_function=lambda: counts.update(two=counts["two"] + 1),
+        periodic=True)
+    # Restarting many times leaves tombstones behind, which must never be triggered
+    for _ in range(5000):
+        timer1.start()
+    assert fake_clock_wheel.nr_timers() == 2
+    timer2.stop()
+    assert fake_clock_wheel.nr_timers() == 1
+    assert not fake_clock_wheel.expired_timers_pending()
+    fake_clock_wheel.fake_now = 1010.0
+    assert fake_clock_wheel.expired_timers_pending()
+    assert fake_clock_wheel.trigger_all_expired_timers() is None
+    assert counts == {"one": 1, "two": 0}
+
+def test_wheel_periodic_catch_up(fake_clock_wheel):
+    # Like the SortedDict scheduler, a periodic timer that is late catches up
+    expired = []
+    timer.Timer(
+        interval=0.25,
+        expire_function=lambda: expired.append(fake_clock_wheel.fake_now))
+    fake_clock_wheel.fake_now = 1002.5
+    time_to_next_expire = fake_clock_wheel.trigger_all_expired_timers()
+    assert len(expired) == 10
+    assert time_to_next_expire == pytest.approx(0.25)
+
+def test_jitter(fake_clock_wheel):
+    # Each expiry is delayed by at most the jitter, but the delays do not accumulate
+    expired = []
+    timer.Timer(
+        interval=1.0,
+        expire_function=lambda: expired.append(fake_clock_wheel.fake_now),
+        jitter=0.2)
+    for tick in range(1, 101):
+        fake_clock_wheel.fake_now = 1000.0 + tick - 0.001
+        fake_clock_wheel.trigger_all_expired_timers()
+        assert len(expired) == tick - 1
+        fake_clock_wheel.fake_now = 1000.0 + tick + 0.2
+        fake_clock_wheel.trigger_all_expired_timers()
+        assert len(expired) == tick
+    # The fake clock only moves in big steps, so look at the expire times instead
+    delays = []
+    jitter_timer = timer.Timer(interval=1.0, expire_function=None, jitter=0.2)
+    for _ in range(100):
+        delays.append(jitter_timer.expire_time() - fake_clock_wheel.fake_now - 1.0)
+        jitter_timer.start()
+    assert min(delays) >= 0.0
+    assert max(delays) < 0.2
+    assert len(set(delays)) > 1
+
+def test_spread_phase(fake_clock_wheel):
+    # The first expiry is somewhere in the first interval; after that, the timer is periodic
+    first_expire_times = []
+    for _ in range(100):
+        spread_timer = timer.Timer(interval=1.0, expire_function=None, spread_phase=True)
+        first_expire_times.append(spread_timer.expire_time() - fake_clock_wheel.fake_now)
+        spread_timer.stop()
+    assert min(first_expire_times) >= 0.0
+    assert max(first_expire_times) < 1.0
+    assert max(first_expire_times) - min(first_expire_times) > 0.5
+    expired = []
+    spread_timer = timer.Timer(
+        interval=1.0,
+        expire_function=lambda: expired.append(fake_clock_wheel.fake_now),
+        spread_phase=True)
+    first_expire_time = spread_timer.expire_time()
+    fake_clock_wheel.fake_now = first_expire_time
+    fake_clock_wheel.trigger_all_expired_timers()
+    assert spread_timer.expire_time() == pytest.approx(first_expire_time + 1.0)
+
+def test_one_shot_no_jitter(fake_clock_wheel):
+    # Jitter and phase spreading only apply to periodic timers
+    one_shot_timer = timer.Timer(interval=1.0, expire_function=None, periodic=False, jitter=0.5,
+                                 spread_phase=True)
+    assert one_shot_timer.expire_time() == pytest.approx(fake_clock_wheel.fake_now + 1.0)
@@ -0,0 +1,52 @@
+import time
+
+import pytest
+
+import watchdog
+
+# pylint: disable=redefined-outer-name
+@pytest.fixture
+def dog():
+    dog = watchdog.Watchdog(threshold_secs=0.02, sample_interval_secs=0.002)
+    saved_watchdog = watchdog.WATCHDOG
+    watchdog.WATCHDOG = dog
+    yield dog
+    watchdog.WATCHDOG = saved_watchdog
+    dog.stop()
+
+def busy_callback(secs):
+    start_time = time.monotonic()
+    while time.monotonic() - start_time < secs:
+        pass
+
+def run_callback(name, secs):
+    watchdog.callback_started(name)
+    busy_callback(secs)
+    watchdog.callback_finished()
+
+def test_short_callback(dog):
+    for _ in range(10):
+        run_callback("Short", 0.005)
+    assert dog.nr_samples() == 0
+    assert dog.collapsed_stacks() == []
+    assert dog.long_callback_histograms == {}
+
+def test_long_callback(dog):
+    run_callback("Long callback", 0.2)
+    assert dog.nr_samples() > 0
+    assert dog.long_callback_histograms["Long callback"].count == 1
+    stacks = dog.collapsed_stacks()
+    total = 0
+    for line in stacks:
+        (stack, count) = line.rsplit(" ", 1)
+        # The frames of the caller of the callback are left out
+        assert stack.startswith("Long_callback;test_watchdog.py:busy_callback")
+        total += int(count)
+    assert total == dog.nr_samples()
+    dog.clear()
+    assert dog.nr_samples() == 0
+    assert dog.long_callback_histograms == {}
+
+def test_disabled():
+    assert watchdog.WATCHDOG is None
+    run_callback("Disabled", 0.001)
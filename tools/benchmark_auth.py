@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+# Benchmark the authentication cost of the send path: for each packet in the corpus of
+# tools/benchmark_decode.py, measure how many times per second the envelope header and the outer
+# security envelope header can be updated (see Interface.send_packet_info), as happens each time
+# the packet is sent on an interface:
+#
+# * none: no outer key
+# * uncached: an hmac-sha-512 outer key which creates a new HMAC from the secret for each digest
+#   (as key.Key did before the HMAC state was precomputed), with a different nonce on each send
+# * precomputed: an hmac-sha-512 outer key (key.Key), with a different nonce on each send
+# * reused: an hmac-sha-512 outer key, with the same nonces and lifetime on each send (e.g. an
+#   unchanged TIDE, or a TIE flooded on several interfaces), so that the outer security envelope
+#   header of the previous send is reused
+#
+# Usage (from the top of the repository): tools/benchmark_auth.py [-d 2.0]
+
+import argparse
+import hmac
+import sys
+import time
+
+sys.path.append("rift")
+
+# pylint:disable=wrong-import-position
+import benchmark_decode
+import key
+import packet_common
+
+SECRET = "this-is-the-secret-of-the-outer-key"
+
+class UncachedKey(key.Key):
+
+    def digest(self, message_parts):
+        digestmod = key.ALGORITHM_TO_DIGESTMOD[self.algorithm]
+        the_hmac = hmac.new(self.secret.encode(), digestmod=digestmod)
+        for message_part in message_parts:
+            if message_part is not None:
+                the_hmac.update(message_part)
+        return the_hmac.digest()
+
+def parse_command_line_arguments():
+    parser = argparse.ArgumentParser(description='Authentication benchmark')
+    parser.add_argument('-d', '--duration', type=float, default=2.0,
+                        help='Duration of each measurement in seconds (default: 2.0)')
+    args = parser.parse_args()
+    return args
+
+def measure(packet_info, outer_key, vary_nonce, duration):
+    nr_done = 0
+    nonce_local = 1
+    start_time = time.perf_counter()
+    while True:
+        for _ in range(10):
+            if vary_nonce:
+                nonce_local = nonce_local % 65535 + 1
+            packet_info.update_env_header(nonce_local)
+            packet_info.update_outer_sec_env_header(outer_key, nonce_local, 2,
+                                                    packet_info.remaining_tie_lifetime)
+            packet_info.message_parts()
+        nr_done += 10
+        elapsed = time.perf_counter() - start_time
+        if elapsed >= duration:
+            return nr_done / elapsed
+
+def main():
+    args = parse_command_line_arguments()
+    packet_common.add_missing_methods_to_thrift()
+    origin_key = key.Key(2, "hmac-sha-512", SECRET)
+    configurations = [
+        (None, True),
+        (UncachedKey(1, "hmac-sha-512", SECRET), True),
+        (key.Key(1, "hmac-sha-512", SECRET), True),
+        (key.Key(1, "hmac-sha-512", SECRET), False)]
+    print("{:>20} {:>8} {:>12} {:>12} {:>12} {:>12}".format(
+        "", "", "Sends/s", "Sends/s", "Sends/s", "Sends/s"))
+    print("{:>20} {:>8} {:>12} {:>12} {:>12} {:>12}".format(
+        "Packet", "Bytes", "none", "uncached", "precomputed", "reused"))
+    for (name, protocol_packet) in benchmark_decode.default_corpus():
+        packet_info = packet_common.encode_protocol_packet(protocol_packet, origin_key)
+        if protocol_packet.content.tie:
+            packet_info.remaining_tie_lifetime = 600
+        rates = [measure(packet_info, outer_key, vary_nonce, args.duration)
+                 for (outer_key, vary_nonce) in configurations]
+        print("{:>20} {:>8} {:>12.0f} {:>12.0f} {:>12.0f} {:>12.0f}".format(
+            name, len(packet_info.encoded_protocol_packet), *rates))
+
+if __name__ == "__main__":
+    main()
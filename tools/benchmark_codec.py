@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+# Benchmark the Thrift codecs (see set_codec in rift/packet_common.py): for LIE, TIDE, TIRE and TIE
+# packets, measure how many packets per second can be decoded (including the fixing of unsigned
+# fields) using the pure-Python codec, the accelerated codec, and the fast decoder (see
+# rift/thrift_decoder.py; in TIE pass-through mode, which leaves the TIE elements encoded), and how
+# many packets per second can be encoded using the Thrift encoder of each codec (which encodes a
+# fixed deep copy of the packet) and using the fast encoder (see rift/thrift_encoder.py), which is
+# what the RIFT engine actually uses to encode packets.
+#
+# Usage (from the top of the repository): tools/benchmark_codec.py [-d 2.0]
+
+import argparse
+import sys
+import time
+
+sys.path.append("rift")
+
+# pylint:disable=wrong-import-position
+import benchmark_decode
+import packet_common
+
+def parse_command_line_arguments():
+    parser = argparse.ArgumentParser(description='Codec benchmark')
+    parser.add_argument('-d', '--duration', type=float, default=2.0,
+                        help='Duration of each measurement in seconds (default: 2.0)')
+    args = parser.parse_args()
+    return args
+
+def measure(function, argument, duration):
+    nr_done = 0
+    start_time = time.perf_counter()
+    while True:
+        for _ in range(10):
+            function(argument)
+        nr_done += 10
+        elapsed = time.perf_counter() - start_time
+        if elapsed >= duration:
+            return nr_done / elapsed
+
+def measure_codec(codec, protocol_packet, encoded_packet, duration):
+    # Return (decode rate, Thrift encode rate) for the codec, or (None, None) if it is not available
+    if packet_common.set_codec(codec) != codec:
+        return (None, None)
+    assert packet_common.decode_protocol_packet_bytes(encoded_packet) == protocol_packet
+    decode_rate = measure(packet_common.decode_protocol_packet_bytes, encoded_packet, duration)
+    encode_rate = measure(packet_common.thrift_encode_protocol_packet, protocol_packet, duration)
+    return (decode_rate, encode_rate)
+
+def rate_str(rate):
+    if rate is None:
+        return "n/a"
+    return "{:.0f}".format(rate)
+
+def benchmark(name, protocol_packet, duration):
+    encoded_packet = packet_common.encode_protocol_packet_fast(protocol_packet)
+    (python_decode_rate, python_encode_rate) = measure_codec(packet_common.CODEC_PYTHON,
+                                                             protocol_packet, encoded_packet,
+                                                             duration)
+    (accelerated_decode_rate, accelerated_encode_rate) = measure_codec(
+        packet_common.CODEC_ACCELERATED, protocol_packet, encoded_packet, duration)
+    fast_decode = packet_common.decode_protocol_packet_pass_through
+    if fast_decode(encoded_packet) is None:
+        fast_decode_rate = None
+    else:
+        assert fast_decode(encoded_packet) == protocol_packet
+        fast_decode_rate = measure(fast_decode, encoded_packet, duration)
+    fast_encode_rate = measure(packet_common.encode_protocol_packet_fast, protocol_packet,
+                               duration)
+    print("{:>20} {:>8} {:>12} {:>12} {:>12} {:>12} {:>12} {:>12}".format(
+        name, len(encoded_packet), rate_str(python_decode_rate),
+        rate_str(accelerated_decode_rate), rate_str(fast_decode_rate), rate_str(python_encode_rate),
+        rate_str(accelerated_encode_rate), rate_str(fast_encode_rate)))
+
+def main():
+    args = parse_command_line_arguments()
+    packet_common.add_missing_methods_to_thrift()
+    print("{:>20} {:>8} {:>12} {:>12} {:>12} {:>12} {:>12} {:>12}".format(
+        "", "", "Decode/s", "Decode/s", "Decode/s", "Encode/s", "Encode/s", "Encode/s"))
+    print("{:>20} {:>8} {:>12} {:>12} {:>12} {:>12} {:>12} {:>12}".format(
+        "Packet", "Bytes", "python", "accelerated", "fast", "python", "accelerated", "fast"))
+    for (name, protocol_packet) in benchmark_decode.default_corpus():
+        benchmark(name, protocol_packet, args.duration)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+# Benchmark the decoding of protocol packets: for each packet in a corpus, measure the time (in
+# microseconds per packet) to decode the packet using Thrift, and the time to fix the unsigned
+# fields of the decoded packet using the generic (interpreted) fixer and using the compiled fixer
+# (see rift/thrift_fixer.py).
+#
+# By default the corpus consists of generated LIE, TIDE, TIRE, node TIE and prefix TIE packets. A
+# recorded corpus can be used instead: a file with one encoded protocol packet (i.e. without the
+# envelope and security headers) per line, in hexadecimal. Use --write-corpus to write the default
+# corpus in that format.
+#
+# Usage (from the top of the repository): tools/benchmark_decode.py [-d 2.0] [--corpus FILE]
+
+import argparse
+import sys
+import time
+
+sys.path.append("rift")
+
+# pylint:disable=wrong-import-position
+import thrift.protocol.TBinaryProtocol
+import thrift.transport.TTransport
+
+import benchmark_encode
+import common.ttypes
+import encoding.ttypes
+import packet_common
+
+def parse_command_line_arguments():
+    parser = argparse.ArgumentParser(description='Decode benchmark')
+    parser.add_argument('-d', '--duration', type=float, default=2.0,
+                        help='Duration of each measurement in seconds (default: 2.0)')
+    parser.add_argument('--corpus', help='Read the corpus from the specified file')
+    parser.add_argument('--write-corpus', help='Write the default corpus to the specified file')
+    args = parser.parse_args()
+    return args
+
+def make_tire_packet(nr_headers):
+    tire_packet = packet_common.make_tire_packet()
+    for header_nr in range(nr_headers):
+        tie_header = packet_common.make_tie_header_with_lifetime(
+            common.ttypes.TieDirectionType.South, 1000 + header_nr,
+            common.ttypes.TIETypeType.PrefixTIEType, 1, 5, 600000)
+        packet_common.add_tie_header_to_tire(tire_packet, tie_header)
+    return benchmark_encode.make_protocol_packet(encoding.ttypes.PacketContent(tire=tire_packet))
+
+def make_node_tie_packet(nr_neighbors):
+    tie_packet = packet_common.make_node_tie_packet("node1001", 1,
+                                                    common.ttypes.TieDirectionType.South, 1001, 1,
+                                                    5)
+    for neighbor_nr in range(nr_neighbors):
+        link_id_pair = encoding.ttypes.LinkIDPair(local_id=neighbor_nr + 1, remote_id=1)
+        neighbor = encoding.ttypes.NodeNeighborsTIEElement(level=2, cost=1,
+                                                           link_ids=set([link_id_pair]),
+                                                           bandwidth=100)
+        tie_packet.element.node.neighbors[2000 + neighbor_nr] = neighbor
+    return benchmark_encode.make_protocol_packet(encoding.ttypes.PacketContent(tie=tie_packet))
+
+def default_corpus():
+    return [
+        ("LIE", benchmark_encode.make_lie_packet()),
+        ("TIDE 100 headers", benchmark_encode.make_tide_packet(100)),
+        ("TIRE 100 headers", make_tire_packet(100)),
+        ("Node TIE 32 nbrs", make_node_tie_packet(32)),
+        ("Prefix TIE 10", benchmark_encode.make_prefix_tie_packet(10)),
+        ("Prefix TIE 1000", benchmark_encode.make_prefix_tie_packet(1000))
+    ]
+
+def read_corpus(file_name):
+    corpus = []
+    with open(file_name, encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if line:
+                encoded_packet = bytes.fromhex(line)
+                protocol_packet = packet_common.decode_protocol_packet_bytes(encoded_packet)
+                name = "#{} {}".format(len(corpus) + 1, packet_type(protocol_packet))
+                corpus.append((name, protocol_packet))
+    return corpus
+
+def write_corpus(file_name, corpus):
+    with open(file_name, "w", encoding="utf-8") as file:
+        for (_name, protocol_packet) in corpus:
+            encoded_packet = packet_common.encode_protocol_packet_fast(protocol_packet)
+            file.write(encoded_packet.hex() + "\n")
+
+def packet_type(protocol_packet):
+    content = protocol_packet.content
+    for type_name in ["lie", "tide", "tire", "tie"]:
+        if getattr(content, type_name) is not None:
+            return type_name.upper()
+    return "?"
+
+def thrift_decode(encoded_packet):
+    transport_in = thrift.transport.TTransport.TMemoryBuffer(encoded_packet)
+    protocol_in = thrift.protocol.TBinaryProtocol.TBinaryProtocol(transport_in)
+    protocol_packet = encoding.ttypes.ProtocolPacket()
+    protocol_packet.read(protocol_in)
+    return protocol_packet
+
+def interpreted_fix(protocol_packet):
+    packet_common.fix_packet_after_decode(protocol_packet, packet_common.PROTOCOL_PACKET_FIXES)
+
+def compiled_fix(protocol_packet):
+    packet_common.fix_prot_packet_after_decode(protocol_packet)
+
+def measure_decode(encoded_packet, duration):
+    # Return the time to decode one packet (without fixing it) in microseconds
+    nr_decoded = 0
+    start_time = time.perf_counter()
+    while True:
+        for _ in range(10):
+            thrift_decode(encoded_packet)
+        nr_decoded += 10
+        elapsed = time.perf_counter() - start_time
+        if elapsed >= duration:
+            return 1e6 * elapsed / nr_decoded
+
+def measure_fix(fix_function, encoded_packet, duration):
+    # Return the time to fix one freshly decoded packet in microseconds. Only the fixing is timed;
+    # the packets are decoded in batches beforehand.
+    nr_fixed = 0
+    fix_time = 0.0
+    start_time = time.perf_counter()
+    while time.perf_counter() - start_time < duration:
+        protocol_packets = [thrift_decode(encoded_packet) for _ in range(10)]
+        batch_start_time = time.perf_counter()
+        for protocol_packet in protocol_packets:
+            fix_function(protocol_packet)
+        fix_time += time.perf_counter() - batch_start_time
+        nr_fixed += 10
+    return 1e6 * fix_time / nr_fixed
+
+def benchmark(name, protocol_packet, duration):
+    encoded_packet = packet_common.encode_protocol_packet_fast(protocol_packet)
+    interpreted_packet = thrift_decode(encoded_packet)
+    interpreted_fix(interpreted_packet)
+    compiled_packet = thrift_decode(encoded_packet)
+    compiled_fix(compiled_packet)
+    assert compiled_packet == interpreted_packet
+    decode_usecs = measure_decode(encoded_packet, duration)
+    interpreted_usecs = measure_fix(interpreted_fix, encoded_packet, duration)
+    compiled_usecs = measure_fix(compiled_fix, encoded_packet, duration)
+    print("{:>20} {:>8} {:>12.1f} {:>12.1f} {:>12.1f} {:>8.1f}x".format(
+        name, len(encoded_packet), decode_usecs, interpreted_usecs, compiled_usecs,
+        interpreted_usecs / compiled_usecs))
+
+def main():
+    args = parse_command_line_arguments()
+    packet_common.add_missing_methods_to_thrift()
+    if args.corpus:
+        corpus = read_corpus(args.corpus)
+    else:
+        corpus = default_corpus()
+    if args.write_corpus:
+        write_corpus(args.write_corpus, corpus)
+    print("{:>20} {:>8} {:>12} {:>12} {:>12} {:>9}".format(
+        "Packet", "Bytes", "Decode us", "Generic us", "Compiled us", "Speedup"))
+    for (name, protocol_packet) in corpus:
+        benchmark(name, protocol_packet, args.duration)
+
+if __name__ == "__main__":
+    main()
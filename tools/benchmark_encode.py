@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+# Benchmark the encoding of protocol packets: measure how many packets per second the Thrift encoder
+# (which encodes a fixed deep copy of the packet) and the fast encoder (see rift/thrift_encoder.py)
+# can encode, for a LIE, for a TIDE, and for prefix TIEs of various sizes.
+#
+# Usage (from the top of the repository): tools/benchmark_encode.py [-d 2.0]
+
+import argparse
+import sys
+import time
+
+sys.path.append("rift")
+
+# pylint:disable=wrong-import-position
+import common.ttypes
+import constants
+import encoding.constants
+import encoding.ttypes
+import packet_common
+
+def parse_command_line_arguments():
+    parser = argparse.ArgumentParser(description='Encode benchmark')
+    parser.add_argument('-d', '--duration', type=float, default=2.0,
+                        help='Duration of each measurement in seconds (default: 2.0)')
+    args = parser.parse_args()
+    return args
+
+def make_protocol_packet(content):
+    return encoding.ttypes.ProtocolPacket(
+        header=encoding.ttypes.PacketHeader(
+            major_version=encoding.constants.protocol_major_version,
+            minor_version=encoding.constants.protocol_minor_version,
+            sender=1001,
+            level=1),
+        content=content)
+
+def make_lie_packet():
+    lie_packet = encoding.ttypes.LIEPacket(
+        name="if_1001a",
+        local_id=1,
+        flood_port=constants.DEFAULT_TIE_PORT,
+        link_mtu_size=1400,
+        link_bandwidth=100000,
+        neighbor=encoding.ttypes.Neighbor(originator=1002, remote_id=2),
+        pod=0,
+        node_capabilities=encoding.ttypes.NodeCapabilities(
+            protocol_minor_version=encoding.constants.protocol_minor_version,
+            flood_reduction=True),
+        link_capabilities=encoding.ttypes.LinkCapabilities(bfd=False),
+        holdtime=3,
+        not_a_ztp_offer=False,
+        you_are_flood_repeater=False,
+        label=None)
+    return make_protocol_packet(encoding.ttypes.PacketContent(lie=lie_packet))
+
+def make_tide_packet(nr_headers):
+    start_range = packet_common.make_tie_id(common.ttypes.TieDirectionType.South, 0,
+                                            common.ttypes.TIETypeType.NodeTIEType, 0)
+    end_range = packet_common.make_tie_id(common.ttypes.TieDirectionType.North,
+                                          packet_common.MAX_U64,
+                                          common.ttypes.TIETypeType.KeyValueTIEType,
+                                          packet_common.MAX_U32)
+    tide_packet = packet_common.make_tide_packet(start_range, end_range)
+    for header_nr in range(nr_headers):
+        tie_header = packet_common.make_tie_header_with_lifetime(
+            common.ttypes.TieDirectionType.South, 1000 + header_nr,
+            common.ttypes.TIETypeType.PrefixTIEType, 1, 5, 600000)
+        packet_common.add_tie_header_to_tide(tide_packet, tie_header)
+    return make_protocol_packet(encoding.ttypes.PacketContent(tide=tide_packet))
+
+def make_prefix_tie_packet(nr_prefixes):
+    tie_packet = packet_common.make_prefix_tie_packet(common.ttypes.TieDirectionType.South, 1001,
+                                                      1, 5)
+    for prefix_nr in range(nr_prefixes):
+        prefix = packet_common.make_ipv4_prefix("10.{}.{}.0/24".format(prefix_nr // 256,
+                                                                       prefix_nr % 256))
+        packet_common.add_ipv4_prefix_to_prefix_tie(tie_packet, prefix, metric=1)
+    return make_protocol_packet(encoding.ttypes.PacketContent(tie=tie_packet))
+
+def measure(encode_function, protocol_packet, duration):
+    nr_encoded = 0
+    start_time = time.perf_counter()
+    while True:
+        for _ in range(10):
+            encode_function(protocol_packet)
+        nr_encoded += 10
+        elapsed = time.perf_counter() - start_time
+        if elapsed >= duration:
+            return nr_encoded / elapsed
+
+def benchmark(name, protocol_packet, duration):
+    thrift_encoded = packet_common.thrift_encode_protocol_packet(protocol_packet)
+    fast_encoded = packet_common.encode_protocol_packet_fast(protocol_packet)
+    assert fast_encoded == thrift_encoded
+    thrift_rate = measure(packet_common.thrift_encode_protocol_packet, protocol_packet, duration)
+    fast_rate = measure(packet_common.encode_protocol_packet_fast, protocol_packet, duration)
+    print("{:>20} {:>8} {:>14.0f} {:>14.0f} {:>8.1f}x".format(
+        name, len(fast_encoded), thrift_rate, fast_rate, fast_rate / thrift_rate))
+
+def main():
+    args = parse_command_line_arguments()
+    packet_common.add_missing_methods_to_thrift()
+    print("{:>20} {:>8} {:>14} {:>14} {:>9}".format("Packet", "Bytes", "Thrift pkts/s",
+                                                    "Fast pkts/s", "Speedup"))
+    benchmark("LIE", make_lie_packet(), args.duration)
+    benchmark("TIDE 10 headers", make_tide_packet(10), args.duration)
+    benchmark("TIDE 100 headers", make_tide_packet(100), args.duration)
+    benchmark("Prefix TIE 10", make_prefix_tie_packet(10), args.duration)
+    benchmark("Prefix TIE 1000", make_prefix_tie_packet(1000), args.duration)
+
+if __name__ == "__main__":
+    main()
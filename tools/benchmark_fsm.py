@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+# Benchmark the finite state machine (FSM) machinery: measure how many events per second the LIE FSM
+# and the ZTP FSM can process. The actions are replaced by functions that do nothing (but that have
+# the same names), so that only the cost of the FSM itself (dispatching, state entry and exit, event
+# queues, statistics, and history records) is measured.
+#
+# Usage (from the top of the repository): tools/benchmark_fsm.py [-e 200000]
+
+import argparse
+import logging
+import random
+import sys
+import time
+
+sys.path.append("rift")
+
+# pylint:disable=wrong-import-position
+import fsm
+import interface
+import node
+import packet_common
+
+def parse_command_line_arguments():
+    parser = argparse.ArgumentParser(description='FSM benchmark')
+    parser.add_argument('-e', '--events', type=int, default=200000,
+                        help='Number of events to push into each FSM (default: 200000)')
+    args = parser.parse_args()
+    return args
+
+def make_no_op_action(action):
+    def no_op_action(_action_handler, _event_data=None):
+        pass
+    no_op_action.__name__ = action.__name__
+    return no_op_action
+
+def make_no_op_definition(definition):
+    # A copy of the FSM definition in which all actions are no-op actions
+    no_op_actions = {}
+    def no_op(actions):
+        result = []
+        for action in actions:
+            if action not in no_op_actions:
+                no_op_actions[action] = make_no_op_action(action)
+            result.append(no_op_actions[action])
+        return result
+    transitions = {}
+    for (from_state, from_state_transitions) in definition.transitions.items():
+        transitions[from_state] = {}
+        for (event, transition) in from_state_transitions.items():
+            (to_state, actions, push_events) = fsm.FsmDefinition.parse_transition(transition)
+            transitions[from_state][event] = (to_state, no_op(actions), push_events)
+    state_actions = {}
+    for (state, (entry_actions, exit_actions)) in definition.state_actions.items():
+        state_actions[state] = (no_op(entry_actions), no_op(exit_actions))
+    return fsm.FsmDefinition(
+        state_enum=definition.state_enum,
+        event_enum=definition.event_enum,
+        transitions=transitions,
+        initial_state=definition.initial_state,
+        state_actions=state_actions,
+        verbose_events=definition.verbose_events)
+
+def benchmark(name, definition, nr_events):
+    # Push a random (but reproducible) sequence of events into the FSM, in batches, and process
+    # them. Events that are verbose in the real FSM are much more common than the other events
+    # (e.g. the LIE FSM receives a TIMER_TICK every second and a LIE_RECEIVED for every LIE).
+    log = logging.getLogger('fsm')
+    no_op_definition = make_no_op_definition(definition)
+    machine = fsm.Fsm(no_op_definition, None, log, name)
+    machine.start()
+    rand = random.Random(1)
+    events = list(definition.event_enum)
+    verbose_events = [event for event in events if event in definition.verbose_events]
+    if not verbose_events:
+        verbose_events = events
+    batch = []
+    for _ in range(1000):
+        if rand.random() < 0.9:
+            batch.append(rand.choice(verbose_events))
+        else:
+            batch.append(rand.choice(events))
+    start_time = time.perf_counter()
+    nr_pushed = 0
+    while nr_pushed < nr_events:
+        for event in batch:
+            machine.push_event(event)
+        nr_pushed += len(batch)
+        fsm.Fsm.process_queued_events()
+    duration = time.perf_counter() - start_time
+    print("{:>10} {:>12} {:>14.0f}".format(name, nr_pushed, nr_pushed / duration))
+
+def main():
+    args = parse_command_line_arguments()
+    packet_common.add_missing_methods_to_thrift()
+    logging.basicConfig(level=logging.INFO, filename="/dev/null")
+    print("{:>10} {:>12} {:>14}".format("FSM", "Events", "Events/sec"))
+    benchmark("LIE", interface.Interface.fsm_definition, args.events)
+    benchmark("ZTP", node.Node.fsm_definition, args.events)
+
+if __name__ == "__main__":
+    main()
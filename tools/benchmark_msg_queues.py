@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+# Benchmark servicing a flooding message queue (see rift/msg_queues.py) against the way it was
+# serviced before: for queues of various depths, measure the average time per timer tick to
+# service a queue whose entries are all waiting to be retransmitted (as they are during adjacency
+# bring-up against a large TIE-DB), including sending the entries that are due.
+#
+# Usage (from the top of the repository): tools/benchmark_msg_queues.py [-d 100 1000 10000]
+
+import argparse
+import collections
+import sys
+import time
+
+sys.path.append("rift")
+
+# pylint:disable=wrong-import-position
+# pylint:disable=protected-access
+import common.ttypes
+import constants
+import msg_queues
+import packet_common
+
+NR_TICKS = 100
+
+class SentCountingQueue(msg_queues._MsgQueueBase):
+
+    # A message queue that only counts the entries that it would have sent
+
+    def __init__(self):
+        msg_queues._MsgQueueBase.__init__(self, "benchmark", None, with_lifetime=False)
+        self.nr_sent = 0
+
+    def start_message(self):
+        pass
+
+    def end_message(self):
+        pass
+
+    def add_to_message(self, _tie_header_lifetime):
+        self.nr_sent += 1
+        return True
+
+class FullScanQueue(SentCountingQueue):
+
+    # The message queue as it was serviced before: every tick, the delay of every entry is
+    # decremented, and the whole queue is copied
+
+    def __init__(self):
+        SentCountingQueue.__init__(self)
+        self._full_scan_queue = collections.OrderedDict()
+
+    def add_tie_header(self, tie_header):
+        tie_header_lifetime = packet_common.expand_tie_header_with_lifetime(tie_header, 0)
+        self._full_scan_queue[tie_header.tieid] = (msg_queues._SHORT_DELAY_TICKS,
+                                                   tie_header_lifetime)
+
+    def service_queue(self):
+        new_queue = collections.OrderedDict()
+        added_at_least_one = False
+        for tie_id, value in self._full_scan_queue.items():
+            (delay_ticks, tie_header_lifetime) = value
+            delay_ticks -= 1
+            if delay_ticks == 0:
+                if not added_at_least_one:
+                    self.start_message()
+                if self.add_to_message(tie_header_lifetime):
+                    added_at_least_one = True
+                delay_ticks = msg_queues._LONG_DELAY_TICKS
+            new_queue[tie_id] = (delay_ticks, tie_header_lifetime)
+        if added_at_least_one:
+            self.end_message()
+        self._full_scan_queue = new_queue
+
+def parse_command_line_arguments():
+    parser = argparse.ArgumentParser(description='Message queue benchmark')
+    parser.add_argument('-d', '--depths', type=int, nargs='+', default=[100, 1000, 10000],
+                        help='Numbers of entries in the queue (default: 100 1000 10000)')
+    args = parser.parse_args()
+    return args
+
+def benchmark(queue, depth):
+    # The entries are added over the course of _LONG_DELAY_TICKS ticks, so that they are spread
+    # over all retransmission slots
+    tie_type = common.ttypes.TIETypeType.PrefixTIEType
+    per_tick = depth // msg_queues._LONG_DELAY_TICKS + 1
+    for originator in range(1, depth + 1):
+        queue.add_tie_header(packet_common.make_tie_header(constants.DIR_SOUTH, originator,
+                                                           tie_type, 1, 1))
+        if originator % per_tick == 0:
+            queue.service_queue()
+    queue.nr_sent = 0
+    start_time = time.perf_counter()
+    for _ in range(NR_TICKS):
+        queue.service_queue()
+    duration = time.perf_counter() - start_time
+    return (duration / NR_TICKS, queue.nr_sent / NR_TICKS)
+
+def main():
+    args = parse_command_line_arguments()
+    packet_common.add_missing_methods_to_thrift()
+    row_format = "{:>8} {:>14} {:>14} {:>14}"
+    print(row_format.format("", "Full scan", "Slots", "Sent"))
+    print(row_format.format("Depth", "per tick", "per tick", "per tick"))
+    for depth in args.depths:
+        (old_time, old_sent) = benchmark(FullScanQueue(), depth)
+        (new_time, new_sent) = benchmark(SentCountingQueue(), depth)
+        assert old_sent == new_sent
+        print(row_format.format(depth, "{:.6f}s".format(old_time), "{:.6f}s".format(new_time),
+                                "{:.0f}".format(new_sent)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+# Benchmark the memory allocations of the receive path: for each packet in the corpus of
+# tools/benchmark_decode.py, send the packet (with envelope and security headers) over a loopback
+# UDP socket, receive it, and decode it (see packet_common.decode_message), using the previous
+# receive path (recvmsg, which allocates a new maximum-sized message for every datagram) and using
+# UdpRxHandler (recvmsg_into a reused buffer, see rift/udp_rx_handler.py).
+#
+# For each receive path, tracemalloc measures the peak of the memory allocated while receiving and
+# decoding one packet (in bytes per packet); tracing is slow, so this is measured for fewer packets.
+# Without tracemalloc, the number of packets received and decoded per second is measured.
+#
+# Usage (from the top of the repository): tools/benchmark_rx_alloc.py [-n 1000] [-t 20]
+
+import argparse
+import errno
+import logging
+import socket
+import sys
+import time
+import tracemalloc
+
+sys.path.append("rift")
+
+# pylint:disable=wrong-import-position
+import benchmark_decode
+import packet_common
+import scheduler
+import udp_rx_handler
+
+def parse_command_line_arguments():
+    parser = argparse.ArgumentParser(description='Receive path allocation benchmark')
+    parser.add_argument('-n', '--nr-packets', type=int, default=1000,
+                        help='Number of packets per rate measurement (default: 1000)')
+    parser.add_argument('-t', '--nr-traced-packets', type=int, default=20,
+                        help='Number of packets per allocation measurement (default: 20)')
+    args = parser.parse_args()
+    return args
+
+def encode_message(protocol_packet):
+    packet_info = packet_common.encode_protocol_packet(protocol_packet, None)
+    packet_info.update_env_header(1)
+    if protocol_packet.content.tie:
+        remaining_lifetime = 600
+    else:
+        remaining_lifetime = None
+    packet_info.update_outer_sec_env_header(None, 1, 2, remaining_lifetime)
+    return b''.join(packet_info.message_parts())
+
+def decode(message, from_info, _sock):
+    return packet_common.decode_message(None, from_info, message, None, None, None, None)
+
+class RecvmsgReceiver:
+
+    # The receive path as it was before UdpRxHandler used recvmsg_into
+
+    def __init__(self, sock):
+        self.sock = sock
+
+    def ready_to_read(self):
+        for _ in range(scheduler.SCHEDULER.read_budget):
+            ancillary_size = socket.CMSG_LEN(udp_rx_handler.UdpRxHandler.MAX_SIZE)
+            try:
+                message, _ancillary_messages, _msg_flags, from_info = \
+                    self.sock.recvmsg(udp_rx_handler.UdpRxHandler.MAX_SIZE, ancillary_size)
+            except (IOError, OSError) as err:
+                if err.args[0] != errno.EWOULDBLOCK:
+                    raise
+                return
+            decode(message, from_info, self.sock)
+
+def free_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+def make_receivers():
+    port = free_port()
+    handler = udp_rx_handler.UdpRxHandler(
+        interface_name="lo",
+        local_port=port,
+        ipv4=True,
+        multicast_address=None,
+        remote_address="127.0.0.1",
+        receive_function=decode,
+        log=logging.getLogger("benchmark"),
+        log_id="benchmark")
+    assert handler.sock is not None
+    recvmsg_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    recvmsg_sock.bind(("127.0.0.1", 0))
+    recvmsg_sock.setblocking(0)
+    return [("recvmsg", RecvmsgReceiver(recvmsg_sock)), ("recvmsg_into", handler)]
+
+def measure_peak_allocation(receiver, tx_sock, message, nr_packets):
+    # Return the average peak number of bytes allocated while receiving and decoding a packet
+    address = receiver.sock.getsockname()
+    tracemalloc.start()
+    peak_total = 0
+    for _ in range(nr_packets):
+        tx_sock.sendto(message, address)
+        (current, _peak) = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        receiver.ready_to_read()
+        (_current, peak) = tracemalloc.get_traced_memory()
+        peak_total += peak - current
+    tracemalloc.stop()
+    return peak_total / nr_packets
+
+def measure_rate(receiver, tx_sock, message, nr_packets):
+    address = receiver.sock.getsockname()
+    start_time = time.perf_counter()
+    for _ in range(nr_packets):
+        tx_sock.sendto(message, address)
+        receiver.ready_to_read()
+    return nr_packets / (time.perf_counter() - start_time)
+
+def main():
+    args = parse_command_line_arguments()
+    packet_common.add_missing_methods_to_thrift()
+    receivers = make_receivers()
+    tx_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    print("{:>20} {:>8} {:>14} {:>14} {:>12} {:>12}".format(
+        "", "", "Peak bytes/pkt", "Peak bytes/pkt", "Packets/s", "Packets/s"))
+    print("{:>20} {:>8} {:>14} {:>14} {:>12} {:>12}".format(
+        "Packet", "Bytes", "recvmsg", "recvmsg_into", "recvmsg", "recvmsg_into"))
+    for (name, protocol_packet) in benchmark_decode.default_corpus():
+        message = encode_message(protocol_packet)
+        peaks = []
+        rates = []
+        for (_receiver_name, receiver) in receivers:
+            # Warm up (e.g. compile the fast decoders) before measuring
+            measure_rate(receiver, tx_sock, message, 10)
+            peaks.append(measure_peak_allocation(receiver, tx_sock, message,
+                                                 args.nr_traced_packets))
+            rates.append(measure_rate(receiver, tx_sock, message, args.nr_packets))
+        print("{:>20} {:>8} {:>14.0f} {:>14.0f} {:>12.0f} {:>12.0f}".format(
+            name, len(message), peaks[0], peaks[1], rates[0], rates[1]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+# Benchmark the schedulers: measure the wake-up latency (the time between a socket becoming ready to
+# read and the handler for that socket being called) as a function of the number of registered
+# file descriptors, for each scheduler type.
+#
+# Usage (from the top of the repository): tools/benchmark_scheduler.py [-n 100 1000 4000]
+
+import argparse
+import random
+import resource
+import socket
+import statistics
+import sys
+import time
+
+sys.path.append("rift")
+
+# pylint:disable=wrong-import-position
+import scheduler
+
+def parse_command_line_arguments():
+    parser = argparse.ArgumentParser(description='Scheduler wake-up latency benchmark')
+    parser.add_argument('-n', '--nr-fds', type=int, nargs='+', default=[100, 500, 1000, 4000],
+                        help='Number of registered file descriptors (default: 100 500 1000 4000)')
+    parser.add_argument('-w', '--wakeups', type=int, default=2000,
+                        help='Number of wake-ups to measure per data point (default: 2000)')
+    args = parser.parse_args()
+    return args
+
+class BenchmarkHandler:
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.ready_time = None
+
+    def rx_fd(self):
+        return self.sock.fileno()
+
+    def ready_to_read(self):
+        self.ready_time = time.perf_counter()
+        self.sock.recv(16)
+
+def raise_fd_limit(nr_fds):
+    (soft, hard) = resource.getrlimit(resource.RLIMIT_NOFILE)
+    needed = 2 * nr_fds + 100
+    if soft < needed:
+        if hard != resource.RLIM_INFINITY:
+            needed = min(needed, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (needed, hard))
+
+def benchmark(scheduler_class, nr_fds, nr_wakeups):
+    # Each handler gets the receive end of a socket pair; we make a random handler ready by sending
+    # a byte on the other end of its socket pair.
+    sched = scheduler_class()
+    socket_pairs = [socket.socketpair() for _ in range(nr_fds)]
+    handlers = []
+    try:
+        for (rx_sock, _tx_sock) in socket_pairs:
+            rx_sock.setblocking(False)
+            handler = BenchmarkHandler(rx_sock)
+            sched.register_handler(handler)
+            handlers.append(handler)
+        rand = random.Random(1)
+        latencies = []
+        for _ in range(nr_wakeups):
+            index = rand.randrange(nr_fds)
+            handler = handlers[index]
+            send_time = time.perf_counter()
+            socket_pairs[index][1].send(b'x')
+            sched.run_one_iteration()
+            latencies.append(handler.ready_time - send_time)
+        return latencies
+    except ValueError:
+        # select() cannot handle file descriptors above FD_SETSIZE
+        return None
+    finally:
+        for handler in handlers:
+            sched.unregister_handler(handler)
+        for (rx_sock, tx_sock) in socket_pairs:
+            rx_sock.close()
+            tx_sock.close()
+
+def main():
+    args = parse_command_line_arguments()
+    raise_fd_limit(max(args.nr_fds))
+    print("{:>8} {:>10} {:>14} {:>14} {:>14}".format(
+        "FDs", "Scheduler", "mean (us)", "p50 (us)", "p99 (us)"))
+    for nr_fds in args.nr_fds:
+        for scheduler_type in scheduler.SCHEDULER_TYPES:
+            scheduler_class = scheduler.SCHEDULER_CLASSES[scheduler_type]
+            latencies = benchmark(scheduler_class, nr_fds, args.wakeups)
+            if latencies is None:
+                print("{:>8} {:>10} {:>14}".format(nr_fds, scheduler_type, "not supported"))
+                continue
+            latencies.sort()
+            mean = statistics.mean(latencies) * 1e6
+            p50 = latencies[len(latencies) // 2] * 1e6
+            p99 = latencies[(len(latencies) * 99) // 100] * 1e6
+            print("{:>8} {:>10} {:>14.1f} {:>14.1f} {:>14.1f}".format(
+                nr_fds, scheduler_type, mean, p50, p99))
+
+if __name__ == "__main__":
+    main()
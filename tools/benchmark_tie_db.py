@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+# Benchmark the TIE database (see rift/tie_db.py) against a sorted dictionary keyed by TIEID
+# objects (which is how the TIE-DB was stored before): for TIE-DBs of various sizes, measure the
+# time to store all TIEs, to look up the south node TIEs of every originator (as SPF does), to look
+# up the negative disaggregation TIEs of a set of parents, to iterate over a range of TIE-IDs, and
+# to age all TIEs for AGE_SECONDS seconds (in which no TIE expires).
+#
+# Each originator has 10 TIEs: a south and a north node TIE, 3 south and 3 north prefix TIEs, a
+# south positive and a south negative disaggregation TIE.
+#
+# Usage (from the top of the repository): tools/benchmark_tie_db.py [-s 10000 100000]
+
+import argparse
+import sys
+import time
+
+import sortedcontainers
+
+sys.path.append("rift")
+
+# pylint:disable=wrong-import-position
+import common.constants
+import common.ttypes
+import constants
+import encoding.ttypes
+import packet_common
+import tie_db
+
+NODE = common.ttypes.TIETypeType.NodeTIEType
+PREFIX = common.ttypes.TIETypeType.PrefixTIEType
+POS_DISAGG = common.ttypes.TIETypeType.PositiveDisaggregationPrefixTIEType
+NEG_DISAGG = common.ttypes.TIETypeType.NegativeDisaggregationPrefixTIEType
+
+TIES_PER_ORIGINATOR = 10
+NR_PARENTS = 8
+AGE_SECONDS = 100
+
+class SortedDictTIEDB:
+
+    # The TIE-DB as it was before rift/tie_db.py: a sorted dictionary keyed by TIEID objects
+
+    def __init__(self):
+        self._tie_packet_infos = sortedcontainers.SortedDict()
+
+    def store(self, tie_packet_info):
+        tie_id = tie_packet_info.protocol_packet.content.tie.header.tieid
+        old_tie_packet_info = self._tie_packet_infos.get(tie_id)
+        self._tie_packet_infos[tie_id] = tie_packet_info
+        return old_tie_packet_info
+
+    def ties_of_type(self, direction, originator, tietype):
+        start_tie_id = packet_common.make_tie_id(direction, originator, tietype, 0)
+        end_tie_id = packet_common.make_tie_id(direction, originator, tietype,
+                                               packet_common.MAX_U32)
+        return [self._tie_packet_infos[tie_id]
+                for tie_id in self._tie_packet_infos.irange(start_tie_id, end_tie_id)]
+
+    def tie_packet_infos_in_range(self, start_tie_id, end_tie_id, inclusive=(True, True)):
+        for tie_id in self._tie_packet_infos.irange(start_tie_id, end_tie_id, inclusive):
+            yield self._tie_packet_infos[tie_id]
+
+    def age(self):
+        # Decrement the remaining lifetime of every TIE, as Node.age_ties did before
+        expired_tie_ids = []
+        for tie_id, tie_packet_info in self._tie_packet_infos.items():
+            tie_packet_info.remaining_tie_lifetime -= 1
+            if tie_packet_info.remaining_tie_lifetime <= 0:
+                expired_tie_ids.append(tie_id)
+        return expired_tie_ids
+
+def parse_command_line_arguments():
+    parser = argparse.ArgumentParser(description='TIE database benchmark')
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', default=[10000, 100000],
+                        help='Numbers of TIEs in the TIE-DB (default: 10000 100000)')
+    args = parser.parse_args()
+    return args
+
+def make_tie_packet_info(direction, originator, tie_type, tie_nr):
+    if tie_type == NODE:
+        tie_packet = packet_common.make_node_tie_packet("node", 1, direction, originator, tie_nr,
+                                                        1)
+    else:
+        tie_packet = packet_common.make_prefix_tie_packet(direction, originator, tie_nr, 1)
+        tie_packet.header.tieid.tietype = tie_type
+    packet_info = packet_common.PacketInfo()
+    packet_info.protocol_packet = encoding.ttypes.ProtocolPacket(
+        header=encoding.ttypes.PacketHeader(sender=originator, level=1),
+        content=encoding.ttypes.PacketContent(tie=tie_packet))
+    packet_info.remaining_tie_lifetime = common.constants.default_lifetime
+    return packet_info
+
+def make_tie_packet_infos(nr_originators):
+    south = constants.DIR_SOUTH
+    north = constants.DIR_NORTH
+    tie_packet_infos = []
+    for originator in range(1, nr_originators + 1):
+        for (direction, tie_type, tie_nr) in [(south, NODE, 1), (north, NODE, 1),
+                                              (south, PREFIX, 1), (south, PREFIX, 2),
+                                              (south, PREFIX, 3), (north, PREFIX, 1),
+                                              (north, PREFIX, 2), (north, PREFIX, 3),
+                                              (south, POS_DISAGG, 1), (south, NEG_DISAGG, 1)]:
+            tie_packet_infos.append(make_tie_packet_info(direction, originator, tie_type, tie_nr))
+    return tie_packet_infos
+
+def measure(function):
+    start_time = time.perf_counter()
+    function()
+    return time.perf_counter() - start_time
+
+def benchmark(tie_database, tie_packet_infos, nr_originators):
+    parents = range(1, nr_originators + 1, max(1, nr_originators // NR_PARENTS))
+    start_tie_id = packet_common.make_tie_id(constants.DIR_SOUTH, nr_originators // 4, NODE, 0)
+    end_tie_id = packet_common.make_tie_id(constants.DIR_SOUTH, nr_originators // 2, NODE, 0)
+    def store():
+        for tie_packet_info in tie_packet_infos:
+            tie_database.store(tie_packet_info)
+    def node_ties():
+        for originator in range(1, nr_originators + 1):
+            tie_database.ties_of_type(constants.DIR_SOUTH, originator, NODE)
+    def neg_disagg_ties():
+        # Repeated for as many times as there are originators, to get a measurable time
+        for _ in range(nr_originators // NR_PARENTS):
+            for parent in parents:
+                tie_database.ties_of_type(constants.DIR_SOUTH, parent, NEG_DISAGG)
+    def tie_range():
+        for _ in tie_database.tie_packet_infos_in_range(start_tie_id, end_tie_id):
+            pass
+    def age():
+        for _ in range(AGE_SECONDS):
+            tie_database.age()
+    return [measure(store), measure(node_ties), measure(neg_disagg_ties), measure(tie_range),
+            measure(age)]
+
+def main():
+    args = parse_command_line_arguments()
+    packet_common.add_missing_methods_to_thrift()
+    row_format = "{:>8}" + " {:>12}" * 10
+    print(row_format.format(
+        "", "Store", "Store", "Node TIEs", "Node TIEs", "Neg TIEs", "Neg TIEs", "Range",
+        "Range", "Age", "Age"))
+    print(row_format.format(
+        "TIEs", "SortedDict", "TIEDB", "SortedDict", "TIEDB", "SortedDict", "TIEDB",
+        "SortedDict", "TIEDB", "SortedDict", "TIEDB"))
+    for size in args.sizes:
+        nr_originators = max(1, size // TIES_PER_ORIGINATOR)
+        tie_packet_infos = make_tie_packet_infos(nr_originators)
+        old_times = benchmark(SortedDictTIEDB(), tie_packet_infos, nr_originators)
+        new_times = benchmark(tie_db.TIEDB(), tie_packet_infos, nr_originators)
+        times = [time_str for pair in zip(old_times, new_times)
+                 for time_str in ["{:.3f}s".format(pair[0]), "{:.3f}s".format(pair[1])]]
+        print(row_format.format(len(tie_packet_infos), *times))
+
+if __name__ == "__main__":
+    main()
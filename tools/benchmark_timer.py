@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+# Benchmark the timer schedulers: compare the SortedDict-based timer scheduler with the timing wheel
+# timer scheduler for large numbers of timers.
+#
+# Usage (from the top of the repository): tools/benchmark_timer.py [-n 10000 100000]
+
+import argparse
+import random
+import sys
+import time
+
+sys.path.append("rift")
+
+# pylint:disable=wrong-import-position
+import timer
+
+SCHEDULERS = [
+    ("sorted-dict", timer.SortedDictTimerScheduler),
+    ("timing-wheel", timer.TimingWheelTimerScheduler),
+]
+
+# Mix of intervals that resembles what the RIFT engine uses (message queue tick, LIE tick, TIDE
+# interval, hold-down, ...)
+INTERVALS = [0.2, 1.0, 1.0, 1.0, 2.0, 3.0, 10.0]
+
+def parse_command_line_arguments():
+    parser = argparse.ArgumentParser(description='Timer scheduler benchmark')
+    parser.add_argument('-n', '--nr-timers', type=int, nargs='+', default=[10000, 100000],
+                        help='Number of timers (default: 10000 100000)')
+    parser.add_argument('-s', '--simulated-secs', type=float, default=10.0,
+                        help='Number of simulated seconds to run the timers (default: 10.0)')
+    args = parser.parse_args()
+    return args
+
+def make_fake_clock_scheduler(scheduler_class):
+
+    class FakeClockScheduler(scheduler_class):
+
+        def __init__(self):
+            self.fake_now = 0.0
+            scheduler_class.__init__(self)
+
+        def now(self):
+            return self.fake_now
+
+    return FakeClockScheduler()
+
+def benchmark(scheduler_class, nr_timers, simulated_secs):
+    # Replace the global timer scheduler with a fake-clock instance of the scheduler under test, so
+    # that the benchmark runs as fast as possible and is not disturbed by any real timers.
+    saved_timer_scheduler = timer.TIMER_SCHEDULER
+    sched = make_fake_clock_scheduler(scheduler_class)
+    timer.TIMER_SCHEDULER = sched
+    rand = random.Random(1)
+    results = {}
+    try:
+        # Start: schedule all timers. The fake clock advances a little bit between timer starts (as
+        # the real clock would) so that not all timers have exactly the same expire time.
+        clock_step = 0.01 / nr_timers
+        start_time = time.perf_counter()
+        timers = []
+        for _ in range(nr_timers):
+            sched.fake_now += clock_step
+            timers.append(timer.Timer(interval=rand.choice(INTERVALS), expire_function=None))
+        results["start"] = time.perf_counter() - start_time
+        # Restart: every timer is restarted once (unschedule + schedule), in random order
+        restart_order = list(timers)
+        rand.shuffle(restart_order)
+        start_time = time.perf_counter()
+        for tmr in restart_order:
+            sched.fake_now += clock_step
+            tmr.start()
+        results["restart"] = time.perf_counter() - start_time
+        # Expire: advance the fake clock in 10 millisecond steps and trigger expired timers
+        nr_steps = int(simulated_secs / 0.01)
+        start_time = time.perf_counter()
+        for _ in range(nr_steps):
+            sched.fake_now += 0.01
+            sched.trigger_all_expired_timers()
+        results["expire"] = time.perf_counter() - start_time
+        # Stop: stop all timers
+        start_time = time.perf_counter()
+        for tmr in timers:
+            tmr.stop()
+        results["stop"] = time.perf_counter() - start_time
+    finally:
+        timer.TIMER_SCHEDULER = saved_timer_scheduler
+    return results
+
+def main():
+    args = parse_command_line_arguments()
+    operations = ["start", "restart", "expire", "stop"]
+    print("{:>10} {:>14} ".format("Timers", "Scheduler") +
+          " ".join(["{:>12}".format(operation + " (s)") for operation in operations]))
+    for nr_timers in args.nr_timers:
+        for (name, scheduler_class) in SCHEDULERS:
+            results = benchmark(scheduler_class, nr_timers, args.simulated_secs)
+            print("{:>10} {:>14} ".format(nr_timers, name) +
+                  " ".join(["{:>12.4f}".format(results[operation]) for operation in operations]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+# Measure the flooding latency of TIEs with and without immediate TIE flooding (see
+# IMMEDIATE_TIE_FLOODING in rift/msg_queues.py).
+#
+# The topology is generated from a multi-level meta-topology (by default a 5-stage Clos topology
+# with leaf, spine, and superspine nodes) and all nodes are run in a single RIFT engine. Once the
+# topology has converged, each leaf node in turn re-originates its north prefix TIE, and the time
+# at which the new version of the TIE is stored by every node north of the leaf is recorded. The
+# number of hops that the TIE traveled is the number of levels between the node and the leaf.
+#
+# By default the engine runs with the virtual clock, which measures the latency that is caused by
+# the protocol (i.e. by the timers) and leaves out the processing time. With --real-time, the
+# engine runs in real time, which includes the processing time (on a busy host that makes the
+# results noisy).
+#
+# Usage (from the top of the repository):
+#   tools/flooding_latency.py [-m meta_topology/clos_2pod_2leaf_2spine_2super.yaml] [--real-time]
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append("rift")
+
+# pylint:disable=wrong-import-position
+import config
+import constants
+import engine
+import node
+import packet_common
+import scheduler
+import table
+import timer
+
+DEFAULT_META_TOPOLOGY = "meta_topology/clos_2pod_2leaf_2spine_2super.yaml"
+DEFAULT_CONVERGE_SECS = 30.0
+DEFAULT_SETTLE_SECS = 3.0
+
+def parse_command_line_arguments():
+    parser = argparse.ArgumentParser(description='Flooding latency measurement')
+    parser.add_argument('-m', '--meta-topology', default=DEFAULT_META_TOPOLOGY,
+                        help='Meta-topology file (default {})'.format(DEFAULT_META_TOPOLOGY))
+    parser.add_argument('-c', '--converge-secs', type=float, default=DEFAULT_CONVERGE_SECS,
+                        help='Seconds to wait for the topology to converge (default {:g})'
+                        .format(DEFAULT_CONVERGE_SECS))
+    parser.add_argument('-s', '--settle-secs', type=float, default=DEFAULT_SETTLE_SECS,
+                        help='Seconds to wait for each re-originated TIE to be flooded (default '
+                             '{:g})'.format(DEFAULT_SETTLE_SECS))
+    parser.add_argument('--real-time', action="store_true",
+                        help='Run in real time instead of with the virtual clock')
+    # Used internally to run one measurement in a separate process
+    parser.add_argument('--measure-config', help=argparse.SUPPRESS)
+    parser.add_argument('--immediate', action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    return args
+
+def run_for(secs, virtual_clock):
+    if virtual_clock:
+        stop_time = timer.TIMER_SCHEDULER.now() + secs
+        while timer.TIMER_SCHEDULER.now() < stop_time:
+            scheduler.SCHEDULER.run_one_iteration()
+    else:
+        stop_time = time.monotonic() + secs
+        while time.monotonic() < stop_time:
+            scheduler.SCHEDULER.run_one_iteration()
+
+def measure(args):
+    # Runs in a separate process (so that each measurement starts with a fresh engine). Prints the
+    # measured (hops, latency) pairs as JSON.
+    store_times = {}   # Indexed by (node name, TIE-ID, sequence number)
+    original_store_tie_packet_info = node.Node.store_tie_packet_info
+    def store_tie_packet_info(self, tie_packet_info):
+        tie_header = tie_packet_info.protocol_packet.content.tie.header
+        store_key = (self.name, packet_common.tie_id_tup(tie_header.tieid), tie_header.seq_nr)
+        store_times.setdefault(store_key, timer.TIMER_SCHEDULER.now())
+        original_store_tie_packet_info(self, tie_packet_info)
+    node.Node.store_tie_packet_info = store_tie_packet_info
+    virtual_clock = not args.real_time
+    packet_common.add_missing_methods_to_thrift()
+    eng = engine.Engine(passive_nodes=[],
+                        run_which_nodes=constants.ActiveNodes.ALL_NODES,
+                        interactive=False,
+                        telnet_port_file=os.path.dirname(args.measure_config) + "/telnet-port",
+                        ipv4_multicast_loopback=True,
+                        ipv6_multicast_loopback=True,
+                        log_level=logging.CRITICAL,
+                        config=config.parse_configuration(args.measure_config),
+                        options=engine.EngineOptions(virtual_clock=virtual_clock, seed=1,
+                                                     immediate_tie_flooding=args.immediate))
+    run_for(args.converge_secs, virtual_clock)
+    # pylint:disable=protected-access
+    nodes = list(eng._nodes.values())
+    # The levels are not necessarily consecutive (e.g. leaf, spine, and superspine are levels 0, 23,
+    # and 24), so the number of hops is the difference in rank of the levels
+    level_ranks = {level: rank
+                   for (rank, level) in enumerate(sorted(set(nod.level_value() for nod in nodes)))}
+    results = []
+    for leaf in [nod for nod in nodes if level_ranks[nod.level_value()] == 0]:
+        originate_time = timer.TIMER_SCHEDULER.now()
+        tie_header = leaf.regenerate_my_north_prefix_tie(force=True)
+        run_for(args.settle_secs, virtual_clock)
+        for nod in nodes:
+            hops = level_ranks[nod.level_value()]
+            if hops > 0:
+                store_key = (nod.name, packet_common.tie_id_tup(tie_header.tieid),
+                             tie_header.seq_nr)
+                if store_key in store_times:
+                    results.append((hops, store_times[store_key] - originate_time))
+    print(json.dumps(results))
+
+def run_measurement(args, config_file_name, immediate):
+    command = [sys.executable, __file__, "--measure-config", config_file_name,
+               "--converge-secs", str(args.converge_secs), "--settle-secs", str(args.settle_secs)]
+    if immediate:
+        command.append("--immediate")
+    if args.real_time:
+        command.append("--real-time")
+    environment = dict(os.environ, RIFT_TEST_RESULTS_DIR=os.path.dirname(config_file_name))
+    output = subprocess.run(command, env=environment, check=True, stdout=subprocess.PIPE,
+                            universal_newlines=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+def latency_stats(results, hops):
+    latencies = [latency for (result_hops, latency) in results if result_hops == hops]
+    if not latencies:
+        return ["-", "-", "-"]
+    average = sum(latencies) / len(latencies)
+    return [len(latencies), "{:.6f}".format(average), "{:.6f}".format(average / hops)]
+
+def main():
+    args = parse_command_line_arguments()
+    if args.measure_config:
+        measure(args)
+        return
+    with tempfile.TemporaryDirectory() as temp_dir:
+        config_file_name = temp_dir + "/config.yaml"
+        subprocess.run([sys.executable, "tools/config_generator.py", args.meta_topology,
+                        config_file_name], check=True)
+        delayed_results = run_measurement(args, config_file_name, immediate=False)
+        immediate_results = run_measurement(args, config_file_name, immediate=True)
+    clock = "real time" if args.real_time else "virtual clock"
+    print("Flooding latency of re-originated leaf north prefix TIEs ({}):".format(clock))
+    tab = table.Table()
+    tab.add_row(["Hops",
+                 ["Delayed", "Samples"], ["Delayed", "Latency", "(secs)"],
+                 ["Delayed", "Per Hop", "(secs)"],
+                 ["Immediate", "Samples"], ["Immediate", "Latency", "(secs)"],
+                 ["Immediate", "Per Hop", "(secs)"]])
+    all_hops = sorted(set(hops for (hops, _) in delayed_results + immediate_results))
+    for hops in all_hops:
+        tab.add_row([hops] + latency_stats(delayed_results, hops) +
+                    latency_stats(immediate_results, hops))
+    print(tab.to_string())
+
+if __name__ == "__main__":
+    main()